@@ -1,6 +1,8 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2026 friday_gemini_ai
 
+# config.yaml is validated on the first request that reads it (and by `harperbot check-config`
+# at deploy time), so a cold start does not import PyYAML.
 from harperbot.harperbot import app
 
 # Export the Flask app for Vercel as 'app' (required for WSGI compatibility)
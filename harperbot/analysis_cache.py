@@ -0,0 +1,165 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Analysis Cache
+Content-addressed store of Gemini analyses, keyed by everything that shapes the
+model call (diff, model, rendered prompt, generation settings). Reruns on an
+unchanged PR are served from it instead of sampling the model again, and the
+analysis posted for each PR head is kept in it for `/apply`.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+ANALYSIS_CACHE_PATH = os.getenv("HARPERBOT_ANALYSIS_CACHE", "").strip()
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("HARPERBOT_ANALYSIS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def _settings(generate_config):
+    # GenerateContentConfig is a pydantic model; plain dicts are accepted as well.
+    if hasattr(generate_config, "model_dump"):
+        return generate_config.model_dump(mode="json", exclude_none=True)
+    return generate_config
+
+
+def analysis_cache_key(diff: str, model_name: str, prompt: str, generate_config) -> str:
+    """Return the SHA-256 cache key for one generate_content call."""
+    payload = json.dumps(
+        {
+            "diff": hashlib.sha256((diff or "").encode()).hexdigest(),
+            "model": model_name,
+            "prompt": hashlib.sha256(prompt.encode()).hexdigest(),
+            "config": _settings(generate_config),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def posted_analysis_key(repo_name: str, pr_number: int, head_sha: str) -> str:
+    """Key of the analysis HarperBot posted for a PR at `head_sha`, which `/apply` commits from."""
+    return f"harperbot-posted:{repo_name}#{pr_number}@{head_sha}"
+
+
+class AnalysisCache:
+    """
+    Size-bounded LRU map from cache key to analysis text.
+
+    Without `path` the entries live in memory for this process. With `path` they are
+    kept in a SQLite file instead, so they survive restarts and are shared by the
+    gunicorn workers and `harperbot worker` processes on the same host. Either way
+    the least recently used analyses are evicted once the stored text exceeds
+    `max_bytes`.
+    """
+
+    def __init__(self, *, path: str = "", max_bytes: int = ANALYSIS_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS analyses ("
+                    "key TEXT PRIMARY KEY, analysis TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS analyses_last_used ON analyses (last_used)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        return closing(conn)
+
+    def get(self, key: str) -> str | None:
+        """Return the cached analysis for `key` (marking it recently used), or None."""
+        with self._lock:
+            if self.path:
+                analysis = self._get_on_disk(key)
+            else:
+                analysis = self._entries.get(key)
+                if analysis is not None:
+                    self._entries.move_to_end(key)
+            if analysis is None:
+                self.misses += 1
+                metrics.increment("analysis_cache_misses")
+            else:
+                self.hits += 1
+                metrics.increment("analysis_cache_hits")
+        return analysis
+
+    def _get_on_disk(self, key: str) -> str | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT analysis FROM analyses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE analyses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, analysis: str):
+        """Store `analysis` under `key`, evicting least recently used entries beyond `max_bytes`."""
+        size = len(analysis.encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if self.path:
+                self._put_on_disk(key, analysis, size)
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.encode())
+            self._entries[key] = analysis
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.encode())
+
+    def _put_on_disk(self, key: str, analysis: str, size: int):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, analysis, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, analysis, size, time.time()),
+            )
+            # Drop everything past the newest entries that fit in the byte budget.
+            conn.execute(
+                "DELETE FROM analyses WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS total FROM analyses) "
+                "WHERE total > ?)",
+                (self.max_bytes,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            if self.path:
+                with self._connect() as conn:
+                    count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analyses").fetchone()
+            else:
+                count, size = len(self._entries), self._size
+            return {"hits": self.hits, "misses": self.misses, "size": count, "bytes": size}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """Return the process-wide analysis cache (disk-backed when HARPERBOT_ANALYSIS_CACHE is set)."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AnalysisCache(path=ANALYSIS_CACHE_PATH)
+        return _default_cache
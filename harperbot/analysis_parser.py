@@ -0,0 +1,198 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Analysis Parser
+Tokenizes the model's markdown analysis in one pass into sections, `N/10`
+scores, fenced code blocks (the suggestion diffs) and finish metadata, so the
+comment, review and merge code read one structure instead of rescanning the text.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+# One alternation finds the only lines the parser acts on: code fences, ATX headings and
+# `- Label: N/10` scores. It is run over "\n" + text and starts with that literal, so the
+# regex engine jumps from line to line and skips everything else without returning to Python.
+_TOKEN_RE = re.compile(
+    r"\n(?:"
+    r"(?P<fence>[ \t]*(?P<marker>`{3,}|~{3,})[ \t]*(?P<info>[^`\s]*)[^`\n]*)"
+    r"|(?P<heading> {0,3}(?P<hashes>#{1,6})[ \t]+(?P<title>\S[^\n]*?)(?:[ \t]+#+)?[ \t]*)"
+    r"|(?P<score>[ \t]*[-*](?P<label>[^\n:]*):[ \t]*(?P<value>\d+(?:\.\d+)?)[ \t]*/[ \t]*10\b[^\n]*)"
+    r")$",
+    re.MULTILINE,
+)
+# Fences with these info strings wrap markdown (models sometimes wrap the whole reply or a suggestion list):
+# code blocks inside them are still found, but their headings and scores are not sections. A wrapper around
+# the whole reply is dropped instead, and the reply inside it is parsed.
+_MARKDOWN_FENCES = frozenset({"markdown", "md"})
+# Appended by sanitize_text when it cuts a response at its character cap.
+LENGTH_CAP_MARKER = "... (truncated for length)"
+
+
+@dataclass(frozen=True)
+class Score:
+    """A `- Label: N/10` line."""
+
+    label: str
+    value: float
+
+
+@dataclass(frozen=True)
+class Section:
+    """
+    A heading and the lines up to the next heading of any level. The first
+    section holds the text before any heading (`heading` None, `level` 0).
+    `start`, `body_start` and `end` are offsets in ParsedAnalysis.text.
+    """
+
+    heading: str | None
+    level: int
+    title: str
+    lines: tuple
+    scores: tuple
+    start: int
+    body_start: int
+    end: int
+
+
+@dataclass(frozen=True)
+class CodeBlock:
+    """A fenced code block; `language` is the lowercased first word of its info string."""
+
+    language: str
+    code: str
+    start: int
+    end: int
+    closed: bool
+
+
+@dataclass(frozen=True)
+class ParsedAnalysis:
+    """
+    A model analysis, with "\\r\\n" normalized to "\\n" and any markdown fence
+    around the whole reply removed. `truncated` is set when
+    the text ends inside an unclosed code block or with sanitize_text's length
+    cap marker; `quota_exceeded` when it reports an exhausted API quota.
+    """
+
+    text: str
+    sections: tuple
+    code_blocks: tuple
+    truncated: bool
+    quota_exceeded: bool
+
+    @property
+    def diff_blocks(self) -> list:
+        """The complete ```diff blocks, in order."""
+        return [block.code for block in self.code_blocks if block.language == "diff" and block.closed]
+
+    def section(self, title: str) -> Section | None:
+        """The first section whose heading text is `title` (case-insensitive)."""
+        title = title.lower()
+        return next((section for section in self.sections if section.title.lower() == title), None)
+
+    def replace_section(self, title: str, body: str) -> str:
+        """
+        The text with the body of section `title`, and of any deeper headings under
+        it, replaced by `body`; unchanged if there is no such section.
+        """
+        section = self.section(title)
+        if section is None:
+            return self.text
+        following = (s.start for s in self.sections if s.start > section.start and s.level <= section.level)
+        end = next(following, None)
+        rest = "" if end is None else "\n" + self.text[end:]
+        return self.text[: section.body_start - 1] + "\n" + body.rstrip("\n") + rest
+
+
+def _is_quota_message(text: str) -> bool:
+    lowered = text.lower()
+    return "api quota exceeded" in lowered or "rate limit" in lowered or "quota" in lowered and "exceeded" in lowered
+
+
+def _lines(text: str, start: int, end: int) -> tuple:
+    """The lines from offset `start` up to `end`, the start of a later line or the end of the text."""
+    if start >= end:
+        return ()
+    return tuple(text[start : end - 1 if end < len(text) else end].split("\n"))
+
+
+def _code(text: str, start: int, end: int, indent: int) -> str:
+    if not indent:
+        return text[start : end - 1 if end < len(text) else end] if start < end else ""
+    # Content of a fence indented under a list item loses up to the fence's own indentation.
+    return "\n".join(line[min(indent, len(line) - len(line.lstrip(" "))) :] for line in _lines(text, start, end))
+
+
+def parse_analysis(text: str) -> ParsedAnalysis:
+    """Parse `text` in one pass, tracking code fences so headings and scores inside them are ignored."""
+    text = (text or "").replace("\r\n", "\n")
+    sections = []
+    code_blocks = []
+    # The open section: [heading, level, title, start, body_start, scores].
+    current = [None, 0, "", 0, 0, []]
+    # Open fences as (marker, info, start, body_start, indent, is_code); markdown wrappers are not code.
+    fences = []
+    # The text inside a closed markdown fence that opens the reply, and the offset after that fence.
+    wrapped = None
+
+    def close_section(end):
+        heading, level, title, start, body_start, scores = current
+        sections.append(Section(heading, level, title, _lines(text, body_start, end), tuple(scores), start, body_start, end))
+
+    # Offsets in "\n" + text: a token's start is its line's start in `text`, and its end is one past the line's end.
+    for token in _TOKEN_RE.finditer("\n" + text):
+        kind = token.lastgroup
+        start, end = token.start(), token.end() - 1
+        if kind == "fence":
+            marker, info = token.group("marker"), token.group("info").lower()
+            if fences:
+                open_marker, open_info, open_start, body_start, indent, is_code = fences[-1]
+                if not info and marker[0] == open_marker[0] and len(marker) >= len(open_marker):
+                    fences.pop()
+                    if is_code:
+                        code = _code(text, body_start, start, indent)
+                        code_blocks.append(CodeBlock(open_info, code, open_start, end, True))
+                    elif not fences and not text[:open_start].strip():
+                        wrapped = (_code(text, body_start, start, indent), end)
+                    continue
+                if is_code:
+                    continue
+            fence = token.group("fence")
+            indent = len(fence) - len(fence.lstrip(" "))
+            fences.append((marker, info, start, end + 1, indent, info not in _MARKDOWN_FENCES))
+        elif fences:
+            continue
+        elif kind == "heading":
+            close_section(start)
+            level = len(token.group("hashes"))
+            current = [token.group("heading").strip(), level, token.group("title"), start, end + 1, []]
+        else:
+            current[5].append(Score(token.group("label").strip(), float(token.group("value"))))
+    close_section(len(text))
+
+    if wrapped is not None and not text[wrapped[1] :].strip():
+        return parse_analysis(wrapped[0])
+    if fences and not fences[0][5] and not text[: fences[0][2]].strip():
+        # The wrapper was never closed: the reply was cut off inside it.
+        _, _, _, body_start, indent, _ = fences[0]
+        return parse_analysis(_code(text, body_start, len(text), indent))
+    # Code blocks cannot nest, so at most one is still open: the reply was cut off inside it.
+    unclosed = [fence for fence in fences if fence[5]]
+    for _, info, start, body_start, indent, _ in unclosed:
+        code_blocks.append(CodeBlock(info, _code(text, body_start, len(text), indent), start, len(text), False))
+    return ParsedAnalysis(
+        text=text,
+        sections=tuple(sections),
+        code_blocks=tuple(code_blocks),
+        truncated=bool(unclosed) or text.rstrip().endswith(LENGTH_CAP_MARKER),
+        quota_exceeded=_is_quota_message(text),
+    )
+
+
+@lru_cache(maxsize=16)
+def parsed_analysis(text: str) -> ParsedAnalysis:
+    """`parse_analysis(text)`, memoized so the consumers of one analysis share a single parse."""
+    return parse_analysis(text)
@@ -0,0 +1,155 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot ASGI App
+Serves the same `/webhook` and `/metrics` routes as the Flask `app`, but from an
+event loop: pull request analyses run through async_pipeline, so one process holds
+many of them in flight. Comment commands and queued deliveries reuse the Flask
+handlers in a worker thread.
+Run with: uvicorn harperbot.asgi:app
+"""
+
+import asyncio
+import json
+import logging
+import os
+
+try:
+    from . import harperbot as core
+    from . import metrics
+    from .async_pipeline import close_async_http_client, run_analysis_for_pr_async
+except ImportError:
+    import metrics
+    from async_pipeline import close_async_http_client, run_analysis_for_pr_async
+
+    import harperbot as core
+
+ANALYSIS_ACTIONS = ("opened", "reopened", "synchronize")
+
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    if scope["path"] == "/webhook" and scope["method"] == "POST":
+        body = await _read_body(receive)
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        status, payload = await handle_webhook(body, headers)
+    elif scope["path"] == "/metrics" and scope["method"] == "GET":
+        status, payload = 200, metrics.snapshot()
+    else:
+        status, payload = 404, {"error": "Not found"}
+    await _send_json(send, status, payload)
+
+
+async def handle_webhook(body: bytes, headers: dict) -> tuple:
+    """
+    Verify, de-duplicate and dispatch one webhook delivery; returns `(status, payload)`.
+
+    Mirrors `webhook_handler`: deliveries that fail with a 5xx are forgotten again so
+    GitHub's redelivery can retry them. `headers` must have lower-case keys.
+    """
+    if not core.verify_webhook_signature(body, headers.get("x-hub-signature-256"), os.getenv("WEBHOOK_SECRET")):
+        logging.warning("Invalid webhook signature received")
+        return 403, {"error": "Invalid signature"}
+
+    delivery_id = headers.get("x-github-delivery")
+    delivery_cache = core.get_delivery_cache()
+    if delivery_cache.check_and_record(delivery_id):
+        logging.info(f"Ignoring duplicate webhook delivery {delivery_id}")
+        return 200, {"status": "duplicate"}
+
+    try:
+        data = json.loads(body)
+    except ValueError:
+        delivery_cache.forget(delivery_id)
+        return 400, {"error": "Invalid JSON payload"}
+
+    status, payload = await dispatch_webhook_event_async(data)
+    if status >= 500:
+        delivery_cache.forget(delivery_id)
+    return status, payload
+
+
+async def dispatch_webhook_event_async(data: dict) -> tuple:
+    """Run inline PR analyses on the event loop and hand every other event to `dispatch_webhook_event`."""
+    repo_name = data.get("repository", {}).get("full_name") or data.get("repo", {}).get("full_name")
+    is_analysis = (
+        data.get("action") in ANALYSIS_ACTIONS
+        and "pull_request" in data
+        and repo_name
+        # With a job queue configured the delivery is only enqueued, which is quick.
+        and core.get_job_queue() is None
+    )
+    if not is_analysis:
+        return await asyncio.to_thread(_dispatch_in_thread, data)
+
+    installation_id = data["installation"]["id"]
+    pr_number = data["pull_request"]["number"]
+    logging.info(f"Processing PR #{pr_number} in {repo_name}")
+    try:
+        await run_analysis_for_pr_async(installation_id, repo_name, pr_number)
+        logging.info(f"Successfully processed PR #{pr_number}")
+        return 200, {"status": "ok"}
+    except Exception as e:
+        logging.error(f"Error processing webhook: {str(e)}")
+        return 500, {"error": "Processing failed"}
+
+
+def _dispatch_in_thread(data: dict) -> tuple:
+    # Command handlers build responses with `jsonify`, which needs the Flask app context.
+    if core.flask_available:
+        with core.app.app_context():
+            return _as_status_payload(core.dispatch_webhook_event(data))
+    return _as_status_payload(core.dispatch_webhook_event(data))
+
+
+def _as_status_payload(result) -> tuple:
+    """Normalize a Flask-style handler result (`response` or `(response, status)`) to `(status, payload)`."""
+    body, status = result if isinstance(result, tuple) and len(result) == 2 else (result, None)
+    if hasattr(body, "get_json"):
+        status = status or body.status_code
+        body = body.get_json()
+    return status or 200, body
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _send_json(send, status: int, payload):
+    body = json.dumps(payload).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                core.load_config()  # Fail fast on an invalid config.yaml
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_http_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
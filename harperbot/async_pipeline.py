@@ -0,0 +1,439 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Async Pipeline
+Asyncio variant of `run_analysis_for_pr`. The Gemini call and the diff download are
+awaited on the event loop, PyGithub calls run in worker threads, and independent
+steps overlap, so one process keeps many analyses in flight (see asgi.py).
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+import weakref
+
+try:
+    from . import harperbot as core
+    from .diff_stream import MAX_DIFF_BYTES, STREAM_CHUNK_BYTES, DiffAccumulator, FetchedDiff
+    from .event_context import github_event, record_api_call
+    from .lazy import lazy_module
+    from .resilience import hedged_async
+except ImportError:
+    from diff_stream import MAX_DIFF_BYTES, STREAM_CHUNK_BYTES, DiffAccumulator, FetchedDiff
+    from event_context import github_event, record_api_call
+    from lazy import lazy_module
+    from resilience import hedged_async
+
+    import harperbot as core
+
+httpx = lazy_module("httpx")
+
+# Analyses beyond this many per process wait for a free slot instead of piling onto GitHub and Gemini.
+ASYNC_MAX_ANALYSES = int(os.getenv("HARPERBOT_ASYNC_MAX_ANALYSES", "64"))
+HTTP_POOL_SIZE = int(os.getenv("HARPERBOT_HTTP_POOL_SIZE", "16"))
+HTTP_RETRIES = int(os.getenv("HARPERBOT_HTTP_RETRIES", "3"))
+
+# httpx clients and semaphores belong to the event loop they were created on.
+_http_clients = weakref.WeakKeyDictionary()
+_analysis_slots = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client():
+    """
+    Return the pooled httpx.AsyncClient for the running event loop.
+
+    Like the shared requests session, every response is counted as a GitHub API call.
+    """
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+            transport=httpx.AsyncHTTPTransport(retries=HTTP_RETRIES),
+            event_hooks={"response": [_count_response]},
+        )
+        _http_clients[loop] = client
+    return client
+
+
+async def close_async_http_client():
+    """Close the running loop's httpx client (called on ASGI shutdown)."""
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def _count_response(response):
+    record_api_call()
+
+
+def _slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _analysis_slots.get(loop)
+    if slots is None:
+        slots = asyncio.Semaphore(max(1, ASYNC_MAX_ANALYSES))
+        _analysis_slots[loop] = slots
+    return slots
+
+
+async def fetch_pr_diff_async(diff_url: str, token: str | None) -> str:
+    """Async twin of `fetch_pr_diff`: returns "" (and logs) on any failure."""
+    return (await stream_pr_diff_async(diff_url, token)).text
+
+
+async def stream_pr_diff_async(
+    diff_url: str, token: str | None, *, max_bytes: int = MAX_DIFF_BYTES, spill: bool = False
+) -> FetchedDiff:
+    """Async twin of `stream_pr_diff`: returns an empty FetchedDiff (and logs) on any failure."""
+    headers = {"Accept": "application/vnd.github.v3.diff"}
+    if token:
+        headers["Authorization"] = f"token {token}"
+    try:
+        async with get_async_http_client().stream("GET", diff_url, headers=headers, timeout=20) as response:
+            if response.status_code != 200:
+                snippet = (await response.aread()).decode("utf-8", errors="replace").strip().replace("\n", " ")
+                if len(snippet) > 200:
+                    snippet = snippet[:200] + "…"
+                logging.warning(f"Failed to fetch PR diff (HTTP {response.status_code}): {snippet}")
+                return FetchedDiff()
+
+            accumulator = DiffAccumulator(max_bytes, spill=spill)
+            try:
+                async for chunk in response.aiter_bytes(STREAM_CHUNK_BYTES):
+                    if not accumulator.feed(chunk):
+                        break
+            except BaseException:
+                accumulator.discard()
+                raise
+    except httpx.HTTPError as e:
+        logging.warning(f"Failed to fetch PR diff: {str(e)}")
+        return FetchedDiff()
+    return core.finished_diff(accumulator)
+
+
+async def analyze_with_gemini_async(client, pr_details, *, use_cache: bool = True):
+    """Async twin of `analyze_with_gemini`, awaiting the genai client's `aio` API."""
+    config = core.load_config()
+    if core.needs_chunking(pr_details, config):
+        return await analyze_in_chunks_async(client, pr_details, config, use_cache=use_cache)
+    return (await generate_analysis_async(client, pr_details, use_cache=use_cache))[0]
+
+
+async def analyze_chunks_async(client, chunk_details: list, config, *, use_cache: bool = True) -> list:
+    """Async twin of `analyze_chunks`: the chunks are awaited concurrently under a semaphore."""
+    limit = asyncio.Semaphore(max(1, config.get("max_parallel_chunks", 4)))
+
+    async def analyze_chunk(details):
+        async with limit:
+            return await generate_analysis_async(client, details, use_cache=use_cache)
+
+    return list(await asyncio.gather(*(analyze_chunk(details) for details in chunk_details)))
+
+
+async def analyze_in_chunks_async(client, pr_details, config, *, use_cache: bool = True):
+    """Async twin of `analyze_in_chunks`."""
+    chunk_details, skipped_files = core.plan_chunks(pr_details, config)
+    logging.info(f"Analyzing PR #{pr_details.get('number', 'unknown')} in {len(chunk_details)} chunks")
+    results = await analyze_chunks_async(client, chunk_details, config, use_cache=use_cache)
+    return core.combine_chunk_analyses(chunk_details, results, skipped_files)
+
+
+async def analyze_incrementally_async(client, pr_details, config, repo_name, last_sha, *, use_cache: bool = True):
+    """Async twin of `analyze_incrementally`."""
+    store = core.get_analysis_cache()
+    findings = await asyncio.to_thread(core.load_findings, store, repo_name, pr_details["number"]) if use_cache else None
+    reused, chunk_details, skipped_files = core.plan_incremental_analysis(pr_details, config, findings, last_sha)
+    logging.info(
+        f"Incremental analysis for PR #{pr_details['number']}: reusing {len(reused)} finding groups, "
+        f"analyzing {len(chunk_details)} chunks"
+    )
+    results = await analyze_chunks_async(client, chunk_details, config, use_cache=use_cache)
+    analysis, findings = core.combine_incremental_analyses(pr_details, reused, chunk_details, results, skipped_files, last_sha)
+    if findings is not None and findings.sha:
+        await asyncio.to_thread(core.save_findings, store, repo_name, pr_details["number"], findings)
+    return analysis
+
+
+async def call_gemini_async(call, model_name, generate_config, prompt_tokens: int, *, hedge: bool = False, can_retry=None):
+    """Async twin of `call_gemini`; `call(config)` returns a coroutine."""
+    scheduler = core.get_gemini_scheduler()
+    breaker = core.get_circuit_breaker(model_name)
+    deadline = core.Deadline()
+    for attempt in itertools.count():
+        try:
+            async with scheduler.slot_async(prompt_tokens):
+                core.ensure_quota_available()
+                config = deadline.apply(generate_config)
+                started = time.monotonic()
+                with breaker.guard():
+                    result = await hedged_async(
+                        lambda: call(config),
+                        core.hedge_delay(model_name) if hedge else None,
+                        lambda: scheduler.try_reserve(prompt_tokens),
+                        # The caller charges the winner; a loser that also finished used tokens too.
+                        lambda response: scheduler.charge(core.output_tokens(response)),
+                    )
+                core.record_latency(model_name, time.monotonic() - started)
+            return result
+        except Exception as e:
+            delay = core.next_retry_delay(attempt, e, deadline) if can_retry is None or can_retry() else None
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+
+async def call_gemini_cached_async(
+    call, client, model_name, generate_config, prompt_tokens: int, *, hedge: bool = False, can_retry=None
+):
+    """Async twin of `call_gemini_cached`."""
+    request_config = await asyncio.to_thread(core.with_context_cache, client, model_name, generate_config)
+    try:
+        return await call_gemini_async(call, model_name, request_config, prompt_tokens, hedge=hedge, can_retry=can_retry)
+    except Exception as e:
+        if can_retry is not None and not can_retry():
+            raise
+        if not await asyncio.to_thread(core.forget_stale_cache, e, model_name, request_config):
+            raise
+    return await call_gemini_async(call, model_name, generate_config, prompt_tokens, hedge=hedge, can_retry=can_retry)
+
+
+async def generate_analysis_async(client, pr_details, *, use_cache: bool = True) -> tuple:
+    """Async twin of `generate_analysis`, returning `(text, is_analysis)`."""
+    model_name = None
+    try:
+        model_name, formatted_prompt, generate_config, max_output_tokens = await asyncio.to_thread(
+            core.build_gemini_request, pr_details, client
+        )
+        cache_key = core.analysis_cache_key(pr_details["diff"], model_name, formatted_prompt, generate_config)
+        if use_cache:
+            analysis = await asyncio.to_thread(core.cached_analysis, cache_key, pr_details)
+            if analysis is not None:
+                return analysis, True
+
+        response = await call_gemini_cached_async(
+            lambda config: client.aio.models.generate_content(model=model_name, contents=formatted_prompt, config=config),
+            client,
+            model_name,
+            generate_config,
+            core.estimate_tokens(formatted_prompt),
+            hedge=True,
+        )
+        core.get_gemini_scheduler().charge(core.output_tokens(response))
+        analysis, is_analysis = core.gemini_response_text(response, max_output_tokens)
+        if is_analysis:
+            await asyncio.to_thread(core.get_analysis_cache().put, cache_key, analysis)
+        return analysis, is_analysis
+    except Exception as e:
+        core.record_quota_error(e, core.QUOTA_COOLDOWN_SECONDS)
+        return core.describe_gemini_error(e, pr_details, model_name), False
+
+
+async def stream_analysis_with_gemini_async(client, pr_details, progress, *, use_cache: bool = True):
+    """
+    Async twin of `stream_analysis_with_gemini`.
+
+    `progress` is a ProgressiveComment; its edits run in a worker thread while the
+    stream keeps being read, with at most one edit in flight. The streamed output
+    tokens are charged to the scheduler.
+    """
+    model_name = None
+    pending = None
+    try:
+        model_name, formatted_prompt, generate_config, max_output_tokens = await asyncio.to_thread(
+            core.build_gemini_request, pr_details, client
+        )
+        cache_key = core.analysis_cache_key(pr_details["diff"], model_name, formatted_prompt, generate_config)
+        if use_cache:
+            analysis = await asyncio.to_thread(core.cached_analysis, cache_key, pr_details)
+            if analysis is not None:
+                return analysis
+
+        stream = None
+
+        async def read_stream(config):
+            nonlocal stream, pending
+            stream = core.AnalysisStream(max_output_tokens)
+            chunks = await client.aio.models.generate_content_stream(
+                model=model_name, contents=formatted_prompt, config=config
+            )
+            async for chunk in chunks:
+                if not stream.add(chunk):
+                    break
+                if stream.has_text and (pending is None or pending.done()) and progress.ready():
+                    pending = asyncio.create_task(asyncio.to_thread(progress.post, stream.partial_text()))
+
+        try:
+            await call_gemini_cached_async(
+                read_stream,
+                client,
+                model_name,
+                generate_config,
+                core.estimate_tokens(formatted_prompt),
+                can_retry=lambda: stream is None or not stream.has_text,
+            )
+        finally:
+            if stream is not None:
+                core.get_gemini_scheduler().charge(stream.output_tokens)
+        analysis, is_analysis = stream.result()
+        if is_analysis:
+            await asyncio.to_thread(core.get_analysis_cache().put, cache_key, analysis)
+        return analysis
+    except Exception as e:
+        core.record_quota_error(e, core.QUOTA_COOLDOWN_SECONDS)
+        return core.describe_gemini_error(e, pr_details, model_name)
+    finally:
+        if pending is not None:
+            # Let a late progress edit land before the final comment replaces it.
+            await pending
+
+
+async def run_analysis_for_pr_async(
+    installation_id: int,
+    repo_name: str,
+    pr_number: int,
+    *,
+    force: bool = False,
+    force_review: bool = False,
+    fresh: bool = False,
+    head_sha: str | None = None,
+    is_cancelled=None,
+):
+    """Async variant of `run_analysis_for_pr`; takes the same arguments and posts the same comments."""
+    async with _slots():
+        with github_event(repo_name, pr_number) as event, core.gemini_caller(installation_id, manual=force):
+            await _run_analysis_for_pr_async(
+                event,
+                installation_id,
+                repo_name,
+                pr_number,
+                force=force,
+                force_review=force_review,
+                fresh=fresh,
+                head_sha=head_sha,
+                is_cancelled=is_cancelled,
+            )
+
+
+async def _run_analysis_for_pr_async(
+    event, installation_id, repo_name, pr_number, *, force, force_review, fresh, head_sha, is_cancelled
+):
+    g, installation_token, client = await asyncio.to_thread(core.setup_environment_webhook, installation_id)
+    event.github = g
+    pr_details, diff_url = await asyncio.to_thread(core.get_pr_metadata_webhook, g, repo_name, pr_number)
+    expected_sha = head_sha
+    head_sha = pr_details.get("head_sha")
+
+    if await asyncio.to_thread(core.is_stale_head, event, pr_number, expected_sha, head_sha, is_cancelled):
+        return
+
+    # The diff download does not depend on the pause, quota and de-duplication checks.
+    skip, diff = await asyncio.gather(
+        asyncio.to_thread(core.should_skip_analysis, event, pr_number, head_sha, force=force),
+        stream_pr_diff_async(diff_url, installation_token),
+    )
+    if skip:
+        return
+    core.attach_diff(pr_details, diff)
+
+    if not pr_details.get("files_changed"):
+        await asyncio.to_thread(
+            core.post_notice_comment,
+            installation_token,
+            repo_name,
+            pr_number,
+            "No files changed",
+            "This PR has no file changes to analyze.",
+        )
+        return
+    if not pr_details.get("diff"):
+        await asyncio.to_thread(
+            core.post_notice_comment,
+            installation_token,
+            repo_name,
+            pr_number,
+            "Empty diff",
+            "HarperBot could not find a diff to analyze.",
+        )
+        return
+    if is_cancelled is not None and is_cancelled():
+        logging.info(f"Cancelled analysis for PR #{pr_number} at {head_sha}: superseded by a newer event")
+        return
+    config = core.load_config()
+    progress = None
+    try:
+        if config.get("incremental_analysis", False):
+            last_sha = core.last_analyzed_sha(event.issue_comments)
+            analysis = await analyze_incrementally_async(client, pr_details, config, repo_name, last_sha, use_cache=not fresh)
+        elif config.get("stream_analysis", False) and not core.needs_chunking(pr_details, config):
+            progress = core.ProgressiveComment(event, config.get("stream_update_interval", 5.0))
+            analysis = await stream_analysis_with_gemini_async(client, pr_details, progress, use_cache=not fresh)
+        else:
+            analysis = await analyze_with_gemini_async(client, pr_details, use_cache=not fresh)
+        if not analysis:
+            await asyncio.to_thread(
+                core.post_notice_comment,
+                installation_token,
+                repo_name,
+                pr_number,
+                "No analysis output",
+                "HarperBot did not receive a response from the model.",
+            )
+            return
+
+        if core.is_quota_exceeded_message(analysis):
+            await asyncio.to_thread(core.post_quota_notice, installation_token, repo_name, pr_number)
+            return
+
+        if is_cancelled is not None and is_cancelled():
+            # Do not let an outdated analysis overwrite the comment a newer run is about to post.
+            logging.info(f"Discarding analysis for PR #{pr_number} at {head_sha}: superseded by a newer event")
+            return
+
+        # The final comment replaces the partial one from here on, even if a later step fails.
+        progress = None
+        await post_comment_async(event, pr_details, analysis, manual=force, force_review=force_review)
+    finally:
+        if progress is not None:
+            await asyncio.to_thread(progress.interrupt)
+
+
+def _post_targets(event):
+    # Resolve the shared objects once, so the posting threads below do not race to fetch them.
+    return event.repo, event.pr, event.issue_comments, event.reviews
+
+
+async def post_comment_async(event, pr_details: dict, analysis: str, *, manual: bool = False, force_review: bool = False):
+    """
+    Async variant of `post_comment_webhook` for the PR in `event`.
+
+    The main comment and the review are independent, so they are posted concurrently;
+    authoring features run afterwards, as in the sync path.
+    """
+    try:
+        config = core.load_config()
+        suggestions = core.parse_code_suggestions(analysis)
+        repo, pr, _, reviews = await asyncio.to_thread(_post_targets, event)
+
+        effective_force_review = force_review or (manual and bool(config.get("force_review_on_analyze", False)))
+        await asyncio.gather(
+            asyncio.to_thread(core.upsert_analysis_comment, event, pr_details, analysis),
+            asyncio.to_thread(
+                core.post_inline_suggestions,
+                pr,
+                pr_details,
+                suggestions,
+                event.github,
+                repo,
+                force_review=effective_force_review,
+                reviews=reviews,
+            ),
+        )
+
+        await asyncio.to_thread(core.apply_authoring_features, repo, pr, pr_details, analysis, suggestions, config)
+    except Exception as e:
+        logging.error(f"Error posting comment to PR #{pr_details.get('number', 'unknown')}: {str(e)}")
+        raise
@@ -0,0 +1,211 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Context Cache
+Registers the static system instruction of the prompt with Gemini's cached-content
+API and reuses it until its TTL runs out, so each review only sends the per-PR
+diff. Cache names are tracked locally per model and instruction.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+try:
+    from . import metrics
+    from .diff_budget import estimate_tokens
+    from .lazy import lazy_module
+except ImportError:
+    import metrics
+    from diff_budget import estimate_tokens
+    from lazy import lazy_module
+
+types = lazy_module("google.genai.types")
+
+CONTEXT_CACHE_PATH = os.getenv("HARPERBOT_CONTEXT_CACHE", "").strip()
+# A cache this close to expiring is replaced, so no request refers to one that lapses mid-flight.
+REFRESH_MARGIN_SECONDS = 120
+# Gemini rejects smaller cached contents (the minimum is higher on some models).
+MIN_CACHE_TOKENS = 1024
+# Gemini's answers to a request naming cached content that expired early or was deleted.
+STALE_CACHE_STATUSES = ("NOT_FOUND", "INVALID_ARGUMENT")
+
+
+class GeminiCacheBackend:
+    """
+    Creates cached contents through a google-genai client.
+
+    `call(request, config, tokens)` sends `request(config)`; harperbot.py passes
+    one that runs it under the same scheduler, deadline and breaker as any other
+    Gemini request.
+    """
+
+    def __init__(self, client, call=None):
+        self.client = client
+        self.call = call or (lambda request, config, tokens: request(config))
+
+    def create(self, model: str, system_instruction: str, ttl_seconds: int) -> str:
+        config = types.CreateCachedContentConfig(
+            system_instruction=system_instruction,
+            ttl=f"{ttl_seconds}s",
+            display_name="harperbot-system-instruction",
+        )
+        cached = self.call(
+            lambda config: self.client.caches.create(model=model, config=config), config, estimate_tokens(system_instruction)
+        )
+        return cached.name
+
+
+class FakeCacheBackend:
+    """In-memory stand-in for the cached-content API, for tests and offline runs."""
+
+    def __init__(self):
+        self.created = []
+
+    def create(self, model: str, system_instruction: str, ttl_seconds: int) -> str:
+        name = f"cachedContents/fake-{len(self.created) + 1}"
+        self.created.append((name, model, system_instruction, ttl_seconds))
+        return name
+
+
+class ContextCacheRegistry:
+    """
+    Cached-content names per (model, instruction hash), with their expiry.
+
+    An empty name records that the instruction could not be cached, so creation
+    is not attempted again until that entry expires too. With `path` the entries
+    are kept in SQLite, so gunicorn workers and `harperbot worker` share caches.
+    A cache is created outside the lock; requests for the same entry meanwhile
+    send the instruction inline rather than wait for it.
+    """
+
+    def __init__(self, *, path: str = "", clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._entries = {}
+        self._creating = set()
+        self._lock = threading.Lock()
+        if path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS context_caches "
+                    "(model TEXT NOT NULL, digest TEXT NOT NULL, name TEXT NOT NULL, expires REAL NOT NULL, "
+                    "PRIMARY KEY (model, digest))"
+                )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        return closing(conn)
+
+    def _fresh(self, entry) -> bool:
+        return entry is not None and entry[1] - self.clock() >= REFRESH_MARGIN_SECONDS
+
+    def _lookup(self, model: str, digest: str):
+        entry = self._entries.get((model, digest))
+        if not self._fresh(entry) and self.path:
+            # Another process may have created or refreshed it.
+            with self._connect() as conn:
+                entry = conn.execute(
+                    "SELECT name, expires FROM context_caches WHERE model = ? AND digest = ?", (model, digest)
+                ).fetchone()
+        if not self._fresh(entry):
+            return None
+        self._entries[(model, digest)] = tuple(entry)
+        return entry[0]
+
+    def _store(self, model: str, digest: str, name: str, expires: float):
+        self._entries[(model, digest)] = (name, expires)
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO context_caches (model, digest, name, expires) VALUES (?, ?, ?, ?)",
+                    (model, digest, name, expires),
+                )
+
+    def get_or_create(self, model: str, system_instruction: str, ttl_seconds: int, backend) -> str:
+        """The cache name for the instruction on `model` ("" if it cannot be cached), creating it if needed."""
+        digest = hashlib.sha256(system_instruction.encode()).hexdigest()
+        with self._lock:
+            name = self._lookup(model, digest)
+            if name is not None:
+                if name:
+                    metrics.increment("context_cache_hits")
+                return name
+            if (model, digest) in self._creating:
+                return ""
+            self._creating.add((model, digest))
+        try:
+            try:
+                name = backend.create(model, system_instruction, ttl_seconds)
+                metrics.increment("context_cache_created")
+                logging.info(f"Cached the system instruction for {model} as {name}")
+            except Exception as e:
+                logging.warning(f"Sending the system instruction inline; caching it for {model} failed: {e}")
+                name = ""
+            with self._lock:
+                self._store(model, digest, name, self.clock() + ttl_seconds)
+            return name
+        finally:
+            with self._lock:
+                self._creating.discard((model, digest))
+
+    def forget(self, model: str, name: str):
+        """Drop the entry for cache `name` on `model`, so the next request creates a new cache."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if key[0] == model and entry[0] == name:
+                    del self._entries[key]
+            if self.path:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM context_caches WHERE model = ? AND name = ?", (model, name))
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_context_cache_registry() -> ContextCacheRegistry:
+    """Return the process-wide registry (file-backed when HARPERBOT_CONTEXT_CACHE is set)."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = ContextCacheRegistry(path=CONTEXT_CACHE_PATH)
+        return _default_registry
+
+
+def cached_generate_config(backend, model_name: str, generate_config, ttl_seconds: int):
+    """
+    `generate_config` with its system instruction replaced by a cached-content
+    reference, or unchanged if there is nothing worth caching (no instruction, a
+    TTL of 0, fewer than MIN_CACHE_TOKENS tokens) or caching failed.
+    """
+    instruction = getattr(generate_config, "system_instruction", None)
+    if not ttl_seconds or not isinstance(instruction, str) or estimate_tokens(instruction) < MIN_CACHE_TOKENS:
+        return generate_config
+    name = get_context_cache_registry().get_or_create(model_name, instruction, ttl_seconds, backend)
+    if not name:
+        return generate_config
+    return generate_config.model_copy(update={"system_instruction": None, "cached_content": name})
+
+
+def forget_stale_cache(error, model_name: str, request_config) -> bool:
+    """
+    Whether `error`, from a request sent with `request_config`, means its cached
+    content is gone (NOT_FOUND, or INVALID_ARGUMENT once it has expired on
+    Gemini's side). The entry is then dropped, and the caller retries once with
+    the instruction inline.
+    """
+    name = getattr(request_config, "cached_content", None)
+    if not name:
+        return False
+    if getattr(error, "code", None) not in (400, 404) and getattr(error, "status", None) not in STALE_CACHE_STATUSES:
+        return False
+    logging.warning(f"Sending the system instruction inline; Gemini rejected cached content {name}: {error}")
+    metrics.increment("context_cache_invalidated")
+    get_context_cache_registry().forget(model_name, name)
+    return True
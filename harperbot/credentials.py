@@ -0,0 +1,166 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Credential Cache
+Reuses GitHub App JWTs, installation tokens, Github clients and genai clients
+across webhook events instead of minting them for every command.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timezone
+
+from github import Auth, Github, GithubIntegration
+
+try:
+    from .lazy import LazyObject, lazy_module
+except ImportError:
+    from lazy import LazyObject, lazy_module
+
+genai = lazy_module("google.genai")
+
+# Refresh installation tokens this long before GitHub expires them (tokens live for one hour).
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("HARPERBOT_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+# Optional JSON file (e.g. /tmp/harperbot-credentials.json) so warm serverless invocations skip the token exchange.
+CREDENTIAL_CACHE_PATH = os.getenv("HARPERBOT_CREDENTIAL_CACHE", "").strip()
+# App JWTs are signed for 5 minutes; reuse them for most of that window.
+JWT_LIFETIME_SECONDS = 240
+
+
+class CredentialCache:
+    """
+    Per-installation cache of GitHub App credentials.
+
+    Each installation maps to `{"token", "expires_at", "github"}`. Tokens are reused
+    until `refresh_margin` seconds before they expire; the Github client built for a
+    token is shared by every caller that receives the same token.
+    """
+
+    def __init__(self, *, path: str = CREDENTIAL_CACHE_PATH, refresh_margin: int = TOKEN_REFRESH_MARGIN_SECONDS):
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self._installations = {}
+        self._jwts = {}
+        self._genai_clients = {}
+        self._lock = threading.Lock()
+        self._installation_locks = {}
+        self._loaded_from_disk = False
+
+    def _installation_lock(self, installation_id) -> threading.Lock:
+        with self._lock:
+            return self._installation_locks.setdefault(str(installation_id), threading.Lock())
+
+    def get_app_jwt(self, app_id, private_key: str) -> str:
+        """Return a signed App JWT, re-signing only when the cached one is about to expire."""
+        now = time.time()
+        with self._lock:
+            cached = self._jwts.get(str(app_id))
+            if cached and cached[1] > now:
+                return cached[0]
+            jwt = Auth.AppAuth(app_id, private_key).create_jwt()
+            self._jwts[str(app_id)] = (jwt, now + JWT_LIFETIME_SECONDS)
+            return jwt
+
+    def get_installation(self, app_id, private_key: str, installation_id) -> tuple:
+        """Return `(github_client, token)` for an installation, minting a token only when needed."""
+        key = str(installation_id)
+        with self._installation_lock(key):
+            entry = self._installations.get(key)
+            if entry is None and self.path and not self._loaded_from_disk:
+                self._load()
+                entry = self._installations.get(key)
+            if entry is not None and entry["expires_at"] - self.refresh_margin > time.time():
+                if entry.get("github") is None:
+                    entry["github"] = Github(auth=Auth.Token(entry["token"]))
+                return entry["github"], entry["token"]
+
+            integration = GithubIntegration(auth=Auth.AppAuthToken(self.get_app_jwt(app_id, private_key)))
+            authorization = integration.get_access_token(int(installation_id))
+            expires_at = authorization.expires_at
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            entry = {
+                "token": authorization.token,
+                "expires_at": expires_at.timestamp(),
+                "github": Github(auth=Auth.Token(authorization.token)),
+            }
+            self._installations[key] = entry
+            logging.info(f"Minted installation token for installation {key}")
+            if self.path:
+                self._save()
+            return entry["github"], entry["token"]
+
+    def find_client(self, token: str):
+        """Return the cached Github client for an installation token, if any."""
+        with self._lock:
+            entries = list(self._installations.values())
+        for entry in entries:
+            if entry["token"] == token and entry.get("github") is not None:
+                return entry["github"]
+        return None
+
+    def invalidate(self, installation_id):
+        """Forget a cached installation token (e.g. after a 401 from GitHub)."""
+        with self._installation_lock(installation_id):
+            self._installations.pop(str(installation_id), None)
+            if self.path:
+                self._save()
+
+    def get_genai_client(self, api_key: str):
+        """
+        Return a shared genai.Client for `api_key`.
+
+        The client (and google-genai itself) is only built when first used, so commands
+        such as `/help` never import it.
+        """
+        with self._lock:
+            client = self._genai_clients.get(api_key)
+            if client is None:
+                client = LazyObject(lambda: genai.Client(api_key=api_key), "genai.Client")
+                self._genai_clients[api_key] = client
+            return client
+
+    def _load(self):
+        self._loaded_from_disk = True
+        try:
+            with open(self.path, "r") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable credential cache {self.path}: {str(e)}")
+            return
+        now = time.time()
+        for key, value in stored.items():
+            if isinstance(value, dict) and value.get("token") and float(value.get("expires_at", 0)) > now:
+                self._installations.setdefault(key, {"token": value["token"], "expires_at": float(value["expires_at"])})
+
+    def _save(self):
+        stored = {
+            key: {"token": entry["token"], "expires_at": entry["expires_at"]} for key, entry in self._installations.items()
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not persist credential cache to {self.path}: {str(e)}")
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_credential_cache() -> CredentialCache:
+    """Return the process-wide credential cache."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = CredentialCache()
+        return _default_cache
@@ -0,0 +1,123 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Delivery Cache
+Remembers recent X-GitHub-Delivery ids so redelivered webhooks are dropped
+before any GitHub or Gemini call is made.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+DELIVERY_CACHE_PATH = os.getenv("HARPERBOT_DELIVERY_CACHE", "").strip()
+DELIVERY_CACHE_SIZE = int(os.getenv("HARPERBOT_DELIVERY_CACHE_SIZE", "10000"))
+DELIVERY_TTL_SECONDS = int(os.getenv("HARPERBOT_DELIVERY_TTL_SECONDS", "86400"))
+
+
+class DeliveryCache:
+    """
+    Bounded, TTL-evicting set of webhook delivery ids.
+
+    The in-memory layer serves a single process. When `path` is given the ids are
+    also recorded in a SQLite file, so gunicorn workers on the same host share them.
+    """
+
+    def __init__(self, *, max_entries: int = DELIVERY_CACHE_SIZE, ttl_seconds: int = DELIVERY_TTL_SECONDS, path: str = ""):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            with self._connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS deliveries (id TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS deliveries_expires_at ON deliveries (expires_at)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        return closing(conn)
+
+    def _evict(self, now: float):
+        while self._entries:
+            oldest_id, expires_at = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[oldest_id]
+
+    def check_and_record(self, delivery_id: str | None) -> bool:
+        """
+        Record `delivery_id` and return True if it was already seen (a duplicate).
+
+        Missing ids are never treated as duplicates.
+        """
+        if not delivery_id:
+            return False
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            duplicate = delivery_id in self._entries
+            if not duplicate and self.path:
+                duplicate = self._check_and_record_on_disk(delivery_id, now)
+            if duplicate:
+                self.hits += 1
+                metrics.increment("delivery_cache_hits")
+            else:
+                self.misses += 1
+                metrics.increment("delivery_cache_misses")
+            self._entries[delivery_id] = now + self.ttl_seconds
+            self._entries.move_to_end(delivery_id)
+            self._evict(now)
+        return duplicate
+
+    def _check_and_record_on_disk(self, delivery_id: str, now: float) -> bool:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM deliveries WHERE expires_at <= ?", (now,))
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO deliveries (id, expires_at) VALUES (?, ?)",
+                (delivery_id, now + self.ttl_seconds),
+            ).rowcount
+            # Keep the table bounded like the in-memory layer.
+            conn.execute(
+                "DELETE FROM deliveries WHERE id NOT IN (SELECT id FROM deliveries ORDER BY expires_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+        return inserted == 0
+
+    def forget(self, delivery_id: str | None):
+        """Drop `delivery_id` so a redelivery of a failed webhook is processed again."""
+        if not delivery_id:
+            return
+        with self._lock:
+            self._entries.pop(delivery_id, None)
+            if self.path:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM deliveries WHERE id = ?", (delivery_id,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_delivery_cache() -> DeliveryCache:
+    """Return the process-wide delivery cache (disk-backed when HARPERBOT_DELIVERY_CACHE is set)."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = DeliveryCache(path=DELIVERY_CACHE_PATH)
+        return _default_cache
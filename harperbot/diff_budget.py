@@ -0,0 +1,244 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Diff Budget
+Fits a PR diff into a token budget for the prompt. Generated, vendored, binary
+and lockfile changes are left out and listed by name, and the remaining files
+are included in order of risk and churn until the budget is spent.
+"""
+
+import fnmatch
+import logging
+import math
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+try:
+    from .mapreduce import file_diffs
+except ImportError:
+    from mapreduce import file_diffs
+
+# Diffs average a little under four characters per Gemini token.
+CHARS_PER_TOKEN = 4
+# A file that does not fit is cut down to the remaining budget only if at least this many tokens are left.
+MIN_PARTIAL_TOKENS = 200
+# count_tokens is called on at most this much of the diff to calibrate the local estimate.
+TOKEN_SAMPLE_CHARS = 100_000
+# A model's calibrated ratio is reused this long, so count_tokens runs about once per model, not per chunk or PR.
+TOKEN_RATIO_TTL_SECONDS = float(os.getenv("HARPERBOT_TOKEN_RATIO_TTL_SECONDS", "21600"))
+# Omitted files listed in the prompt; the rest are only counted.
+MAX_LISTED_OMISSIONS = 50
+
+# Path pattern -> risk weight; a file's risk is the sum of the weights that match.
+_RISK_PATTERNS = (
+    (re.compile(r"auth|login|passw|secret|token|credential|crypt|permission|session|oauth|jwt", re.I), 3),
+    (re.compile(r"(^|/)(\.github/workflows|migrations?)/|dockerfile|\.sql$|security", re.I), 2),
+    (re.compile(r"\.(py|js|jsx|ts|tsx|go|rb|rs|java|kt|c|cc|cpp|h|cs|php|swift|sh)$", re.I), 1),
+    (re.compile(r"(^|/)(tests?|spec|docs?|examples?)/|(^|/)test_|_test\.|\.(md|rst|txt)$", re.I), -1),
+)
+_GITATTRIBUTES_GENERATED = ("linguist-generated", "linguist-vendored")
+
+# model name -> (tokens per estimated token, monotonic time it was measured)
+_token_ratios = {}
+_token_ratios_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class FileChange:
+    """One file's section of a unified diff."""
+
+    path: str
+    text: str
+    additions: int
+    deletions: int
+    binary: bool
+
+    @property
+    def churn(self) -> int:
+        return self.additions + self.deletions
+
+
+@dataclass(frozen=True)
+class BudgetedDiff:
+    """
+    The diff text to put in the prompt.
+
+    `included` lists the paths that are (at least partly) in `text`; `omitted` holds
+    `(path, reason)` pairs for the rest, which are summarised at the end of `text`.
+    """
+
+    text: str
+    included: tuple
+    omitted: tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """Local token estimate for `text` (no API call)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def gemini_token_counter(count_tokens, model_name: str, sample: str, *, clock=time.monotonic):
+    """
+    Return a token counter calibrated with `count_tokens(model_name, sample)`, the API's count.
+
+    The local estimate is scaled by the ratio the API reports, so files can be
+    measured without a request each. The ratio is kept per model for
+    TOKEN_RATIO_TTL_SECONDS and reused for later chunks and PRs. Falls back to
+    `estimate_tokens` if the call fails; the next call tries again.
+    """
+    now = clock()
+    with _token_ratios_lock:
+        cached = _token_ratios.get(model_name)
+    if cached is not None and now - cached[1] < TOKEN_RATIO_TTL_SECONDS:
+        ratio = cached[0]
+    else:
+        sample = sample[:TOKEN_SAMPLE_CHARS]
+        try:
+            total = count_tokens(model_name, sample)
+        except Exception as e:
+            logging.warning(f"count_tokens failed, using the local token estimate: {str(e)}")
+            return estimate_tokens
+        ratio = total / max(1, estimate_tokens(sample))
+        with _token_ratios_lock:
+            _token_ratios[model_name] = (ratio, now)
+    return lambda text: math.ceil(estimate_tokens(text) * ratio)
+
+
+def parse_file_changes(diff: str) -> list:
+    """Return a FileChange per file in `diff`, with its added and removed line counts."""
+    changes = []
+    for path, text in file_diffs(diff):
+        additions = deletions = 0
+        in_hunk = False
+        for line in text.splitlines():
+            if line.startswith("@@"):
+                in_hunk = True
+            elif in_hunk and line.startswith("+"):
+                additions += 1
+            elif in_hunk and line.startswith("-"):
+                deletions += 1
+        binary = "\nBinary files " in text or "\nGIT binary patch" in text
+        changes.append(FileChange(path=path, text=text, additions=additions, deletions=deletions, binary=binary))
+    return changes
+
+
+def parse_gitattributes(text: str) -> list:
+    """Return `(pattern, generated)` rules from the linguist-generated/-vendored attributes in `text`."""
+    rules = []
+    for line in text.splitlines():
+        parts = line.split()
+        if not parts or parts[0].startswith("#"):
+            continue
+        for attribute in parts[1:]:
+            name, _, value = attribute.lstrip("-!").partition("=")
+            if name in _GITATTRIBUTES_GENERATED:
+                unset = attribute[0] in "-!" or value.lower() == "false"
+                rules.append((parts[0], not unset))
+    return rules
+
+
+def path_matches(pattern: str, path: str) -> bool:
+    """gitattributes-style match: patterns without a slash match the file name at any depth."""
+    if pattern.endswith("/"):
+        pattern += "**"
+    if "/" not in pattern:
+        return fnmatch.fnmatchcase(path.rsplit("/", 1)[-1], pattern)
+    pattern = pattern.lstrip("/")
+    if pattern.startswith("**/"):
+        return fnmatch.fnmatchcase(path, pattern) or fnmatch.fnmatchcase(path, pattern[3:])
+    return fnmatch.fnmatchcase(path, pattern)
+
+
+def skip_reason(change: FileChange, generated_files, gitattribute_rules) -> str | None:
+    """Why `change` should be left out of the prompt ("binary", "generated"), or None to keep it."""
+    if change.binary:
+        return "binary"
+    # As in git, the last matching .gitattributes line wins, and it overrides the configured globs.
+    for pattern, generated in reversed(gitattribute_rules):
+        if path_matches(pattern, change.path):
+            return "generated" if generated else None
+    if any(path_matches(pattern, change.path) for pattern in generated_files):
+        return "generated"
+    return None
+
+
+def risk_score(path: str) -> int:
+    return sum(weight for pattern, weight in _RISK_PATTERNS if pattern.search(path))
+
+
+def drop_generated(diff: str, generated_files=(), gitattributes: str = "") -> tuple:
+    """Return `(diff, omitted)`: `diff` without generated and binary files, and `(path, reason)` for each one removed."""
+    rules = parse_gitattributes(gitattributes)
+    kept, omitted = [], []
+    for change in parse_file_changes(diff):
+        reason = skip_reason(change, generated_files, rules)
+        if reason:
+            omitted.append((change.path, reason))
+        else:
+            kept.append(change.text)
+    return "".join(kept), tuple(omitted)
+
+
+def _truncate(text: str, max_tokens: int, count_tokens) -> str:
+    ratio = count_tokens(text) / max(1, len(text))
+    cut = text.rfind("\n", 0, int(max_tokens / ratio))
+    return text[: cut + 1] if cut > 0 else ""
+
+
+def _summary(changes: dict, omitted: list) -> str:
+    lines = ["", "# Not shown above:"]
+    for path, reason in omitted[:MAX_LISTED_OMISSIONS]:
+        change = changes[path]
+        lines.append(f"#   {path} (+{change.additions} -{change.deletions}): {reason}")
+    if len(omitted) > MAX_LISTED_OMISSIONS:
+        lines.append(f"#   … and {len(omitted) - MAX_LISTED_OMISSIONS} more files")
+    return "\n".join(lines) + "\n"
+
+
+def budget_diff(diff: str, max_tokens: int, *, generated_files=(), gitattributes: str = "", count_tokens=estimate_tokens):
+    """
+    Fit `diff` into `max_tokens` and return a BudgetedDiff.
+
+    Generated (by `generated_files` glob or a `linguist-generated`/`linguist-vendored`
+    attribute), binary and lockfile changes are omitted. The other files are added
+    highest risk first, then by churn; a file that no longer fits is cut at a line
+    boundary if enough budget is left, and omitted otherwise.
+    """
+    rules = parse_gitattributes(gitattributes)
+    changes = parse_file_changes(diff)
+    by_path = {change.path: change for change in changes}
+    candidates, omitted = [], []
+    for change in changes:
+        reason = skip_reason(change, generated_files, rules)
+        if reason:
+            omitted.append((change.path, reason))
+        else:
+            candidates.append(change)
+    candidates.sort(key=lambda change: (-risk_score(change.path), -change.churn))
+
+    parts, included = [], []
+    remaining = max_tokens
+    for change in candidates:
+        tokens = count_tokens(change.text)
+        if tokens <= remaining:
+            parts.append(change.text)
+            included.append(change.path)
+            remaining -= tokens
+            continue
+        partial = _truncate(change.text, remaining, count_tokens) if remaining >= MIN_PARTIAL_TOKENS else ""
+        if partial:
+            parts.append(partial)
+            included.append(change.path)
+            remaining -= count_tokens(partial)
+            omitted.append((change.path, "truncated to fit the token budget"))
+        else:
+            omitted.append((change.path, "over the token budget"))
+
+    text = "".join(parts)
+    if omitted:
+        text += _summary(by_path, omitted)
+    return BudgetedDiff(text=text, included=tuple(included), omitted=tuple(omitted))
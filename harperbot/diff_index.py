@@ -0,0 +1,165 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Diff Index
+Parses a unified diff once into per-file hunks and line maps, so looking up the
+review-comment position of a line, or whether a line range is part of the diff,
+does not rescan the diff text.
+"""
+
+import bisect
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+_FILE_HEADER_RE = re.compile(r"^diff --git a/(.+?) b/(.+)$")
+_HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+@dataclass(frozen=True)
+class Hunk:
+    """One `@@` hunk; `position` is the diff position of its header line (0 for a file's first hunk)."""
+
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    position: int
+
+
+@dataclass
+class FileDiff:
+    """
+    The hunks of one file and maps from its lines to diff positions.
+
+    Positions count lines from the file's first `@@` header, continuing through
+    later hunks (each later header takes a position), as GitHub's `position`
+    field for review comments does. `right` maps new-file line numbers (added and
+    context lines), `left` maps old-file line numbers (removed and context lines)
+    and `sides` maps a position back to its `(side, line)`.
+    """
+
+    path: str
+    hunks: list = field(default_factory=list)
+    right: dict = field(default_factory=dict)
+    left: dict = field(default_factory=dict)
+    sides: dict = field(default_factory=dict)
+
+    def position(self, line: int, side: str = "RIGHT") -> int | None:
+        """The diff position of `line` on `side` ("RIGHT" = new file, "LEFT" = old), or None if it is not in the diff."""
+        return (self.right if side == "RIGHT" else self.left).get(line)
+
+    def hunk_for(self, line: int) -> Hunk | None:
+        """The hunk whose new-file range contains `line`, if any."""
+        i = bisect.bisect_right(self.hunks, line, key=lambda hunk: hunk.new_start) - 1
+        if i < 0:
+            return None
+        hunk = self.hunks[i]
+        return hunk if line < hunk.new_start + hunk.new_count else None
+
+    def covers(self, start_line: int, end_line: int, side: str = "RIGHT") -> bool:
+        """Whether every line from `start_line` to `end_line` (inclusive) on `side` is in the diff."""
+        lines = self.right if side == "RIGHT" else self.left
+        return start_line <= end_line and all(line in lines for line in range(start_line, end_line + 1))
+
+    def anchorable(self, start_line: int, end_line: int) -> bool:
+        """
+        Whether a review comment on new-file lines `start_line`..`end_line` can be
+        placed: GitHub rejects lines outside the diff and ranges that span hunks.
+        """
+        return self.covers(start_line, end_line) and self.hunk_for(start_line) is self.hunk_for(end_line)
+
+
+class DiffIndex:
+    """A parsed unified diff: the FileDiff of every changed path."""
+
+    def __init__(self, files: dict):
+        self.files = files
+
+    def __contains__(self, path) -> bool:
+        return path in self.files
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def file(self, path: str) -> FileDiff | None:
+        return self.files.get(path)
+
+    def position(self, path: str, line: int, side: str = "RIGHT") -> int | None:
+        """The diff position of `line` in `path`, or None if the file or line is not in the diff."""
+        file_diff = self.files.get(path)
+        return None if file_diff is None else file_diff.position(line, side)
+
+    def covers(self, path: str, start_line: int, end_line: int, side: str = "RIGHT") -> bool:
+        file_diff = self.files.get(path)
+        return file_diff is not None and file_diff.covers(start_line, end_line, side)
+
+    def anchorable(self, path: str, start_line: int, end_line: int) -> bool:
+        file_diff = self.files.get(path)
+        return file_diff is not None and file_diff.anchorable(start_line, end_line)
+
+
+def parse_diff(diff: str) -> DiffIndex:
+    """
+    Index `diff` in a single pass. A path that appears in more than one
+    `diff --git` section keeps its first; lines outside a hunk's declared counts
+    (such as a trailing blank line) are ignored, and a hunk cut short by a
+    truncated diff ends at the next `diff --git` header.
+    """
+    files = {}
+    current = None
+    position = old_line = new_line = old_left = new_left = 0
+    for line in diff.split("\n"):
+        if (old_left > 0 or new_left > 0) and not line.startswith("diff --git "):
+            position += 1
+            tag = line[:1]
+            if tag == "+":
+                current.right[new_line] = position
+                current.sides[position] = ("RIGHT", new_line)
+                new_line += 1
+                new_left -= 1
+            elif tag == "-":
+                current.left[old_line] = position
+                current.sides[position] = ("LEFT", old_line)
+                old_line += 1
+                old_left -= 1
+            elif tag == "\\":
+                # "\ No newline at end of file" takes a position but no line.
+                pass
+            else:
+                current.right[new_line] = position
+                current.left[old_line] = position
+                current.sides[position] = ("RIGHT", new_line)
+                new_line += 1
+                old_line += 1
+                new_left -= 1
+                old_left -= 1
+            continue
+
+        if line.startswith("diff --git "):
+            match = _FILE_HEADER_RE.match(line)
+            current = None
+            old_left = new_left = 0
+            if match and match.group(2) not in files:
+                current = files[match.group(2)] = FileDiff(match.group(2))
+            continue
+        if current is None or not line.startswith("@@ "):
+            # File headers (index, ---, +++, mode changes) or the "\" marker after a hunk's last line.
+            if current is not None and line.startswith("\\") and current.hunks:
+                position += 1
+            continue
+        match = _HUNK_HEADER_RE.match(line)
+        if not match:
+            continue
+        position = position + 1 if current.hunks else 0
+        old_line, old_left = int(match.group(1)), int(match.group(2) or 1)
+        new_line, new_left = int(match.group(3)), int(match.group(4) or 1)
+        current.hunks.append(Hunk(old_line, old_left, new_line, new_left, position))
+    return DiffIndex(files)
+
+
+@lru_cache(maxsize=4)
+def diff_index(diff: str) -> DiffIndex:
+    """`parse_diff(diff)`, memoized for the few diffs handled at a time."""
+    return parse_diff(diff)
@@ -0,0 +1,140 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Diff Stream
+Collects a PR diff from a streamed HTTP response without holding more than
+`HARPERBOT_MAX_DIFF_BYTES` of it in memory. Whole lines are kept up to the cap,
+bytes and lines are counted per file, and the complete diff can optionally be
+spilled to a temporary file.
+"""
+
+import os
+import re
+import tempfile
+from dataclasses import dataclass, field
+
+# Diffs larger than this are cut at the last whole line before it (0 = no cap).
+MAX_DIFF_BYTES = int(os.getenv("HARPERBOT_MAX_DIFF_BYTES", str(8 * 1024 * 1024)))
+STREAM_CHUNK_BYTES = 64 * 1024
+
+_FILE_HEADER_RE = re.compile(rb"^diff --git a/(.+?) b/(.+)$", re.MULTILINE)
+
+
+@dataclass
+class FileSize:
+    """Bytes and lines of one file's section of a diff, headers included."""
+
+    path: str
+    bytes: int = 0
+    lines: int = 0
+
+
+@dataclass
+class FetchedDiff:
+    """
+    A downloaded diff. `text` holds at most the byte cap, and `truncated` says
+    whether anything was left out. `total_bytes` counts what was read from the
+    response. `files` covers the kept text, or the whole diff when it was
+    spilled to `spill_path` (which the caller deletes).
+    """
+
+    text: str = ""
+    truncated: bool = False
+    total_bytes: int = 0
+    files: dict = field(default_factory=dict)
+    spill_path: str | None = None
+
+
+class DiffAccumulator:
+    """
+    Feed it the chunks of a diff response; `feed` returns False once the rest is not needed.
+
+    With `spill=True` the whole response goes to a temporary file, and the
+    per-file counts keep covering it after the in-memory cap is reached.
+    """
+
+    def __init__(self, max_bytes: int = MAX_DIFF_BYTES, *, spill: bool = False):
+        self.max_bytes = max_bytes
+        self.truncated = False
+        self.total_bytes = 0
+        self.files = {}
+        self._current = None
+        self._kept = []
+        self._kept_bytes = 0
+        self._partial = b""
+        self._spill = None
+        if spill:
+            self._spill = tempfile.NamedTemporaryFile(prefix="harperbot-diff-", suffix=".diff", delete=False)
+
+    def _count(self, data: bytes):
+        start = 0
+        for match in _FILE_HEADER_RE.finditer(data):
+            self._count_span(data, start, match.start())
+            path = match.group(2).decode("utf-8", errors="replace")
+            self._current = self.files.setdefault(path, FileSize(path))
+            start = match.start()
+        self._count_span(data, start, len(data))
+
+    def _count_span(self, data: bytes, start: int, end: int):
+        # Anything before the first file header belongs to no file.
+        if self._current is not None and end > start:
+            self._current.bytes += end - start
+            self._current.lines += data.count(b"\n", start, end)
+
+    def _keep(self, lines: bytes) -> bytes:
+        """Keep whole `lines` up to the cap and return the part that was kept."""
+        room = self.max_bytes - self._kept_bytes if self.max_bytes else len(lines)
+        if len(lines) > room:
+            lines = lines[: lines.rfind(b"\n", 0, room) + 1]
+            self.truncated = True
+        self._kept.append(lines)
+        self._kept_bytes += len(lines)
+        self._count(lines)
+        return lines
+
+    def feed(self, chunk: bytes) -> bool:
+        self.total_bytes += len(chunk)
+        if self._spill is not None:
+            self._spill.write(chunk)
+        data = self._partial + chunk
+        end = data.rfind(b"\n") + 1
+        lines, self._partial = data[:end], data[end:]
+        rest = lines if self.truncated else lines[len(self._keep(lines)) :]
+        if rest and self._spill is not None:
+            self._count(rest)
+        if not self.truncated and self.max_bytes and len(self._partial) > self.max_bytes - self._kept_bytes:
+            # A single line longer than the room left.
+            self.truncated = True
+        if self.truncated and self._spill is None:
+            self._partial = b""
+            return False
+        return True
+
+    def finish(self) -> FetchedDiff:
+        if self._partial:
+            # The last line had no newline (it fits: `feed` checked).
+            if not self.truncated:
+                self._kept.append(self._partial)
+            self._count(self._partial)
+            if self._current is not None:
+                self._current.lines += 1
+            self._partial = b""
+        spill_path = None
+        if self._spill is not None:
+            self._spill.close()
+            spill_path = self._spill.name
+        return FetchedDiff(
+            text=b"".join(self._kept).decode("utf-8", errors="replace"),
+            truncated=self.truncated,
+            total_bytes=self.total_bytes,
+            files=self.files,
+            spill_path=spill_path,
+        )
+
+    def discard(self):
+        """Drop a failed download, removing its spill file."""
+        if self._spill is not None:
+            self._spill.close()
+            os.unlink(self._spill.name)
+            self._spill = None
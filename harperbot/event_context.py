@@ -0,0 +1,163 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Event Context
+Request-scoped cache of the repository, pull request, issue, labels and comments
+for one webhook event, plus a count of the GitHub API calls the event made.
+Labels, comments and reviews come from a single GraphQL snapshot when possible.
+"""
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    from . import metrics
+    from .snapshot import SnapshotComment, load_pr_snapshot
+except ImportError:
+    import metrics
+    from snapshot import SnapshotComment, load_pr_snapshot
+
+_SNAPSHOT_UNAVAILABLE = object()
+
+_current_event = ContextVar("harperbot_event", default=None)
+
+
+class EventContext:
+    """
+    GitHub objects for one PR, each fetched at most once.
+
+    `github` may be assigned after construction (once the installation client is
+    known) so the token exchange is counted against the event as well.
+    """
+
+    def __init__(self, repo_name: str, pr_number: int, github=None):
+        self.repo_name = repo_name
+        self.pr_number = pr_number
+        self.github = github
+        self.api_calls = 0
+        self._repo = None
+        self._pr = None
+        self._issue = None
+        self._label_names = None
+        self._issue_comments = None
+        self._editable_comments = {}
+        self._snapshot = None
+
+    def matches(self, repo_name: str, pr_number: int) -> bool:
+        return self.repo_name == repo_name and self.pr_number == pr_number
+
+    @property
+    def repo(self):
+        if self._repo is None:
+            # Lazy: nothing is fetched until an attribute of the repository itself is read.
+            self._repo = self.github.get_repo(self.repo_name, lazy=True)
+        return self._repo
+
+    @property
+    def pr(self):
+        if self._pr is None:
+            self._pr = self.repo.get_pull(self.pr_number)
+        return self._pr
+
+    @property
+    def issue(self):
+        if self._issue is None:
+            self._issue = self.repo.get_issue(number=self.pr_number)
+        return self._issue
+
+    @property
+    def snapshot(self):
+        """
+        The PRSnapshot for this PR, loaded with one GraphQL round trip.
+
+        None if GraphQL is unavailable (e.g. an older GitHub Enterprise Server); callers
+        then fall back to the paginated REST calls.
+        """
+        if self._snapshot is None:
+            try:
+                self._snapshot = load_pr_snapshot(self.github, self.repo_name, self.pr_number)
+            except Exception as e:
+                logging.warning(f"GraphQL snapshot failed for {self.repo_name}#{self.pr_number}, using REST: {str(e)}")
+                self._snapshot = _SNAPSHOT_UNAVAILABLE
+        return None if self._snapshot is _SNAPSHOT_UNAVAILABLE else self._snapshot
+
+    @property
+    def label_names(self) -> set:
+        if self._label_names is None:
+            snapshot = self.snapshot
+            if snapshot is not None:
+                self._label_names = set(snapshot.labels)
+            else:
+                self._label_names = {label.name for label in self.issue.get_labels()}
+        return self._label_names
+
+    @property
+    def issue_comments(self) -> list:
+        """PR conversation comments (anything with `.id` and `.body`) as of the first read in this event."""
+        if self._issue_comments is None:
+            snapshot = self.snapshot
+            if snapshot is not None:
+                self._issue_comments = list(snapshot.comments)
+            else:
+                self._issue_comments = list(self.pr.get_issue_comments())
+        return self._issue_comments
+
+    @property
+    def reviews(self) -> list | None:
+        """Reviews from the snapshot, or None to let callers list them over REST."""
+        snapshot = self.snapshot
+        return list(snapshot.reviews) if snapshot is not None else None
+
+    def editable_comment(self, comment):
+        """Return a PyGithub IssueComment for an entry of `issue_comments` (fetched once per comment)."""
+        if isinstance(comment, SnapshotComment):
+            if comment.id not in self._editable_comments:
+                self._editable_comments[comment.id] = self.pr.get_issue_comment(comment.id)
+            return self._editable_comments[comment.id]
+        return comment
+
+    def remember_issue_comment(self, comment):
+        """Add a comment this event created to `issue_comments`, so later stages edit it instead of posting another."""
+        self.issue_comments.append(comment)
+
+
+@contextmanager
+def github_event(repo_name: str, pr_number: int):
+    """
+    Make an EventContext current for the duration of the block.
+
+    Nested handlers for the same PR (e.g. `/analyze` running an analysis) share the
+    outer context; the outermost block logs and exports the API call count.
+    """
+    current = _current_event.get()
+    if current is not None and current.matches(repo_name, pr_number):
+        yield current
+        return
+    event = EventContext(repo_name, pr_number)
+    token = _current_event.set(event)
+    try:
+        yield event
+    finally:
+        _current_event.reset(token)
+        metrics.increment("github_events")
+        logging.info(f"GitHub API calls for {repo_name}#{pr_number}: {event.api_calls}")
+
+
+def current_event(repo_name: str, pr_number: int, github) -> EventContext:
+    """Return the current EventContext for this PR, or a standalone one outside an event."""
+    current = _current_event.get()
+    if current is not None and current.matches(repo_name, pr_number):
+        if current.github is None:
+            current.github = github
+        return current
+    return EventContext(repo_name, pr_number, github)
+
+
+def record_api_call():
+    """Count one GitHub HTTP request against the process totals and the current event."""
+    metrics.increment("github_api_calls")
+    current = _current_event.get()
+    if current is not None:
+        current.api_calls += 1
@@ -7,33 +7,101 @@ Supports both CLI and webhook modes.
 """
 
 import argparse
+import base64
+import binascii
+import contextvars
 import hashlib
 import hmac
+import itertools
 import logging
 import os
 import re
 import sys
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
-import google.genai as genai
-import requests
-import yaml
-from dotenv import load_dotenv
-from github import Auth, Github
-from github.GithubException import GithubException
-from google.genai import errors as genai_errors
-from google.genai import types
-
 PAUSE_LABEL = "harperbot:paused"
 QUOTA_COOLDOWN_SECONDS = int(os.getenv("HARPERBOT_QUOTA_COOLDOWN_SECONDS", "1800"))
 QUOTA_UNTIL_MARKER_RE = re.compile(r"harperbot-quota-until:\s*(\d+)")
 ENABLE_RANGE_COMMENTS = os.getenv("HARPERBOT_ENABLE_RANGE_COMMENTS", "0").strip().lower() in {"1", "true", "yes", "on"}
 
 try:
+    from . import metrics
+    from .analysis_cache import analysis_cache_key, get_analysis_cache, posted_analysis_key
+    from .analysis_parser import LENGTH_CAP_MARKER, parsed_analysis
+    from .context_cache import GeminiCacheBackend, cached_generate_config, forget_stale_cache
+    from .deliveries import get_delivery_cache
+    from .diff_budget import budget_diff, drop_generated, estimate_tokens, gemini_token_counter
+    from .diff_index import diff_index
+    from .diff_stream import MAX_DIFF_BYTES, STREAM_CHUNK_BYTES, DiffAccumulator, FetchedDiff
+    from .event_context import current_event, github_event
     from .harperbot_apply import handle_apply_comment
+    from .incremental import FindingGroup, Findings, load_findings, patch_hashes, pending_diff, reusable_groups, save_findings
+    from .jobqueue import SYNC_DEBOUNCE_SECONDS, WORKER_CONCURRENCY, JobQueue, get_job_queue, run_worker
+    from .lazy import lazy_attribute, lazy_module
+    from .mapreduce import merge_analyses, split_diff
+    from .quota import QuotaCooldown, current_cooldown_until, ensure_quota_available, record_quota_error
+    from .resilience import (
+        CircuitOpen,
+        Deadline,
+        GeminiDeadlineExceeded,
+        get_circuit_breaker,
+        hedge_delay,
+        hedged,
+        next_retry_delay,
+    )
+    from .routing import record_latency, route_model, routing_size
+    from .sanitizer import sanitize_markup
+    from .scheduler import GeminiQueueTimeout, gemini_caller, get_gemini_scheduler
+    from .settings import CONFIG_PATH, ConfigError, ConfigLoader, get_config
 except ImportError:
+    import metrics
+    from analysis_cache import analysis_cache_key, get_analysis_cache, posted_analysis_key
+    from analysis_parser import LENGTH_CAP_MARKER, parsed_analysis
+    from context_cache import GeminiCacheBackend, cached_generate_config, forget_stale_cache
+    from deliveries import get_delivery_cache
+    from diff_budget import budget_diff, drop_generated, estimate_tokens, gemini_token_counter
+    from diff_index import diff_index
+    from diff_stream import MAX_DIFF_BYTES, STREAM_CHUNK_BYTES, DiffAccumulator, FetchedDiff
+    from event_context import current_event, github_event
     from harperbot_apply import handle_apply_comment
+    from incremental import FindingGroup, Findings, load_findings, patch_hashes, pending_diff, reusable_groups, save_findings
+    from jobqueue import SYNC_DEBOUNCE_SECONDS, WORKER_CONCURRENCY, JobQueue, get_job_queue, run_worker
+    from lazy import lazy_attribute, lazy_module
+    from mapreduce import merge_analyses, split_diff
+    from quota import QuotaCooldown, current_cooldown_until, ensure_quota_available, record_quota_error
+    from resilience import (
+        CircuitOpen,
+        Deadline,
+        GeminiDeadlineExceeded,
+        get_circuit_breaker,
+        hedge_delay,
+        hedged,
+        next_retry_delay,
+    )
+    from routing import record_latency, route_model, routing_size
+    from sanitizer import sanitize_markup
+    from scheduler import GeminiQueueTimeout, gemini_caller, get_gemini_scheduler
+    from settings import CONFIG_PATH, ConfigError, ConfigLoader, get_config
+
+# Heavy dependencies are imported on first use, so events that never reach GitHub or
+# Gemini (pings, ignored actions, duplicates) do not pay for them on a cold start.
+# See test/benchmarks/bench_import_time.py for the import-time budget.
+genai = lazy_module("google.genai")
+genai_errors = lazy_module("google.genai.errors")
+types = lazy_module("google.genai.types")
+github = lazy_module("github")
+Auth = lazy_module("github.Auth")
+Github = lazy_attribute("github", "Github")
+requests = lazy_module("requests")
+load_dotenv = lazy_attribute("dotenv", "load_dotenv")
+
+_SIBLING_PREFIX = f"{__package__}." if __package__ else ""
+get_credential_cache = lazy_attribute(f"{_SIBLING_PREFIX}credentials", "get_credential_cache")
+get_http_session = lazy_attribute(f"{_SIBLING_PREFIX}http_session", "get_http_session")
+install_github_session = lazy_attribute(f"{_SIBLING_PREFIX}http_session", "install_github_session")
 
 # Flask imported conditionally for webhook mode
 flask_available = False
@@ -47,6 +115,18 @@ try:
     def webhook():
         return webhook_handler()
 
+    @app.route("/metrics", methods=["GET"])
+    def metrics_endpoint():
+        return jsonify(metrics.snapshot())
+
+    def create_app():
+        """
+        Return the Flask app once config.yaml is validated, so a WSGI server fails at
+        startup on a bad config, as the ASGI lifespan does: gunicorn 'harperbot.harperbot:create_app()'
+        """
+        load_config()
+        return app
+
 except ImportError:
     # Allow non-Flask environments (CLI/tests) to import and call helpers that
     # return JSON-ish payloads.
@@ -57,23 +137,62 @@ except ImportError:
 
 
 def fetch_pr_diff(diff_url: str, token: str | None) -> str:
+    """The PR diff text (up to HARPERBOT_MAX_DIFF_BYTES), or "" on failure."""
+    return stream_pr_diff(diff_url, token).text
+
+
+def stream_pr_diff(diff_url: str, token: str | None, *, max_bytes: int = MAX_DIFF_BYTES, spill: bool = False) -> FetchedDiff:
+    """
+    Download the PR diff incrementally, keeping at most `max_bytes` of it (see diff_stream.py).
+
+    Returns an empty FetchedDiff (and logs) on any failure.
+    """
     headers = {"Accept": "application/vnd.github.v3.diff"}
     if token:
         headers["Authorization"] = f"token {token}"
     try:
-        response = requests.get(diff_url, headers=headers, timeout=20)
+        response = get_http_session().get(diff_url, headers=headers, timeout=20, stream=True)
     except requests.RequestException as e:
         logging.warning(f"Failed to fetch PR diff: {str(e)}")
-        return ""
+        return FetchedDiff()
+
+    try:
+        if response.status_code != 200:
+            snippet = (response.text or "").strip().replace("\n", " ")
+            if len(snippet) > 200:
+                snippet = snippet[:200] + "…"
+            logging.warning(f"Failed to fetch PR diff (HTTP {response.status_code}): {snippet}")
+            return FetchedDiff()
+
+        accumulator = DiffAccumulator(max_bytes, spill=spill)
+        try:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_BYTES):
+                if not accumulator.feed(chunk):
+                    break
+        except requests.RequestException as e:
+            accumulator.discard()
+            logging.warning(f"Failed to fetch PR diff: {str(e)}")
+            return FetchedDiff()
+    finally:
+        response.close()
+    return finished_diff(accumulator)
 
-    if response.status_code != 200:
-        snippet = (response.text or "").strip().replace("\n", " ")
-        if len(snippet) > 200:
-            snippet = snippet[:200] + "…"
-        logging.warning(f"Failed to fetch PR diff (HTTP {response.status_code}): {snippet}")
-        return ""
 
-    return response.text or ""
+def finished_diff(accumulator: DiffAccumulator) -> FetchedDiff:
+    """Finish a streamed download, logging and counting a diff cut at the byte cap."""
+    fetched = accumulator.finish()
+    if fetched.truncated:
+        metrics.increment("diffs_truncated")
+        logging.warning(f"PR diff exceeds {accumulator.max_bytes} bytes; reviewing its first {len(fetched.text)} characters")
+    return fetched
+
+
+def attach_diff(details: dict, fetched: FetchedDiff) -> dict:
+    """Store a downloaded diff, its truncation flag and per-file sizes in `details`."""
+    details["diff"] = fetched.text
+    details["diff_truncated"] = fetched.truncated
+    details["diff_files"] = fetched.files
+    return details
 
 
 def get_build_string() -> str:
@@ -92,53 +211,12 @@ def get_build_string() -> str:
 
 def find_diff_position(diff, file_path, line_number):
     """
-    Find the position in the diff hunk for a given file and line number.
-
-    Parses the unified diff to locate the hunk containing the specified line,
-    then calculates the position within that hunk for inline comments.
-    """
-    lines = diff.split("\n")
-    i = 0
-    while i < len(lines):
-        # Look for the diff header for the specific file
-        if lines[i].startswith("diff --git") and f"b/{file_path}" in lines[i]:
-            i += 1  # Skip the header
-            # Process hunks for this file
-            while i < len(lines):
-                if lines[i].startswith("@@"):
-                    # Parse hunk header to get starting line in new file
-                    match = re.match(r"@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@", lines[i])
-                    if match:
-                        hunk_start = int(match.group(1))
-                        i += 1  # Move to hunk content
-                        # Collect all lines in this hunk
-                        hunk_lines = []
-                        while i < len(lines) and not lines[i].startswith("@@") and not lines[i].startswith("diff --git"):
-                            hunk_lines.append(lines[i])
-                            i += 1
-                        # Find the position of the target line in the hunk
-                        # Simulate line numbers in the new file
-                        current_line = hunk_start
-                        position = 1
-                        for line in hunk_lines:
-                            if line.startswith("+"):
-                                if current_line == line_number:
-                                    return position
-                                current_line += 1
-                            elif line.startswith("-"):
-                                # Removed line, no change to current_line
-                                pass
-                            else:
-                                # Context line
-                                current_line += 1
-                            position += 1
-                elif lines[i].startswith("diff --git"):
-                    break
-                else:
-                    i += 1
-        else:
-            i += 1
-    return None  # Line not found in any hunk
+    Find the diff position of a line of the new file, for `position`-based inline comments.
+
+    Positions count from the file's first hunk header, as GitHub's do; returns
+    None when the line is not part of the diff.
+    """
+    return diff_index(diff).position(file_path, line_number)
 
 
 def setup_environment():
@@ -160,12 +238,27 @@ def setup_environment():
 
     # Create Gemini client
     client = genai.Client(api_key=gemini_api_key)
+    install_github_session()
     return github_token, client
 
 
+def get_github_client(github_token: str):
+    """
+    Return a Github client for `github_token`.
+
+    Installation tokens minted by setup_environment_webhook already have a cached
+    client; any other token gets a new client on the shared connection pool.
+    """
+    install_github_session()
+    cached = get_credential_cache().find_client(github_token)
+    if cached is not None:
+        return cached
+    return Github(auth=Auth.Token(github_token))
+
+
 def get_pr_details(github_token, repo_name, pr_number):
     """Fetch PR details from GitHub."""
-    g = Github(auth=Auth.Token(github_token))
+    g = get_github_client(github_token)
     repo = g.get_repo(repo_name)
     pr = repo.get_pull(pr_number)
 
@@ -173,361 +266,826 @@ def get_pr_details(github_token, repo_name, pr_number):
     files_changed = [f.filename for f in pr.get_files()]
     diff_url = pr.diff_url
 
-    # Get diff content
-    diff_content = fetch_pr_diff(diff_url, github_token)
-
-    return {
+    details = {
         "title": pr.title,
         "body": pr.body or "",
         "author": pr.user.login,
         "files_changed": files_changed,
-        "diff": diff_content,
         "base": pr.base.ref,
         "head": pr.head.ref,
         "head_sha": pr.head.sha,
         "number": pr_number,
     }
+    return attach_diff(details, stream_pr_diff(diff_url, github_token))
 
 
 def load_config():
     """
-    Load configuration from config.yaml with defaults.
+    Return the validated configuration from config.yaml, merged over the defaults.
 
     Supports customization of analysis focus, model, limits, and AI prompt.
-    Users can modify config.yaml to change bot behavior without code changes.
-    """
-    default_prompt = """**Files Changed** ({num_files}):
-{files_list}
-
-```diff
-{diff_content}
-```
-
-{focus_instruction}
-
-Provide a concise code review analysis in this format:
-
-## Summary
-[Brief overview of changes and purpose]
-
-### Scores
-- Code Quality: [score]/10
-- Maintainability: [score]/10
-- Security: [score]/10
-
-### Strengths
-- [Key positives]
-- [What's working well]
-
-### Areas Needing Attention
-- [Potential issues or improvements]
-- [Be specific and constructive]
-
-### Recommendations
-- [Specific suggestions for code, docs, or tests]
-
-### Code Suggestions
-- [Provide specific code changes as diff blocks]
-- [Use ```diff format for each suggestion]
-
-### Next Steps
-- [Actionable items for the author]"""
-
-    default_config = {
-        "focus": "all",
-        "model": "gemini-2.5-flash",
-        "max_diff_length": 4000,
-        "temperature": 0.2,
-        "max_output_tokens": 8192,
-        # When enabled, a manual `/analyze` will post a new PR review even if one already exists
-        # for the current head SHA. This can create extra reviews; prefer `/analyze --force-review`
-        # for one-off reruns.
-        "force_review_on_analyze": False,
-        "enable_authoring": False,
-        "auto_commit_suggestions": False,
-        "create_improvement_prs": False,
-        "improvement_branch_pattern": "harperbot-improvements-{timestamp}",
-        "prompt": default_prompt,
-        "safety_settings": [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ],
+    Users can modify config.yaml to change bot behavior without code changes; the
+    file is parsed once and re-read only when it changes (see settings.py).
+    Raises settings.ConfigError if the file is invalid on first load.
+    """
+    return get_config()
+
+
+def build_gemini_request(pr_details, client=None):
+    """
+    Return `(model_name, prompt, generate_config, max_output_tokens)` for analyzing a PR.
+
+    Shared by the sync and async analysis paths. `client` is only used for
+    `count_tokens` when `token_counter: api` is configured.
+    """
+    config = load_config()
+    model_name = config.get("model", "gemini-2.5-flash")
+    focus = config.get("focus", "all")
+    temperature = config.get("temperature", 0.2)
+    max_output_tokens = config.get("max_output_tokens", 8192)
+    safety_settings = config.get("safety_settings", [])
+
+    thinking_budget = None
+
+    # Route by PR size to a model tier (see routing.py); without `model_tiers`, `model` is used.
+    tier = route_model(config, pr_details)
+    if tier is not None:
+        model_name = tier.model or model_name
+        max_output_tokens = tier.max_output_tokens or max_output_tokens
+        thinking_budget = tier.thinking_budget
+        logging.info(f"Analyzing PR #{pr_details.get('number', 'unknown')} with the {tier.name} tier ({model_name})")
+
+    # Prepare the prompt based on focus
+    focus_instructions = {
+        "security": "Focus primarily on security concerns, authentication, data handling, and potential vulnerabilities.",
+        "performance": "Focus primarily on performance optimizations, efficiency, and potential bottlenecks.",
+        "quality": "Focus primarily on code quality, maintainability, readability, and best practices.",
     }
-    config_path = os.path.join(os.path.dirname(__file__), "config.yaml")
-    if os.path.exists(config_path):
-        with open(config_path, "r") as f:
-            try:
-                user_config = yaml.safe_load(f) or {}
-                return {**default_config, **user_config}
-            except yaml.YAMLError as e:
-                logging.error(f"Error loading config.yaml: {e}")
-                return default_config
-    return default_config
+    focus_instruction = focus_instructions.get(focus, "")
+
+    # Static instructions go in the system instruction, which context caching can store (see context_cache.py).
+    system_instruction = config.get("system_instruction", "").replace("{focus_instruction}", focus_instruction).strip()
+
+    # Use configurable prompt template
+    prompt_template = config["prompt"]
+    files_list = ", ".join(pr_details["files_changed"])
+    diff_content = prompt_diff(pr_details, config, model_name, client)
+    formatted_prompt = prompt_template.format(
+        # Preferred placeholders (used by the built-in default prompt)
+        num_files=len(pr_details["files_changed"]),
+        files_list=files_list,
+        diff_content=diff_content,
+        # Backward-compatible placeholders (used by harperbot/config.yaml)
+        files=files_list,
+        diff=diff_content,
+        focus_instruction=focus_instruction,
+    )
 
+    generate_config = types.GenerateContentConfig(
+        temperature=temperature,
+        top_p=0.95,
+        top_k=40,
+        max_output_tokens=max_output_tokens,
+        safety_settings=[dict(setting) for setting in safety_settings],
+        thinking_config=None if thinking_budget is None else types.ThinkingConfig(thinking_budget=thinking_budget),
+        system_instruction=system_instruction or None,
+    )
+
+    return model_name, formatted_prompt, generate_config, max_output_tokens
 
-def analyze_with_gemini(client, pr_details):
-    """Analyze the PR using Gemini API."""
-    try:
-        config = load_config()
-        model_name = config.get("model", "gemini-2.5-flash")
-        focus = config.get("focus", "all")
-        max_diff = config.get("max_diff_length", 4000)
-        temperature = config.get("temperature", 0.2)
-        max_output_tokens = config.get("max_output_tokens", 8192)
-        safety_settings = config.get("safety_settings", [])
-
-        # Auto-select model based on PR complexity
-        diff_length = len(pr_details["diff"])
-        num_files = len(pr_details["files_changed"])
-        if diff_length > 10000 or num_files > 10:
-            model_name = "gemini-2.5-flash"  # More powerful model for complex PRs
-        # For simple PRs, use the configured model (default gemini-2.5-flash)
-
-        # Use client for selected model
-
-        # Prepare the prompt based on focus
-        focus_instructions = {
-            "security": "Focus primarily on security concerns, authentication, data handling, and potential vulnerabilities.",
-            "performance": "Focus primarily on performance optimizations, efficiency, and potential bottlenecks.",
-            "quality": "Focus primarily on code quality, maintainability, readability, and best practices.",
-        }
-        focus_instruction = focus_instructions.get(focus, "")
-
-        # Use configurable prompt template
-        prompt_template = config["prompt"]
-        files_list = ", ".join(pr_details["files_changed"])
-        diff_content = pr_details["diff"][:max_diff]
-        formatted_prompt = prompt_template.format(
-            # Preferred placeholders (used by the built-in default prompt)
-            num_files=len(pr_details["files_changed"]),
-            files_list=files_list,
-            diff_content=diff_content,
-            # Backward-compatible placeholders (used by harperbot/config.yaml)
-            files=files_list,
-            diff=diff_content,
-            focus_instruction=focus_instruction,
-        )
 
-        # Generate content with retries for transient failures (5xx, network).
-        generate_config = types.GenerateContentConfig(
-            temperature=temperature,
-            top_p=0.95,
-            top_k=40,
-            max_output_tokens=max_output_tokens,
-            safety_settings=safety_settings,
+def prompt_diff(pr_details, config, model_name, client=None) -> str:
+    """
+    The diff text for the prompt: cut at `max_diff_length` characters, or, with
+    `max_diff_tokens` set, fitted into that many tokens by diff_budget.budget_diff.
+    """
+    max_diff_tokens = config.get("max_diff_tokens", 0)
+    if not max_diff_tokens:
+        return pr_details["diff"][: config.get("max_diff_length", 4000)]
+    count_tokens = estimate_tokens
+    if client is not None and config.get("token_counter", "local") == "api":
+        count_tokens = gemini_token_counter(
+            lambda model, sample: count_gemini_tokens(client, model, sample), model_name, pr_details["diff"]
         )
+    budgeted = budget_diff(
+        pr_details["diff"],
+        max_diff_tokens,
+        generated_files=config.get("generated_files", ()),
+        gitattributes=pr_details.get("gitattributes", ""),
+        count_tokens=count_tokens,
+    )
+    if budgeted.omitted:
+        logging.info(f"Left {len(budgeted.omitted)} files out of the prompt for PR #{pr_details.get('number', 'unknown')}")
+    return budgeted.text
 
-        for attempt in range(3):
-            try:
-                response = client.models.generate_content(
-                    model=model_name,
-                    contents=formatted_prompt,
-                    config=generate_config,
-                )
-                break
-            except genai_errors.ServerError:
-                if attempt < 2:
-                    time.sleep(2**attempt)
-                    continue
-                raise
-            except Exception as e:
-                # Retry common transient network failures surfaced as generic exceptions.
-                transient_markers = (
-                    "timeout",
-                    "timed out",
-                    "temporarily unavailable",
-                    "connection reset",
-                    "connection aborted",
-                    "connection refused",
-                    "name or service not known",
-                    "dns",
-                )
-                if attempt < 2 and any(m in str(e).lower() for m in transient_markers):
-                    time.sleep(2**attempt)
-                    continue
-                raise
 
-        # Handle different response formats
-        def extract_text(resp):
-            """
-            Extract text from Gemini API response object.
+def count_gemini_tokens(client, model_name: str, text: str) -> int:
+    """
+    `count_tokens` for `text`, under the scheduler's concurrency and request limits,
+    the quota cooldown and the model's circuit breaker, like a generate call.
+    """
+    with get_gemini_scheduler().slot():
+        ensure_quota_available()
+        with get_circuit_breaker(model_name).guard():
+            return client.models.count_tokens(model=model_name, contents=text).total_tokens
 
-            Attempts to extract text from various possible response structures:
-            - Direct text attribute
-            - Candidates with content parts
-            - Direct parts array
 
-            Args:
-                resp: The response object from Gemini API
+def extract_text(resp, max_output_tokens):
+    """
+    Extract text from Gemini API response object.
 
-            Returns:
-                str: Sanitized extracted text, or None if extraction fails
-            """
-            try:
-                # Try the standard text accessor first
-                if getattr(resp, "text", None):
-                    text = resp.text.strip()
-                    logging.debug(f"Extracted text from direct response.text (length: {len(text)})")
-                    # Check if text ends abruptly (might indicate incomplete response)
-                    if len(text) > 50 and not text.endswith((".", "!", "?", "\n", "```")):
-                        logging.warning(f"Response text appears incomplete - ends with: '{text[-50:]}'")
-                    return sanitize_text(text)
-
-                # Try candidates structure (most common for Gemini API)
-                candidates = getattr(resp, "candidates", None)
-                if candidates:
-                    logging.debug(f"Found {len(candidates)} candidates")
-                    for i, candidate in enumerate(candidates):
-                        content = getattr(candidate, "content", None)
-                        if content and getattr(content, "parts", None):
-                            parts = [getattr(part, "text", "") for part in content.parts if getattr(part, "text", None)]
-                            if parts:
-                                text = "\n".join(parts).strip()
-                                logging.debug(f"Extracted text from candidate {i} (length: {len(text)})")
-                                # Check if text ends abruptly
-                                if len(text) > 50 and not text.endswith((".", "!", "?", "\n", "```")):
-                                    logging.warning(
-                                        f"Response text from candidate {i} appears incomplete - ends with: '{text[-50:]}'"
-                                    )
-                                return sanitize_text(text)
-
-                # Try direct parts access as fallback
-                parts = getattr(resp, "parts", None)
-                if parts:
-                    parts = [getattr(part, "text", "") for part in parts if getattr(part, "text", None)]
+    Attempts to extract text from various possible response structures:
+    - Direct text attribute
+    - Candidates with content parts
+    - Direct parts array
+
+    Args:
+        resp: The response object from Gemini API
+
+    Returns:
+        str: Sanitized extracted text, or None if extraction fails
+    """
+    try:
+        # Try the standard text accessor first
+        if getattr(resp, "text", None):
+            text = resp.text.strip()
+            logging.debug(f"Extracted text from direct response.text (length: {len(text)})")
+            # Check if text ends abruptly (might indicate incomplete response)
+            if len(text) > 50 and not text.endswith((".", "!", "?", "\n", "```")):
+                logging.warning(f"Response text appears incomplete - ends with: '{text[-50:]}'")
+            return sanitize_text(text, max_output_tokens)
+
+        # Try candidates structure (most common for Gemini API)
+        candidates = getattr(resp, "candidates", None)
+        if candidates:
+            logging.debug(f"Found {len(candidates)} candidates")
+            for i, candidate in enumerate(candidates):
+                content = getattr(candidate, "content", None)
+                if content and getattr(content, "parts", None):
+                    parts = [getattr(part, "text", "") for part in content.parts if getattr(part, "text", None)]
                     if parts:
                         text = "\n".join(parts).strip()
-                        logging.debug(f"Extracted text from direct response.parts (length: {len(text)})")
+                        logging.debug(f"Extracted text from candidate {i} (length: {len(text)})")
                         # Check if text ends abruptly
                         if len(text) > 50 and not text.endswith((".", "!", "?", "\n", "```")):
-                            logging.warning(f"Response text from direct parts appears incomplete - ends with: '{text[-50:]}'")
-                        return sanitize_text(text)
+                            logging.warning(f"Response text from candidate {i} appears incomplete - ends with: '{text[-50:]}'")
+                        return sanitize_text(text, max_output_tokens)
+
+        # Try direct parts access as fallback
+        parts = getattr(resp, "parts", None)
+        if parts:
+            parts = [getattr(part, "text", "") for part in parts if getattr(part, "text", None)]
+            if parts:
+                text = "\n".join(parts).strip()
+                logging.debug(f"Extracted text from direct response.parts (length: {len(text)})")
+                # Check if text ends abruptly
+                if len(text) > 50 and not text.endswith((".", "!", "?", "\n", "```")):
+                    logging.warning(f"Response text from direct parts appears incomplete - ends with: '{text[-50:]}'")
+                return sanitize_text(text, max_output_tokens)
+
+        logging.warning("No text found in any response structure")
+    except Exception as extract_error:
+        logging.error(f"Error during text extraction: {str(extract_error)}")
+        return None
 
-                logging.warning("No text found in any response structure")
-            except Exception as extract_error:
-                logging.error(f"Error during text extraction: {str(extract_error)}")
-                return None
+    return None
+
+
+def sanitize_text(text, max_output_tokens):
+    """Comprehensive sanitization of extracted text for security."""
+    if not text:
+        return text
+    # Remove HTML tags, javascript: URLs and event handlers; fenced code is kept as written.
+    text = sanitize_markup(text)
+    # Keep the character cap aligned with the configured token budget.
+    max_sanitized_chars = max(20000, max_output_tokens * 4)
+    if len(text) > max_sanitized_chars:
+        logging.warning(
+            "Sanitized Gemini response exceeded %s chars; truncating to fit downstream limits",
+            max_sanitized_chars,
+        )
+        text = text[:max_sanitized_chars] + LENGTH_CAP_MARKER
+    return text.strip()
 
-            return None
 
-        def sanitize_text(text):
-            """Comprehensive sanitization of extracted text for security."""
-            if not text:
-                return text
-            # Remove potentially dangerous patterns
-            text = re.sub(r"</?script[^>]*>", "", text, flags=re.IGNORECASE)
-            text = re.sub(r"<[^>]+>", "", text)  # Remove all HTML tags
-            text = re.sub(r"javascript:", "", text, flags=re.IGNORECASE)
-            text = re.sub(r"on\w+\s*=", "", text, flags=re.IGNORECASE)  # Remove event handlers
-            # Keep the character cap aligned with the configured token budget.
-            max_sanitized_chars = max(20000, max_output_tokens * 4)
-            if len(text) > max_sanitized_chars:
-                logging.warning(
-                    "Sanitized Gemini response exceeded %s chars; truncating to fit downstream limits",
-                    max_sanitized_chars,
-                )
-                text = text[:max_sanitized_chars] + "... (truncated for length)"
-            return text.strip()
+TRUNCATED_ANALYSIS_MESSAGE = (
+    "Analysis truncated due to token limit. The code changes are too extensive for a complete analysis. "
+    "Please review manually or split into smaller PRs."
+)
+SAFETY_BLOCKED_MESSAGE = (
+    "Analysis blocked due to content safety filters. Please ensure the PR content complies with usage policies."
+)
+UNEXPECTED_FORMAT_MESSAGE = (
+    "Unable to generate analysis due to an unexpected response format. Please try again or review the code manually."
+)
 
-        try:
-            text = extract_text(response)
-            if text:
-                # Additional check for potentially incomplete responses
-                if len(text) < 100 and not any(
-                    indicator in text.lower() for indicator in ["analysis", "review", "summary", "changes"]
-                ):
-                    logging.warning(f"Response seems too short and may be incomplete (length: {len(text)}): {text[:200]}")
-                return text
-
-            # Check for finish reasons that indicate truncation or issues
-            candidates = getattr(response, "candidates", None)
-            if candidates:
-                for candidate in candidates:
-                    finish_reason = getattr(candidate, "finish_reason", None)
-                    if finish_reason:
-                        finish_str = str(finish_reason).upper()
-                        if "MAX" in finish_str and "TOKEN" in finish_str:
-                            logging.warning(f"Analysis truncated due to token limit (finish_reason: {finish_reason})")
-                            return "Analysis truncated due to token limit. The code changes are too extensive for a complete analysis. Please review manually or split into smaller PRs."
-                        elif "SAFETY" in finish_str:
-                            logging.warning(f"Analysis blocked due to safety filters (finish_reason: {finish_reason})")
-                            return "Analysis blocked due to content safety filters. Please ensure the PR content complies with usage policies."
-                        elif "STOP" in finish_str:
-                            logging.info(f"Analysis completed normally (finish_reason: {finish_reason})")
-                        else:
-                            logging.warning(f"Unexpected finish_reason: {finish_reason}")
-
-            # If we get here, no text found - log and return safe message
-            logging.warning(f"No text extracted from response. Response type: {type(response)}")
-            return "Unable to generate analysis due to an unexpected response format. Please try again or review the code manually."
 
-        except Exception as e:
-            # Log the error and return safe info
-            logging.error(f"Error processing Gemini response: {str(e)}")
-            return f"Error processing response: {str(e)}\n\nResponse type: {type(response)}"
+def gemini_response_text(response, max_output_tokens) -> tuple:
+    """
+    Turn a generate_content response into `(text, is_analysis)`.
+
+    `is_analysis` is False when `text` is a safe explanation (truncation, safety
+    block, unexpected format) rather than model output; only analyses are cached.
+    """
+    try:
+        text = extract_text(response, max_output_tokens)
+        if text:
+            # Additional check for potentially incomplete responses
+            if len(text) < 100 and not any(
+                indicator in text.lower() for indicator in ["analysis", "review", "summary", "changes"]
+            ):
+                logging.warning(f"Response seems too short and may be incomplete (length: {len(text)}): {text[:200]}")
+            return text, True
+
+        # Check for finish reasons that indicate truncation or issues
+        candidates = getattr(response, "candidates", None)
+        if candidates:
+            for candidate in candidates:
+                finish_reason = getattr(candidate, "finish_reason", None)
+                if finish_reason:
+                    finish_str = str(finish_reason).upper()
+                    if "MAX" in finish_str and "TOKEN" in finish_str:
+                        logging.warning(f"Analysis truncated due to token limit (finish_reason: {finish_reason})")
+                        return TRUNCATED_ANALYSIS_MESSAGE, False
+                    elif "SAFETY" in finish_str:
+                        logging.warning(f"Analysis blocked due to safety filters (finish_reason: {finish_reason})")
+                        return SAFETY_BLOCKED_MESSAGE, False
+                    elif "STOP" in finish_str:
+                        logging.info(f"Analysis completed normally (finish_reason: {finish_reason})")
+                    else:
+                        logging.warning(f"Unexpected finish_reason: {finish_reason}")
+
+        # If we get here, no text found - log and return safe message
+        logging.warning(f"No text extracted from response. Response type: {type(response)}")
+        return UNEXPECTED_FORMAT_MESSAGE, False
 
     except Exception as e:
-        context = (
-            f" (PR: {pr_details.get('title', 'Unknown')}, Model: {model_name}, Diff length: {len(pr_details.get('diff', ''))})"
-        )
+        # Log the error and return safe info
+        logging.error(f"Error processing Gemini response: {str(e)}")
+        return f"Error processing response: {str(e)}\n\nResponse type: {type(response)}", False
 
-        # Prefer structured API errors when available (google-genai).
-        if isinstance(e, genai_errors.ClientError):
-            code = getattr(e, "code", None)
-            status = getattr(e, "status", None)
-            message = getattr(e, "message", None)
-            lower_message = (message or str(e)).lower()
-
-            if code == 429 or "quota" in lower_message or "rate limit" in lower_message or "billing" in lower_message:
-                logging.exception(f"API quota/rate limit error{context}: {str(e)}")
-                return f"Error generating analysis: API quota exceeded{context}. Please check your billing or try again later."
-
-            if (
-                code in (401, 403)
-                or "api key" in lower_message
-                or "authentication" in lower_message
-                or "unauthorized" in lower_message
-            ):
-                logging.exception(f"API authentication error{context}: {str(e)}")
-                return (
-                    "Error generating analysis: Invalid API key or authentication failed"
-                    f"{context}. Please check your GEMINI_API_KEY or HARPERBOT_GEMINI_API_KEY."
-                )
 
-            if code == 404 or "model" in lower_message or "not found" in lower_message:
-                logging.exception(f"Model error{context}: {str(e)}")
-                return f"Error generating analysis: Requested model not available{context}. Please try again later."
+def describe_gemini_error(e, pr_details, model_name):
+    """Log a failed analysis and return the user-facing error message."""
+    context = (
+        f" (PR: {pr_details.get('title', 'Unknown')}, Model: {model_name}, Diff length: {len(pr_details.get('diff', ''))})"
+    )
 
-            logging.exception(f"API client error{context}: {str(e)}")
-            details = f" (HTTP {code} {status})" if code else ""
-            return f"Error generating analysis: API request failed{details}{context}. Please try again later."
+    if isinstance(e, QuotaCooldown):
+        logging.info(f"Skipped the Gemini call{context}: {str(e)}")
+        return f"Error generating analysis: API quota exceeded{context}. {str(e)}."
 
-        if isinstance(e, genai_errors.ServerError):
-            code = getattr(e, "code", None)
-            status = getattr(e, "status", None)
-            details = f" (HTTP {code} {status})" if code else ""
-            logging.exception(f"API server error{context}: {str(e)}")
-            return f"Error generating analysis: API unavailable{details}{context}. Please try again later."
+    if isinstance(e, CircuitOpen):
+        logging.warning(f"{str(e)}{context}")
+        return f"Error generating analysis: API unavailable{context}. Gemini keeps failing; please try again later."
 
-        error_msg = str(e).lower()
-        if "quota" in error_msg or "rate limit" in error_msg or "billing" in error_msg:
-            logging.error(f"API quota/rate limit error{context}: {str(e)}")
+    if isinstance(e, GeminiDeadlineExceeded):
+        logging.warning(f"{str(e)}{context}")
+        return f"Error generating analysis: {str(e)}{context}. Please try again later."
+
+    if isinstance(e, GeminiQueueTimeout):
+        logging.warning(f"{str(e)}{context}")
+        return f"Error generating analysis: Gemini is busy with other reviews{context}. Please try again later."
+
+    # Prefer structured API errors when available (google-genai).
+    if isinstance(e, genai_errors.ClientError):
+        code = getattr(e, "code", None)
+        status = getattr(e, "status", None)
+        message = getattr(e, "message", None)
+        lower_message = (message or str(e)).lower()
+
+        if code == 429 or "quota" in lower_message or "rate limit" in lower_message or "billing" in lower_message:
+            logging.exception(f"API quota/rate limit error{context}: {str(e)}")
             return f"Error generating analysis: API quota exceeded{context}. Please check your billing or try again later."
-        elif "api key" in error_msg or "authentication" in error_msg or "unauthorized" in error_msg:
-            logging.error(f"API authentication error{context}: {str(e)}")
+
+        if (
+            code in (401, 403)
+            or "api key" in lower_message
+            or "authentication" in lower_message
+            or "unauthorized" in lower_message
+        ):
+            logging.exception(f"API authentication error{context}: {str(e)}")
             return (
                 "Error generating analysis: Invalid API key or authentication failed"
                 f"{context}. Please check your GEMINI_API_KEY or HARPERBOT_GEMINI_API_KEY."
             )
-        elif "model" in error_msg or "not found" in error_msg:
-            logging.error(f"Model error{context}: {str(e)}")
+
+        if code == 404 or "model" in lower_message or "not found" in lower_message:
+            logging.exception(f"Model error{context}: {str(e)}")
             return f"Error generating analysis: Requested model not available{context}. Please try again later."
-        else:
-            logging.error(f"Unexpected API error{context}: {str(e)}")
-            error_type = type(e).__name__
-            return f"Error generating analysis: API unavailable ({error_type}){context}. Please try again later."
+
+        logging.exception(f"API client error{context}: {str(e)}")
+        details = f" (HTTP {code} {status})" if code else ""
+        return f"Error generating analysis: API request failed{details}{context}. Please try again later."
+
+    if isinstance(e, genai_errors.ServerError):
+        code = getattr(e, "code", None)
+        status = getattr(e, "status", None)
+        details = f" (HTTP {code} {status})" if code else ""
+        logging.exception(f"API server error{context}: {str(e)}")
+        return f"Error generating analysis: API unavailable{details}{context}. Please try again later."
+
+    error_msg = str(e).lower()
+    if "quota" in error_msg or "rate limit" in error_msg or "billing" in error_msg:
+        logging.error(f"API quota/rate limit error{context}: {str(e)}")
+        return f"Error generating analysis: API quota exceeded{context}. Please check your billing or try again later."
+    elif "api key" in error_msg or "authentication" in error_msg or "unauthorized" in error_msg:
+        logging.error(f"API authentication error{context}: {str(e)}")
+        return (
+            "Error generating analysis: Invalid API key or authentication failed"
+            f"{context}. Please check your GEMINI_API_KEY or HARPERBOT_GEMINI_API_KEY."
+        )
+    elif "model" in error_msg or "not found" in error_msg:
+        logging.error(f"Model error{context}: {str(e)}")
+        return f"Error generating analysis: Requested model not available{context}. Please try again later."
+    else:
+        logging.error(f"Unexpected API error{context}: {str(e)}")
+        error_type = type(e).__name__
+        return f"Error generating analysis: API unavailable ({error_type}){context}. Please try again later."
+
+
+def cached_analysis(cache_key: str, pr_details) -> str | None:
+    """Return the stored analysis for `cache_key`, logging the hit."""
+    analysis = get_analysis_cache().get(cache_key)
+    if analysis is not None:
+        logging.info(f"Serving analysis for PR #{pr_details.get('number', 'unknown')} from the analysis cache")
+    return analysis
+
+
+def analyze_with_gemini(client, pr_details, *, use_cache: bool = True):
+    """
+    Analyze the PR using Gemini API.
+
+    Analyses are stored in the analysis cache; with `use_cache` (the default) an
+    identical request is answered from it without calling the model. With
+    `chunked_analysis` enabled, diffs longer than `max_diff_length` are reviewed
+    in parts (see analyze_in_chunks).
+    """
+    config = load_config()
+    if needs_chunking(pr_details, config):
+        return analyze_in_chunks(client, pr_details, config, use_cache=use_cache)
+    return generate_analysis(client, pr_details, use_cache=use_cache)[0]
+
+
+def output_tokens(response) -> int:
+    """Output tokens reported in a response's usage metadata (0 if absent)."""
+    count = getattr(getattr(response, "usage_metadata", None), "candidates_token_count", None)
+    return count if isinstance(count, int) else 0
+
+
+def with_context_cache(client, model_name, generate_config):
+    """
+    The config to send: the system instruction is swapped for its cached content
+    when context caching applies. The analysis cache key is computed on
+    `generate_config` itself, so it does not change when a cache is renewed.
+    Creating the cache is a Gemini request too, so it goes through `call_gemini`.
+    """
+    ttl = load_config().get("context_cache_ttl", 3600)
+    backend = GeminiCacheBackend(client, lambda request, config, tokens: call_gemini(request, model_name, config, tokens))
+    return cached_generate_config(backend, model_name, generate_config, ttl)
+
+
+def call_gemini(call, model_name, generate_config, prompt_tokens: int, *, hedge: bool = False, can_retry=None):
+    """
+    Return `call(config)`, one Gemini request, run under the shared policies.
+
+    Each attempt waits for a scheduler slot, checks the quota cooldown and the
+    model's circuit breaker, and gets the time left before the call's deadline as
+    its HTTP timeout. Transient failures are retried with jittered backoff while
+    `can_retry()` allows it (see resilience.py). With `hedge`, a slow request is
+    raced against a second one; the caller charges the output tokens of the
+    response it gets, and the other request's are charged here if it finishes.
+    """
+    scheduler = get_gemini_scheduler()
+    breaker = get_circuit_breaker(model_name)
+    deadline = Deadline()
+    for attempt in itertools.count():
+        try:
+            with scheduler.slot(prompt_tokens):
+                ensure_quota_available()
+                config = deadline.apply(generate_config)
+                started = time.monotonic()
+                with breaker.guard():
+                    result = hedged(
+                        lambda: call(config),
+                        hedge_delay(model_name) if hedge else None,
+                        lambda: scheduler.try_reserve(prompt_tokens),
+                        # The caller charges the winner; a loser that also finished used tokens too.
+                        lambda response: scheduler.charge(output_tokens(response)),
+                    )
+                record_latency(model_name, time.monotonic() - started)
+            return result
+        except Exception as e:
+            delay = next_retry_delay(attempt, e, deadline) if can_retry is None or can_retry() else None
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+
+def call_gemini_cached(call, client, model_name, generate_config, prompt_tokens: int, *, hedge: bool = False, can_retry=None):
+    """
+    `call_gemini` with `with_context_cache(...)` as the config. If Gemini no longer
+    has that cached content, its entry is dropped and the request is sent once
+    more right away with the system instruction inline.
+    """
+    request_config = with_context_cache(client, model_name, generate_config)
+    try:
+        return call_gemini(call, model_name, request_config, prompt_tokens, hedge=hedge, can_retry=can_retry)
+    except Exception as e:
+        if (can_retry is not None and not can_retry()) or not forget_stale_cache(e, model_name, request_config):
+            raise
+    return call_gemini(call, model_name, generate_config, prompt_tokens, hedge=hedge, can_retry=can_retry)
+
+
+def generate_analysis(client, pr_details, *, use_cache: bool = True) -> tuple:
+    """
+    Run one Gemini analysis of `pr_details` and return `(text, is_analysis)`.
+
+    `is_analysis` is False when `text` is an error or a notice rather than a review.
+    """
+    model_name = None
+    try:
+        model_name, formatted_prompt, generate_config, max_output_tokens = build_gemini_request(pr_details, client)
+        cache_key = analysis_cache_key(pr_details["diff"], model_name, formatted_prompt, generate_config)
+        if use_cache:
+            analysis = cached_analysis(cache_key, pr_details)
+            if analysis is not None:
+                return analysis, True
+
+        response = call_gemini_cached(
+            lambda config: client.models.generate_content(model=model_name, contents=formatted_prompt, config=config),
+            client,
+            model_name,
+            generate_config,
+            estimate_tokens(formatted_prompt),
+            hedge=True,
+        )
+        get_gemini_scheduler().charge(output_tokens(response))
+        analysis, is_analysis = gemini_response_text(response, max_output_tokens)
+        if is_analysis:
+            get_analysis_cache().put(cache_key, analysis)
+        return analysis, is_analysis
+    except Exception as e:
+        record_quota_error(e, QUOTA_COOLDOWN_SECONDS)
+        return describe_gemini_error(e, pr_details, model_name), False
+
+
+def needs_chunking(pr_details, config) -> bool:
+    """Whether the diff is too long for one prompt and should be reviewed in chunks."""
+    return bool(config.get("chunked_analysis", False)) and len(pr_details["diff"]) > config.get("max_diff_length", 4000)
+
+
+def plan_chunks(pr_details, config) -> tuple:
+    """
+    Split the PR diff into `max_diff_length` chunks.
+
+    Returns `(chunk_details, skipped_files)`: one pr_details dict per chunk (at most
+    `max_diff_chunks`), and the files that only appear in the chunks beyond that cap.
+    Each chunk is routed to a model tier by the size of the whole diff.
+    """
+    diff = pr_details["diff"]
+    if config.get("max_diff_tokens", 0):
+        # Generated files would be dropped from every chunk's prompt anyway; do not spend chunks on them.
+        diff, _ = drop_generated(diff, config.get("generated_files", ()), pr_details.get("gitattributes", ""))
+    chunks = split_diff(diff, config.get("max_diff_length", 4000))
+    max_chunks = config.get("max_diff_chunks", 12)
+    kept, dropped = chunks[:max_chunks], chunks[max_chunks:]
+    reviewed = {path for chunk in kept for path in chunk.files}
+    skipped_files = []
+    for chunk in dropped:
+        skipped_files.extend(path for path in chunk.files if path not in reviewed and path not in skipped_files)
+    size = routing_size(pr_details)
+    chunk_details = [
+        {**pr_details, "diff": chunk.text, "files_changed": list(chunk.files), "routing_size": size} for chunk in kept
+    ]
+    return chunk_details, skipped_files
+
+
+def combine_chunk_analyses(chunk_details: list, results: list, skipped_files: list) -> str:
+    """
+    Reduce the per-chunk `(text, is_analysis)` results into one analysis.
+
+    If no chunk produced a review (or Gemini ran out of quota) the first such
+    message is returned unchanged, so the usual notices are posted.
+    """
+    failures = [text for text, is_analysis in results if not is_analysis]
+    quota = next((text for text in failures if is_quota_exceeded_message(text)), None)
+    if quota is not None:
+        return quota
+    analyses = [(text, len(details["diff"])) for details, (text, is_analysis) in zip(chunk_details, results) if is_analysis]
+    if not analyses:
+        return failures[0] if failures else ""
+
+    notes = [f"Reviewed in {len(results)} parts because the diff exceeds the configured size limit."]
+    metrics.increment("chunked_analyses")
+    return merge_analyses(analyses, notes + _coverage_notes(len(failures), len(results), skipped_files))
+
+
+def _coverage_notes(failed: int, parts: int, skipped_files: list) -> list:
+    notes = []
+    if failed:
+        notes.append(f"{failed} of {parts} parts could not be analyzed and are not covered above.")
+    if skipped_files:
+        notes.append("Not reviewed (diff too large): " + ", ".join(skipped_files))
+    return notes
+
+
+def analyze_chunks(client, chunk_details: list, config, *, use_cache: bool = True) -> list:
+    """Run generate_analysis on each chunk, at most `max_parallel_chunks` at a time, and return the results in order."""
+    if not chunk_details:
+        return []
+    workers = max(1, min(config.get("max_parallel_chunks", 4), len(chunk_details)))
+    # Run each chunk in a copy of this context, so the Gemini scheduler sees the same caller.
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="harperbot-chunk") as pool:
+        return list(
+            pool.map(
+                lambda details: context.copy().run(generate_analysis, client, details, use_cache=use_cache), chunk_details
+            )
+        )
+
+
+def analyze_in_chunks(client, pr_details, config, *, use_cache: bool = True):
+    """
+    Map-reduce analysis of a large diff.
+
+    The diff is split on file and hunk boundaries, the chunks are analyzed in
+    parallel (at most `max_parallel_chunks` at a time, each cached on its own), and
+    the results are merged into a single review in the usual comment format.
+    """
+    chunk_details, skipped_files = plan_chunks(pr_details, config)
+    logging.info(f"Analyzing PR #{pr_details.get('number', 'unknown')} in {len(chunk_details)} chunks")
+    results = analyze_chunks(client, chunk_details, config, use_cache=use_cache)
+    return combine_chunk_analyses(chunk_details, results, skipped_files)
+
+
+_SHA_MARKER_RE = re.compile(r"<!-- harperbot-sha: ([0-9a-f]+) -->")
+
+
+def last_analyzed_sha(comments) -> str | None:
+    """The head SHA in the `harperbot-sha` marker of the newest HarperBot analysis comment."""
+    for comment in reversed(list(comments or [])):
+        if is_harperbot_comment(comment):
+            match = _SHA_MARKER_RE.search(comment.body or "")
+            if match:
+                return match.group(1)
+    return None
+
+
+def plan_incremental_analysis(pr_details, config, findings, last_sha: str | None) -> tuple:
+    """
+    Work out what an incremental analysis has to send to Gemini.
+
+    `findings` from an earlier run are only trusted if they belong to `last_sha`,
+    the SHA of the analysis currently posted. Returns `(reused, chunk_details,
+    skipped_files)`: the finding groups whose files' patches are unchanged, and
+    plan_chunks output for the rest of the diff.
+    """
+    reused = ()
+    diff = pr_details["diff"]
+    if findings is not None and last_sha and findings.sha == last_sha:
+        reused = reusable_groups(findings, patch_hashes(diff))
+        diff = pending_diff(diff, reused)
+    if not diff:
+        return reused, [], []
+    chunk_details, skipped_files = plan_chunks({**pr_details, "diff": diff}, config)
+    return reused, chunk_details, skipped_files
+
+
+def combine_incremental_analyses(pr_details, reused, chunk_details, results, skipped_files, last_sha) -> tuple:
+    """
+    Merge reused finding groups with the new chunk results.
+
+    Returns `(analysis, findings)`; `findings` (None when nothing usable was
+    produced) is what the next run can reuse.
+    """
+    failures = [text for text, is_analysis in results if not is_analysis]
+    quota = next((text for text in failures if is_quota_exceeded_message(text)), None)
+    if quota is not None:
+        return quota, None
+    hashes = patch_hashes(pr_details["diff"])
+    new_groups = tuple(
+        FindingGroup(
+            files=tuple((path, hashes[path]) for path in details["files_changed"] if path in hashes),
+            analysis=text,
+            size=len(details["diff"]),
+        )
+        for details, (text, is_analysis) in zip(chunk_details, results)
+        if is_analysis
+    )
+    groups = tuple(reused) + new_groups
+    if not groups:
+        return (failures[0] if failures else ""), None
+    findings = Findings(sha=pr_details.get("head_sha") or "", groups=groups)
+    if len(groups) == 1 and not failures and not skipped_files:
+        return groups[0].analysis, findings
+
+    if reused:
+        reviewed = {path for group in new_groups for path, _ in group.files}
+        notes = [
+            f"Re-reviewed {len(reviewed)} of {len(hashes)} files whose changes differ from {last_sha[:7]}; "
+            "the rest of this review is carried over from the earlier analysis."
+        ]
+        metrics.increment("incremental_analyses")
+        metrics.increment("incremental_groups_reused", len(reused))
+    else:
+        notes = [f"Reviewed in {len(groups)} parts because the diff exceeds the configured size limit."]
+    notes += _coverage_notes(len(failures), len(results), skipped_files)
+    return merge_analyses([(group.analysis, group.size) for group in groups], notes), findings
+
+
+def analyze_incrementally(client, pr_details, config, repo_name: str, last_sha: str | None, *, use_cache: bool = True):
+    """
+    Analyze only the files whose patches changed since the last analyzed head.
+
+    Findings from earlier runs (kept in the analysis cache store) cover the other
+    files; everything is merged into one review. With `use_cache=False` nothing is
+    reused, but the new findings are still stored.
+    """
+    store = get_analysis_cache()
+    findings = load_findings(store, repo_name, pr_details["number"]) if use_cache else None
+    reused, chunk_details, skipped_files = plan_incremental_analysis(pr_details, config, findings, last_sha)
+    logging.info(
+        f"Incremental analysis for PR #{pr_details['number']}: reusing {len(reused)} finding groups, "
+        f"analyzing {len(chunk_details)} chunks"
+    )
+    results = analyze_chunks(client, chunk_details, config, use_cache=use_cache)
+    analysis, findings = combine_incremental_analyses(pr_details, reused, chunk_details, results, skipped_files, last_sha)
+    if findings is not None and findings.sha:
+        save_findings(store, repo_name, pr_details["number"], findings)
+    return analysis
+
+
+STREAMING_NOTE = "_HarperBot is still writing this review…_"
+INTERRUPTED_NOTE = "_HarperBot was interrupted before finishing this review. Comment `/analyze` to run it again._"
+
+
+class AnalysisStream:
+    """
+    Accumulates `generate_content_stream` chunks into an analysis.
+
+    `add` returns False as soon as a chunk reports the output token limit or a safety
+    filter, so callers stop reading; the reason is kept in `stop_reason`.
+    """
+
+    def __init__(self, max_output_tokens: int):
+        self.max_output_tokens = max_output_tokens
+        self.stop_reason = None
+        # Output tokens so far, from the newest chunk's usage metadata.
+        self.output_tokens = 0
+        self._parts = []
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    @property
+    def has_text(self) -> bool:
+        return bool(self._parts)
+
+    def add(self, chunk) -> bool:
+        text = getattr(chunk, "text", None)
+        if text:
+            self._parts.append(text)
+        self.output_tokens = output_tokens(chunk) or self.output_tokens
+        for candidate in getattr(chunk, "candidates", None) or []:
+            finish_str = str(getattr(candidate, "finish_reason", None) or "").upper()
+            if "MAX" in finish_str and "TOKEN" in finish_str:
+                self.stop_reason = "token_limit"
+            elif "SAFETY" in finish_str:
+                self.stop_reason = "safety"
+        return self.stop_reason is None
+
+    def partial_text(self) -> str:
+        """The analysis so far, sanitized for posting."""
+        return sanitize_text(self.text.strip(), self.max_output_tokens)
+
+    def result(self) -> tuple:
+        """Return `(text, is_analysis)` like `gemini_response_text`; truncated output is not an analysis."""
+        if self.stop_reason is not None:
+            logging.warning(f"Stopped streaming analysis early: {self.stop_reason}")
+            metrics.increment(f"analysis_stream_stopped_{self.stop_reason}")
+        text = self.partial_text()
+        if self.stop_reason == "safety":
+            return SAFETY_BLOCKED_MESSAGE, False
+        if self.stop_reason == "token_limit":
+            if not text:
+                return TRUNCATED_ANALYSIS_MESSAGE, False
+            return f"{text}\n\n> ⚠️ Analysis stopped early: the model reached its output token limit.", False
+        if not text:
+            return UNEXPECTED_FORMAT_MESSAGE, False
+        return text, True
+
+
+class ProgressiveComment:
+    """
+    Shows a partial analysis in the HarperBot comment while it streams in.
+
+    Edits are rate-limited to one per `interval` seconds (the first is immediate).
+    Partial comments carry no SHA marker, so they never count as a finished analysis;
+    the final `upsert_analysis_comment` replaces the same comment. A run that ends
+    without one (cancelled, quota, error) calls `interrupt` instead.
+    """
+
+    def __init__(self, event, interval: float):
+        self.event = event
+        self.interval = interval
+        self.updates = 0
+        self._comment = None
+        self._last_update = None
+        self._partial = ""
+
+    def ready(self) -> bool:
+        """Whether an update is due now; claims the slot if so."""
+        now = time.monotonic()
+        if self._last_update is not None and now - self._last_update < self.interval:
+            return False
+        self._last_update = now
+        return True
+
+    def post(self, partial: str):
+        self._partial = partial
+        body = format_comment(f"{partial}\n\n{STREAMING_NOTE}")
+        try:
+            if self._comment is None:
+                existing = next((c for c in self.event.issue_comments if is_harperbot_comment(c)), None)
+                if existing is not None:
+                    self._comment = self.event.editable_comment(existing)
+                    self._comment.edit(body)
+                else:
+                    self._comment = self.event.pr.create_issue_comment(body)
+                    self.event.remember_issue_comment(self._comment)
+            else:
+                self._comment.edit(body)
+            self.updates += 1
+        except Exception as e:
+            # Progress is best effort; the final comment is still posted.
+            logging.warning(f"Could not update streaming comment for PR #{self.event.pr_number}: {str(e)}")
+
+    def interrupt(self):
+        """Replace the "still writing" note on a posted partial review, so it does not look like it is still running."""
+        if self._comment is None:
+            return
+        try:
+            self._comment.edit(format_comment(f"{self._partial}\n\n{INTERRUPTED_NOTE}"))
+        except Exception as e:
+            logging.warning(f"Could not mark the streaming comment for PR #{self.event.pr_number} as interrupted: {str(e)}")
+
+
+def stream_analysis_with_gemini(client, pr_details, progress, *, use_cache: bool = True):
+    """
+    Analyze the PR with `generate_content_stream`, showing the partial analysis through
+    `progress` (a ProgressiveComment) as it arrives.
+
+    Progress edits run in a worker thread, at most one at a time, so a slow GitHub
+    API does not hold the Gemini scheduler slot. Returns the analysis like
+    `analyze_with_gemini`. Transient errors are retried only until the first text
+    arrives. The streamed output tokens are charged to the scheduler.
+    """
+    model_name = None
+    pending = None
+    posting = ThreadPoolExecutor(max_workers=1, thread_name_prefix="harperbot-progress")
+    try:
+        model_name, formatted_prompt, generate_config, max_output_tokens = build_gemini_request(pr_details, client)
+        cache_key = analysis_cache_key(pr_details["diff"], model_name, formatted_prompt, generate_config)
+        if use_cache:
+            analysis = cached_analysis(cache_key, pr_details)
+            if analysis is not None:
+                return analysis
+
+        stream = None
+
+        def read_stream(config):
+            nonlocal stream, pending
+            stream = AnalysisStream(max_output_tokens)
+            for chunk in client.models.generate_content_stream(model=model_name, contents=formatted_prompt, config=config):
+                if not stream.add(chunk):
+                    break
+                if stream.has_text and (pending is None or pending.done()) and progress.ready():
+                    pending = posting.submit(contextvars.copy_context().run, progress.post, stream.partial_text())
+
+        try:
+            call_gemini_cached(
+                read_stream,
+                client,
+                model_name,
+                generate_config,
+                estimate_tokens(formatted_prompt),
+                can_retry=lambda: stream is None or not stream.has_text,
+            )
+        finally:
+            if stream is not None:
+                get_gemini_scheduler().charge(stream.output_tokens)
+        analysis, is_analysis = stream.result()
+        if is_analysis:
+            get_analysis_cache().put(cache_key, analysis)
+        return analysis
+    except Exception as e:
+        record_quota_error(e, QUOTA_COOLDOWN_SECONDS)
+        return describe_gemini_error(e, pr_details, model_name)
+    finally:
+        # Let a late progress edit land before the final comment replaces it.
+        posting.shutdown(wait=True)
 
 
 def parse_diff_for_suggestions(diff_text):
@@ -655,9 +1213,37 @@ def parse_diff_for_suggestions(diff_text):
     return suggestions or None
 
 
-def format_comment(analysis, sha=None):
+_SUGGESTIONS_MARKER_RE = re.compile(r"<!-- harperbot-suggestions: ([A-Za-z0-9+/=]*) -->")
+# GitHub rejects issue comments longer than this.
+GITHUB_COMMENT_MAX_CHARS = 65536
+
+
+def suggestions_marker(analysis: str) -> str:
+    """
+    A hidden marker with the analysis' ```diff blocks (zlib-compressed, base64), so `/apply`
+    can read the posted suggestions back from the comment in any process.
+    """
+    posted = "\n\n".join(f"```diff\n{code}\n```" for code in parsed_analysis(analysis or "").diff_blocks)
+    return f"<!-- harperbot-suggestions: {base64.b64encode(zlib.compress(posted.encode())).decode()} -->"
+
+
+def read_suggestions_marker(body: str) -> str | None:
+    """The ```diff blocks kept in a comment's suggestions marker, or None if it has none (or it is damaged)."""
+    match = _SUGGESTIONS_MARKER_RE.search(body or "")
+    if match is None:
+        return None
+    try:
+        return zlib.decompress(base64.b64decode(match.group(1), validate=True)).decode()
+    except (binascii.Error, zlib.error, UnicodeDecodeError) as e:
+        logging.warning(f"Ignoring an unreadable suggestions marker: {str(e)}")
+        return None
+
+
+def format_comment(analysis, sha=None, suggestions=None):
     """Format the analysis with proper markdown and emojis."""
     sha_marker = f"\n<!-- harperbot-sha: {sha} -->" if sha else ""
+    if suggestions:
+        sha_marker += f"\n{suggestions}"
     return f"""<details>
 <summary>HarperBot</summary>
 
@@ -672,22 +1258,12 @@ def parse_code_suggestions(analysis):
     """
     Parse code suggestions from analysis text.
 
-    Extracts diff blocks and parses them into structured operations.
+    Takes the complete ```diff blocks found by analysis_parser (including ones
+    indented in lists or inside a ```markdown wrapper) and parses them into
+    structured operations.
     """
-    diff_blocks = []
-    start_pos = 0
-    while True:
-        start_pos = analysis.find("```diff\n", start_pos)
-        if start_pos == -1:
-            break
-        end_pos = analysis.find("\n```", start_pos + 8)
-        if end_pos == -1:
-            break
-        diff_text = analysis[start_pos + 8 : end_pos]
-        diff_blocks.append(diff_text)
-        start_pos = end_pos + 4
     suggestions: list[dict] = []
-    for diff_text in diff_blocks:
+    for diff_text in parsed_analysis(analysis or "").diff_blocks:
         parsed = parse_diff_for_suggestions(diff_text)
         if not parsed:
             continue
@@ -934,25 +1510,36 @@ def update_main_comment(analysis):
     """
     Update the main comment by replacing the code suggestions section.
     """
-    start_pos = analysis.find("### Code Suggestions\n")
-    if start_pos == -1:
-        return analysis
-    end_pos = analysis.find("###", start_pos + 21)
-    if end_pos == -1:
-        end_pos = len(analysis)
-    return analysis[:start_pos] + "### Code Suggestions\n- Suggestions posted as inline comments below.\n" + analysis[end_pos:]
+    return parsed_analysis(analysis).replace_section("Code Suggestions", "- Suggestions posted as inline comments below.")
 
 
-def post_inline_suggestions(pr, pr_details, suggestions, g, repo, *, force_review: bool = False):
+def format_unanchored_suggestions(suggestions) -> str:
+    """Review-body text for suggestions on lines that inline comments cannot reach."""
+    parts = ["**Suggestions outside the diff**"]
+    for sugg in suggestions:
+        start_line, end_line = sugg["start_line"], sugg["end_line"]
+        lines = f"line {start_line}" if end_line <= start_line else f"lines {start_line}-{end_line}"
+        if sugg.get("op") == "delete":
+            parts.append(f"`{sugg['path']}` {lines}: suggested deletion.")
+        else:
+            parts.append(f"`{sugg['path']}` {lines}:\n```\n{sugg.get('suggestion') or ''}\n```")
+    return "\n\n".join(parts)
+
+
+def post_inline_suggestions(pr, pr_details, suggestions, g, repo, *, force_review: bool = False, reviews=None):
     """
     Post inline code suggestions as a pull request review.
+
+    Suggestions on lines outside the diff are listed in the review body instead
+    of being sent as comments, which GitHub would reject along with the review.
+    Pass `reviews` (e.g. from the event's PR snapshot) to skip listing them over REST.
     """
     try:
         head_sha = pr_details["head_sha"]
 
         # Check if we already posted a review for this exact commit
         # We'll look for reviews that include the harperbot marker.
-        for review in pr.get_reviews():
+        for review in pr.get_reviews() if reviews is None else reviews:
             if f"harperbot-sha: {head_sha}" in (review.body or ""):
                 if not force_review:
                     logging.info(f"Skipping inline suggestions for SHA {head_sha}: Review already exists")
@@ -961,7 +1548,11 @@ def post_inline_suggestions(pr, pr_details, suggestions, g, repo, *, force_revie
                 break
 
         commit = repo.get_commit(head_sha)
+        # Checked against the diff up front: one comment outside it makes GitHub reject the whole review.
+        index = diff_index(pr_details.get("diff", ""))
         review_comments = []
+        anchored = []
+        unanchored = []
         for sugg in suggestions or []:
             file_path = sugg.get("path")
             start_line = sugg.get("start_line")
@@ -978,8 +1569,13 @@ def post_inline_suggestions(pr, pr_details, suggestions, g, repo, *, force_revie
             else:
                 body = f"```suggestion\n{suggestion_text or ''}\n```"
 
+            ranged = ENABLE_RANGE_COMMENTS and end_line > start_line
+            if not index.anchorable(file_path, start_line, end_line if ranged else start_line):
+                unanchored.append(sugg)
+                continue
+
             comment = {"path": file_path, "body": body}
-            if ENABLE_RANGE_COMMENTS and end_line > start_line:
+            if ranged:
                 comment.update(
                     {
                         "start_line": start_line,
@@ -991,8 +1587,13 @@ def post_inline_suggestions(pr, pr_details, suggestions, g, repo, *, force_revie
             else:
                 comment.update({"line": start_line, "side": "RIGHT"})
             review_comments.append(comment)
+            anchored.append(sugg)
 
         review_body = f"HarperBot Analysis for {head_sha}\n<!-- harperbot-sha: {head_sha} -->"
+        if unanchored:
+            metrics.increment("review_comments_unanchored", len(unanchored))
+            logging.info(f"Moved {len(unanchored)} suggestions outside the diff into the review body")
+            review_body += "\n\n" + format_unanchored_suggestions(unanchored)
 
         if not review_comments:
             # Still create a review so it shows up in the PR review timeline.
@@ -1012,7 +1613,7 @@ def post_inline_suggestions(pr, pr_details, suggestions, g, repo, *, force_revie
             # Fallback to legacy `position` field if the API rejects line-based comments.
             logging.warning(f"Line-based review comments failed, retrying with diff positions: {str(e)}")
             position_comments = []
-            for sugg in suggestions or []:
+            for sugg in anchored:
                 file_path = sugg.get("path")
                 start_line = sugg.get("start_line")
                 op = sugg.get("op")
@@ -1020,7 +1621,7 @@ def post_inline_suggestions(pr, pr_details, suggestions, g, repo, *, force_revie
                 if not file_path or not isinstance(start_line, int):
                     continue
 
-                position = find_diff_position(pr_details.get("diff", ""), file_path, start_line)
+                position = index.position(file_path, start_line)
                 if position is None:
                     continue
                 body = "Suggested deletion." if op == "delete" else f"```suggestion\n{suggestion_text or ''}\n```"
@@ -1076,14 +1677,22 @@ def verify_webhook_signature(payload, signature, secret):
     return hmac.compare_digest(mac.hexdigest(), sig)
 
 
+_dotenv_loaded = False
+
+
 def setup_environment_webhook(installation_id):
     """
     Setup environment for webhook mode using GitHub App authentication.
 
     Generates an installation token for the specific repository installation.
     This provides secure, scoped access without storing long-lived tokens.
+    Tokens, Github clients and the Gemini client are cached per installation
+    (see credentials.py), so repeated events skip the JWT and token round trip.
     """
-    load_dotenv()
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        load_dotenv()
+        _dotenv_loaded = True
     logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
     gemini_api_key = os.getenv("HARPERBOT_GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY")
@@ -1096,40 +1705,70 @@ def setup_environment_webhook(installation_id):
         )
         raise ValueError("Missing required environment variables")
 
-    client = genai.Client(api_key=gemini_api_key)
+    install_github_session()
+    credentials = get_credential_cache()
+    client = credentials.get_genai_client(gemini_api_key)
 
-    # Generate installation-specific token
-    auth = Auth.AppAuth(app_id, private_key)
-    installation_auth = auth.get_installation_auth(installation_id)
-    g = Github(auth=installation_auth)
-    return g, installation_auth.token, client
+    # Reuse the installation token until shortly before it expires
+    g, installation_token = credentials.get_installation(app_id, private_key, installation_id)
+    return g, installation_token, client
 
 
-def build_pr_details_from_pr(pr, installation_token: str | None = None):
-    """Build normalized PR details from an existing pull request object."""
-    files_changed = [f.filename for f in pr.get_files()]
-
-    # Get diff content using diff_url
-    diff_content = fetch_pr_diff(pr.diff_url, installation_token)
-
-    return {
+def pr_metadata_from_pr(pr) -> tuple:
+    """Return `(pr_details, diff_url)` for a pull request object; `pr_details` has no "diff" yet."""
+    details = {
         "title": pr.title,
         "body": pr.body or "",
         "author": pr.user.login,
-        "files_changed": files_changed,
-        "diff": diff_content,
+        "files_changed": [f.filename for f in pr.get_files()],
         "base": pr.base.ref,
         "head": pr.head.ref,
         "head_sha": pr.head.sha,
         "number": pr.number,
     }
+    return details, pr.diff_url
+
+
+def pr_metadata_from_snapshot(snapshot) -> tuple:
+    """Return `(pr_details, diff_url)` for a GraphQL PRSnapshot; `pr_details` has no "diff" yet."""
+    details = {
+        "title": snapshot.title,
+        "body": snapshot.body,
+        "author": snapshot.author,
+        "files_changed": list(snapshot.files),
+        "base": snapshot.base_ref,
+        "head": snapshot.head_ref,
+        "head_sha": snapshot.head_sha,
+        "number": snapshot.number,
+        "gitattributes": snapshot.gitattributes,
+    }
+    return details, snapshot.diff_url
+
+
+def build_pr_details_from_pr(pr, installation_token: str | None = None):
+    """Build normalized PR details from an existing pull request object."""
+    details, diff_url = pr_metadata_from_pr(pr)
+    return attach_diff(details, stream_pr_diff(diff_url, installation_token))
+
+
+def build_pr_details_from_snapshot(snapshot, installation_token: str | None = None):
+    """Build normalized PR details from a GraphQL PRSnapshot."""
+    details, diff_url = pr_metadata_from_snapshot(snapshot)
+    return attach_diff(details, stream_pr_diff(diff_url, installation_token))
+
+
+def get_pr_metadata_webhook(g, repo_name, pr_number) -> tuple:
+    """Return `(pr_details, diff_url)` without downloading the diff (GraphQL snapshot, REST as a fallback)."""
+    event = current_event(repo_name, pr_number, g)
+    if event.snapshot is not None:
+        return pr_metadata_from_snapshot(event.snapshot)
+    return pr_metadata_from_pr(event.pr)
 
 
 def get_pr_details_webhook(g, repo_name, pr_number, installation_token: str | None = None):
-    """Fetch PR details using GitHub App authentication."""
-    repo = g.get_repo(repo_name)
-    pr = repo.get_pull(pr_number)
-    return build_pr_details_from_pr(pr, installation_token=installation_token)
+    """Fetch PR details using GitHub App authentication (GraphQL snapshot, REST as a fallback)."""
+    details, diff_url = get_pr_metadata_webhook(g, repo_name, pr_number)
+    return attach_diff(details, stream_pr_diff(diff_url, installation_token))
 
 
 def is_harperbot_comment(comment):
@@ -1153,46 +1792,91 @@ def post_comment_webhook(
     otherwise creates a new one. Posts code suggestions as inline review comments.
     """
     try:
-        g = Github(auth=Auth.Token(github_token))
+        g = get_github_client(github_token)
         config = load_config()
-        repo = g.get_repo(repo_name)
-        pr = repo.get_pull(pr_details["number"])
+        event = current_event(repo_name, pr_details["number"], g)
+        repo = event.repo
+        pr = event.pr
 
         suggestions = parse_code_suggestions(analysis)
-        main_comment = update_main_comment(analysis)
-        formatted_comment = format_comment(main_comment, sha=pr_details.get("head_sha"))
-
-        # Find existing HarperBot comment to update
-        existing_comment = None
-        for comment in pr.get_issue_comments():
-            if is_harperbot_comment(comment):
-                existing_comment = comment
-                break
-
-        if existing_comment:
-            existing_comment.edit(formatted_comment)
-            logging.info(f"Updated existing analysis comment for PR #{pr_details['number']}")
-        else:
-            pr.create_issue_comment(formatted_comment)
-            logging.info(f"Posted new analysis comment to PR #{pr_details['number']}")
+        upsert_analysis_comment(event, pr_details, analysis)
 
         # Post inline suggestions (as a Review)
         effective_force_review = force_review or (manual and bool(config.get("force_review_on_analyze", False)))
-        post_inline_suggestions(pr, pr_details, suggestions, g, repo, force_review=effective_force_review)
-
-        # Apply authoring features if enabled
-        if config.get("enable_authoring", False):
-            if config.get("auto_commit_suggestions", False) and suggestions:
-                apply_suggestions_to_pr(repo, pr, suggestions)
+        post_inline_suggestions(
+            pr, pr_details, suggestions, g, repo, force_review=effective_force_review, reviews=event.reviews
+        )
 
-            if config.get("create_improvement_prs", False):
-                create_improvement_pr_from_analysis(repo, pr_details, analysis, config)
+        apply_authoring_features(repo, pr, pr_details, analysis, suggestions, config)
 
     except Exception as e:
         logging.error(f"Error posting comment to PR #{pr_details.get('number', 'unknown')}: {str(e)}")
         raise
 
 
+def upsert_analysis_comment(event, pr_details: dict, analysis: str):
+    """Update HarperBot's main PR comment with `analysis`, or create it if there is none yet."""
+    main_comment = update_main_comment(analysis)
+    formatted_comment = format_comment(main_comment, sha=pr_details.get("head_sha"), suggestions=suggestions_marker(analysis))
+    if len(formatted_comment) > GITHUB_COMMENT_MAX_CHARS:
+        logging.warning(f"Analysis comment for PR #{pr_details['number']} is too long to keep its suggestions for /apply")
+        formatted_comment = format_comment(main_comment, sha=pr_details.get("head_sha"))
+
+    # Find existing HarperBot comment to update
+    existing_comment = None
+    for comment in event.issue_comments:
+        if is_harperbot_comment(comment):
+            existing_comment = comment
+            break
+
+    if existing_comment:
+        event.editable_comment(existing_comment).edit(formatted_comment)
+        logging.info(f"Updated existing analysis comment for PR #{pr_details['number']}")
+    else:
+        event.pr.create_issue_comment(formatted_comment)
+        logging.info(f"Posted new analysis comment to PR #{pr_details['number']}")
+    remember_posted_analysis(event.repo_name, pr_details, analysis)
+
+
+def remember_posted_analysis(repo_name: str, pr_details: dict, analysis: str):
+    """
+    Keep the analysis just posted for the PR's head commit, so `/apply` commits the
+    suggestions that were shown, however they were produced (cached, chunked,
+    incremental or routed to another model).
+    """
+    head_sha = pr_details.get("head_sha")
+    if head_sha:
+        get_analysis_cache().put(posted_analysis_key(repo_name, pr_details["number"], head_sha), analysis)
+
+
+def load_posted_analysis(repo_name: str, pr_number: int, head_sha: str, comments=()) -> str | None:
+    """
+    The analysis posted for the PR at `head_sha` (at least its ```diff blocks), or None.
+
+    The analysis cache is only shared when HARPERBOT_ANALYSIS_CACHE is set, so on a
+    miss the suggestions are read back from the marker in HarperBot's comment on
+    that commit among `comments`.
+    """
+    analysis = get_analysis_cache().get(posted_analysis_key(repo_name, pr_number, head_sha))
+    if analysis is not None:
+        return analysis
+    for comment in reversed(list(comments or [])):
+        if is_harperbot_comment(comment) and f"harperbot-sha: {head_sha} " in (comment.body or ""):
+            return read_suggestions_marker(comment.body)
+    return None
+
+
+def apply_authoring_features(repo, pr, pr_details: dict, analysis: str, suggestions: list, config):
+    """Commit suggestions and open an improvement PR when authoring is enabled in config.yaml."""
+    if not config.get("enable_authoring", False):
+        return
+    if config.get("auto_commit_suggestions", False) and suggestions:
+        apply_suggestions_to_pr(repo, pr, suggestions)
+
+    if config.get("create_improvement_prs", False):
+        create_improvement_pr_from_analysis(repo, pr_details, analysis, config)
+
+
 def format_notice(title: str, details: str) -> str:
     # Notice comments should not include the SHA marker to avoid being treated as successful analysis
     return f"""⚠️ **HarperBot Notice: {title}**
@@ -1202,9 +1886,7 @@ def format_notice(title: str, details: str) -> str:
 
 
 def post_notice_comment(github_token: str, repo_name: str, pr_number: int, title: str, details: str):
-    g = Github(auth=Auth.Token(github_token))
-    repo = g.get_repo(repo_name)
-    pr = repo.get_pull(pr_number)
+    pr = current_event(repo_name, pr_number, get_github_client(github_token)).pr
     pr.create_issue_comment(format_notice(title, details))
 
 
@@ -1215,44 +1897,49 @@ def run_analysis_for_pr(
     *,
     force: bool = False,
     force_review: bool = False,
+    fresh: bool = False,
+    head_sha: str | None = None,
+    is_cancelled=None,
 ):
     """Fetch PR details, run analysis, and post comments for a PR.
 
     Args:
         force: If True, re-run analysis even when an analysis already exists for
             the current PR head SHA (useful for manual `/analyze` requests).
+        fresh: If True, ask the model again instead of reusing a cached analysis
+            of the same diff (`/analyze --fresh`).
+        head_sha: Head SHA the triggering event was about. When the PR has since
+            moved to a newer commit, this run is stale and is skipped; when GitHub
+            still reports an older head, StaleHeadPending is raised to retry.
+        is_cancelled: Optional callable polled between expensive stages; returning
+            True abandons the run (e.g. a newer push was queued for this PR).
     """
+    with github_event(repo_name, pr_number) as event, gemini_caller(installation_id, manual=force):
+        _run_analysis_for_pr(
+            event,
+            installation_id,
+            repo_name,
+            pr_number,
+            force=force,
+            force_review=force_review,
+            fresh=fresh,
+            head_sha=head_sha,
+            is_cancelled=is_cancelled,
+        )
+
+
+def _run_analysis_for_pr(event, installation_id, repo_name, pr_number, *, force, force_review, fresh, head_sha, is_cancelled):
+    """Body of `run_analysis_for_pr`, run with the event's GitHub objects cached in `event`."""
     g, installation_token, client = setup_environment_webhook(installation_id)
+    event.github = g
     pr_details = get_pr_details_webhook(g, repo_name, pr_number, installation_token=installation_token)
+    expected_sha = head_sha
     head_sha = pr_details.get("head_sha")
 
-    if not force:
-        try:
-            repo = g.get_repo(repo_name)
-            issue = repo.get_issue(number=pr_number)
-            paused = any((label.name == PAUSE_LABEL) for label in issue.get_labels())
-            if paused:
-                logging.info(f"Skipping analysis for PR #{pr_number}: paused via label '{PAUSE_LABEL}'")
-                return
-
-            pr = repo.get_pull(pr_number)
-            quota_until = get_quota_cooldown_until(pr)
-            if quota_until is not None and time.time() < quota_until:
-                until_iso = datetime.fromtimestamp(quota_until, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
-                logging.info(f"Skipping analysis for PR #{pr_number}: quota cooldown until {until_iso}")
-                return
-        except Exception as e:
-            # Do not hard-fail analysis for label lookup issues.
-            logging.warning(f"Pause label check failed for PR #{pr_number}: {str(e)}")
-
-    # De-duplication check: Skip ONLY if analysis already exists for this EXACT commit SHA
-    if not force:
-        repo = g.get_repo(repo_name)
-        pr = repo.get_pull(pr_number)
-        for comment in pr.get_issue_comments():
-            if f"harperbot-sha: {head_sha}" in (comment.body or ""):
-                logging.info(f"Skipping analysis for PR #{pr_number}: Analysis already exists for SHA {head_sha}")
-                return
+    if is_stale_head(event, pr_number, expected_sha, head_sha, is_cancelled):
+        return
+    if should_skip_analysis(event, pr_number, head_sha, force=force):
+        return
 
     if not pr_details.get("files_changed"):
         post_notice_comment(
@@ -1272,43 +1959,138 @@ def run_analysis_for_pr(
             "HarperBot could not find a diff to analyze.",
         )
         return
-    analysis = analyze_with_gemini(client, pr_details)
-    if not analysis:
-        post_notice_comment(
-            installation_token,
-            repo_name,
-            pr_number,
-            "No analysis output",
-            "HarperBot did not receive a response from the model.",
-        )
+    if is_cancelled is not None and is_cancelled():
+        logging.info(f"Cancelled analysis for PR #{pr_number} at {head_sha}: superseded by a newer event")
         return
+    config = load_config()
+    progress = None
+    try:
+        if config.get("incremental_analysis", False):
+            last_sha = last_analyzed_sha(event.issue_comments)
+            analysis = analyze_incrementally(client, pr_details, config, repo_name, last_sha, use_cache=not fresh)
+        elif config.get("stream_analysis", False) and not needs_chunking(pr_details, config):
+            progress = ProgressiveComment(event, config.get("stream_update_interval", 5.0))
+            analysis = stream_analysis_with_gemini(client, pr_details, progress, use_cache=not fresh)
+        else:
+            analysis = analyze_with_gemini(client, pr_details, use_cache=not fresh)
+        if not analysis:
+            post_notice_comment(
+                installation_token,
+                repo_name,
+                pr_number,
+                "No analysis output",
+                "HarperBot did not receive a response from the model.",
+            )
+            return
 
-    if is_quota_exceeded_message(analysis):
-        quota_until = int(time.time()) + max(0, QUOTA_COOLDOWN_SECONDS)
-        until_iso = datetime.fromtimestamp(quota_until, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
-        post_notice_comment(
+        if is_quota_exceeded_message(analysis):
+            post_quota_notice(installation_token, repo_name, pr_number)
+            return
+
+        if is_cancelled is not None and is_cancelled():
+            # Do not let an outdated analysis overwrite the comment a newer run is about to post.
+            logging.info(f"Discarding analysis for PR #{pr_number} at {head_sha}: superseded by a newer event")
+            return
+
+        # The final comment replaces the partial one from here on, even if a later step fails.
+        progress = None
+        post_comment_webhook(
             installation_token,
             repo_name,
-            pr_number,
-            "Gemini quota exceeded",
-            (
-                "HarperBot hit a Gemini quota/rate limit and will pause auto-analysis for this PR.\n\n"
-                f"Auto-analysis resumes after: **{until_iso}**\n\n"
-                "You can retry immediately with `/analyze`.\n\n"
-                f"<!-- harperbot-quota-until: {quota_until} -->"
-            ),
+            pr_details,
+            analysis,
+            manual=force,
+            force_review=force_review,
         )
-        logging.warning(f"Quota exceeded for PR #{pr_number}; cooldown until {until_iso}")
-        return
+    finally:
+        if progress is not None:
+            progress.interrupt()
+
+
+class StaleHeadPending(Exception):
+    """GitHub does not report the event's head commit yet; raised so the job queue retries the run."""
+
+
+def is_stale_head(event, pr_number: int, expected_sha: str | None, head_sha: str | None, is_cancelled=None) -> bool:
+    """
+    Whether the PR has moved past the commit the triggering event was about.
+
+    Only a fetched head that is a descendant of the event's commit makes the run stale.
+    Right after a push the API can still return the previous head; then the run raises
+    StaleHeadPending to be retried, unless a newer job for the PR has superseded it.
+    """
+    if not expected_sha or not head_sha or expected_sha == head_sha:
+        return False
+    try:
+        status = event.repo.compare(expected_sha, head_sha).status
+    except Exception as e:
+        logging.warning(f"Could not compare {expected_sha}...{head_sha} for PR #{pr_number}: {e}")
+        status = None
+    if status == "ahead":
+        logging.info(f"Skipping stale analysis for PR #{pr_number}: event was for {expected_sha}, head is now {head_sha}")
+        return True
+    if is_cancelled is not None and is_cancelled():
+        logging.info(f"Cancelled analysis for PR #{pr_number} at {expected_sha}: superseded by a newer event")
+        return True
+    raise StaleHeadPending(f"PR #{pr_number}: event was for {expected_sha}, but GitHub reports head {head_sha}")
+
+
+def should_skip_analysis(event, pr_number: int, head_sha: str | None, *, force: bool) -> bool:
+    """
+    Run the pause-label, quota-cooldown and de-duplication checks for an analysis.
 
-    post_comment_webhook(
+    Returns True (after logging why) when the analysis should not run. `force`
+    (a manual `/analyze`) bypasses all three.
+    """
+    if force:
+        return False
+    try:
+        paused = PAUSE_LABEL in event.label_names
+        if paused:
+            logging.info(f"Skipping analysis for PR #{pr_number}: paused via label '{PAUSE_LABEL}'")
+            return True
+
+        # The shared per-key cooldown is checked first; the PR's own marker covers restarts without a shared file.
+        quota_until = current_cooldown_until() or get_quota_cooldown_until(comments=event.issue_comments)
+        if quota_until is not None and time.time() < quota_until:
+            until_iso = datetime.fromtimestamp(quota_until, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+            logging.info(f"Skipping analysis for PR #{pr_number}: quota cooldown until {until_iso}")
+            return True
+    except Exception as e:
+        # Do not hard-fail analysis for label lookup issues.
+        logging.warning(f"Pause label check failed for PR #{pr_number}: {str(e)}")
+
+    # De-duplication check: Skip ONLY if analysis already exists for this EXACT commit SHA
+    for comment in event.issue_comments:
+        if f"harperbot-sha: {head_sha}" in (comment.body or ""):
+            logging.info(f"Skipping analysis for PR #{pr_number}: Analysis already exists for SHA {head_sha}")
+            return True
+    return False
+
+
+def post_quota_notice(installation_token: str, repo_name: str, pr_number: int):
+    """
+    Post the quota notice whose marker pauses auto-analysis for this PR.
+
+    The pause lasts as long as the shared cooldown (the retry delay Gemini asked
+    for), or QUOTA_COOLDOWN_SECONDS if none is recorded.
+    """
+    shared_until = current_cooldown_until()
+    quota_until = int(shared_until or time.time() + max(0, QUOTA_COOLDOWN_SECONDS))
+    until_iso = datetime.fromtimestamp(quota_until, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+    post_notice_comment(
         installation_token,
         repo_name,
-        pr_details,
-        analysis,
-        manual=force,
-        force_review=force_review,
+        pr_number,
+        "Gemini quota exceeded",
+        (
+            "HarperBot hit a Gemini quota/rate limit and paused its Gemini calls, including `/analyze`.\n\n"
+            f"Analysis resumes after: **{until_iso}**\n\n"
+            "Comment `/analyze` after that time to run it again.\n\n"
+            f"<!-- harperbot-quota-until: {quota_until} -->"
+        ),
     )
+    logging.warning(f"Quota exceeded for PR #{pr_number}; cooldown until {until_iso}")
 
 
 def handle_pr_comment_command(
@@ -1329,7 +2111,8 @@ def handle_pr_comment_command(
     command_args = {part.lower() for part in command_parts[1:]}
 
     if command == "/apply":
-        return handle_apply_comment(installation_id, repo_name, pr_number, commenter_login=commenter_login)
+        with github_event(repo_name, pr_number):
+            return handle_apply_comment(installation_id, repo_name, pr_number, commenter_login=commenter_login)
     if command == "/analyze":
         logging.info(f"Processing /analyze for PR #{pr_number} in {repo_name}")
         force_review = ("--force-review" in command_args) or ("--force_review" in command_args)
@@ -1340,90 +2123,97 @@ def handle_pr_comment_command(
                 pr_number,
                 force=True,
                 force_review=force_review,
+                fresh="--fresh" in command_args,
             )
             return {"status": "ok"}, 200
         except Exception as e:
             logging.error(f"Error processing /analyze: {str(e)}")
             return {"error": "Processing failed"}, 500
     if command in {"/pause", "/resume", "/status"}:
-        g, installation_token, _ = setup_environment_webhook(installation_id)
-        repo = g.get_repo(repo_name)
-        issue = repo.get_issue(number=pr_number)
-        label_names = {label.name for label in issue.get_labels()}
-        is_paused = PAUSE_LABEL in label_names
-
-        if command == "/pause":
-            if not is_paused:
-                try:
-                    issue.add_to_labels(PAUSE_LABEL)
-                except GithubException:
-                    ensure_label_exists(repo, PAUSE_LABEL)
-                    issue.add_to_labels(PAUSE_LABEL)
-            post_notice_comment(
-                installation_token,
-                repo_name,
-                pr_number,
-                "Paused",
-                f"Auto analysis is paused for this PR.\n\nUse `/resume` to turn it back on.\n\nLabel: `{PAUSE_LABEL}`",
-            )
-            return {"status": "ok"}, 200
+        with github_event(repo_name, pr_number) as event:
+            g, installation_token, _ = setup_environment_webhook(installation_id)
+            event.github = g
+            repo = event.repo
+            issue = event.issue
+            is_paused = PAUSE_LABEL in event.label_names
+
+            if command == "/pause":
+                if not is_paused:
+                    try:
+                        issue.add_to_labels(PAUSE_LABEL)
+                    except github.GithubException:
+                        ensure_label_exists(repo, PAUSE_LABEL)
+                        issue.add_to_labels(PAUSE_LABEL)
+                post_notice_comment(
+                    installation_token,
+                    repo_name,
+                    pr_number,
+                    "Paused",
+                    f"Auto analysis is paused for this PR.\n\nUse `/resume` to turn it back on.\n\nLabel: `{PAUSE_LABEL}`",
+                )
+                return {"status": "ok"}, 200
+
+            if command == "/resume":
+                if is_paused:
+                    try:
+                        issue.remove_from_labels(PAUSE_LABEL)
+                    except github.GithubException:
+                        # If the label was deleted/renamed, treat it as already resumed.
+                        pass
+                post_notice_comment(
+                    installation_token,
+                    repo_name,
+                    pr_number,
+                    "Resumed",
+                    f"Auto analysis is enabled for this PR.\n\nUse `/pause` to pause again.\n\nLabel: `{PAUSE_LABEL}`",
+                )
+                return {"status": "ok"}, 200
+
+            # /status
+            try:
+                comments = event.issue_comments
+            except Exception:
+                # Best effort, like get_quota_cooldown_until itself.
+                comments = []
+            quota_until = current_cooldown_until() or get_quota_cooldown_until(comments=comments)
+            quota_msg = ""
+            if quota_until is not None and time.time() < quota_until:
+                until_iso = datetime.fromtimestamp(quota_until, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+                quota_msg = f"\n\nQuota cooldown active until: **{until_iso}**"
 
-        if command == "/resume":
-            if is_paused:
-                try:
-                    issue.remove_from_labels(PAUSE_LABEL)
-                except GithubException:
-                    # If the label was deleted/renamed, treat it as already resumed.
-                    pass
+            state = "paused" if is_paused else "enabled"
+            label_msg = f"Paused label present: `{PAUSE_LABEL}`" if is_paused else f"Paused label not present: `{PAUSE_LABEL}`"
+            build_msg = get_build_string()
+            build_line = f"\n\n{build_msg}" if build_msg else ""
             post_notice_comment(
                 installation_token,
                 repo_name,
                 pr_number,
-                "Resumed",
-                f"Auto analysis is enabled for this PR.\n\nUse `/pause` to pause again.\n\nLabel: `{PAUSE_LABEL}`",
+                "Status",
+                f"Auto analysis is **{state}** for this PR.{quota_msg}\n\n{label_msg}{build_line}",
             )
             return {"status": "ok"}, 200
-
-        # /status
-        repo = g.get_repo(repo_name)
-        pr = repo.get_pull(pr_number)
-        quota_until = get_quota_cooldown_until(pr)
-        quota_msg = ""
-        if quota_until is not None and time.time() < quota_until:
-            until_iso = datetime.fromtimestamp(quota_until, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
-            quota_msg = f"\n\nQuota cooldown active until: **{until_iso}**"
-
-        state = "paused" if is_paused else "enabled"
-        label_msg = f"Paused label present: `{PAUSE_LABEL}`" if is_paused else f"Paused label not present: `{PAUSE_LABEL}`"
-        build_msg = get_build_string()
-        build_line = f"\n\n{build_msg}" if build_msg else ""
-        post_notice_comment(
-            installation_token,
-            repo_name,
-            pr_number,
-            "Status",
-            f"Auto analysis is **{state}** for this PR.{quota_msg}\n\n{label_msg}{build_line}",
-        )
-        return {"status": "ok"}, 200
     if command == "/help":
-        _, installation_token, _ = setup_environment_webhook(installation_id)
-        help_text = """
+        with github_event(repo_name, pr_number) as event:
+            g, installation_token, _ = setup_environment_webhook(installation_id)
+            event.github = g
+            help_text = """
 **HarperBot Capabilities**
 
 - Automatic analysis on PR open/reopen
-- Manual analysis: `/analyze`
+- Manual analysis: `/analyze` (`/analyze --fresh` skips the analysis cache)
 - Apply suggestions: `/apply`
 - Pause/resume auto analysis: `/pause`, `/resume`, `/status`
 - Merge commands (write/admin only): `/merge`, `/squash`, `/rebase`
 """.strip()
-        post_notice_comment(
-            installation_token,
-            repo_name,
-            pr_number,
-            "Help",
-            help_text,
-        )
-        return {"status": "ok"}, 200
+            post_notice_comment(
+                installation_token,
+                repo_name,
+                pr_number,
+                "Help",
+                help_text,
+            )
+            return {"status": "ok"}, 200
     if command == "/merge":
         return handle_merge_command(installation_id, repo_name, pr_number, "merge", commenter_login)
     if command == "/squash":
@@ -1434,15 +2224,17 @@ def handle_pr_comment_command(
 
 
 def is_quota_exceeded_message(analysis: str) -> bool:
-    text = (analysis or "").lower()
-    return "api quota exceeded" in text or "rate limit" in text or "quota" in text and "exceeded" in text
+    return parsed_analysis(analysis or "").quota_exceeded
 
 
-def get_quota_cooldown_until(pr) -> int | None:
-    """Return a unix timestamp until which auto-analysis should be skipped."""
+def get_quota_cooldown_until(pr=None, comments=None) -> int | None:
+    """Return a unix timestamp until which auto-analysis should be skipped.
+
+    Pass `comments` when the PR's issue comments were already fetched.
+    """
     latest = None
     try:
-        for comment in pr.get_issue_comments():
+        for comment in pr.get_issue_comments() if comments is None else comments:
             body = comment.body or ""
             match = QUOTA_UNTIL_MARKER_RE.search(body)
             if not match:
@@ -1463,7 +2255,7 @@ def ensure_label_exists(repo, name: str):
     try:
         # If it already exists, GitHub will return 422 on create; swallow it.
         repo.create_label(name=name, color="6e7681", description="HarperBot control label")
-    except GithubException as e:
+    except github.GithubException as e:
         status = getattr(e, "status", None)
         if status in {422, 409}:
             return
@@ -1477,7 +2269,7 @@ def get_commenter_permission(repo, commenter_login: str | None):
 
     try:
         return repo.get_collaborator_permission(commenter_login)
-    except GithubException as e:
+    except github.GithubException as e:
         status = getattr(e, "status", None)
         if status in {403, 404}:
             logging.warning(f"Permission lookup failed for user {commenter_login}; treating as unprivileged (status={status})")
@@ -1493,85 +2285,168 @@ def handle_merge_command(
     commenter_login: str,
 ):
     """Handle merge/rebase commands from PR comments."""
-    g, _, _ = setup_environment_webhook(installation_id)
-    repo = g.get_repo(repo_name)
-    permission = get_commenter_permission(repo, commenter_login)
-    if permission not in {"admin", "write"}:
-        pr = repo.get_pull(pr_number)
-        pr.create_issue_comment(
-            format_notice(
-                "Insufficient permissions",
-                "You need write/admin permissions to use merge commands.",
-            )
-        )
-        logging.warning(f"User {commenter_login} lacks permission ({permission}) for {merge_method} on PR #{pr_number}")
-        return jsonify({"status": "forbidden"}), 403
-
-    pr = repo.get_pull(pr_number)
-    if pr.merged:
-        pr.create_issue_comment(format_notice("Already merged", "This PR is already merged."))
-        return jsonify({"status": "already_merged"})
-
-    try:
-        if pr.mergeable is False:
+    with github_event(repo_name, pr_number) as event:
+        g, _, _ = setup_environment_webhook(installation_id)
+        event.github = g
+        repo = event.repo
+        permission = get_commenter_permission(repo, commenter_login)
+        if permission not in {"admin", "write"}:
+            pr = event.pr
             pr.create_issue_comment(
                 format_notice(
-                    "PR not mergeable",
-                    "Resolve conflicts or wait for checks, then try again.",
+                    "Insufficient permissions",
+                    "You need write/admin permissions to use merge commands.",
                 )
             )
-            return jsonify({"status": "not_mergeable"})
+            logging.warning(f"User {commenter_login} lacks permission ({permission}) for {merge_method} on PR #{pr_number}")
+            return jsonify({"status": "forbidden"}), 403
 
-        result = pr.merge(merge_method=merge_method)
-        if result.merged:
-            pr.create_issue_comment(f"Merged via {merge_method} by HarperBot.")
-            logging.info(f"Merged PR #{pr_number} with method={merge_method}")
-            return jsonify({"status": "merged"})
+        pr = event.pr
+        if pr.merged:
+            pr.create_issue_comment(format_notice("Already merged", "This PR is already merged."))
+            return jsonify({"status": "already_merged"})
 
-        pr.create_issue_comment(f"Merge failed: {result.message}")
-        return jsonify({"status": "merge_failed"}), 409
-    except GithubException as e:
-        status = getattr(e, "status", None)
-        message = ""
-        documentation_url = ""
         try:
-            data = getattr(e, "data", None) or {}
-            message = (data.get("message") or "").strip()
-            documentation_url = (data.get("documentation_url") or "").strip()
-        except Exception:
+            if pr.mergeable is False:
+                pr.create_issue_comment(
+                    format_notice(
+                        "PR not mergeable",
+                        "Resolve conflicts or wait for checks, then try again.",
+                    )
+                )
+                return jsonify({"status": "not_mergeable"})
+
+            result = pr.merge(merge_method=merge_method)
+            if result.merged:
+                pr.create_issue_comment(f"Merged via {merge_method} by HarperBot.")
+                logging.info(f"Merged PR #{pr_number} with method={merge_method}")
+                return jsonify({"status": "merged"})
+
+            pr.create_issue_comment(f"Merge failed: {result.message}")
+            return jsonify({"status": "merge_failed"}), 409
+        except github.GithubException as e:
+            status = getattr(e, "status", None)
             message = ""
             documentation_url = ""
+            try:
+                data = getattr(e, "data", None) or {}
+                message = (data.get("message") or "").strip()
+                documentation_url = (data.get("documentation_url") or "").strip()
+            except Exception:
+                message = ""
+                documentation_url = ""
+
+            logging.error(f"Error merging PR #{pr_number}: {str(e)}")
+
+            if status == 405:
+                # Common for /rebase when the repo disallows rebase merges.
+                details = message or "GitHub rejected this merge method for the PR."
+                docs_line = f"\n\nDocs: {documentation_url}" if documentation_url else ""
+                pr.create_issue_comment(
+                    format_notice(
+                        "Merge method not allowed",
+                        (
+                            f"GitHub API rejected this request (HTTP {status}).\n\n"
+                            f"{details}\n\n"
+                            "Try `/merge` or `/squash`, or enable rebase merges in repository settings."
+                            f"{docs_line}"
+                        ),
+                    )
+                )
+                return jsonify({"status": "method_not_allowed"}), 200
 
-        logging.error(f"Error merging PR #{pr_number}: {str(e)}")
+            if status in {409, 422}:
+                details = message or "GitHub rejected the merge request."
+                pr.create_issue_comment(format_notice("Merge rejected", details))
+                return jsonify({"status": "merge_rejected"}), 200
 
-        if status == 405:
-            # Common for /rebase when the repo disallows rebase merges.
-            details = message or "GitHub rejected this merge method for the PR."
-            docs_line = f"\n\nDocs: {documentation_url}" if documentation_url else ""
-            pr.create_issue_comment(
-                format_notice(
-                    "Merge method not allowed",
-                    (
-                        f"GitHub API rejected this request (HTTP {status}).\n\n"
-                        f"{details}\n\n"
-                        "Try `/merge` or `/squash`, or enable rebase merges in repository settings."
-                        f"{docs_line}"
-                    ),
-                )
-            )
-            return jsonify({"status": "method_not_allowed"}), 200
+            pr.create_issue_comment(format_notice("Merge failed", "Merge failed due to an error. Check logs for details."))
+            return jsonify({"error": "merge_failed"}), 500
+        except Exception as e:
+            logging.error(f"Error merging PR #{pr_number}: {str(e)}")
+            pr.create_issue_comment(format_notice("Merge failed", "Merge failed due to an error. Check logs for details."))
+            return jsonify({"error": "merge_failed"}), 500
 
-        if status in {409, 422}:
-            details = message or "GitHub rejected the merge request."
-            pr.create_issue_comment(format_notice("Merge rejected", details))
-            return jsonify({"status": "merge_rejected"}), 200
 
-        pr.create_issue_comment(format_notice("Merge failed", "Merge failed due to an error. Check logs for details."))
-        return jsonify({"error": "merge_failed"}), 500
+def enqueue_webhook_job(job_queue: JobQueue, kind: str, payload: dict, **enqueue_kwargs):
+    """Persist a verified webhook as a job and acknowledge it with 202."""
+    try:
+        job_id = job_queue.enqueue(kind, payload, **enqueue_kwargs)
     except Exception as e:
-        logging.error(f"Error merging PR #{pr_number}: {str(e)}")
-        pr.create_issue_comment(format_notice("Merge failed", "Merge failed due to an error. Check logs for details."))
-        return jsonify({"error": "merge_failed"}), 500
+        logging.error(f"Error enqueueing {kind} job: {str(e)}")
+        return jsonify({"error": "Enqueue failed"}), 500
+    return jsonify({"status": "queued", "job_id": job_id}), 202
+
+
+def process_job(job: dict, job_queue: JobQueue | None = None):
+    """
+    Run a queued webhook job. Raises on failure so the queue retries it.
+
+    Jobs run inside the Flask app context because command handlers build
+    responses with `jsonify`. Analyses stop early once `job_queue` reports a
+    newer job for the same PR.
+    """
+    kind = job["kind"]
+    payload = dict(job["payload"])
+    if kind == "pull_request":
+        handler = run_analysis_for_pr
+        if job_queue is not None and job.get("coalesce_key"):
+            payload["is_cancelled"] = lambda: job_queue.is_superseded(job)
+    elif kind == "comment_command":
+        handler = handle_pr_comment_command
+    else:
+        logging.error(f"Dropping job {job.get('id')} with unknown kind {kind!r}")
+        return
+
+    if flask_available:
+        with app.app_context():
+            result = handler(**payload)
+    else:
+        result = handler(**payload)
+
+    status = result[1] if isinstance(result, tuple) and len(result) == 2 else 200
+    if isinstance(status, int) and status >= 500:
+        raise RuntimeError(f"{kind} job returned HTTP {status}")
+
+
+def worker_main(argv=None):
+    """Drain the webhook job queue (`harperbot worker`)."""
+    parser = argparse.ArgumentParser(prog="harperbot worker", description="Process queued HarperBot webhook jobs")
+    parser.add_argument(
+        "--queue",
+        default=os.getenv("HARPERBOT_JOB_QUEUE", ""),
+        help="Path to the SQLite job queue (defaults to HARPERBOT_JOB_QUEUE)",
+    )
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="Number of worker threads")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if not args.queue:
+        logging.error("No job queue configured. Pass --queue or set HARPERBOT_JOB_QUEUE.")
+        sys.exit(1)
+
+    load_config()  # Fail fast on an invalid config.yaml
+    job_queue = JobQueue(args.queue)
+    run_worker(job_queue, lambda job: process_job(job, job_queue), concurrency=args.concurrency)
+
+
+def check_config_main(argv=None) -> int:
+    """Validate config.yaml without starting the bot (`harperbot check-config`), for CI and deploy steps."""
+    parser = argparse.ArgumentParser(prog="harperbot check-config", description="Validate a HarperBot config.yaml")
+    parser.add_argument("path", nargs="?", default=CONFIG_PATH, help="Path to config.yaml (defaults to the bundled one)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"{args.path}: not found", file=sys.stderr)
+        return 1
+    try:
+        ConfigLoader(args.path).get()
+    except ConfigError as e:
+        print(f"{args.path}: {e}", file=sys.stderr)
+        return 1
+    print(f"{args.path}: OK")
+    return 0
 
 
 def webhook_handler():
@@ -1580,6 +2455,12 @@ def webhook_handler():
 
     Processes webhook payloads for pull request opened/reopened events.
     Verifies signature, extracts PR data, runs analysis, and posts comments.
+    With HARPERBOT_JOB_QUEUE set, the work is enqueued and the delivery is
+    acknowledged with 202 instead.
+
+    Redelivered webhooks (same X-GitHub-Delivery id) are dropped right after the
+    signature check. Deliveries that fail with a 5xx are forgotten again so
+    GitHub's redelivery can retry them.
     """
     if not flask_available:
         logging.error("Flask not available for webhook mode")
@@ -1593,8 +2474,21 @@ def webhook_handler():
         logging.warning("Invalid webhook signature received")
         return jsonify({"error": "Invalid signature"}), 403
 
-    data = request.get_json()
+    delivery_id = request.headers.get("X-GitHub-Delivery")
+    delivery_cache = get_delivery_cache()
+    if delivery_cache.check_and_record(delivery_id):
+        logging.info(f"Ignoring duplicate webhook delivery {delivery_id}")
+        return jsonify({"status": "duplicate"})
+
+    response = dispatch_webhook_event(request.get_json())
+    status = response[1] if isinstance(response, tuple) and len(response) == 2 else 200
+    if isinstance(status, int) and status >= 500:
+        delivery_cache.forget(delivery_id)
+    return response
 
+
+def dispatch_webhook_event(data: dict):
+    """Route a verified webhook payload to the matching handler."""
     event_type = data.get("action")
     has_pr = "pull_request" in data
     has_comment = "issue" in data and "comment" in data
@@ -1607,11 +2501,26 @@ def webhook_handler():
         logging.warning(f"Webhook payload missing repository field: {data.keys()}")
         return jsonify({"error": "Missing repository information"}), 400
 
+    # When a job queue is configured, acknowledge with 202 and let `harperbot worker` do the work.
+    job_queue = get_job_queue()
+
     # Inline PR review comments (Files changed tab)
     if event_type == "created" and has_review_comment:
         pr_number = data["pull_request"]["number"]
         comment_body = data["comment"]["body"]
         commenter_login = data.get("comment", {}).get("user", {}).get("login", "")
+        if job_queue is not None:
+            return enqueue_webhook_job(
+                job_queue,
+                "comment_command",
+                {
+                    "installation_id": installation_id,
+                    "repo_name": repo_name,
+                    "pr_number": pr_number,
+                    "comment_body": comment_body,
+                    "commenter_login": commenter_login,
+                },
+            )
         result = handle_pr_comment_command(
             installation_id,
             repo_name,
@@ -1631,6 +2540,18 @@ def webhook_handler():
         pr_number = issue["number"]
         comment_body = data["comment"]["body"]
         commenter_login = data.get("comment", {}).get("user", {}).get("login", "")
+        if job_queue is not None:
+            return enqueue_webhook_job(
+                job_queue,
+                "comment_command",
+                {
+                    "installation_id": installation_id,
+                    "repo_name": repo_name,
+                    "pr_number": pr_number,
+                    "comment_body": comment_body,
+                    "commenter_login": commenter_login,
+                },
+            )
         result = handle_pr_comment_command(
             installation_id,
             repo_name,
@@ -1650,6 +2571,18 @@ def webhook_handler():
 
     pr_number = data["pull_request"]["number"]
 
+    if job_queue is not None:
+        head_sha = (data["pull_request"].get("head") or {}).get("sha")
+        return enqueue_webhook_job(
+            job_queue,
+            "pull_request",
+            {"installation_id": installation_id, "repo_name": repo_name, "pr_number": pr_number, "head_sha": head_sha},
+            # One pending analysis per PR; pushes inside the debounce window replace each other.
+            coalesce_key=f"{repo_name}#{pr_number}",
+            head_sha=head_sha,
+            delay=SYNC_DEBOUNCE_SECONDS if event_type == "synchronize" else 0.0,
+        )
+
     logging.info(f"Processing PR #{pr_number} in {repo_name}")
 
     try:
@@ -1661,13 +2594,20 @@ def webhook_handler():
         return jsonify({"error": "Processing failed"}), 500
 
 
-def main():
+def main(argv=None):
     """Main function to run the PR bot."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "worker":
+        return worker_main(argv[1:])
+    if argv and argv[0] == "check-config":
+        return check_config_main(argv[1:])
+
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="GitHub PR Bot with Gemini AI")
     parser.add_argument("--repo", required=True, help="GitHub repository in format: owner/repo")
     parser.add_argument("--pr", type=int, required=True, help="Pull request number")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    load_config()  # Fail fast on an invalid config.yaml
 
     # Setup environment and get PR details
     github_token, client = setup_environment()
@@ -1696,10 +2636,11 @@ if __name__ == "__main__":
     else:
         # Webhook mode
         if flask_available:
+            webhook_app = create_app()  # Fail fast on an invalid config.yaml
             print("Starting HarperBot in webhook mode...")
             # Note: Flask's development server is for testing only. For production,
-            # use a WSGI server like Gunicorn: gunicorn -w 4 harperbot:app
-            app.run(debug=False)
+            # use a WSGI server like Gunicorn: gunicorn -w 4 'harperbot.harperbot:create_app()'
+            webhook_app.run(debug=False)
         else:
             print("Flask not installed. For webhook mode, install with: pip install flask")
             print("For CLI mode, run: python harperbot.py --repo owner/repo --pr 123")
@@ -8,6 +8,13 @@ Handles user-approved application of code suggestions, committed as HarperBot.
 
 import logging
 
+try:
+    from .event_context import current_event
+    from .scheduler import gemini_caller
+except ImportError:
+    from event_context import current_event
+    from scheduler import gemini_caller
+
 # Flask imported conditionally for webhook mode
 flask_available = False
 try:
@@ -18,12 +25,18 @@ except ImportError:
     pass
 
 # Assuming these are imported from harperbot
-# from harperbot.harperbot import setup_environment_webhook, get_pr_details_webhook, analyze_with_gemini, parse_code_suggestions, apply_suggestions_to_pr
+# from harperbot.harperbot import setup_environment_webhook, load_posted_analysis, analyze_with_gemini, parse_code_suggestions, apply_suggestions_to_pr
 
 
 def handle_apply_comment(installation_id, repo_name, pr_number, commenter_login=None):
     """
-    Handle /apply comment on PR: re-analyze and apply suggestions as HarperBot.
+    Handle /apply comment on PR: apply the posted suggestions as HarperBot.
+
+    The suggestions come from the analysis HarperBot posted for the PR's current
+    head commit (the analysis cache, or the marker kept in the analysis comment), so
+    only suggestions that were shown get committed. A review of that commit posted
+    without the marker (older, or too long to keep it) is analyzed again. Without a
+    review of that commit, the user is asked to run `/analyze` first.
     """
     if not flask_available:
         logging.error("Flask not available for webhook mode")
@@ -36,14 +49,17 @@ def handle_apply_comment(installation_id, repo_name, pr_number, commenter_login=
             build_pr_details_from_pr,
             format_notice,
             get_commenter_permission,
+            last_analyzed_sha,
             load_config,
+            load_posted_analysis,
             parse_code_suggestions,
             setup_environment_webhook,
         )
 
         g, installation_token, client = setup_environment_webhook(installation_id)
-        repo = g.get_repo(repo_name)
-        pr = repo.get_pull(pr_number)
+        event = current_event(repo_name, pr_number, g)
+        repo = event.repo
+        pr = event.pr
         config = load_config()
 
         if not config.get("enable_authoring", False):
@@ -68,8 +84,21 @@ def handle_apply_comment(installation_id, repo_name, pr_number, commenter_login=
             )
             return jsonify({"status": "forbidden"}), 403
 
-        pr_details = build_pr_details_from_pr(pr, installation_token=installation_token)
-        analysis = analyze_with_gemini(client, pr_details)
+        head_sha = pr.head.sha
+        analysis = load_posted_analysis(repo_name, pr_number, head_sha, event.issue_comments)
+        if analysis is None and last_analyzed_sha(event.issue_comments) == head_sha:
+            pr_details = build_pr_details_from_pr(pr, installation_token=installation_token)
+            with gemini_caller(installation_id, manual=True):
+                analysis = analyze_with_gemini(client, pr_details)
+        if analysis is None:
+            pr.create_issue_comment(
+                format_notice(
+                    "Nothing to apply",
+                    f"HarperBot has not reviewed the current head commit ({head_sha[:7]}). "
+                    "Comment `/analyze`, then `/apply` once the review is posted.",
+                )
+            )
+            return jsonify({"status": "no_analysis"})
         suggestions = parse_code_suggestions(analysis)
 
         if suggestions:
@@ -0,0 +1,99 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot HTTP Session
+One keep-alive connection pool per process, shared by diff downloads and every
+PyGithub client, so requests to GitHub reuse TCP/TLS connections.
+"""
+
+import os
+import threading
+
+import requests
+from github import GithubRetry
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from .event_context import record_api_call
+except ImportError:
+    from event_context import record_api_call
+
+HTTP_POOL_SIZE = int(os.getenv("HARPERBOT_HTTP_POOL_SIZE", "16"))
+HTTP_RETRIES = int(os.getenv("HARPERBOT_HTTP_RETRIES", "3"))
+
+_session = None
+_session_lock = threading.Lock()
+_github_installed = False
+
+
+def get_http_session() -> requests.Session:
+    """
+    Return the process-wide pooled session.
+
+    Every response is counted as a GitHub API call (see event_context.py).
+
+    api.github.com uses PyGithub's GithubRetry (which honours rate-limit headers);
+    other hosts, such as the diff redirect target, use plain retries on 5xx.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # Keep requests from falling back to ~/.netrc credentials, as PyGithub does.
+            session.auth = Requester.noopAuth
+            session.hooks["response"].append(_count_response)
+            default_retry = Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset({"GET", "HEAD"}),
+            )
+            session.mount(
+                "https://",
+                HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=default_retry),
+            )
+            github_adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=GithubRetry(total=HTTP_RETRIES),
+            )
+            # PyGithub builds its URLs as https://{host}:{port}{url}, so mount the port-qualified prefix too.
+            session.mount("https://api.github.com/", github_adapter)
+            session.mount("https://api.github.com:443/", github_adapter)
+            _session = session
+        return _session
+
+
+def _count_response(response, *args, **kwargs):
+    record_api_call()
+
+
+class SharedSessionHTTPSConnection(HTTPSRequestsConnectionClass):
+    """PyGithub connection that sends requests through the shared session instead of its own."""
+
+    def __init__(self, host, port=None, strict=False, timeout=None, retry=None, pool_size=None, **kwargs):
+        self.port = port if port else 443
+        self.host = host
+        self.protocol = "https"
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+        self.retry = retry
+        self.pool_size = pool_size
+        self.session = get_http_session()
+
+    def close(self):
+        # The shared session outlives any single PyGithub connection.
+        pass
+
+
+def install_github_session():
+    """Route all PyGithub HTTPS traffic in this process through the shared session."""
+    global _github_installed
+    with _session_lock:
+        if _github_installed:
+            return
+        Requester.injectConnectionClasses(HTTPRequestsConnectionClass, SharedSessionHTTPSConnection)
+        _github_installed = True
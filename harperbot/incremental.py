@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Incremental Review
+Per-PR findings from earlier analyses: which files were reviewed together, their
+patches (by hash) at the time, and the resulting analysis. On the next push only
+the files whose patches changed are sent to Gemini again.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass
+
+try:
+    from .mapreduce import file_diffs
+except ImportError:
+    from mapreduce import file_diffs
+
+
+@dataclass(frozen=True)
+class FindingGroup:
+    """The analysis of a set of files; `files` holds `(path, patch_hash)` pairs."""
+
+    files: tuple
+    analysis: str
+    size: int
+
+
+@dataclass(frozen=True)
+class Findings:
+    """All finding groups for a PR, as of the analyzed head `sha`."""
+
+    sha: str
+    groups: tuple
+
+
+def findings_key(repo_name: str, pr_number: int) -> str:
+    return f"harperbot-findings:{repo_name}#{pr_number}"
+
+
+def patch_hashes(diff: str) -> dict:
+    """Map each path in `diff` to the SHA-256 of its patch."""
+    hashes = {}
+    for path, text in file_diffs(diff):
+        # A file split across `diff --git` sections (unusual) hashes all of them.
+        hashes[path] = hashlib.sha256((hashes.get(path, "") + text).encode()).hexdigest()
+    return hashes
+
+
+def load_findings(store, repo_name: str, pr_number: int) -> Findings | None:
+    """Read the PR's findings from `store` (an AnalysisCache); None if absent or unreadable."""
+    raw = store.get(findings_key(repo_name, pr_number))
+    if raw is None:
+        return None
+    try:
+        data = json.loads(raw)
+        groups = tuple(
+            FindingGroup(files=tuple(tuple(entry) for entry in group["files"]), analysis=group["analysis"], size=group["size"])
+            for group in data["groups"]
+        )
+        return Findings(sha=data["sha"], groups=groups)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def save_findings(store, repo_name: str, pr_number: int, findings: Findings):
+    payload = {
+        "sha": findings.sha,
+        "groups": [{"files": list(group.files), "analysis": group.analysis, "size": group.size} for group in findings.groups],
+    }
+    store.put(findings_key(repo_name, pr_number), json.dumps(payload))
+
+
+def reusable_groups(findings: Findings, hashes: dict) -> tuple:
+    """The groups whose files are all still in the PR with unchanged patches."""
+    return tuple(
+        group for group in findings.groups if group.files and all(hashes.get(path) == digest for path, digest in group.files)
+    )
+
+
+def pending_diff(diff: str, reused: tuple) -> str:
+    """The part of `diff` not covered by the `reused` groups."""
+    covered = {path for group in reused for path, _ in group.files}
+    return "".join(text for path, text in file_diffs(diff) if path not in covered)
@@ -0,0 +1,321 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Job Queue
+Durable SQLite-backed queue so webhook deliveries can be acknowledged immediately
+and analyzed later by `harperbot worker`.
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+
+JOB_QUEUE_PATH = os.getenv("HARPERBOT_JOB_QUEUE", "").strip()
+JOB_LEASE_SECONDS = int(os.getenv("HARPERBOT_JOB_LEASE_SECONDS", "900"))
+JOB_MAX_ATTEMPTS = int(os.getenv("HARPERBOT_JOB_MAX_ATTEMPTS", "5"))
+WORKER_CONCURRENCY = int(os.getenv("HARPERBOT_WORKER_CONCURRENCY", "4"))
+WORKER_POLL_SECONDS = float(os.getenv("HARPERBOT_WORKER_POLL_SECONDS", "1.0"))
+# Rapid `synchronize` pushes are held this long so only the newest head SHA is analyzed.
+SYNC_DEBOUNCE_SECONDS = float(os.getenv("HARPERBOT_SYNC_DEBOUNCE_SECONDS", "30"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,
+    lease_until REAL,
+    worker_id TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    coalesce_key TEXT,
+    head_sha TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_run_after ON jobs (status, run_after);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS jobs_coalesce_key ON jobs (coalesce_key, status);
+"""
+
+
+class JobQueue:
+    """
+    At-least-once job queue stored in a local SQLite database.
+
+    Jobs move from `pending` to `running` when claimed. A running job holds a lease,
+    which its worker renews while the job runs; if the worker crashes before
+    completing it, the lease expires and the job is handed out again. Jobs that keep failing are parked as `dead` after
+    `max_attempts` so they do not loop forever.
+
+    Jobs that share a `coalesce_key` (one per repository/PR) are coalesced: a new
+    job replaces any that are still pending, at most one of them runs at a time,
+    and a running job can ask `is_superseded()` to stop early.
+    """
+
+    def __init__(self, path: str, *, lease_seconds: int = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("coalesce_key", "head_sha"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+            conn.executescript(_INDEXES)
+
+    def _connect(self):
+        # One short-lived connection per operation keeps the queue safe to share
+        # across worker threads and gunicorn processes.
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return closing(conn)
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: dict,
+        *,
+        delay: float = 0.0,
+        coalesce_key: str | None = None,
+        head_sha: str | None = None,
+    ) -> str:
+        """
+        Persist a job and return its id.
+
+        With a `coalesce_key`, pending jobs for the same key are dropped in favour of
+        this one, so a burst of pushes collapses into a single analysis.
+        """
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                superseded = 0
+                if coalesce_key:
+                    superseded = conn.execute(
+                        "DELETE FROM jobs WHERE coalesce_key = ? AND status = 'pending'",
+                        (coalesce_key,),
+                    ).rowcount
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, payload, status, run_after, created_at, updated_at, coalesce_key, head_sha) "
+                    "VALUES (?, ?, ?, 'pending', ?, ?, ?, ?, ?)",
+                    (job_id, kind, json.dumps(payload), now + max(0.0, delay), now, now, coalesce_key, head_sha),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if superseded:
+            logging.info(f"Enqueued {kind} job {job_id}; superseded {superseded} pending job(s) for {coalesce_key}")
+        else:
+            logging.info(f"Enqueued {kind} job {job_id}")
+        return job_id
+
+    def claim(self, worker_id: str) -> dict | None:
+        """
+        Lease the next runnable job to `worker_id`.
+
+        Expired leases from crashed workers are reclaimed here, which is what gives
+        the queue its crash recovery. Jobs whose coalesce key is already leased by
+        another worker wait, so a PR is never analyzed twice at the same time.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = conn.execute(
+                        "SELECT * FROM jobs "
+                        "WHERE ((status = 'pending' AND run_after <= ?) OR (status = 'running' AND lease_until < ?)) "
+                        "AND (coalesce_key IS NULL OR NOT EXISTS ("
+                        "    SELECT 1 FROM jobs AS other WHERE other.coalesce_key = jobs.coalesce_key "
+                        "    AND other.id != jobs.id AND other.status = 'running' AND other.lease_until >= ?"
+                        ")) "
+                        "ORDER BY run_after, created_at LIMIT 1",
+                        (now, now, now),
+                    ).fetchone()
+                    if row is None:
+                        conn.execute("COMMIT")
+                        return None
+                    if row["attempts"] >= self.max_attempts:
+                        conn.execute(
+                            "UPDATE jobs SET status = 'dead', lease_until = NULL, updated_at = ?, "
+                            "last_error = COALESCE(last_error, 'lease expired too many times') WHERE id = ?",
+                            (now, row["id"]),
+                        )
+                        logging.error(f"Job {row['id']} exceeded {self.max_attempts} attempts; marked dead")
+                        continue
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, "
+                        "worker_id = ?, updated_at = ? WHERE id = ?",
+                        (now + self.lease_seconds, worker_id, now, row["id"]),
+                    )
+                    conn.execute("COMMIT")
+                    job = dict(row)
+                    job["attempts"] += 1
+                    job["payload"] = json.loads(job["payload"])
+                    return job
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def renew(self, job_id: str, worker_id: str) -> bool:
+        """Extend the lease `worker_id` holds on a running job; returns False if it no longer holds it."""
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + self.lease_seconds, now, job_id, worker_id),
+            ).rowcount
+        return updated > 0
+
+    def is_superseded(self, job: dict) -> bool:
+        """Return True when a newer job with the same coalesce key has been enqueued."""
+        if not job.get("coalesce_key"):
+            return False
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM jobs WHERE coalesce_key = ? AND id != ? "
+                "AND rowid > (SELECT rowid FROM jobs WHERE id = ?) LIMIT 1",
+                (job["coalesce_key"], job["id"], job["id"]),
+            ).fetchone()
+        return row is not None
+
+    def complete(self, job_id: str):
+        """Remove a finished job."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def fail(self, job_id: str, error: str):
+        """Schedule a retry with exponential backoff, or park the job once attempts run out."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            attempts = row["attempts"]
+            if attempts >= self.max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = 'dead', lease_until = NULL, last_error = ?, updated_at = ? WHERE id = ?",
+                    (error, now, job_id),
+                )
+                logging.error(f"Job {job_id} failed {attempts} times; marked dead: {error}")
+                return
+            backoff = min(300, 2**attempts)
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', lease_until = NULL, worker_id = NULL, last_error = ?, "
+                "run_after = ?, updated_at = ? WHERE id = ?",
+                (error, now + backoff, now, job_id),
+            )
+            logging.warning(f"Job {job_id} failed (attempt {attempts}); retrying in {backoff}s: {error}")
+
+    def stats(self) -> dict:
+        """Return job counts by status."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue | None:
+    """Return the process-wide queue configured by HARPERBOT_JOB_QUEUE, or None when disabled."""
+    global _default_queue
+    if not JOB_QUEUE_PATH:
+        return None
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = JobQueue(JOB_QUEUE_PATH)
+        return _default_queue
+
+
+@contextmanager
+def _lease_heartbeat(queue: JobQueue, job_id: str, worker_id: str):
+    """Renew the job's lease every third of the lease period while the block runs."""
+    done = threading.Event()
+
+    def beat():
+        while not done.wait(queue.lease_seconds / 3):
+            try:
+                if not queue.renew(job_id, worker_id):
+                    logging.warning(f"Worker {worker_id} lost the lease on job {job_id}")
+                    return
+            except sqlite3.Error as e:
+                logging.error(f"Worker {worker_id} could not renew the lease on job {job_id}: {str(e)}")
+
+    thread = threading.Thread(target=beat, name="harperbot-lease", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def run_worker(
+    queue: JobQueue,
+    handler,
+    *,
+    concurrency: int = WORKER_CONCURRENCY,
+    poll_interval: float = WORKER_POLL_SECONDS,
+    stop_event: threading.Event | None = None,
+):
+    """
+    Drain `queue` with a pool of `concurrency` threads until `stop_event` is set.
+
+    `handler(job)` runs the job; raising marks it failed so it is retried later.
+    The job's lease is renewed while the handler runs, so a long analysis is not
+    handed to a second worker.
+    """
+    stop_event = stop_event or threading.Event()
+    base_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def loop(index: int):
+        worker_id = f"{base_id}:{index}"
+        while not stop_event.is_set():
+            try:
+                job = queue.claim(worker_id)
+            except sqlite3.Error as e:
+                logging.error(f"Worker {worker_id} could not claim a job: {str(e)}")
+                stop_event.wait(poll_interval)
+                continue
+            if job is None:
+                stop_event.wait(poll_interval)
+                continue
+            logging.info(f"Worker {worker_id} running {job['kind']} job {job['id']} (attempt {job['attempts']})")
+            try:
+                with _lease_heartbeat(queue, job["id"], worker_id):
+                    handler(job)
+            except Exception as e:
+                queue.fail(job["id"], str(e))
+                continue
+            queue.complete(job["id"])
+
+    logging.info(f"Starting HarperBot worker with {concurrency} threads on {queue.path}")
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="harperbot-worker") as pool:
+        for index in range(max(1, concurrency)):
+            pool.submit(loop, index)
+        try:
+            while not stop_event.is_set():
+                stop_event.wait(poll_interval)
+        except KeyboardInterrupt:
+            logging.info("Stopping HarperBot worker")
+            stop_event.set()
@@ -0,0 +1,56 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Lazy Imports
+Proxies that defer heavy dependencies (google-genai, PyGithub, requests, ...) until
+they are first used, so webhook cold starts only pay for what an event needs.
+"""
+
+import importlib
+import threading
+
+
+class LazyObject:
+    """
+    Stand-in for an object produced by `factory()` on first attribute access or call.
+
+    Attributes set on the proxy (e.g. by `unittest.mock.patch`) shadow the real
+    object's attributes, so module-level patching keeps working.
+    """
+
+    def __init__(self, factory, description: str):
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_description", description)
+        object.__setattr__(self, "_lazy_target", None)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    def _lazy_resolve(self):
+        target = self._lazy_target
+        if target is None:
+            with self._lazy_lock:
+                target = self._lazy_target
+                if target is None:
+                    target = self._lazy_factory()
+                    object.__setattr__(self, "_lazy_target", target)
+        return target
+
+    def __getattr__(self, attr):
+        return getattr(self._lazy_resolve(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._lazy_resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        state = "loaded" if self._lazy_target is not None else "not loaded"
+        return f"<lazy {self._lazy_description} ({state})>"
+
+
+def lazy_module(name: str) -> LazyObject:
+    """Return a proxy that imports module `name` on first use."""
+    return LazyObject(lambda: importlib.import_module(name), name)
+
+
+def lazy_attribute(module_name: str, attr: str) -> LazyObject:
+    """Return a proxy for `module_name.attr` (a class or function) that imports on first use."""
+    return LazyObject(lambda: getattr(importlib.import_module(module_name), attr), f"{module_name}.{attr}")
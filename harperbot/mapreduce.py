@@ -0,0 +1,213 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Map-Reduce
+Splits a large diff into chunks on file and hunk boundaries, and merges the
+analyses of the chunks back into one review in the usual comment format.
+"""
+
+import re
+from dataclasses import dataclass
+
+try:
+    from .analysis_parser import parsed_analysis
+except ImportError:
+    from analysis_parser import parsed_analysis
+
+_FILE_HEADER_RE = re.compile(r"^diff --git a/(.+?) b/(.+)$")
+_HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@(.*)$")
+
+
+@dataclass(frozen=True)
+class DiffChunk:
+    """Part of a diff that fits in one model call; `files` are the paths it touches."""
+
+    text: str
+    files: tuple
+
+
+def file_diffs(diff: str) -> list:
+    """Split a unified diff into `(path, text)` pairs, one per `diff --git` section."""
+    return [((_section_files(section) or ("",))[0], section) for section in _file_sections(diff)]
+
+
+def _file_sections(diff: str) -> list:
+    sections = []
+    current = []
+    for line in diff.splitlines(keepends=True):
+        if line.startswith("diff --git ") and current:
+            sections.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append("".join(current))
+    return sections
+
+
+def _section_files(section: str) -> tuple:
+    match = _FILE_HEADER_RE.match(section.split("\n", 1)[0])
+    return (match.group(2),) if match else ()
+
+
+def _split_hunk(hunk: str, max_chars: int) -> list:
+    """Cut an oversized hunk on line boundaries, giving every piece its own `@@` header."""
+    lines = hunk.splitlines(keepends=True)
+    match = _HUNK_HEADER_RE.match(lines[0].rstrip("\n"))
+    if not match:
+        return [hunk[i : i + max_chars] for i in range(0, len(hunk), max_chars)]
+    old_line, new_line, trailer = int(match.group(1)), int(match.group(2)), match.group(3)
+
+    pieces = []
+    body, old_count, new_count = [], 0, 0
+    piece_old, piece_new = old_line, new_line
+    budget = max(1, max_chars - len(lines[0]))
+
+    def flush():
+        if body:
+            header = f"@@ -{piece_old},{old_count} +{piece_new},{new_count} @@{trailer}\n"
+            pieces.append(header + "".join(body))
+
+    size = 0
+    for line in lines[1:]:
+        if body and size + len(line) > budget:
+            flush()
+            piece_old, piece_new = old_line, new_line
+            body, old_count, new_count, size = [], 0, 0, 0
+        body.append(line)
+        size += len(line)
+        if line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        if not line.startswith("+"):
+            old_line += 1
+            old_count += 1
+        if not line.startswith("-"):
+            new_line += 1
+            new_count += 1
+    flush()
+    return pieces
+
+
+def _section_pieces(section: str, max_chars: int) -> list:
+    """Split one file's diff into pieces of at most `max_chars`, repeating the file header in each."""
+    if len(section) <= max_chars:
+        return [section]
+    lines = section.splitlines(keepends=True)
+    first_hunk = next((i for i, line in enumerate(lines) if line.startswith("@@")), len(lines))
+    header = "".join(lines[:first_hunk])
+    hunks = []
+    for line in lines[first_hunk:]:
+        if line.startswith("@@") or not hunks:
+            hunks.append([])
+        hunks[-1].append(line)
+
+    budget = max(1, max_chars - len(header))
+    pieces = []
+    current = ""
+    for hunk in ("".join(hunk_lines) for hunk_lines in hunks):
+        parts = [hunk] if len(hunk) <= budget else _split_hunk(hunk, budget)
+        for part in parts:
+            if current and len(current) + len(part) > budget:
+                pieces.append(header + current)
+                current = ""
+            current += part
+    if current or not pieces:
+        pieces.append(header + current)
+    return pieces
+
+
+def split_diff(diff: str, max_chars: int) -> list:
+    """
+    Split `diff` into DiffChunks of at most about `max_chars` characters.
+
+    Whole files are packed together where they fit; larger files are split between
+    hunks, and a single oversized hunk between lines.
+    """
+    chunks = []
+    text, files = "", []
+    for section in _file_sections(diff):
+        for piece in _section_pieces(section, max_chars):
+            if text and len(text) + len(piece) > max_chars:
+                chunks.append(DiffChunk(text=text, files=tuple(files)))
+                text, files = "", []
+            text += piece
+            files.extend(path for path in _section_files(piece) if path not in files)
+    if text:
+        chunks.append(DiffChunk(text=text, files=tuple(files)))
+    return chunks
+
+
+def _format_score(value: float) -> str:
+    return f"{value:.1f}".rstrip("0").rstrip(".")
+
+
+def _merge_scores(sections: list) -> list:
+    totals = {}
+    for section, weight in sections:
+        for score in section.scores:
+            score_sum, weight_sum = totals.get(score.label, (0.0, 0))
+            totals[score.label] = (score_sum + score.value * weight, weight_sum + weight)
+    return [f"- {label}: {_format_score(score_sum / weight_sum)}/10" for label, (score_sum, weight_sum) in totals.items()]
+
+
+def _merge_lines(sections: list) -> list:
+    merged = []
+    seen = set()
+    for section, _ in sections:
+        text = "\n".join(section.lines).strip("\n")
+        if not text:
+            continue
+        if "```" in text:
+            # Code blocks (e.g. suggestion diffs) are kept whole.
+            merged.extend([text, ""])
+            continue
+        for line in text.splitlines():
+            key = line.strip()
+            if key and key in seen:
+                continue
+            seen.add(key)
+            merged.append(line)
+    while merged and not merged[-1].strip():
+        merged.pop()
+    return merged
+
+
+def merge_analyses(analyses: list, notes: list = ()) -> str:
+    """
+    Merge `(analysis, weight)` pairs (one per chunk) into a single analysis.
+
+    Sections are matched by heading and kept in order of first appearance. Summaries
+    become consecutive paragraphs, `N/10` scores are averaged by weight (the chunk's
+    diff size), and other sections are concatenated with duplicate lines removed.
+    `notes` are appended as italic lines.
+    """
+    order = []
+    collected = {}
+    for analysis, weight in analyses:
+        for section in parsed_analysis(analysis).sections:
+            key = section.title.lower() if section.heading else None
+            if key not in collected:
+                order.append(key)
+                collected[key] = (section.heading, [])
+            collected[key][1].append((section, weight))
+
+    out = []
+    for key in order:
+        heading, sections = collected[key]
+        if key is not None and "score" in key:
+            lines = _merge_scores(sections) or _merge_lines(sections)
+        elif key is not None and "summary" in key:
+            lines = []
+            for section, _ in sections:
+                paragraph = "\n".join(section.lines).strip()
+                if paragraph:
+                    lines.extend([paragraph, ""])
+            lines = lines[:-1]
+        else:
+            lines = _merge_lines(sections)
+        if heading:
+            out.append(heading)
+        out.extend(lines)
+        out.append("")
+    out.extend(f"_{note}_" for note in notes)
+    return "\n".join(out).strip()
@@ -0,0 +1,37 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Metrics
+Process-wide counters exported as JSON from the `/metrics` endpoint.
+"""
+
+import threading
+from collections import Counter
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def increment(name: str, value: int = 1):
+    """Add `value` to the counter `name`."""
+    with _lock:
+        _counters[name] += value
+
+
+def get(name: str) -> int:
+    """Return the current value of the counter `name`."""
+    with _lock:
+        return _counters[name]
+
+
+def snapshot() -> dict:
+    """Return a copy of all counters."""
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    """Clear all counters (used by tests)."""
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,189 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Quota State
+Shared Gemini quota cooldown per API key. After a 429 every PR (and, with a
+shared file, every worker) stops calling the model until the retry delay the
+API asked for has passed, then resumes on its own.
+"""
+
+import email.utils
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+QUOTA_STATE_PATH = os.getenv("HARPERBOT_QUOTA_STATE", "").strip()
+# How long a process trusts its copy of the shared file before reading it again.
+QUOTA_STATE_RECHECK_SECONDS = 1.0
+
+_RETRY_IN_RE = re.compile(r"retry (?:in|after) (\d+(?:\.\d+)?)\s*s", re.I)
+_DURATION_RE = re.compile(r"^(\d+(?:\.\d+)?)s$")
+
+
+class QuotaCooldown(Exception):
+    """Raised instead of calling Gemini while the API key's quota cooldown is active."""
+
+    def __init__(self, until: float):
+        self.until = until
+        until_iso = datetime.fromtimestamp(until, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+        super().__init__(f"Gemini quota cooldown active until {until_iso}")
+
+
+def gemini_key_id() -> str:
+    """A stable, non-secret id for the configured Gemini API key."""
+    key = os.getenv("HARPERBOT_GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY") or ""
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def is_quota_error(error) -> bool:
+    """Whether a failed Gemini call was rejected for quota or rate limits."""
+    if isinstance(error, QuotaCooldown):
+        return False
+    if getattr(error, "code", None) == 429:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in ("quota", "rate limit", "resource_exhausted", "resource exhausted"))
+
+
+def _find_retry_delay(value):
+    if isinstance(value, dict):
+        delay = value.get("retryDelay")
+        if isinstance(delay, str):
+            match = _DURATION_RE.match(delay.strip())
+            if match:
+                return float(match.group(1))
+        value = list(value.values())
+    if isinstance(value, list):
+        for item in value:
+            delay = _find_retry_delay(item)
+            if delay is not None:
+                return delay
+    return None
+
+
+def _retry_after_header(response) -> float | None:
+    headers = getattr(response, "headers", None)
+    value = headers.get("Retry-After") if hasattr(headers, "get") else None
+    if not isinstance(value, str) or not value.strip():
+        return None
+    if value.strip().isdigit():
+        return float(value.strip())
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(error) -> float | None:
+    """
+    The retry delay a quota error asked for, in seconds, or None.
+
+    Looks at the google.rpc.RetryInfo `retryDelay` in the error details, then a
+    Retry-After header on the HTTP response, then "retry in Ns" in the message.
+    """
+    delay = _find_retry_delay(getattr(error, "details", None))
+    if delay is None:
+        delay = _retry_after_header(getattr(error, "response", None))
+    if delay is None:
+        match = _RETRY_IN_RE.search(str(error))
+        delay = float(match.group(1)) if match else None
+    return delay
+
+
+class QuotaState:
+    """
+    Quota cooldown deadlines per API key id.
+
+    Checks are served from memory. When `path` is given the deadlines are also
+    kept in a SQLite file, so a 429 seen by one gunicorn worker or `harperbot
+    worker` pauses the others too (they re-read it at most once a second).
+    """
+
+    def __init__(self, *, path: str = ""):
+        self.path = path
+        self._until = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+        if path:
+            with self._connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS quota_cooldowns (key TEXT PRIMARY KEY, until REAL NOT NULL)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        return closing(conn)
+
+    def cooldown_until(self, key: str) -> float | None:
+        """The unix time the cooldown for `key` ends, or None if calls are allowed now."""
+        now = time.time()
+        with self._lock:
+            if self.path and now - self._checked.get(key, 0.0) >= QUOTA_STATE_RECHECK_SECONDS:
+                with self._connect() as conn:
+                    row = conn.execute("SELECT until FROM quota_cooldowns WHERE key = ?", (key,)).fetchone()
+                self._until[key] = max(self._until.get(key, 0.0), row[0] if row else 0.0)
+                self._checked[key] = now
+            until = self._until.get(key)
+        return until if until is not None and until > now else None
+
+    def trip(self, key: str, seconds: float) -> float:
+        """Start (or extend) the cooldown for `key` by `seconds`; returns when it ends."""
+        until = time.time() + max(0.0, seconds)
+        with self._lock:
+            until = max(until, self._until.get(key, 0.0))
+            self._until[key] = until
+            if self.path:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT INTO quota_cooldowns (key, until) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET until = MAX(until, excluded.until)",
+                        (key, until),
+                    )
+        return until
+
+
+_default_state = None
+_default_state_lock = threading.Lock()
+
+
+def get_quota_state() -> QuotaState:
+    """Return the process-wide quota state (file-backed when HARPERBOT_QUOTA_STATE is set)."""
+    global _default_state
+    with _default_state_lock:
+        if _default_state is None:
+            _default_state = QuotaState(path=QUOTA_STATE_PATH)
+        return _default_state
+
+
+def current_cooldown_until() -> float | None:
+    """When the configured API key's cooldown ends, or None if Gemini may be called."""
+    return get_quota_state().cooldown_until(gemini_key_id())
+
+
+def ensure_quota_available():
+    """Raise QuotaCooldown if the configured API key is cooling down."""
+    until = current_cooldown_until()
+    if until is not None:
+        metrics.increment("gemini_calls_skipped_quota")
+        raise QuotaCooldown(until)
+
+
+def record_quota_error(error, default_seconds: float) -> float | None:
+    """Start the shared cooldown if `error` is a quota error; returns when it ends (None otherwise)."""
+    if not is_quota_error(error):
+        return None
+    seconds = retry_delay(error)
+    until = get_quota_state().trip(gemini_key_id(), default_seconds if seconds is None else seconds)
+    metrics.increment("gemini_quota_errors")
+    logging.warning(f"Gemini quota exceeded; pausing model calls for {until - time.time():.0f}s")
+    return until
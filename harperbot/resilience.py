@@ -0,0 +1,326 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Gemini Resilience
+Retry policy for generate_content: an overall deadline per call, jittered
+exponential backoff, an optional hedged second request once the first is slower
+than the model's recent p95, and a circuit breaker that fails fast while Gemini
+keeps returning server errors.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import contextmanager
+
+try:
+    from . import metrics
+    from .lazy import lazy_module
+    from .routing import get_latency_tracker
+except ImportError:
+    import metrics
+    from lazy import lazy_module
+    from routing import get_latency_tracker
+
+genai_errors = lazy_module("google.genai.errors")
+types = lazy_module("google.genai.types")
+
+GEMINI_ATTEMPTS = int(os.getenv("HARPERBOT_GEMINI_ATTEMPTS", "3"))
+GEMINI_BACKOFF_SECONDS = float(os.getenv("HARPERBOT_GEMINI_BACKOFF_SECONDS", "1"))
+GEMINI_MAX_BACKOFF_SECONDS = 30.0
+# Overall time for one Gemini call including retries (0 = none). On Vercel it must end
+# before the function does, so it defaults to 50 seconds there.
+GEMINI_DEADLINE_SECONDS = float(os.getenv("HARPERBOT_GEMINI_DEADLINE_SECONDS", "50" if os.getenv("VERCEL") else "0"))
+# Send a second, identical request when the first is slower than the model's recent p95.
+# The prompt is sent twice and the loser may run to completion, which can double a slow call's spend.
+GEMINI_HEDGE = os.getenv("HARPERBOT_GEMINI_HEDGE", "").strip().lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+# Consecutive server errors that open the circuit (0 disables it), and how long it stays open.
+BREAKER_THRESHOLD = int(os.getenv("HARPERBOT_GEMINI_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("HARPERBOT_GEMINI_BREAKER_COOLDOWN_SECONDS", "30"))
+# A deadline with less time left than this is treated as spent.
+_MIN_ATTEMPT_SECONDS = 1.0
+
+# Transient network failures surfaced by the genai client as generic exceptions.
+_TRANSIENT_ERROR_MARKERS = (
+    "timeout",
+    "timed out",
+    "temporarily unavailable",
+    "connection reset",
+    "connection aborted",
+    "connection refused",
+    "name or service not known",
+    "dns",
+)
+
+
+class GeminiDeadlineExceeded(Exception):
+    """Raised when a Gemini call (with its retries) would run past its deadline."""
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a model that has kept failing with server errors."""
+
+
+def is_transient_gemini_error(error) -> bool:
+    """Whether a failed generate_content call is worth retrying (5xx or network)."""
+    message = str(error).lower()
+    return any(marker in message for marker in _TRANSIENT_ERROR_MARKERS) or isinstance(error, genai_errors.ServerError)
+
+
+class Deadline:
+    """The time left for one Gemini call; `seconds=0` means no deadline."""
+
+    def __init__(self, seconds: float = GEMINI_DEADLINE_SECONDS, *, clock=time.monotonic):
+        self.seconds = seconds
+        self.clock = clock
+        self.expires = clock() + seconds if seconds else None
+
+    def remaining(self) -> float | None:
+        return None if self.expires is None else self.expires - self.clock()
+
+    def apply(self, generate_config):
+        """`generate_config` with an HTTP timeout for the time left; raises GeminiDeadlineExceeded if it is spent."""
+        remaining = self.remaining()
+        if remaining is None:
+            return generate_config
+        if remaining < _MIN_ATTEMPT_SECONDS:
+            raise GeminiDeadlineExceeded(f"Gemini did not answer within {self.seconds:.0f}s")
+        return generate_config.model_copy(update={"http_options": types.HttpOptions(timeout=int(remaining * 1000))})
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number `attempt + 1`."""
+    return random.uniform(0, min(GEMINI_MAX_BACKOFF_SECONDS, GEMINI_BACKOFF_SECONDS * 2**attempt))
+
+
+def next_retry_delay(attempt: int, error, deadline: Deadline) -> float | None:
+    """
+    Seconds to wait before retrying after `error` on attempt `attempt` (from 0),
+    or None if it should not be retried. Raises GeminiDeadlineExceeded (from
+    `error`) when a retry is warranted but would not fit before the deadline.
+    """
+    if attempt >= GEMINI_ATTEMPTS - 1 or not is_transient_gemini_error(error):
+        return None
+    delay = backoff_delay(attempt)
+    remaining = deadline.remaining()
+    if remaining is not None and delay + _MIN_ATTEMPT_SECONDS > remaining:
+        raise GeminiDeadlineExceeded(f"Gemini did not answer within {deadline.seconds:.0f}s") from error
+    metrics.increment("gemini_retries")
+    return delay
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after `threshold` consecutive transient failures.
+
+    While open, calls raise CircuitOpen. After `cooldown` seconds one call is let
+    through as a probe: success closes the circuit, another failure re-opens it.
+    Errors other than server and network failures (a 4xx, say) show that the model
+    is answering and count as success.
+    """
+
+    def __init__(
+        self, *, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN_SECONDS, clock=time.monotonic
+    ):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.cooldown - self.clock()
+            if remaining > 0 or self._probing:
+                metrics.increment("gemini_circuit_rejections")
+                raise CircuitOpen(f"Gemini keeps failing; calls are paused for {max(remaining, 0):.0f}s")
+            self._probing = True
+
+    def _record(self, failed: bool):
+        with self._lock:
+            self._probing = False
+            if not failed:
+                if self._opened_at is not None:
+                    logging.info("Gemini circuit closed")
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logging.warning(f"Gemini circuit opened after {self._failures} consecutive failures")
+                    metrics.increment("gemini_circuit_opened")
+                self._opened_at = self.clock()
+
+    def _release(self):
+        with self._lock:
+            self._probing = False
+
+    @contextmanager
+    def guard(self):
+        """Run one Gemini call inside the block, or raise CircuitOpen while the circuit is open."""
+        if not self.threshold:
+            yield
+            return
+        self._admit()
+        try:
+            yield
+        except Exception as e:
+            self._record(is_transient_gemini_error(e))
+            raise
+        except BaseException:
+            # Cancelled: no verdict on the model, but free the probe.
+            self._release()
+            raise
+        self._record(False)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(model_name: str) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for `model_name`."""
+    with _breakers_lock:
+        breaker = _breakers.get(model_name)
+        if breaker is None:
+            breaker = _breakers[model_name] = CircuitBreaker()
+        return breaker
+
+
+def hedge_delay(model_name: str) -> float | None:
+    """Seconds after which to hedge a call to `model_name`, or None to send a single request."""
+    if not GEMINI_HEDGE:
+        return None
+    return get_latency_tracker().percentile(model_name, HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES)
+
+
+def _start(call) -> Future:
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            future.set_result(context.run(call))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="harperbot-gemini", daemon=True).start()
+    return future
+
+
+def _reserve_hedge(reserve):
+    """The function that frees the hedge's reservation, or None (counted) if `reserve` found no room."""
+    if reserve is None:
+        return lambda: None
+    release = reserve()
+    if release is None:
+        metrics.increment("gemini_hedges_skipped")
+    return release
+
+
+def _on_abandoned(on_abandoned):
+    """A done callback handing the result of a request that lost the race, if it succeeded, to `on_abandoned`."""
+
+    def callback(future):
+        if not future.cancelled() and future.exception() is None:
+            on_abandoned(future.result())
+
+    return callback
+
+
+def hedged(call, delay: float | None, reserve=None, on_abandoned=None):
+    """
+    Return `call()`; if it has not finished after `delay` seconds, also start a
+    second `call()` and return whichever succeeds first (the other is abandoned).
+    Raises the last error if both fail.
+
+    `reserve()` is called before the second request; it returns a function that
+    frees what it reserved once that request ends, or None to skip the hedge.
+    `on_abandoned(result)` is called if the abandoned request succeeds as well,
+    so its usage can still be charged.
+    """
+    if delay is None:
+        return call()
+    first = _start(call)
+    if wait([first], timeout=delay).done:
+        return first.result()
+    release = _reserve_hedge(reserve)
+    if release is None:
+        return first.result()
+    metrics.increment("gemini_hedged_requests")
+
+    def hedge():
+        try:
+            return call()
+        finally:
+            release()
+
+    requests = {first, _start(hedge)}
+    pending = set(requests)
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is not first:
+                    metrics.increment("gemini_hedge_wins")
+                if on_abandoned is not None:
+                    for other in requests - {future}:
+                        other.add_done_callback(_on_abandoned(on_abandoned))
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def hedged_async(call, delay: float | None, reserve=None, on_abandoned=None):
+    """
+    Async variant of `hedged`; `call` returns a coroutine, and the slower request
+    is cancelled. `on_abandoned` only sees it if it finished before that.
+    """
+    if delay is None:
+        return await call()
+    first = asyncio.ensure_future(call())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result()
+        release = _reserve_hedge(reserve)
+        if release is None:
+            return await first
+        metrics.increment("gemini_hedged_requests")
+        second = asyncio.ensure_future(call())
+        # A done callback also runs if the task is cancelled before it starts.
+        second.add_done_callback(lambda _: release())
+        tasks.add(second)
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        metrics.increment("gemini_hedge_wins")
+                    if on_abandoned is not None:
+                        for other in tasks - {task}:
+                            other.add_done_callback(_on_abandoned(on_abandoned))
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,163 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Model Routing
+Picks the Gemini model, output limit and thinking budget for a PR from the
+`model_tiers` in config.yaml, by the size of its whole diff. A tier whose recent calls
+missed its latency target hands its PRs to the next faster tier until it recovers.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+# Latency samples older than this are forgotten, so a slow tier is tried again.
+LATENCY_WINDOW_SECONDS = float(os.getenv("HARPERBOT_LATENCY_WINDOW_SECONDS", "600"))
+# Weight of the newest sample in a model's moving average latency.
+LATENCY_SMOOTHING = 0.3
+# Recent samples kept per model for latency percentiles.
+LATENCY_SAMPLES = 100
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    """
+    One routing rule from `model_tiers`. Limits of 0 and settings of None mean
+    "no limit" and "use the top-level setting (or the model's default)".
+    """
+
+    name: str
+    model: str | None = None
+    max_changed_lines: int = 0
+    max_files: int = 0
+    max_output_tokens: int | None = None
+    thinking_budget: int | None = None
+    latency_target_seconds: float = 0.0
+
+    def fits(self, lines: int, files: int) -> bool:
+        return (not self.max_changed_lines or lines <= self.max_changed_lines) and (
+            not self.max_files or files <= self.max_files
+        )
+
+
+def model_tiers(config) -> tuple:
+    """The configured tiers, fastest first."""
+    return tuple(ModelTier(**dict(tier)) for tier in config.get("model_tiers", ()))
+
+
+def changed_lines(diff: str) -> int:
+    """Number of added and removed lines in a unified diff."""
+    count = 0
+    for line in diff.splitlines():
+        if line.startswith(("+", "-")) and not line.startswith(("+++ ", "--- ")):
+            count += 1
+    return count
+
+
+def routing_size(pr_details) -> tuple:
+    """
+    `(changed lines, files)` to route `pr_details` by. A chunk carries the size of
+    the diff it was split from in `routing_size`, so every chunk gets the same tier.
+    """
+    size = pr_details.get("routing_size")
+    if size is None:
+        size = (changed_lines(pr_details["diff"]), len(pr_details["files_changed"]))
+    return tuple(size)
+
+
+class LatencyTracker:
+    """Moving average and recent samples of Gemini call latency per model."""
+
+    def __init__(self, *, window: float = LATENCY_WINDOW_SECONDS, smoothing: float = LATENCY_SMOOTHING, clock=time.monotonic):
+        self.window = window
+        self.smoothing = smoothing
+        self.clock = clock
+        self._averages = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def _average(self, model: str, now: float) -> float | None:
+        entry = self._averages.get(model)
+        if entry is None or now - entry[1] >= self.window:
+            return None
+        return entry[0]
+
+    def record(self, model: str, seconds: float):
+        now = self.clock()
+        with self._lock:
+            previous = self._average(model, now)
+            average = seconds if previous is None else previous + self.smoothing * (seconds - previous)
+            self._averages[model] = (average, now)
+            self._samples.setdefault(model, deque(maxlen=LATENCY_SAMPLES)).append((now, seconds))
+
+    def average(self, model: str) -> float | None:
+        """The model's moving average latency in seconds, or None without recent samples."""
+        with self._lock:
+            return self._average(model, self.clock())
+
+    def percentile(self, model: str, fraction: float, *, min_samples: int = 1) -> float | None:
+        """The `fraction` (e.g. 0.95) latency percentile of the model's recent calls, or None with fewer than `min_samples`."""
+        now = self.clock()
+        with self._lock:
+            recent = sorted(seconds for at, seconds in self._samples.get(model, ()) if now - at < self.window)
+        if not recent or len(recent) < min_samples:
+            return None
+        return recent[min(len(recent) - 1, math.ceil(fraction * len(recent)) - 1)]
+
+    def is_slow(self, tier: ModelTier, default_model: str) -> bool:
+        """Whether the tier's model has recently been slower than its latency target."""
+        if not tier.latency_target_seconds:
+            return False
+        average = self.average(tier.model or default_model)
+        return average is not None and average > tier.latency_target_seconds
+
+
+_default_tracker = None
+_default_tracker_lock = threading.Lock()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    """Return the process-wide latency tracker."""
+    global _default_tracker
+    with _default_tracker_lock:
+        if _default_tracker is None:
+            _default_tracker = LatencyTracker()
+        return _default_tracker
+
+
+def record_latency(model: str, seconds: float):
+    """Record how long a successful Gemini call to `model` took."""
+    get_latency_tracker().record(model, seconds)
+
+
+def route_model(config, pr_details) -> ModelTier | None:
+    """
+    The tier to analyze `pr_details` with, or None when no `model_tiers` are configured.
+
+    The first tier the whole diff fits (by changed lines and files, see `routing_size`) is chosen, or the last
+    tier if it fits none. While that tier misses its latency target, the next faster
+    one is used instead.
+    """
+    tiers = model_tiers(config)
+    if not tiers:
+        return None
+    lines, files = routing_size(pr_details)
+    index = next((i for i, tier in enumerate(tiers) if tier.fits(lines, files)), len(tiers) - 1)
+    default_model = config.get("model", "gemini-2.5-flash")
+    tracker = get_latency_tracker()
+    while index > 0 and tracker.is_slow(tiers[index], default_model):
+        logging.info(f"Model tier {tiers[index].name} is missing its latency target; using {tiers[index - 1].name}")
+        metrics.increment("model_tier_fallbacks")
+        index -= 1
+    metrics.increment(f"model_tier_{tiers[index].name}")
+    return tiers[index]
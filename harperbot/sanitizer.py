@@ -0,0 +1,66 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Output Sanitizer
+Strips HTML tags, `javascript:` URLs and inline event handlers from model
+output. Fenced code blocks are copied through literally, since GitHub renders
+them as text; that keeps `List<int>` or `onClick=` in a suggested snippet intact.
+"""
+
+import re
+
+# Fence lines only (up to three spaces in, as in CommonMark). Run over "\n" + text so the
+# search jumps between line starts; the pairing of openers and closers is done in Python.
+_FENCE_RE = re.compile(r"\n {0,3}(?P<fence>`{3,}|~{3,})(?P<info>[^\n]*)")
+# Everything removed from the prose between code blocks, as one alternation. The leading class
+# lets the regex engine skip ahead to a candidate character; the lookbehind picks the rule.
+_MARKUP_RE = re.compile(r"[<jJoO](?:(?<=<)[^>]+>|(?<=[jJ])(?i:avascript:)|(?<=[oO])(?i:n\w+\s*=))")
+
+
+def _code_blocks(text: str) -> list:
+    """(start, end) offsets of the fenced code blocks in `text`; an unclosed fence runs to the end."""
+    blocks = []
+    opener = None
+    # A match starts at its line's start in `text` and ends one past the line's end.
+    for match in _FENCE_RE.finditer("\n" + text):
+        fence, info = match.group("fence"), match.group("info")
+        if opener is None:
+            # A backtick fence's info string cannot contain a backtick (that is inline code).
+            if fence[0] != "`" or "`" not in info:
+                opener = (fence, match.start())
+        elif fence[0] == opener[0][0] and len(fence) >= len(opener[0]) and not info.strip():
+            blocks.append((opener[1], match.end() - 1))
+            opener = None
+    if opener is not None:
+        blocks.append((opener[1], len(text)))
+    return blocks
+
+
+def _strip_markup(prose: str) -> tuple:
+    """`prose` with markup removed, and the number of removals; most prose has nothing to scan for."""
+    if "<" not in prose and "=" not in prose and "javascript:" not in prose.lower():
+        return prose, 0
+    return _MARKUP_RE.subn("", prose)
+
+
+def sanitize_markup(text: str) -> str:
+    """
+    `text` without HTML tags, `javascript:` or `on*=` handlers outside fenced code blocks.
+    A removal can join two fragments into a new match (`java<b>script:`) or a new fence,
+    so after any removal the whole text is sanitized again; clean text takes one pass.
+    """
+    while True:
+        parts = []
+        removed = 0
+        position = 0
+        for start, end in _code_blocks(text):
+            prose, count = _strip_markup(text[position:start])
+            parts += (prose, text[start:end])
+            removed += count
+            position = end
+        prose, count = _strip_markup(text[position:])
+        parts.append(prose)
+        if not removed + count:
+            return text
+        text = "".join(parts)
@@ -0,0 +1,373 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Gemini Scheduler
+Admission control for the Gemini calls of all installations sharing one API key:
+a requests-per-minute and tokens-per-minute budget, weighted fair queuing between
+installations, and priority for manual `/analyze` runs over automatic ones. When
+the budget is spent, calls wait in line instead of failing with a quota error.
+With a shared SQLite file the RPM/TPM budget is shared by every process using the key.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, closing, contextmanager
+from contextvars import ContextVar
+
+try:
+    from . import metrics
+    from .quota import QUOTA_STATE_PATH, gemini_key_id
+except ImportError:
+    import metrics
+    from quota import QUOTA_STATE_PATH, gemini_key_id
+
+# Limits of the shared Gemini key; 0 disables a limit. The concurrency limit is per process.
+GEMINI_RPM = int(os.getenv("HARPERBOT_GEMINI_RPM", "0"))
+GEMINI_TPM = int(os.getenv("HARPERBOT_GEMINI_TPM", "0"))
+GEMINI_MAX_CONCURRENT = int(os.getenv("HARPERBOT_GEMINI_MAX_CONCURRENT", "0"))
+# A call that waits longer than this for its turn fails with GeminiQueueTimeout.
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("HARPERBOT_GEMINI_QUEUE_TIMEOUT", "600"))
+# SQLite file holding the RPM/TPM buckets, shared by every process; empty keeps them per process.
+GEMINI_BUDGET_STATE_PATH = os.getenv("HARPERBOT_GEMINI_BUDGET_STATE", QUOTA_STATE_PATH).strip()
+# Share of the budget per installation, e.g. "123:2,456:0.5"; unlisted installations weigh 1.
+TENANT_WEIGHTS = os.getenv("HARPERBOT_TENANT_WEIGHTS", "")
+
+MANUAL = 0
+AUTOMATIC = 1
+
+_current_caller = ContextVar("harperbot_gemini_caller", default=("default", AUTOMATIC))
+
+
+class GeminiQueueTimeout(Exception):
+    """Raised when a Gemini call waited longer than the queue timeout for its turn."""
+
+
+@contextmanager
+def gemini_caller(installation_id, *, manual: bool = False):
+    """Attribute the Gemini calls made inside the block to `installation_id` (and a manual or automatic run)."""
+    token = _current_caller.set((str(installation_id), MANUAL if manual else AUTOMATIC))
+    try:
+        yield
+    finally:
+        _current_caller.reset(token)
+
+
+def parse_weights(spec: str) -> dict:
+    weights = {}
+    for entry in spec.split(","):
+        tenant, _, weight = entry.strip().partition(":")
+        if tenant and weight:
+            try:
+                weights[tenant] = max(float(weight), 0.01)
+            except ValueError:
+                logging.warning(f"Ignoring invalid tenant weight {entry.strip()!r}")
+    return weights
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: int, clock):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: int) -> float:
+        """Seconds until `amount` can be taken (0 if now, or if the bucket is unlimited)."""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: int):
+        if self.rate:
+            self._refill()
+            self.level -= amount
+
+
+class _Budget:
+    """The RPM and TPM buckets of one process."""
+
+    def __init__(self, rpm: int, tpm: int, clock):
+        self.requests = _TokenBucket(rpm, clock)
+        self.tokens = _TokenBucket(tpm, clock)
+
+    def admit(self, tokens: int) -> float:
+        """Take one request and `tokens` if both fit now (returns 0); otherwise the seconds to wait."""
+        delay = max(self.requests.delay(1), self.tokens.delay(tokens))
+        if delay <= 0:
+            self.requests.take(1)
+            self.tokens.take(tokens)
+        return delay
+
+    def charge(self, tokens: int):
+        self.tokens.take(tokens)
+
+
+class _SharedBudget(_Budget):
+    """
+    RPM and TPM buckets kept in a SQLite file per API key id, so gunicorn workers
+    and `harperbot worker` draw from one budget. Each admission reads, refills and
+    writes both buckets in one transaction; levels use wall-clock time.
+    """
+
+    def __init__(self, rpm: int, tpm: int, *, path: str, key: str):
+        super().__init__(rpm, tpm, time.time)
+        self.path = path
+        self.key = key
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS gemini_budget "
+                "(key TEXT NOT NULL, bucket TEXT NOT NULL, level REAL NOT NULL, updated REAL NOT NULL, "
+                "PRIMARY KEY (key, bucket))"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        return closing(conn)
+
+    @contextmanager
+    def _synced(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for name, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+                    row = conn.execute(
+                        "SELECT level, updated FROM gemini_budget WHERE key = ? AND bucket = ?", (self.key, name)
+                    ).fetchone()
+                    bucket.level, bucket.updated = row if row else (float(bucket.capacity), bucket.clock())
+                yield
+                conn.executemany(
+                    "INSERT OR REPLACE INTO gemini_budget (key, bucket, level, updated) VALUES (?, ?, ?, ?)",
+                    [
+                        (self.key, name, bucket.level, bucket.updated)
+                        for name, bucket in (("requests", self.requests), ("tokens", self.tokens))
+                    ],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def admit(self, tokens: int) -> float:
+        with self._synced():
+            return super().admit(tokens)
+
+    def charge(self, tokens: int):
+        with self._synced():
+            super().charge(tokens)
+
+
+class _Ticket:
+    __slots__ = ("tenant", "tokens", "start", "wake", "granted", "cancelled")
+
+    def __init__(self, tenant, tokens, start, wake):
+        self.tenant = tenant
+        self.tokens = tokens
+        self.start = start
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+class GeminiScheduler:
+    """
+    Weighted fair queue in front of generate_content.
+
+    Waiting calls are ordered by priority (manual first), then by virtual finish
+    time: each installation's calls are spaced by `tokens / weight`, so a tenant
+    with fifty queued PRs cannot starve one with a single PR. The head of the
+    queue starts once the RPM/TPM buckets and the concurrency limit allow it.
+    Works from threads (`slot`) and coroutines (`slot_async`) alike. With
+    `state_path` the buckets live in that SQLite file and are shared between
+    processes; the queue order and concurrency limit stay per process.
+    """
+
+    def __init__(
+        self,
+        *,
+        rpm: int = GEMINI_RPM,
+        tpm: int = GEMINI_TPM,
+        max_concurrent: int = GEMINI_MAX_CONCURRENT,
+        weights: dict | None = None,
+        timeout: float = GEMINI_QUEUE_TIMEOUT,
+        state_path: str = GEMINI_BUDGET_STATE_PATH,
+        clock=time.monotonic,
+    ):
+        self.max_concurrent = max_concurrent
+        self.weights = parse_weights(TENANT_WEIGHTS) if weights is None else weights
+        self.timeout = timeout
+        self.clock = clock
+        self.enabled = bool(rpm or tpm or max_concurrent)
+        if state_path and (rpm or tpm):
+            self._budget = _SharedBudget(rpm, tpm, path=state_path, key=gemini_key_id())
+        else:
+            self._budget = _Budget(rpm, tpm, clock)
+        self._lock = threading.Lock()
+        self._queue = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish = {}
+        self._in_flight = 0
+
+    def _enqueue(self, tokens: int, wake) -> _Ticket:
+        tenant, priority = _current_caller.get()
+        cost = max(1, tokens) / self.weights.get(tenant, 1.0)
+        start = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+        self._last_finish[tenant] = start + cost
+        ticket = _Ticket(tenant, tokens, start, wake)
+        heapq.heappush(self._queue, (priority, start + cost, next(self._seq), ticket))
+        return ticket
+
+    def _dispatch(self) -> float | None:
+        """Start queued calls while the limits allow; return the seconds until a bucket refills enough, if that is what blocks."""
+        while self._queue:
+            ticket = self._queue[0][3]
+            if ticket.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if self.max_concurrent and self._in_flight >= self.max_concurrent:
+                return None
+            delay = self._budget.admit(ticket.tokens)
+            if delay > 0:
+                return delay
+            heapq.heappop(self._queue)
+            self._in_flight += 1
+            self._virtual_time = max(self._virtual_time, ticket.start)
+            ticket.granted = True
+            ticket.wake()
+        return None
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def _cancel(self, ticket: _Ticket) -> bool:
+        """Give up on `ticket` unless it was granted meanwhile; returns True if it was cancelled."""
+        with self._lock:
+            if ticket.granted:
+                return False
+            ticket.cancelled = True
+            self._dispatch()
+        return True
+
+    def try_reserve(self, tokens: int = 0):
+        """
+        Take a slot for an optional extra call, such as a hedged request, only if
+        one is free now: nothing is queued and the limits allow it. Returns the
+        function that frees the slot, or None; never waits.
+        """
+        if not self.enabled:
+            return lambda: None
+        with self._lock:
+            if self._queue or (self.max_concurrent and self._in_flight >= self.max_concurrent):
+                return None
+            if self._budget.admit(tokens) > 0:
+                return None
+            self._in_flight += 1
+        return self._release
+
+    def charge(self, tokens: int):
+        """Count `tokens` more (e.g. the output tokens of a finished call) against the TPM budget."""
+        if self.enabled and tokens > 0:
+            with self._lock:
+                self._budget.charge(tokens)
+
+    def _timeout_error(self, tenant: str, waited: float) -> GeminiQueueTimeout:
+        metrics.increment("gemini_queue_timeouts")
+        return GeminiQueueTimeout(f"Gemini is busy: installation {tenant} waited {waited:.0f}s for its turn")
+
+    @contextmanager
+    def slot(self, tokens: int = 0):
+        """Hold one Gemini call's turn (for a prompt of about `tokens` tokens) inside the block."""
+        if not self.enabled:
+            yield
+            return
+        event = threading.Event()
+        started = self.clock()
+        with self._lock:
+            ticket = self._enqueue(tokens, event.set)
+            delay = self._dispatch()
+        while not ticket.granted:
+            remaining = started + self.timeout - self.clock()
+            if remaining <= 0 and self._cancel(ticket):
+                raise self._timeout_error(ticket.tenant, self.clock() - started)
+            event.wait(min(delay, remaining) if delay else max(remaining, 0))
+            with self._lock:
+                if not ticket.granted:
+                    delay = self._dispatch()
+        self._record_wait(started)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def slot_async(self, tokens: int = 0):
+        """Async variant of `slot`; waiting does not block the event loop."""
+        if not self.enabled:
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        started = self.clock()
+        with self._lock:
+            ticket = self._enqueue(tokens, wake)
+            delay = self._dispatch()
+        while not ticket.granted:
+            remaining = started + self.timeout - self.clock()
+            if remaining <= 0 and self._cancel(ticket):
+                raise self._timeout_error(ticket.tenant, self.clock() - started)
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), min(delay, remaining) if delay else max(remaining, 0))
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                if not self._cancel(ticket):
+                    self._release()
+                raise
+            with self._lock:
+                if not ticket.granted:
+                    delay = self._dispatch()
+        self._record_wait(started)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _record_wait(self, started: float):
+        waited = self.clock() - started
+        if waited >= 1:
+            metrics.increment("gemini_queue_waits")
+            logging.info(f"Waited {waited:.1f}s for a Gemini slot")
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_gemini_scheduler() -> GeminiScheduler:
+    """Return the process-wide scheduler (a pass-through unless a HARPERBOT_GEMINI_* limit is set)."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = GeminiScheduler()
+        return _default_scheduler
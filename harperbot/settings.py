@@ -0,0 +1,399 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot Settings
+Parses and validates config.yaml once, then serves an immutable Config that is
+only rebuilt when the file's mtime, size or content hash changes.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass, field, fields
+from types import MappingProxyType
+
+try:
+    from . import metrics
+    from .lazy import lazy_module
+except ImportError:
+    import metrics
+    from lazy import lazy_module
+
+yaml = lazy_module("yaml")
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.yaml")
+FOCUS_OPTIONS = ("all", "security", "performance", "quality")
+TOKEN_COUNTERS = ("local", "api")
+MODEL_TIER_KEYS = (
+    "name",
+    "model",
+    "max_changed_lines",
+    "max_files",
+    "max_output_tokens",
+    "thinking_budget",
+    "latency_target_seconds",
+)
+
+DEFAULT_PROMPT = """**Files Changed** ({num_files}):
+{files_list}
+
+```diff
+{diff_content}
+```
+
+{focus_instruction}
+
+Provide a concise code review analysis in this format:
+
+## Summary
+[Brief overview of changes and purpose]
+
+### Scores
+- Code Quality: [score]/10
+- Maintainability: [score]/10
+- Security: [score]/10
+
+### Strengths
+- [Key positives]
+- [What's working well]
+
+### Areas Needing Attention
+- [Potential issues or improvements]
+- [Be specific and constructive]
+
+### Recommendations
+- [Specific suggestions for code, docs, or tests]
+
+### Code Suggestions
+- [Provide specific code changes as diff blocks]
+- [Use ```diff format for each suggestion]
+
+### Next Steps
+- [Actionable items for the author]"""
+
+DEFAULT_SAFETY_SETTINGS = (
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+)
+
+DEFAULT_GENERATED_FILES = (
+    "*.lock",
+    "package-lock.json",
+    "pnpm-lock.yaml",
+    "go.sum",
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "*.snap",
+    "**/__snapshots__/**",
+    "vendor/**",
+    "node_modules/**",
+    "dist/**",
+    "*_pb2.py",
+    "*.pb.go",
+)
+
+
+class ConfigError(ValueError):
+    """Raised when config.yaml cannot be parsed or holds an invalid value."""
+
+
+def _freeze(value):
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@dataclass(frozen=True)
+class Config(Mapping):
+    """
+    Validated, read-only HarperBot configuration.
+
+    Known settings are typed attributes; keys the bot does not know about are kept in
+    `extra`. The object also behaves like the dict `load_config()` used to return, so
+    `config["prompt"]` and `config.get("model")` keep working.
+    """
+
+    focus: str = "all"
+    model: str = "gemini-2.5-flash"
+    max_diff_length: int = 4000
+    temperature: float = 0.2
+    max_output_tokens: int = 8192
+    # Route PRs by diff size to a model, output limit and thinking budget (fastest tier first).
+    # Empty uses `model` for every PR.
+    model_tiers: tuple = ()
+    # Review diffs longer than max_diff_length in chunks (map-reduce) instead of truncating them.
+    chunked_analysis: bool = False
+    max_diff_chunks: int = 12
+    max_parallel_chunks: int = 4
+    # On new pushes, re-analyze only files whose patches changed and reuse earlier findings for the rest.
+    incremental_analysis: bool = False
+    # Token budget for the diff in the prompt (0 keeps the max_diff_length character cut).
+    # Generated files are left out and the rest are included by risk and churn.
+    max_diff_tokens: int = 0
+    token_counter: str = "local"
+    generated_files: tuple = DEFAULT_GENERATED_FILES
+    # Stream the model output and show it in the PR comment while it is being written.
+    stream_analysis: bool = False
+    stream_update_interval: float = 5.0
+    # When enabled, a manual `/analyze` will post a new PR review even if one already exists
+    # for the current head SHA. This can create extra reviews; prefer `/analyze --force-review`
+    # for one-off reruns.
+    force_review_on_analyze: bool = False
+    enable_authoring: bool = False
+    auto_commit_suggestions: bool = False
+    create_improvement_prs: bool = False
+    improvement_branch_pattern: str = "harperbot-improvements-{timestamp}"
+    prompt: str = DEFAULT_PROMPT
+    # Static instructions sent as the system instruction, ahead of the per-PR prompt. With at least
+    # 1024 tokens it is stored with Gemini's context caching for context_cache_ttl seconds (0 disables).
+    system_instruction: str = ""
+    context_cache_ttl: int = 3600
+    safety_settings: tuple = _freeze(DEFAULT_SAFETY_SETTINGS)
+    extra: Mapping = field(default_factory=lambda: MappingProxyType({}))
+
+    def __getitem__(self, key):
+        if key != "extra" and key in _FIELD_NAMES:
+            return getattr(self, key)
+        return self.extra[key]
+
+    def __iter__(self):
+        yield from (name for name in _FIELD_NAMES if name != "extra")
+        yield from self.extra
+
+    def __len__(self):
+        return len(_FIELD_NAMES) - 1 + len(self.extra)
+
+
+_FIELD_NAMES = tuple(f.name for f in fields(Config))
+
+
+def _require(condition: bool, key: str, expected: str, value):
+    if not condition:
+        raise ConfigError(f"config.yaml: `{key}` must be {expected}, got {value!r}")
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _parse_model_tiers(tiers) -> tuple:
+    _require(isinstance(tiers, list), "model_tiers", "a list", tiers)
+    names = set()
+    parsed = []
+    for tier in tiers:
+        _require(
+            isinstance(tier, Mapping) and isinstance(tier.get("name"), str) and tier["name"].strip() != "",
+            "model_tiers",
+            "a list of entries with a `name`",
+            tier,
+        )
+        name = tier["name"]
+        _require(name not in names, f"model_tiers.{name}", "a unique name", name)
+        names.add(name)
+        unknown = sorted(set(tier) - set(MODEL_TIER_KEYS))
+        _require(not unknown, f"model_tiers.{name}", f"limited to the keys {', '.join(MODEL_TIER_KEYS)}", unknown)
+        if "model" in tier:
+            _require(
+                isinstance(tier["model"], str) and tier["model"].strip() != "",
+                f"model_tiers.{name}.model",
+                "a non-empty string",
+                tier["model"],
+            )
+        for key in ("max_changed_lines", "max_files", "max_output_tokens"):
+            if key in tier:
+                _require(_is_int(tier[key]) and tier[key] > 0, f"model_tiers.{name}.{key}", "a positive integer", tier[key])
+        if "thinking_budget" in tier:
+            value = tier["thinking_budget"]
+            _require(_is_int(value) and value >= -1, f"model_tiers.{name}.thinking_budget", "an integer of at least -1", value)
+        entry = dict(tier)
+        if "latency_target_seconds" in tier:
+            value = tier["latency_target_seconds"]
+            _require(
+                isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0,
+                f"model_tiers.{name}.latency_target_seconds",
+                "a positive number of seconds",
+                value,
+            )
+            entry["latency_target_seconds"] = float(value)
+        parsed.append(entry)
+    return _freeze(parsed)
+
+
+def parse_config(raw: Mapping) -> Config:
+    """Validate a parsed config.yaml mapping and merge it over the defaults."""
+    _require(isinstance(raw, Mapping), "<root>", "a mapping", raw)
+    known = {}
+    extra = {}
+    for key, value in raw.items():
+        if key in _FIELD_NAMES and key != "extra":
+            known[key] = value
+        else:
+            extra[key] = value
+
+    for key in ("max_diff_length", "max_output_tokens", "max_diff_chunks", "max_parallel_chunks"):
+        if key in known:
+            value = known[key]
+            _require(isinstance(value, int) and not isinstance(value, bool) and value > 0, key, "a positive integer", value)
+    if "temperature" in known:
+        value = known["temperature"]
+        _require(
+            isinstance(value, (int, float)) and not isinstance(value, bool) and 0 <= value <= 2,
+            "temperature",
+            "a number between 0 and 2",
+            value,
+        )
+        known["temperature"] = float(value)
+    if "stream_update_interval" in known:
+        value = known["stream_update_interval"]
+        _require(
+            isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0,
+            "stream_update_interval",
+            "a positive number of seconds",
+            value,
+        )
+        known["stream_update_interval"] = float(value)
+    if "context_cache_ttl" in known:
+        value = known["context_cache_ttl"]
+        _require(
+            isinstance(value, int) and not isinstance(value, bool) and value >= 0,
+            "context_cache_ttl",
+            "a non-negative integer",
+            value,
+        )
+    if "system_instruction" in known:
+        _require(isinstance(known["system_instruction"], str), "system_instruction", "a string", known["system_instruction"])
+    if "max_diff_tokens" in known:
+        value = known["max_diff_tokens"]
+        _require(
+            isinstance(value, int) and not isinstance(value, bool) and value >= 0,
+            "max_diff_tokens",
+            "a non-negative integer",
+            value,
+        )
+    if "token_counter" in known:
+        _require(
+            known["token_counter"] in TOKEN_COUNTERS,
+            "token_counter",
+            f"one of {', '.join(TOKEN_COUNTERS)}",
+            known["token_counter"],
+        )
+    if "generated_files" in known:
+        patterns = known["generated_files"]
+        _require(
+            isinstance(patterns, list) and all(isinstance(pattern, str) and pattern.strip() for pattern in patterns),
+            "generated_files",
+            "a list of path globs",
+            patterns,
+        )
+        known["generated_files"] = tuple(patterns)
+    if "model_tiers" in known:
+        known["model_tiers"] = _parse_model_tiers(known["model_tiers"])
+    if "focus" in known:
+        _require(known["focus"] in FOCUS_OPTIONS, "focus", f"one of {', '.join(FOCUS_OPTIONS)}", known["focus"])
+    for key in ("model", "prompt", "improvement_branch_pattern"):
+        if key in known:
+            _require(isinstance(known[key], str) and known[key].strip() != "", key, "a non-empty string", known[key])
+    for key in (
+        "chunked_analysis",
+        "incremental_analysis",
+        "stream_analysis",
+        "force_review_on_analyze",
+        "enable_authoring",
+        "auto_commit_suggestions",
+        "create_improvement_prs",
+    ):
+        if key in known:
+            _require(isinstance(known[key], bool), key, "true or false", known[key])
+    if "safety_settings" in known:
+        settings = known["safety_settings"]
+        _require(isinstance(settings, list), "safety_settings", "a list", settings)
+        for entry in settings:
+            _require(
+                isinstance(entry, Mapping)
+                and isinstance(entry.get("category"), str)
+                and isinstance(entry.get("threshold"), str),
+                "safety_settings",
+                "a list of {category, threshold} entries",
+                entry,
+            )
+        known["safety_settings"] = _freeze(settings)
+
+    return Config(**known, extra=_freeze(extra))
+
+
+class ConfigLoader:
+    """
+    Serves the Config for one config.yaml path.
+
+    The file is stat()ed on every call; it is only re-read when its mtime or size
+    changes, and only re-parsed when its SHA-256 changes too. An invalid file raises
+    ConfigError on the first load. Later, an invalid edit is logged and the last
+    good Config stays in use.
+    """
+
+    def __init__(self, path: str = CONFIG_PATH):
+        self.path = path
+        self._config = None
+        self._stat_key = None
+        self._digest = None
+        self._lock = threading.Lock()
+
+    def _stat(self):
+        if not os.path.exists(self.path):
+            return None
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self) -> Config:
+        stat_key = self._stat()
+        with self._lock:
+            if self._config is not None and stat_key == self._stat_key:
+                return self._config
+            try:
+                self._reload(stat_key)
+            except ConfigError as e:
+                if self._config is None:
+                    raise
+                logging.error(f"Keeping the previous configuration: {e}")
+                self._stat_key = stat_key
+            return self._config
+
+    def _reload(self, stat_key):
+        if stat_key is None:
+            config, digest = Config(), None
+        else:
+            with open(self.path, "rb") as f:
+                content = f.read()
+            digest = hashlib.sha256(content).hexdigest()
+            if self._config is not None and digest == self._digest:
+                self._stat_key = stat_key
+                return
+            try:
+                raw = yaml.safe_load(content) or {}
+            except yaml.YAMLError as e:
+                raise ConfigError(f"Error loading config.yaml: {e}") from e
+            config = parse_config(raw)
+        self._config, self._stat_key, self._digest = config, stat_key, digest
+        metrics.increment("config_loads")
+        logging.info(f"Loaded configuration from {self.path if stat_key else 'defaults'}")
+
+
+_default_loader = None
+_default_loader_lock = threading.Lock()
+
+
+def get_config() -> Config:
+    """Return the current Config for harperbot/config.yaml."""
+    global _default_loader
+    with _default_loader_lock:
+        if _default_loader is None:
+            _default_loader = ConfigLoader()
+    return _default_loader.get()
@@ -0,0 +1,151 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+HarperBot PR Snapshot
+Loads the pull request state HarperBot needs (metadata, labels, changed files,
+comments, reviews and the head's .gitattributes) with one GraphQL query, paginating only when a
+connection has more than one page.
+"""
+
+import logging
+from dataclasses import dataclass
+
+PAGE_SIZE = 100
+
+# Connection name -> node fields.
+_CONNECTIONS = {
+    "labels": "name",
+    "files": "path",
+    "comments": "databaseId body author { login }",
+    "reviews": "databaseId body commit { oid }",
+}
+
+
+def _connection(name: str, *, paginated: bool = False) -> str:
+    after = ", after: $cursor" if paginated else ""
+    return f"{name}(first: {PAGE_SIZE}{after}) {{ nodes {{ {_CONNECTIONS[name]} }} pageInfo {{ hasNextPage endCursor }} }}"
+
+
+SNAPSHOT_QUERY = f"""
+query($owner: String!, $name: String!, $number: Int!) {{
+  repository(owner: $owner, name: $name) {{
+    pullRequest(number: $number) {{
+      number title body url headRefName headRefOid baseRefName
+      author {{ login }}
+      headRef {{ target {{ ... on Commit {{ file(path: ".gitattributes") {{ object {{ ... on Blob {{ text }} }} }} }} }} }}
+      {" ".join(_connection(name) for name in _CONNECTIONS)}
+    }}
+  }}
+}}
+"""
+
+PAGE_QUERIES = {
+    name: f"""
+query($owner: String!, $name: String!, $number: Int!, $cursor: String) {{
+  repository(owner: $owner, name: $name) {{
+    pullRequest(number: $number) {{ {_connection(name, paginated=True)} }}
+  }}
+}}
+"""
+    for name in _CONNECTIONS
+}
+
+
+@dataclass(frozen=True)
+class SnapshotComment:
+    """A PR conversation comment; `id` is the REST id (usable with `pr.get_issue_comment`)."""
+
+    id: int
+    body: str
+    author: str | None
+
+
+@dataclass(frozen=True)
+class SnapshotReview:
+    id: int
+    body: str
+    commit_sha: str | None
+
+
+@dataclass(frozen=True)
+class PRSnapshot:
+    number: int
+    title: str
+    body: str
+    url: str
+    author: str | None
+    base_ref: str
+    head_ref: str
+    head_sha: str
+    labels: tuple
+    files: tuple
+    comments: tuple
+    reviews: tuple
+    # Contents of .gitattributes at the head commit ("" if absent or the branch is gone).
+    gitattributes: str = ""
+
+    @property
+    def diff_url(self) -> str:
+        return f"{self.url}.diff"
+
+
+def _login(actor) -> str | None:
+    # Deleted accounts ("ghost") come back as null.
+    return (actor or {}).get("login")
+
+
+def _node(kind: str, node: dict):
+    if kind == "labels":
+        return node["name"]
+    if kind == "files":
+        return node["path"]
+    if kind == "comments":
+        return SnapshotComment(id=node["databaseId"], body=node.get("body") or "", author=_login(node.get("author")))
+    return SnapshotReview(id=node["databaseId"], body=node.get("body") or "", commit_sha=(node.get("commit") or {}).get("oid"))
+
+
+def _gitattributes(pr: dict) -> str:
+    target = (pr.get("headRef") or {}).get("target") or {}
+    blob = (target.get("file") or {}).get("object") or {}
+    return blob.get("text") or ""
+
+
+def load_pr_snapshot(github, repo_name: str, pr_number: int) -> PRSnapshot:
+    """
+    Fetch a PRSnapshot through `github`'s GraphQL endpoint.
+
+    Raises GithubException on API errors, like the REST calls it replaces.
+    """
+    owner, name = repo_name.split("/", 1)
+    variables = {"owner": owner, "name": name, "number": pr_number}
+    requester = github.requester
+    _, data = requester.graphql_query(SNAPSHOT_QUERY, variables)
+    pr = data["data"]["repository"]["pullRequest"]
+
+    collected = {}
+    for kind in _CONNECTIONS:
+        connection = pr[kind]
+        nodes = list(connection["nodes"])
+        pages = 1
+        while connection["pageInfo"]["hasNextPage"]:
+            _, page = requester.graphql_query(PAGE_QUERIES[kind], {**variables, "cursor": connection["pageInfo"]["endCursor"]})
+            connection = page["data"]["repository"]["pullRequest"][kind]
+            nodes.extend(connection["nodes"])
+            pages += 1
+        if pages > 1:
+            logging.info(f"Paginated {kind} for {repo_name}#{pr_number}: {len(nodes)} in {pages} pages")
+        collected[kind] = tuple(_node(kind, node) for node in nodes if node)
+
+    return PRSnapshot(
+        number=pr["number"],
+        title=pr["title"],
+        body=pr.get("body") or "",
+        url=pr["url"],
+        author=_login(pr.get("author")),
+        base_ref=pr["baseRefName"],
+        head_ref=pr["headRefName"],
+        head_sha=pr["headRefOid"],
+        gitattributes=_gitattributes(pr),
+        **collected,
+    )
@@ -0,0 +1,104 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Parsing a model analysis once against the per-consumer rescans it replaces.
+Run with: python test/benchmarks/bench_analysis_parser.py [--chars 32000] [--repeat 200]
+
+Builds a synthetic analysis of about `--chars` characters (sections, scores and
+diff suggestion blocks) and times the separate diff-block, code-suggestions,
+quota and section scans against one analysis_parser pass.
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from harperbot.analysis_parser import parse_analysis  # noqa: E402
+
+_HEADING_RE = re.compile(r"^#{1,6}\s+\S")
+_SCORE_RE = re.compile(r"^\s*[-*]\s*(.+?):\s*(\d+(?:\.\d+)?)\s*/\s*10\b")
+
+
+def build_analysis(chars: int) -> str:
+    """A review in HarperBot's comment format, padded with suggestion blocks up to `chars`."""
+    parts = [
+        "### Summary\nRefactors the request pipeline and adds caching.\n",
+        "### Scores\n- Code Quality: 7/10\n- Security: 8/10\n- Performance: 6/10\n",
+        "### Issues\n" + "".join(f"- Issue {n}: unchecked return value in `handler_{n}`.\n" for n in range(20)),
+        "### Code Suggestions\n",
+    ]
+    n = 0
+    while sum(map(len, parts)) < chars:
+        parts.append(
+            f"Suggestion {n}: guard the lookup.\n```diff\nsrc/module_{n}.py\n@@ -{n + 1},2 +{n + 1},3 @@\n"
+            f"-    value = cache[key]\n+    value = cache.get(key)\n+    if value is None:\n     return value\n```\n"
+        )
+        n += 1
+    return "".join(parts)
+
+
+def legacy(analysis: str):
+    """The separate scans: diff blocks, the code-suggestions section, the quota check and the merge's sections."""
+    blocks = []
+    start = 0
+    while True:
+        start = analysis.find("```diff\n", start)
+        if start == -1:
+            break
+        end = analysis.find("\n```", start + 8)
+        if end == -1:
+            break
+        blocks.append(analysis[start + 8 : end])
+        start = end + 4
+    section = analysis.find("### Code Suggestions\n")
+    if section != -1:
+        end = analysis.find("###", section + 21)
+        analysis[:section] + analysis[end if end != -1 else len(analysis) :]
+    lowered = analysis.lower()
+    "api quota exceeded" in lowered or "rate limit" in lowered or "quota" in lowered and "exceeded" in lowered
+    sections = [(None, [])]
+    in_fence = False
+    for line in analysis.splitlines():
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        if not in_fence and _HEADING_RE.match(line):
+            sections.append((line.strip(), []))
+        else:
+            sections[-1][1].append(line)
+    scores = [m for _, body in sections for m in map(_SCORE_RE.match, body) if m]
+    return blocks, scores
+
+
+def parsed(analysis: str):
+    result = parse_analysis(analysis)
+    result.replace_section("Code Suggestions", "- Suggestions posted as inline comments below.")
+    return result.diff_blocks, [score for section in result.sections for score in section.scores]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chars", type=int, default=32000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    analysis = build_analysis(args.chars)
+    legacy_blocks, legacy_scores = legacy(analysis)
+    blocks, scores = parsed(analysis)
+    if legacy_blocks != blocks or len(legacy_scores) != len(scores):
+        print("parser and legacy scans disagree")
+        return 1
+
+    print(f"analysis: {len(analysis)} chars, {len(blocks)} diff blocks")
+    for name, func in (("separate scans", legacy), ("analysis_parser", parsed)):
+        seconds = min(timeit.repeat(lambda: func(analysis), number=args.repeat, repeat=3)) / args.repeat
+        print(f"{seconds * 1e6:9.1f} us  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Diff position lookups on large PR diffs: the diff index against a linear rescan per lookup.
+Run with: python test/benchmarks/bench_diff_index.py [--files 400] [--lookups 50]
+
+Builds a synthetic multi-megabyte diff, then times indexing it once plus a
+position lookup per inline suggestion against rescanning the diff text for each.
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from harperbot.diff_index import parse_diff  # noqa: E402
+
+
+def build_diff(files: int, hunks: int, hunk_lines: int) -> str:
+    """A diff of `files` files, each with `hunks` hunks of `hunk_lines` context/removed/added lines."""
+    rng = random.Random(0)
+    parts = []
+    for f in range(files):
+        path = f"src/module_{f}/file_{f}.py"
+        parts.append(f"diff --git a/{path} b/{path}\nindex 0000000..1111111 100644\n--- a/{path}\n+++ b/{path}")
+        start = 1
+        for _ in range(hunks):
+            body = []
+            old = new = 0
+            for _ in range(hunk_lines):
+                tag = rng.choice(" -+")
+                body.append(f"{tag}    value = compute_{rng.randrange(10**6)}(item, options)  # padding padding")
+                old += tag != "+"
+                new += tag != "-"
+            parts.append(f"@@ -{start},{old} +{start},{new} @@ def function_{start}():")
+            parts.extend(body)
+            start += max(old, new) + 20
+    return "\n".join(parts) + "\n"
+
+
+def linear_position(diff: str, file_path: str, line_number: int):
+    """The per-lookup rescan the index replaces: split and walk the diff for every suggestion."""
+    lines = diff.split("\n")
+    position = None
+    in_file = False
+    for line in lines:
+        if line.startswith("diff --git"):
+            in_file = line.endswith(f" b/{file_path}")
+            position = None
+            continue
+        if not in_file:
+            continue
+        match = re.match(r"@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@", line)
+        if match:
+            position = 0 if position is None else position + 1
+            current = int(match.group(1))
+            continue
+        if position is None:
+            continue
+        position += 1
+        if line.startswith("-"):
+            continue
+        if current == line_number:
+            return position
+        current += 1
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=400)
+    parser.add_argument("--hunks", type=int, default=10)
+    parser.add_argument("--hunk-lines", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=50)
+    args = parser.parse_args()
+
+    diff = build_diff(args.files, args.hunks, args.hunk_lines)
+    index = parse_diff(diff)
+    rng = random.Random(1)
+    targets = []
+    for _ in range(args.lookups):
+        file_diff = index.file(rng.choice(list(index.files)))
+        targets.append((file_diff.path, rng.choice(list(file_diff.right))))
+
+    started = time.perf_counter()
+    linear = [linear_position(diff, path, line) for path, line in targets]
+    linear_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = parse_diff(diff)
+    indexed = [index.position(path, line) for path, line in targets]
+    indexed_s = time.perf_counter() - started
+
+    if linear != indexed:
+        print("index and linear scan disagree")
+        return 1
+    print(f"diff: {len(diff) / 2**20:.1f} MiB, {args.files} files, {args.lookups} lookups")
+    print(f"{linear_s * 1000:9.1f} ms  linear scan per lookup")
+    print(f"{indexed_s * 1000:9.1f} ms  index once + lookups ({linear_s / indexed_s:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
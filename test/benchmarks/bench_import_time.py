@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Cold-start import budget for the webhook entry point (api/webhook.py).
+Run with: python test/benchmarks/bench_import_time.py [--budget-ms 400] [--top 15]
+
+Imports the entry point in a fresh interpreter with `-X importtime`, prints the
+slowest top-level imports and exits non-zero when the total exceeds the budget.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_BUDGET_MS = 400
+# Dependencies that must only be imported once an event actually needs them.
+HEAVY_MODULES = {"google.genai", "github", "requests", "yaml", "dotenv"}
+
+
+def is_heavy(name: str) -> bool:
+    """Whether `name` is one of HEAVY_MODULES or a submodule of one (`yaml.loader`, `google.genai.types`)."""
+    return any(name == heavy or name.startswith(heavy + ".") for heavy in HEAVY_MODULES)
+
+
+def measure(module: str) -> list:
+    """Return `(cumulative_us, depth, name)` for every import made while importing `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative), depth, name.strip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="api.webhook")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    # Warm the bytecode cache so the measurement reflects a deployed cold start.
+    measure(args.module)
+    rows = measure(args.module)
+    package = args.module.split(".")[0]
+
+    # importtime lists children before their parent, so each top-level row closes a subtree.
+    total_ms = 0.0
+    breakdown = []
+    subtree = []
+    for cumulative, depth, name in rows:
+        if depth > 0:
+            subtree.append((cumulative, depth, name))
+            continue
+        if name.split(".")[0] == package:
+            total_ms += cumulative / 1000
+            breakdown.append((cumulative, depth, name))
+            breakdown.extend(row for row in subtree if row[1] == 1)
+        subtree = []
+
+    for cumulative, depth, name in sorted(breakdown, reverse=True)[: args.top]:
+        print(f"{cumulative / 1000:9.1f} ms  {'  ' * depth}{name}")
+    print(f"{total_ms:9.1f} ms  total (budget {args.budget_ms:.0f} ms)")
+
+    heavy = sorted({name for _, _, name in rows if is_heavy(name)})
+    if heavy:
+        print(f"eagerly imported: {', '.join(heavy)}")
+    return 0 if total_ms <= args.budget_ms and not heavy else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
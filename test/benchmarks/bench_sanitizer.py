@@ -0,0 +1,56 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Sanitizer throughput against the four separate substitutions it replaces.
+Run with: python test/benchmarks/bench_sanitizer.py [--chars 80000] [--repeat 50]
+
+Times three synthetic replies of about `--chars` characters: prose with diff
+suggestion blocks, plain prose, and prose with inline HTML, in million chars/s.
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from harperbot.sanitizer import sanitize_markup  # noqa: E402
+
+PROSE = "The change adds a cache to the handler; see the docs for more information on the options.\n"
+SUGGESTION = (
+    "### Code Suggestions\nGuard the lookup.\n"
+    "```diff\nsrc/a.py\n@@ -1,2 +1,3 @@\n-    value = cache[key]\n+    value: Dict<str, int> = cache.get(key)\n```\n"
+)
+
+
+def separate_substitutions(text: str) -> str:
+    text = re.sub(r"</?script[^>]*>", "", text, flags=re.IGNORECASE)
+    text = re.sub(r"<[^>]+>", "", text)
+    text = re.sub(r"javascript:", "", text, flags=re.IGNORECASE)
+    return re.sub(r"on\w+\s*=", "", text, flags=re.IGNORECASE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chars", type=int, default=80000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    replies = {
+        "suggestions": (PROSE * 3 + SUGGESTION) * (args.chars // len(PROSE * 3 + SUGGESTION)),
+        "prose": PROSE * (args.chars // len(PROSE)),
+        "inline html": PROSE.replace("docs", "<b>docs</b>") * (args.chars // len(PROSE)),
+    }
+    for name, reply in replies.items():
+        print(f"{name}: {len(reply)} chars")
+        for label, func in (("separate substitutions", separate_substitutions), ("sanitize_markup", sanitize_markup)):
+            seconds = min(timeit.repeat(lambda: func(reply), number=args.repeat, repeat=3)) / args.repeat
+            print(f"  {len(reply) / seconds / 1e6:8.1f} Mchar/s  {label}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot analysis cache.
+Run with: python -m pytest test/test_analysis_cache.py
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot import metrics  # noqa: E402
+from harperbot.analysis_cache import AnalysisCache, analysis_cache_key  # noqa: E402
+
+SETTINGS = {"temperature": 0.2, "top_p": 0.95, "max_output_tokens": 4096}
+
+
+class TestAnalysisCacheKey(unittest.TestCase):
+    def test_key_covers_diff_model_prompt_and_settings(self):
+        key = analysis_cache_key("diff", "gemini-2.5-flash", "prompt", SETTINGS)
+
+        self.assertEqual(key, analysis_cache_key("diff", "gemini-2.5-flash", "prompt", dict(SETTINGS)))
+        self.assertNotEqual(key, analysis_cache_key("other diff", "gemini-2.5-flash", "prompt", SETTINGS))
+        self.assertNotEqual(key, analysis_cache_key("diff", "gemini-2.5-pro", "prompt", SETTINGS))
+        self.assertNotEqual(key, analysis_cache_key("diff", "gemini-2.5-flash", "other prompt", SETTINGS))
+        self.assertNotEqual(key, analysis_cache_key("diff", "gemini-2.5-flash", "prompt", {**SETTINGS, "temperature": 0.7}))
+
+
+class TestAnalysisCache(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_get_returns_stored_analysis_and_counts_hits(self):
+        cache = AnalysisCache()
+
+        self.assertIsNone(cache.get("k1"))
+        cache.put("k1", "analysis")
+        self.assertEqual(cache.get("k1"), "analysis")
+
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "size": 1, "bytes": 8})
+        self.assertEqual(metrics.get("analysis_cache_hits"), 1)
+        self.assertEqual(metrics.get("analysis_cache_misses"), 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = AnalysisCache(max_bytes=10)
+        cache.put("k1", "aaaa")
+        cache.put("k2", "bbbb")
+        cache.get("k1")
+        cache.put("k3", "cccc")
+
+        self.assertEqual(cache.get("k1"), "aaaa")
+        self.assertIsNone(cache.get("k2"))
+        self.assertEqual(cache.get("k3"), "cccc")
+
+    def test_oversized_analysis_is_not_stored(self):
+        cache = AnalysisCache(max_bytes=4)
+        cache.put("k1", "too long")
+        self.assertIsNone(cache.get("k1"))
+
+    def test_disk_cache_is_shared_and_bounded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "analyses.sqlite3")
+            first = AnalysisCache(path=path, max_bytes=10)
+            first.put("k1", "aaaa")
+            first.put("k2", "bbbb")
+
+            second = AnalysisCache(path=path, max_bytes=10)
+            self.assertEqual(second.get("k1"), "aaaa")
+            second.put("k3", "cccc")
+
+            self.assertEqual(first.get("k1"), "aaaa")
+            self.assertIsNone(first.get("k2"))
+            self.assertEqual(first.stats()["bytes"], 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
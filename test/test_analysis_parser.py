@@ -0,0 +1,95 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot analysis parser.
+Run with: python -m pytest test/test_analysis_parser.py
+"""
+
+import os
+import sys
+import unittest
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot.analysis_parser import Score, parse_analysis, parsed_analysis  # noqa: E402
+
+ANALYSIS = "\r\n".join(
+    [
+        "Intro line.",
+        "## Summary",
+        "Adds a cache.",
+        "### Scores",
+        "- Security: 8/10",
+        "- Code Quality: 7.5 / 10",
+        "### Code Suggestions",
+        "```diff",
+        "app.py",
+        "@@ -1,1 +1,1 @@",
+        "-a",
+        "+b",
+        "```",
+        "````python",
+        "```",
+        "# not a heading",
+        "- Fake: 1/10",
+        "````",
+    ]
+)
+
+
+class TestParseAnalysis(unittest.TestCase):
+    def test_sections_scores_and_blocks_in_one_pass(self):
+        parsed = parse_analysis(ANALYSIS)
+
+        self.assertEqual([s.title for s in parsed.sections], ["", "Summary", "Scores", "Code Suggestions"])
+        self.assertEqual(parsed.sections[0].lines, ("Intro line.",))
+        self.assertEqual(parsed.section("scores").scores, (Score("Security", 8.0), Score("Code Quality", 7.5)))
+        self.assertEqual(parsed.diff_blocks, ["app.py\n@@ -1,1 +1,1 @@\n-a\n+b"])
+        # The longer ```` fence is not closed by the ``` inside it.
+        self.assertEqual([b.language for b in parsed.code_blocks], ["diff", "python"])
+        self.assertEqual(parsed.code_blocks[1].code, "```\n# not a heading\n- Fake: 1/10")
+        self.assertFalse(parsed.truncated)
+
+    def test_markdown_wrapper_around_the_whole_reply_is_dropped(self):
+        analysis = "```markdown\n### Code Suggestions\n```diff\napp.py\n+x\n```\n```\n"
+
+        parsed = parse_analysis(analysis)
+
+        self.assertEqual(parsed.diff_blocks, ["app.py\n+x"])
+        self.assertEqual([s.title for s in parsed.sections], ["", "Code Suggestions"])
+        self.assertEqual(parsed.text, "### Code Suggestions\n```diff\napp.py\n+x\n```")
+        # A wrapper the reply was cut off inside is dropped too.
+        self.assertEqual(parse_analysis("```md\n## Summary\nOK").section("summary").lines, ("OK",))
+
+    def test_headings_in_a_markdown_block_within_the_reply_are_not_sections(self):
+        parsed = parse_analysis("## Summary\n```markdown\n### Example\n```\nDone.")
+
+        self.assertEqual([s.title for s in parsed.sections], ["", "Summary"])
+        self.assertEqual(parse_analysis("```md\n### Example\n```\n## Summary").sections[-1].title, "Summary")
+
+    def test_cut_off_reply_is_truncated_and_its_open_diff_is_not_used(self):
+        parsed = parse_analysis("### Code Suggestions\n```diff\napp.py\n@@ -1 +1 @@\n-a")
+
+        self.assertTrue(parsed.truncated)
+        self.assertEqual(parsed.diff_blocks, [])
+        self.assertFalse(parsed.code_blocks[0].closed)
+        self.assertTrue(parse_analysis("Long review... (truncated for length)").truncated)
+
+    def test_replace_section_includes_its_subsections(self):
+        parsed = parse_analysis("## A\nx\n## B\ny\n### B.1\nz\n## C\nw")
+
+        self.assertEqual(parsed.replace_section("b", "gone"), "## A\nx\n## B\ngone\n## C\nw")
+        self.assertEqual(parsed.replace_section("missing", "gone"), parsed.text)
+
+    def test_quota_messages(self):
+        self.assertTrue(parse_analysis("Error generating analysis: API quota exceeded.").quota_exceeded)
+        self.assertFalse(parse_analysis("### Summary\nAll good.").quota_exceeded)
+
+    def test_parse_is_shared_between_consumers(self):
+        self.assertIs(parsed_analysis(ANALYSIS), parsed_analysis(ANALYSIS))
+
+
+if __name__ == "__main__":
+    unittest.main()
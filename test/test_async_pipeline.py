@@ -0,0 +1,239 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot async pipeline and ASGI app.
+Run with: python -m pytest test/test_async_pipeline.py
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot import asgi  # noqa: E402
+from harperbot import harperbot as core  # noqa: E402
+from harperbot.analysis_cache import AnalysisCache  # noqa: E402
+from harperbot.async_pipeline import (  # noqa: E402
+    analyze_with_gemini_async,
+    run_analysis_for_pr_async,
+    stream_analysis_with_gemini_async,
+)
+from harperbot.deliveries import DeliveryCache  # noqa: E402
+from harperbot.diff_stream import FetchedDiff  # noqa: E402
+
+PR_DETAILS = {
+    "title": "Test PR",
+    "body": "",
+    "author": "octocat",
+    "files_changed": ["a.py"],
+    "base": "main",
+    "head": "feature",
+    "head_sha": "abc123",
+    "number": 1,
+}
+
+
+def _gemini_client(generate_content):
+    client = Mock()
+    client.aio.models.generate_content = generate_content
+    return client
+
+
+class TestAsyncPipeline(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch("harperbot.harperbot.get_analysis_cache", return_value=AnalysisCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.dict("harperbot.resilience._breakers", clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _patch_core(self, client, *, skip=False, diff="diff --git a/a.py b/a.py"):
+        patches = {
+            "setup_environment_webhook": Mock(return_value=(Mock(), "inst-token", client)),
+            "get_pr_metadata_webhook": Mock(side_effect=lambda *args: (dict(PR_DETAILS), "https://example.invalid/diff")),
+            "should_skip_analysis": Mock(return_value=skip),
+            "upsert_analysis_comment": Mock(),
+            "post_inline_suggestions": Mock(),
+            "apply_authoring_features": Mock(),
+            "post_notice_comment": Mock(),
+        }
+        for name, mock in patches.items():
+            patcher = patch(f"harperbot.harperbot.{name}", mock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch("harperbot.async_pipeline.stream_pr_diff_async", AsyncMock(return_value=FetchedDiff(text=diff)))
+        self.fetch_diff = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("harperbot.async_pipeline._post_targets", return_value=(Mock(), Mock(), [], []))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return patches
+
+    async def test_posts_comment_and_review(self):
+        generate = AsyncMock(return_value=Mock(text="## Summary\nLooks good."))
+        mocks = self._patch_core(_gemini_client(generate))
+
+        await run_analysis_for_pr_async(123, "o/r", 1)
+
+        self.fetch_diff.assert_awaited_once_with("https://example.invalid/diff", "inst-token")
+        generate.assert_awaited_once()
+        mocks["upsert_analysis_comment"].assert_called_once()
+        mocks["post_inline_suggestions"].assert_called_once()
+        mocks["apply_authoring_features"].assert_called_once()
+
+    async def test_skipped_analysis_does_not_call_gemini(self):
+        generate = AsyncMock()
+        mocks = self._patch_core(_gemini_client(generate), skip=True)
+
+        await run_analysis_for_pr_async(123, "o/r", 1)
+
+        generate.assert_not_awaited()
+        mocks["upsert_analysis_comment"].assert_not_called()
+
+    async def test_empty_diff_posts_notice(self):
+        generate = AsyncMock()
+        mocks = self._patch_core(_gemini_client(generate), diff="")
+
+        await run_analysis_for_pr_async(123, "o/r", 1)
+
+        generate.assert_not_awaited()
+        self.assertEqual(mocks["post_notice_comment"].call_args[0][3], "Empty diff")
+
+    async def test_analyses_run_concurrently(self):
+        in_flight = 0
+        peak = 0
+        release = asyncio.Event()
+
+        async def generate_content(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await release.wait()
+            in_flight -= 1
+            return Mock(text="## Summary\nLooks good.")
+
+        self._patch_core(_gemini_client(generate_content))
+
+        runs = [asyncio.create_task(run_analysis_for_pr_async(123, "o/r", n)) for n in range(1, 21)]
+        while peak < 20 and not any(run.done() for run in runs):
+            await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(*runs)
+
+        self.assertEqual(peak, 20)
+
+    async def test_transient_gemini_errors_are_retried(self):
+        generate = AsyncMock(side_effect=[Exception("connection reset by peer"), Mock(text="## Summary\nLooks good.")])
+        with patch("harperbot.async_pipeline.asyncio.sleep", AsyncMock()):
+            analysis = await analyze_with_gemini_async(_gemini_client(generate), {**PR_DETAILS, "diff": "diff"})
+
+        self.assertEqual(generate.await_count, 2)
+        self.assertIn("Looks good", analysis)
+
+    async def test_streaming_posts_progress_before_the_stream_ends(self):
+        posted = []
+
+        async def chunks():
+            yield Mock(text="## Summary\n", candidates=[])
+            # The first edit lands while the model is still writing.
+            while not posted:
+                await asyncio.sleep(0.01)
+            yield Mock(
+                text="Looks good.",
+                candidates=[Mock(finish_reason="FinishReason.STOP")],
+                usage_metadata=Mock(candidates_token_count=42),
+            )
+
+        client = Mock()
+        client.aio.models.generate_content_stream = AsyncMock(return_value=chunks())
+        progress = Mock(ready=Mock(return_value=True), post=Mock(side_effect=posted.append))
+
+        with patch.object(core.get_gemini_scheduler(), "charge") as charge:
+            analysis = await stream_analysis_with_gemini_async(client, {**PR_DETAILS, "diff": "diff"}, progress)
+
+        self.assertEqual(analysis, "## Summary\nLooks good.")
+        self.assertEqual(posted[0], "## Summary")
+        charge.assert_called_once_with(42)
+
+
+class TestAsgiApp(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch.dict(os.environ, {"WEBHOOK_SECRET": "test-secret"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("harperbot.harperbot.get_delivery_cache", return_value=DeliveryCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("harperbot.harperbot.get_job_queue", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _headers(self, body: bytes, delivery_id="delivery-1"):
+        signature = "sha256=" + hmac.new(b"test-secret", body, hashlib.sha256).hexdigest()
+        return {"x-hub-signature-256": signature, "x-github-delivery": delivery_id}
+
+    async def test_invalid_signature_is_rejected(self):
+        status, payload = await asgi.handle_webhook(b"{}", {"x-hub-signature-256": "sha256=bad"})
+        self.assertEqual(status, 403)
+
+    @patch("harperbot.asgi.run_analysis_for_pr_async", new_callable=AsyncMock)
+    async def test_pull_request_runs_async_analysis_once(self, mock_run):
+        body = json.dumps(
+            {
+                "action": "opened",
+                "installation": {"id": 123},
+                "repository": {"full_name": "o/r"},
+                "pull_request": {"number": 1},
+            }
+        ).encode()
+
+        first = await asgi.handle_webhook(body, self._headers(body))
+        second = await asgi.handle_webhook(body, self._headers(body))
+
+        self.assertEqual(first, (200, {"status": "ok"}))
+        self.assertEqual(second, (200, {"status": "duplicate"}))
+        mock_run.assert_awaited_once_with(123, "o/r", 1)
+
+    @patch("harperbot.harperbot.dispatch_webhook_event", return_value=({"status": "ok"}, 200))
+    async def test_comment_commands_use_sync_dispatch(self, mock_dispatch):
+        body = json.dumps(
+            {
+                "action": "created",
+                "installation": {"id": 123},
+                "repository": {"full_name": "o/r"},
+                "issue": {"number": 1, "pull_request": {}},
+                "comment": {"body": "/help"},
+            }
+        ).encode()
+
+        status, payload = await asgi.handle_webhook(body, self._headers(body))
+
+        self.assertEqual((status, payload), (200, {"status": "ok"}))
+        mock_dispatch.assert_called_once()
+
+    async def test_app_serves_metrics(self):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi.app({"type": "http", "path": "/metrics", "method": "GET", "headers": []}, receive, send)
+
+        self.assertEqual(sent[0]["status"], 200)
+        self.assertIsInstance(json.loads(sent[1]["body"]), dict)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for HarperBot context caching of the system instruction.
+Run with: python -m pytest test/test_context_cache.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot import metrics  # noqa: E402
+from harperbot.context_cache import (  # noqa: E402
+    ContextCacheRegistry,
+    FakeCacheBackend,
+    cached_generate_config,
+    forget_stale_cache,
+)
+
+LONG_INSTRUCTION = "Review guideline. " * 400
+
+
+class _Config:
+    """Stands in for GenerateContentConfig (a pydantic model)."""
+
+    def __init__(self, **fields):
+        self.system_instruction = None
+        self.cached_content = None
+        self.__dict__.update(fields)
+
+    def model_copy(self, update):
+        return _Config(**{**self.__dict__, **update})
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCachedGenerateConfig(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.clock = _Clock()
+        self.registry = ContextCacheRegistry(clock=self.clock)
+        patcher = patch("harperbot.context_cache.get_context_cache_registry", return_value=self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backend = FakeCacheBackend()
+
+    def test_instruction_is_cached_once_and_reused_until_it_expires(self):
+        config = _Config(system_instruction=LONG_INSTRUCTION, temperature=0.2)
+
+        first = cached_generate_config(self.backend, "gemini-2.5-flash", config, 3600)
+        second = cached_generate_config(self.backend, "gemini-2.5-flash", config, 3600)
+
+        self.assertEqual(
+            (first.cached_content, first.system_instruction, first.temperature), ("cachedContents/fake-1", None, 0.2)
+        )
+        self.assertEqual(second.cached_content, "cachedContents/fake-1")
+        self.assertEqual(self.backend.created, [("cachedContents/fake-1", "gemini-2.5-flash", LONG_INSTRUCTION, 3600)])
+        self.assertEqual(config.system_instruction, LONG_INSTRUCTION)
+        self.assertEqual(metrics.get("context_cache_hits"), 1)
+
+        # Renewed shortly before the TTL runs out, and separately per model.
+        self.clock.now += 3600 - 60
+        self.assertEqual(
+            cached_generate_config(self.backend, "gemini-2.5-flash", config, 3600).cached_content, "cachedContents/fake-2"
+        )
+        self.assertEqual(
+            cached_generate_config(self.backend, "gemini-2.5-pro", config, 3600).cached_content, "cachedContents/fake-3"
+        )
+
+    def test_short_or_missing_instructions_are_sent_inline(self):
+        for config, ttl in (
+            (_Config(system_instruction="Be brief."), 3600),
+            (_Config(), 3600),
+            (_Config(system_instruction=LONG_INSTRUCTION), 0),
+        ):
+            with self.subTest(ttl=ttl):
+                self.assertIs(cached_generate_config(self.backend, "gemini-2.5-flash", config, ttl), config)
+        self.assertEqual(self.backend.created, [])
+
+    def test_failed_creation_falls_back_to_inline_until_the_ttl_passes(self):
+        backend = FakeCacheBackend()
+        config = _Config(system_instruction=LONG_INSTRUCTION)
+
+        with patch.object(backend, "create", side_effect=RuntimeError("content too small")) as create:
+            with self.assertLogs(level="WARNING"):
+                self.assertIs(cached_generate_config(backend, "gemini-2.5-pro", config, 600), config)
+            self.assertIs(cached_generate_config(backend, "gemini-2.5-pro", config, 600), config)
+
+        create.assert_called_once()
+
+    def test_cache_is_created_outside_the_lock(self):
+        started, finish = threading.Event(), threading.Event()
+        backend = FakeCacheBackend()
+        create = backend.create
+
+        def slow_create(model, system_instruction, ttl_seconds):
+            if model == "gemini-2.5-pro":
+                started.set()
+                finish.wait(2)
+            return create(model, system_instruction, ttl_seconds)
+
+        names = []
+        with patch.object(backend, "create", side_effect=slow_create):
+            creator = threading.Thread(
+                target=lambda: names.append(self.registry.get_or_create("gemini-2.5-pro", LONG_INSTRUCTION, 3600, backend))
+            )
+            creator.start()
+            self.assertTrue(started.wait(2))
+            # The same entry is sent inline meanwhile, and other models are not held up.
+            self.assertEqual(self.registry.get_or_create("gemini-2.5-pro", LONG_INSTRUCTION, 3600, backend), "")
+            self.assertTrue(self.registry.get_or_create("gemini-2.5-flash", LONG_INSTRUCTION, 3600, backend))
+            finish.set()
+            creator.join(2)
+
+        self.assertEqual(len(backend.created), 2)
+        self.assertEqual(self.registry.get_or_create("gemini-2.5-pro", LONG_INSTRUCTION, 3600, backend), names[0])
+
+    def test_cache_gemini_no_longer_has_is_forgotten(self):
+        config = _Config(system_instruction=LONG_INSTRUCTION)
+        request_config = cached_generate_config(self.backend, "gemini-2.5-flash", config, 3600)
+        gone = RuntimeError("404 NOT_FOUND")
+        gone.code, gone.status = 404, "NOT_FOUND"
+
+        self.assertFalse(forget_stale_cache(RuntimeError("503 UNAVAILABLE"), "gemini-2.5-flash", request_config))
+        self.assertFalse(forget_stale_cache(gone, "gemini-2.5-flash", config))
+        with self.assertLogs(level="WARNING"):
+            self.assertTrue(forget_stale_cache(gone, "gemini-2.5-flash", request_config))
+
+        self.assertEqual(metrics.get("context_cache_invalidated"), 1)
+        self.assertEqual(
+            cached_generate_config(self.backend, "gemini-2.5-flash", config, 3600).cached_content, "cachedContents/fake-2"
+        )
+
+    def test_file_registry_is_shared_between_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "context.sqlite3")
+            worker_a = ContextCacheRegistry(path=path, clock=self.clock)
+            worker_b = ContextCacheRegistry(path=path, clock=self.clock)
+
+            name = worker_a.get_or_create("gemini-2.5-flash", LONG_INSTRUCTION, 3600, self.backend)
+
+            self.assertEqual(worker_b.get_or_create("gemini-2.5-flash", LONG_INSTRUCTION, 3600, self.backend), name)
+            self.assertEqual(len(self.backend.created), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
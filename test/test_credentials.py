@@ -0,0 +1,112 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot credential cache.
+Run with: python -m pytest test/test_credentials.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot.credentials import CredentialCache  # noqa: E402
+
+
+def _authorization(token, expires_at):
+    authorization = Mock()
+    authorization.token = token
+    authorization.expires_at = datetime.fromtimestamp(expires_at, tz=timezone.utc)
+    return authorization
+
+
+@patch("harperbot.credentials.Auth.AppAuth")
+@patch("harperbot.credentials.Github")
+@patch("harperbot.credentials.GithubIntegration")
+class TestCredentialCache(unittest.TestCase):
+    def test_reuses_token_and_client_until_refresh_margin(self, mock_integration, mock_github, mock_app_auth):
+        mock_app_auth.return_value.create_jwt.return_value = "jwt"
+        mock_integration.return_value.get_access_token.side_effect = [
+            _authorization("tok-1", 1000 + 3600),
+            _authorization("tok-2", 1000 + 7200),
+        ]
+        cache = CredentialCache(path="", refresh_margin=300)
+
+        with patch("harperbot.credentials.time.time", return_value=1000):
+            g1, token1 = cache.get_installation(1, "key", 42)
+            g2, token2 = cache.get_installation(1, "key", 42)
+        self.assertEqual((token1, token2), ("tok-1", "tok-1"))
+        self.assertIs(g1, g2)
+        self.assertEqual(mock_integration.return_value.get_access_token.call_count, 1)
+
+        # Inside the refresh margin a new token is minted.
+        with patch("harperbot.credentials.time.time", return_value=1000 + 3600 - 200):
+            _g3, token3 = cache.get_installation(1, "key", 42)
+        self.assertEqual(token3, "tok-2")
+        self.assertEqual(mock_integration.return_value.get_access_token.call_count, 2)
+
+    def test_app_jwt_is_reused_across_installations(self, mock_integration, mock_github, mock_app_auth):
+        mock_app_auth.return_value.create_jwt.return_value = "jwt"
+        mock_integration.return_value.get_access_token.side_effect = lambda installation_id: _authorization(
+            f"tok-{installation_id}", 10**10
+        )
+        cache = CredentialCache(path="")
+
+        cache.get_installation(1, "key", 1)
+        cache.get_installation(1, "key", 2)
+
+        self.assertEqual(mock_app_auth.return_value.create_jwt.call_count, 1)
+
+    def test_persists_tokens_for_warm_starts(self, mock_integration, mock_github, mock_app_auth):
+        mock_app_auth.return_value.create_jwt.return_value = "jwt"
+        mock_integration.return_value.get_access_token.return_value = _authorization("tok-1", 10**10)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "credentials.json")
+            CredentialCache(path=path).get_installation(1, "key", 42)
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+            with open(path) as f:
+                self.assertEqual(json.load(f)["42"]["token"], "tok-1")
+
+            _g, token = CredentialCache(path=path).get_installation(1, "key", 42)
+
+        self.assertEqual(token, "tok-1")
+        self.assertEqual(mock_integration.return_value.get_access_token.call_count, 1)
+
+    def test_invalidate_forces_new_token(self, mock_integration, mock_github, mock_app_auth):
+        mock_app_auth.return_value.create_jwt.return_value = "jwt"
+        mock_integration.return_value.get_access_token.return_value = _authorization("tok", 10**10)
+        cache = CredentialCache(path="")
+
+        cache.get_installation(1, "key", 42)
+        cache.invalidate(42)
+        cache.get_installation(1, "key", 42)
+
+        self.assertEqual(mock_integration.return_value.get_access_token.call_count, 2)
+
+    @patch("harperbot.credentials.genai.Client")
+    def test_genai_client_is_shared_per_api_key(self, mock_client, mock_integration, mock_github, mock_app_auth):
+        cache = CredentialCache(path="")
+
+        first = cache.get_genai_client("k1")
+        self.assertIs(first, cache.get_genai_client("k1"))
+        second = cache.get_genai_client("k2")
+        self.assertEqual(mock_client.call_count, 0)
+
+        first.models.generate_content("prompt")
+        first.models.generate_content("prompt")
+        second.models.generate_content("prompt")
+
+        self.assertEqual(mock_client.call_count, 2)
+        mock_client.assert_any_call(api_key="k1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot webhook delivery cache.
+Run with: python -m pytest test/test_deliveries.py
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot import metrics  # noqa: E402
+from harperbot.deliveries import DeliveryCache  # noqa: E402
+
+
+class TestDeliveryCache(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_detects_duplicate_and_counts_hits_and_misses(self):
+        cache = DeliveryCache()
+
+        self.assertFalse(cache.check_and_record("d-1"))
+        self.assertTrue(cache.check_and_record("d-1"))
+        self.assertFalse(cache.check_and_record("d-2"))
+
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 2, "size": 2})
+        self.assertEqual(metrics.get("delivery_cache_hits"), 1)
+        self.assertEqual(metrics.get("delivery_cache_misses"), 2)
+
+    def test_missing_delivery_id_is_never_a_duplicate(self):
+        cache = DeliveryCache()
+        self.assertFalse(cache.check_and_record(None))
+        self.assertFalse(cache.check_and_record(""))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_entries_expire_after_ttl(self):
+        cache = DeliveryCache(ttl_seconds=10)
+        with patch("harperbot.deliveries.time.time", return_value=1000.0):
+            cache.check_and_record("d-1")
+        with patch("harperbot.deliveries.time.time", return_value=1011.0):
+            self.assertFalse(cache.check_and_record("d-1"))
+
+    def test_size_is_bounded(self):
+        cache = DeliveryCache(max_entries=2)
+        for delivery_id in ("a", "b", "c"):
+            cache.check_and_record(delivery_id)
+
+        self.assertEqual(cache.stats()["size"], 2)
+        # The oldest id was evicted, so it is no longer recognised.
+        self.assertFalse(cache.check_and_record("a"))
+
+    def test_forget_allows_redelivery(self):
+        cache = DeliveryCache()
+        cache.check_and_record("d-1")
+        cache.forget("d-1")
+        self.assertFalse(cache.check_and_record("d-1"))
+
+    def test_disk_cache_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "deliveries.sqlite3")
+            first = DeliveryCache(path=path)
+            second = DeliveryCache(path=path)
+
+            self.assertFalse(first.check_and_record("d-1"))
+            self.assertTrue(second.check_and_record("d-1"))
+
+            second.forget("d-1")
+            self.assertFalse(DeliveryCache(path=path).check_and_record("d-1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for HarperBot diff budgeting.
+Run with: python -m pytest test/test_diff_budget.py
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import Mock
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot import diff_budget  # noqa: E402
+from harperbot.diff_budget import (  # noqa: E402
+    budget_diff,
+    drop_generated,
+    estimate_tokens,
+    gemini_token_counter,
+    parse_gitattributes,
+    path_matches,
+)
+from harperbot.settings import DEFAULT_GENERATED_FILES  # noqa: E402
+
+
+def _file_diff(path: str, added: int, removed: int = 0) -> str:
+    body = "".join(f"-old {n}\n" for n in range(removed)) + "".join(f"+new line {n}\n" for n in range(added))
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1,{removed} +1,{added} @@\n{body}"
+
+
+class TestGeneratedFiles(unittest.TestCase):
+    def test_default_globs_match_lockfiles_and_bundles(self):
+        for path in (
+            "yarn.lock",
+            "web/package-lock.json",
+            "static/app.min.js",
+            "src/__snapshots__/a.test.js.snap",
+            "dist/x/y.js",
+        ):
+            self.assertTrue(any(path_matches(pattern, path) for pattern in DEFAULT_GENERATED_FILES), path)
+        for path in ("src/lock.py", "lib/dist.py", "app/vendor.py"):
+            self.assertFalse(any(path_matches(pattern, path) for pattern in DEFAULT_GENERATED_FILES), path)
+
+    def test_gitattributes_markers_override_globs(self):
+        rules = parse_gitattributes("# comment\nschema/*.py linguist-generated=true\ndist/keep.js -linguist-generated\n")
+        diff = _file_diff("schema/models.py", 3) + _file_diff("dist/keep.js", 3) + _file_diff("app.py", 3)
+
+        kept, omitted = drop_generated(
+            diff, ("dist/**",), "schema/*.py linguist-generated=true\ndist/keep.js -linguist-generated\n"
+        )
+
+        self.assertEqual(rules, [("schema/*.py", True), ("dist/keep.js", False)])
+        self.assertEqual(omitted, (("schema/models.py", "generated"),))
+        self.assertIn("dist/keep.js", kept)
+        self.assertIn("app.py", kept)
+
+    def test_binary_files_are_omitted(self):
+        diff = "diff --git a/logo.png b/logo.png\nindex 1..2 100644\nBinary files a/logo.png and b/logo.png differ\n"
+
+        self.assertEqual(drop_generated(diff)[1], (("logo.png", "binary"),))
+
+
+class TestBudgetDiff(unittest.TestCase):
+    def test_generated_files_are_summarised_not_sent(self):
+        diff = _file_diff("package-lock.json", 500, 20) + _file_diff("app.py", 3)
+
+        budgeted = budget_diff(diff, 10_000, generated_files=DEFAULT_GENERATED_FILES)
+
+        self.assertEqual(budgeted.included, ("app.py",))
+        self.assertNotIn("+new line 499", budgeted.text)
+        self.assertIn("package-lock.json (+500 -20): generated", budgeted.text)
+
+    def test_risky_and_high_churn_files_fill_the_budget_first(self):
+        diff = (
+            _file_diff("docs/guide.md", 40)
+            + _file_diff("src/util.py", 5)
+            + _file_diff("src/big.py", 30)
+            + _file_diff("src/auth.py", 5)
+        )
+        auth_tokens = estimate_tokens(_file_diff("src/auth.py", 5))
+        big_tokens = estimate_tokens(_file_diff("src/big.py", 30))
+
+        budgeted = budget_diff(diff, auth_tokens + big_tokens + 10)
+
+        self.assertEqual(budgeted.included, ("src/auth.py", "src/big.py"))
+        self.assertIn(("src/util.py", "over the token budget"), budgeted.omitted)
+        self.assertIn(("docs/guide.md", "over the token budget"), budgeted.omitted)
+
+    def test_file_is_cut_at_a_line_when_enough_budget_is_left(self):
+        diff = _file_diff("src/app.py", 400)
+
+        budgeted = budget_diff(diff, 1000)
+
+        self.assertEqual(budgeted.included, ("src/app.py",))
+        self.assertEqual(budgeted.omitted, (("src/app.py", "truncated to fit the token budget"),))
+        shown = budgeted.text.split("\n# Not shown above:")[0]
+        self.assertLessEqual(estimate_tokens(shown), 1000)
+        self.assertTrue(shown.endswith("\n"))
+
+
+class TestTokenCounter(unittest.TestCase):
+    def setUp(self):
+        diff_budget._token_ratios.clear()
+
+    def test_count_tokens_calibrates_the_estimate(self):
+        count_tokens = Mock(return_value=50)
+
+        count = gemini_token_counter(count_tokens, "gemini-2.5-flash", "x" * 400)
+
+        self.assertEqual(count("y" * 400), 50)
+        count_tokens.assert_called_once_with("gemini-2.5-flash", "x" * 400)
+
+    def test_ratio_is_reused_per_model_until_it_expires(self):
+        count_tokens = Mock(return_value=50)
+        now = [0.0]
+
+        gemini_token_counter(count_tokens, "gemini-2.5-flash", "x" * 400, clock=lambda: now[0])
+        count = gemini_token_counter(count_tokens, "gemini-2.5-flash", "z" * 400, clock=lambda: now[0])
+        self.assertEqual(count("y" * 400), 50)
+        self.assertEqual(count_tokens.call_count, 1)
+
+        gemini_token_counter(count_tokens, "gemini-2.5-pro", "x" * 400, clock=lambda: now[0])
+        self.assertEqual(count_tokens.call_count, 2)
+
+        now[0] = diff_budget.TOKEN_RATIO_TTL_SECONDS
+        gemini_token_counter(count_tokens, "gemini-2.5-flash", "x" * 400, clock=lambda: now[0])
+        self.assertEqual(count_tokens.call_count, 3)
+
+    def test_falls_back_to_the_local_estimate(self):
+        count_tokens = Mock(side_effect=RuntimeError("offline"))
+
+        with self.assertLogs(level="WARNING"):
+            count = gemini_token_counter(count_tokens, "gemini-2.5-flash", "x" * 400)
+
+        self.assertIs(count, estimate_tokens)
+        self.assertNotIn("gemini-2.5-flash", diff_budget._token_ratios)
+
+
+if __name__ == "__main__":
+    unittest.main()
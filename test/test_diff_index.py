@@ -0,0 +1,104 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot diff index.
+Run with: python -m pytest test/test_diff_index.py
+"""
+
+import os
+import sys
+import unittest
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot.diff_index import diff_index, parse_diff  # noqa: E402
+
+DIFF = "\n".join(
+    [
+        "diff --git a/app.py b/app.py",
+        "index 1111111..2222222 100644",
+        "--- a/app.py",
+        "+++ b/app.py",
+        "@@ -1,3 +1,3 @@",
+        " import os",
+        "-import sys",
+        "+import re",
+        " ",
+        "@@ -10,2 +10,3 @@ def main():",
+        "     run()",
+        "+    log()",
+        "     return 0",
+        "diff --git a/docs/readme.md b/docs/readme.md",
+        "new file mode 100644",
+        "--- /dev/null",
+        "+++ b/docs/readme.md",
+        "@@ -0,0 +1,2 @@",
+        "+# Title",
+        "+text",
+        "\\ No newline at end of file",
+        "",
+    ]
+)
+
+
+class TestDiffIndex(unittest.TestCase):
+    def test_positions_continue_across_hunks(self):
+        index = parse_diff(DIFF)
+
+        self.assertEqual(index.position("app.py", 2), 3)
+        self.assertEqual(index.position("app.py", 2, side="LEFT"), 2)
+        # The second hunk header takes position 5.
+        self.assertEqual([index.position("app.py", line) for line in (10, 11, 12)], [6, 7, 8])
+        self.assertEqual(index.file("app.py").sides[7], ("RIGHT", 11))
+        self.assertEqual(index.file("app.py").sides[2], ("LEFT", 2))
+
+    def test_lines_outside_the_diff_have_no_position(self):
+        index = parse_diff(DIFF)
+
+        self.assertIsNone(index.position("app.py", 5))
+        self.assertIsNone(index.position("missing.py", 1))
+        self.assertIsNone(index.position("docs/readme.md", 3))
+        self.assertEqual(index.position("docs/readme.md", 2), 2)
+
+    def test_hunk_lookup_and_range_coverage(self):
+        index = parse_diff(DIFF)
+        app = index.file("app.py")
+
+        self.assertEqual(app.hunk_for(11).new_start, 10)
+        self.assertEqual(app.hunk_for(11).position, 5)
+        self.assertIsNone(app.hunk_for(5))
+        self.assertTrue(index.covers("app.py", 10, 12))
+        self.assertFalse(index.covers("app.py", 3, 10))
+        self.assertFalse(index.covers("missing.py", 1, 1))
+
+    def test_comments_are_anchorable_within_one_hunk(self):
+        index = parse_diff(DIFF)
+
+        self.assertTrue(index.anchorable("app.py", 1, 3))
+        self.assertTrue(index.anchorable("app.py", 11, 11))
+        self.assertFalse(index.anchorable("app.py", 3, 10))
+        self.assertFalse(index.anchorable("app.py", 4, 4))
+        self.assertFalse(index.anchorable("missing.py", 1, 1))
+
+    def test_paths_are_matched_exactly(self):
+        diff = "diff --git a/lib/app.py b/lib/app.py\n@@ -1 +1 @@\n-a\n+b\n"
+
+        self.assertIsNone(parse_diff(diff).position("app.py", 1))
+        self.assertEqual(parse_diff(diff).position("lib/app.py", 1), 2)
+
+    def test_truncated_hunk_ends_at_the_next_file(self):
+        diff = "diff --git a/a.py b/a.py\n@@ -1,5 +1,5 @@\n x\ndiff --git a/b.py b/b.py\n@@ -1 +1 @@\n+y\n"
+
+        index = parse_diff(diff)
+
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.position("b.py", 1), 1)
+
+    def test_index_is_memoized_per_diff(self):
+        self.assertIs(diff_index(DIFF), diff_index(DIFF))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot streamed diff accumulator.
+Run with: python -m pytest test/test_diff_stream.py
+"""
+
+import os
+import sys
+import unittest
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot.diff_stream import DiffAccumulator  # noqa: E402
+
+DIFF = (
+    b"diff --git a/a.py b/a.py\n"
+    b"--- a/a.py\n"
+    b"+++ b/a.py\n"
+    b"@@ -1 +1 @@\n"
+    b"-old\n"
+    b"+new\n"
+    b"diff --git a/vendor/lib.js b/vendor/lib.js\n"
+    b"@@ -0,0 +1,3 @@\n"
+    b"+var a = 1;\n"
+    b"+var b = 2;\n"
+    b"+var c = 3;"
+)
+
+
+def _feed(accumulator, data: bytes, size: int) -> int:
+    """Feed `data` in `size`-byte chunks, as a streamed response would; returns the chunks read."""
+    for read, start in enumerate(range(0, len(data), size), 1):
+        if not accumulator.feed(data[start : start + size]):
+            return read
+    return -(-len(data) // size)
+
+
+class TestDiffAccumulator(unittest.TestCase):
+    def test_whole_diff_is_kept_with_per_file_sizes(self):
+        accumulator = DiffAccumulator(0)
+        _feed(accumulator, DIFF, 7)
+
+        fetched = accumulator.finish()
+
+        self.assertEqual(fetched.text, DIFF.decode())
+        self.assertFalse(fetched.truncated)
+        self.assertEqual(fetched.total_bytes, len(DIFF))
+        sizes = {path: (size.bytes, size.lines) for path, size in fetched.files.items()}
+        self.assertEqual(sizes, {"a.py": (69, 6), "vendor/lib.js": (94, 5)})
+        self.assertEqual(sum(size.bytes for size in fetched.files.values()), len(DIFF))
+
+    def test_cap_keeps_whole_lines_and_stops_reading(self):
+        accumulator = DiffAccumulator(80)
+        chunks_read = _feed(accumulator, DIFF, 16)
+
+        fetched = accumulator.finish()
+
+        self.assertTrue(fetched.truncated)
+        self.assertEqual(fetched.text, DIFF[:69].decode())
+        self.assertEqual(chunks_read, 6)
+        self.assertEqual(list(fetched.files), ["a.py"])
+
+    def test_line_longer_than_the_cap_truncates(self):
+        accumulator = DiffAccumulator(30)
+        _feed(accumulator, b"diff --git a/m.js b/m.js\n+" + b"x" * 100, 16)
+
+        fetched = accumulator.finish()
+
+        self.assertTrue(fetched.truncated)
+        self.assertEqual(fetched.text, "diff --git a/m.js b/m.js\n")
+
+    def test_spill_keeps_the_whole_diff_on_disk(self):
+        accumulator = DiffAccumulator(80, spill=True)
+        self.assertEqual(_feed(accumulator, DIFF, 16), -(-len(DIFF) // 16))
+
+        fetched = accumulator.finish()
+        self.addCleanup(os.unlink, fetched.spill_path)
+
+        self.assertTrue(fetched.truncated)
+        self.assertEqual(fetched.text, DIFF[:69].decode())
+        with open(fetched.spill_path, "rb") as f:
+            self.assertEqual(f.read(), DIFF)
+        self.assertEqual(fetched.files["vendor/lib.js"].lines, 5)
+
+    def test_discard_removes_the_spill_file(self):
+        accumulator = DiffAccumulator(spill=True)
+        accumulator.feed(DIFF[:10])
+        path = accumulator._spill.name
+
+        accumulator.discard()
+
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
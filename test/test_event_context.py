@@ -0,0 +1,94 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot per-event GitHub context.
+Run with: python -m pytest test/test_event_context.py
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import Mock
+
+import requests
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot import metrics  # noqa: E402
+from harperbot.event_context import current_event, github_event, record_api_call  # noqa: E402
+from harperbot.http_session import get_http_session  # noqa: E402
+
+
+class _StaticAdapter(requests.adapters.BaseAdapter):
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class TestEventContext(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_objects_are_fetched_once(self):
+        g = Mock()
+        label = Mock()
+        label.name = "harperbot:paused"
+        g.get_repo.return_value.get_issue.return_value.get_labels.return_value = [label]
+        g.get_repo.return_value.get_pull.return_value.get_issue_comments.return_value = iter([Mock()])
+
+        with github_event("o/r", 1) as event:
+            event.github = g
+            for _ in range(3):
+                self.assertIs(current_event("o/r", 1, Mock()).pr, event.pr)
+                self.assertEqual(event.label_names, {"harperbot:paused"})
+                self.assertEqual(len(event.issue_comments), 1)
+
+        g.get_repo.assert_called_once_with("o/r", lazy=True)
+        g.get_repo.return_value.get_pull.assert_called_once_with(1)
+        g.get_repo.return_value.get_issue.assert_called_once_with(number=1)
+
+    def test_nested_events_for_the_same_pr_share_one_context(self):
+        with github_event("o/r", 1) as outer:
+            with github_event("o/r", 1) as inner:
+                self.assertIs(inner, outer)
+            with github_event("o/r", 2) as other:
+                self.assertIsNot(other, outer)
+            self.assertIs(current_event("o/r", 1, Mock()), outer)
+
+        self.assertIsNot(current_event("o/r", 1, Mock()), outer)
+        self.assertEqual(metrics.get("github_events"), 2)
+
+    def test_api_calls_are_counted_per_event_and_exported(self):
+        record_api_call()
+        with self.assertLogs(level="INFO") as logs:
+            with github_event("o/r", 1) as event:
+                record_api_call()
+                record_api_call()
+
+        self.assertEqual(event.api_calls, 2)
+        self.assertEqual(metrics.get("github_api_calls"), 3)
+        self.assertIn("GitHub API calls for o/r#1: 2", "\n".join(logs.output))
+
+    def test_shared_session_counts_responses(self):
+        session = get_http_session()
+        session.mount("https://harperbot.invalid/", _StaticAdapter())
+        try:
+            with github_event("o/r", 1) as event:
+                session.get("https://harperbot.invalid/repos/o/r")
+        finally:
+            session.adapters.pop("https://harperbot.invalid/")
+
+        self.assertEqual(event.api_calls, 1)
+        self.assertEqual(metrics.get("github_api_calls"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,6 +9,7 @@ Run with: python -m pytest test/test_harperbot.py
 
 import os
 import sys
+import threading
 import unittest
 from unittest.mock import Mock, patch
 
@@ -17,7 +18,11 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 from github.GithubException import GithubException  # noqa: E402
 
+from harperbot.analysis_cache import AnalysisCache  # noqa: E402
+from harperbot.diff_stream import FetchedDiff  # noqa: E402
 from harperbot.harperbot import (  # noqa: E402
+    ProgressiveComment,
+    analyze_incrementally,
     analyze_with_gemini,
     apply_suggestions_to_pr,
     create_branch,
@@ -26,18 +31,37 @@ from harperbot.harperbot import (  # noqa: E402
     get_pr_details_webhook,
     handle_pr_comment_command,
     is_quota_exceeded_message,
+    last_analyzed_sha,
     load_config,
+    parse_code_suggestions,
     parse_diff_for_suggestions,
     post_comment_webhook,
     post_inline_suggestions,
     run_analysis_for_pr,
+    stream_analysis_with_gemini,
+    stream_pr_diff,
+    update_main_comment,
     verify_webhook_signature,
 )
+from harperbot.quota import QuotaState  # noqa: E402
 
 
 class TestHarperBot(unittest.TestCase):
     """Test cases for HarperBot functionality."""
 
+    def setUp(self):
+        # Each test starts with an empty analysis cache so mocked responses never leak between tests.
+        patcher = patch("harperbot.harperbot.get_analysis_cache", return_value=AnalysisCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Likewise for the shared quota cooldown.
+        patcher = patch("harperbot.quota.get_quota_state", return_value=QuotaState())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.dict("harperbot.resilience._breakers", clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_verify_webhook_signature_valid(self):
         """Test webhook signature verification with valid signature."""
         payload = b'{"test": "data"}'
@@ -168,6 +192,335 @@ class TestHarperBot(unittest.TestCase):
         self.assertIn("api unavailable", result.lower())
         self.assertIn("http 503", result.lower())
 
+    @patch("harperbot.harperbot.time.sleep", return_value=None)
+    @patch("harperbot.harperbot.load_config")
+    def test_analyze_with_gemini_fails_fast_while_the_circuit_is_open(self, mock_load_config, _mock_sleep):
+        """After a burst of server errors, Gemini is not called until the breaker's cooldown has passed."""
+        from google.genai import errors as genai_errors
+
+        mock_load_config.return_value = {
+            "model": "gemini-2.5-flash",
+            "max_diff_length": 4000,
+            "max_output_tokens": 4096,
+            "prompt": "Test prompt {num_files} {files_list} {diff_content} {focus_instruction}",
+        }
+        mock_client = Mock()
+        mock_client.models.generate_content.side_effect = genai_errors.ServerError(
+            503, {"error": {"message": "unavailable"}}, None
+        )
+        pr_details = {"title": "Test PR", "body": "", "files_changed": ["test.py"], "diff": "test diff"}
+
+        with self.assertLogs(level="WARNING"):
+            analyze_with_gemini(mock_client, pr_details)
+            analyze_with_gemini(mock_client, {**pr_details, "diff": "other diff"})
+            result = analyze_with_gemini(mock_client, {**pr_details, "diff": "third diff"})
+
+        # Three attempts for the first PR, two more open the circuit, and the third PR never reaches Gemini.
+        self.assertEqual(mock_client.models.generate_content.call_count, 5)
+        self.assertIn("gemini keeps failing", result.lower())
+
+    @patch("harperbot.harperbot.load_config")
+    def test_analyze_with_gemini_serves_repeat_requests_from_cache(self, mock_load_config):
+        """An identical request is answered from the analysis cache unless use_cache=False."""
+        mock_load_config.return_value = {
+            "model": "gemini-2.5-flash",
+            "focus": "all",
+            "max_diff_length": 4000,
+            "temperature": 0.2,
+            "max_output_tokens": 4096,
+            "prompt": "Test prompt {num_files} {files_list} {diff_content} {focus_instruction}",
+        }
+
+        mock_client = Mock()
+        mock_client.models.generate_content.side_effect = [
+            Mock(text="First analysis"),
+            Mock(text="Second analysis"),
+            Mock(text="Third analysis"),
+        ]
+        pr_details = {"title": "Test PR", "body": "", "files_changed": ["test.py"], "diff": "test diff"}
+
+        self.assertEqual(analyze_with_gemini(mock_client, pr_details), "First analysis")
+        self.assertEqual(analyze_with_gemini(mock_client, pr_details), "First analysis")
+        self.assertEqual(mock_client.models.generate_content.call_count, 1)
+
+        self.assertEqual(analyze_with_gemini(mock_client, pr_details, use_cache=False), "Second analysis")
+        self.assertEqual(analyze_with_gemini(mock_client, {**pr_details, "diff": "other diff"}), "Third analysis")
+        self.assertEqual(mock_client.models.generate_content.call_count, 3)
+
+    @patch("harperbot.harperbot.load_config")
+    def test_analyze_with_gemini_quota_error_pauses_other_prs(self, mock_load_config):
+        """After a 429 no PR calls Gemini until the retry delay the API asked for has passed."""
+        mock_load_config.return_value = {
+            "model": "gemini-2.5-flash",
+            "focus": "all",
+            "max_diff_length": 4000,
+            "temperature": 0.2,
+            "max_output_tokens": 4096,
+            "prompt": "Test prompt {num_files} {files_list} {diff_content} {focus_instruction}",
+        }
+
+        quota_error = Exception("429 RESOURCE_EXHAUSTED. Quota exceeded, please retry in 30s.")
+        mock_client = Mock()
+        mock_client.models.generate_content.side_effect = quota_error
+        pr_details = {"title": "Test PR", "body": "", "files_changed": ["test.py"], "diff": "test diff"}
+
+        with self.assertLogs(level="WARNING"):
+            first = analyze_with_gemini(mock_client, pr_details)
+        second = analyze_with_gemini(mock_client, {**pr_details, "diff": "other diff"})
+
+        self.assertTrue(is_quota_exceeded_message(first))
+        self.assertTrue(is_quota_exceeded_message(second))
+        self.assertIn("cooldown active until", second)
+        self.assertEqual(mock_client.models.generate_content.call_count, 1)
+
+    @patch("harperbot.harperbot.load_config")
+    def test_analyze_with_gemini_reviews_large_diff_in_chunks(self, mock_load_config):
+        """With chunked_analysis, a diff over max_diff_length is analyzed per chunk and merged."""
+        mock_load_config.return_value = {
+            "model": "gemini-2.5-flash",
+            "focus": "all",
+            "max_diff_length": 200,
+            "temperature": 0.2,
+            "max_output_tokens": 4096,
+            "chunked_analysis": True,
+            "max_diff_chunks": 12,
+            "max_parallel_chunks": 2,
+            "prompt": "Test prompt {num_files} {files_list} {diff_content} {focus_instruction}",
+        }
+        diffs = [
+            f"diff --git a/{name} b/{name}\n--- a/{name}\n+++ b/{name}\n@@ -1,0 +1,12 @@\n" + "+x = 1\n" * 12
+            for name in ("a.py", "b.py")
+        ]
+
+        def generate_content(model, contents, config):
+            name = "a.py" if "a.py" in contents else "b.py"
+            return Mock(text=f"### Summary\nChanges {name}.\n\n### Scores\n- Code Quality: {8 if name == 'a.py' else 6}/10")
+
+        mock_client = Mock()
+        mock_client.models.generate_content.side_effect = generate_content
+        pr_details = {"title": "Test PR", "body": "", "files_changed": ["a.py", "b.py"], "diff": "".join(diffs)}
+
+        analysis = analyze_with_gemini(mock_client, pr_details)
+
+        self.assertEqual(mock_client.models.generate_content.call_count, 2)
+        self.assertIn("Changes a.py.\n\nChanges b.py.", analysis)
+        self.assertIn("- Code Quality: 7/10", analysis)
+        self.assertIn("Reviewed in 2 parts", analysis)
+
+    @patch("harperbot.harperbot.load_config")
+    def test_chunks_of_a_large_diff_use_the_tier_of_the_whole_diff(self, mock_load_config):
+        """Every chunk is routed by the whole diff's size, not by its own."""
+        mock_load_config.return_value = {
+            "model": "gemini-2.5-flash",
+            "max_diff_length": 200,
+            "max_output_tokens": 4096,
+            "chunked_analysis": True,
+            "prompt": "{diff_content}",
+            "model_tiers": [
+                {"name": "small", "model": "gemini-2.5-flash-lite", "max_changed_lines": 15},
+                {"name": "large", "model": "gemini-2.5-pro"},
+            ],
+        }
+        diff = "".join(
+            f"diff --git a/{name} b/{name}\n--- a/{name}\n+++ b/{name}\n@@ -1,0 +1,12 @@\n" + "+x = 1\n" * 12
+            for name in ("a.py", "b.py")
+        )
+        mock_client = Mock()
+        mock_client.models.generate_content.return_value = Mock(text="### Summary\nOK.")
+
+        analyze_with_gemini(mock_client, {"title": "Test PR", "body": "", "files_changed": ["a.py", "b.py"], "diff": diff})
+
+        models = [call.kwargs["model"] for call in mock_client.models.generate_content.call_args_list]
+        self.assertEqual(models, ["gemini-2.5-pro", "gemini-2.5-pro"])
+
+    @patch("harperbot.harperbot.load_config")
+    def test_analyze_with_gemini_token_budget_leaves_out_generated_files(self, mock_load_config):
+        """With max_diff_tokens, lockfiles are listed instead of sent, and no character cut applies."""
+        mock_load_config.return_value = {
+            "model": "gemini-2.5-flash",
+            "focus": "all",
+            "max_diff_length": 100,
+            "max_diff_tokens": 2000,
+            "generated_files": ("*.lock",),
+            "temperature": 0.2,
+            "max_output_tokens": 4096,
+            "prompt": "{diff_content}",
+        }
+        lockfile = "diff --git a/yarn.lock b/yarn.lock\n--- a/yarn.lock\n+++ b/yarn.lock\n@@ -1,0 +1,2 @@\n+a\n+b\n"
+        source = "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n@@ -1,0 +1,20 @@\n" + "+print('hello')\n" * 20
+
+        mock_client = Mock()
+        mock_client.models.generate_content.return_value = Mock(text="Analysis")
+        pr_details = {"title": "Test PR", "body": "", "files_changed": ["yarn.lock", "app.py"], "diff": lockfile + source}
+
+        analyze_with_gemini(mock_client, pr_details)
+
+        prompt = mock_client.models.generate_content.call_args.kwargs["contents"]
+        self.assertTrue(prompt.startswith(source))
+        self.assertIn("yarn.lock (+2 -0): generated", prompt)
+
+    @patch("harperbot.harperbot.load_config")
+    def test_analyze_with_gemini_routes_small_prs_to_the_fast_tier(self, mock_load_config):
+        """A small PR uses the first model tier's model, output limit and thinking budget."""
+        from harperbot.settings import parse_config
+
+        mock_load_config.return_value = parse_config(
+            {
+                "model": "gemini-2.5-flash",
+                "max_output_tokens": 8192,
+                "prompt": "{diff_content}",
+                "model_tiers": [
+                    {
+                        "name": "small",
+                        "model": "gemini-2.5-flash-lite",
+                        "max_changed_lines": 10,
+                        "max_output_tokens": 2048,
+                        "thinking_budget": 0,
+                    },
+                    {"name": "large", "model": "gemini-2.5-pro"},
+                ],
+            }
+        )
+        mock_client = Mock()
+        mock_client.models.generate_content.return_value = Mock(text="Analysis")
+        small = {"title": "Test PR", "body": "", "files_changed": ["a.py"], "diff": "+one\n-two\n"}
+        large = {**small, "diff": "+line\n" * 50}
+
+        analyze_with_gemini(mock_client, small)
+        small_call = mock_client.models.generate_content.call_args.kwargs
+        analyze_with_gemini(mock_client, large)
+        large_call = mock_client.models.generate_content.call_args.kwargs
+
+        self.assertEqual(small_call["model"], "gemini-2.5-flash-lite")
+        self.assertEqual(small_call["config"].max_output_tokens, 2048)
+        self.assertEqual(small_call["config"].thinking_config.thinking_budget, 0)
+        self.assertEqual(large_call["model"], "gemini-2.5-pro")
+        self.assertEqual(large_call["config"].max_output_tokens, 8192)
+        self.assertIsNone(large_call["config"].thinking_config)
+
+    @patch("harperbot.harperbot.load_config")
+    def test_analyze_with_gemini_sends_the_system_instruction_from_the_context_cache(self, mock_load_config):
+        """A long system instruction is cached once; each request then only carries the per-PR prompt."""
+        from harperbot.context_cache import ContextCacheRegistry, FakeCacheBackend
+
+        mock_load_config.return_value = {
+            "model": "gemini-2.5-flash",
+            "focus": "security",
+            "max_diff_length": 4000,
+            "max_output_tokens": 4096,
+            "prompt": "Diff:\n{diff_content}",
+            "system_instruction": "{focus_instruction}\n" + "Follow the team's review guidelines. " * 200,
+            "context_cache_ttl": 3600,
+        }
+        backend = FakeCacheBackend()
+        mock_client = Mock()
+        mock_client.models.generate_content.side_effect = [Mock(text="First analysis"), Mock(text="Second analysis")]
+        pr_details = {"title": "Test PR", "body": "", "files_changed": ["test.py"], "diff": "test diff"}
+
+        with (
+            patch("harperbot.harperbot.GeminiCacheBackend", return_value=backend),
+            patch("harperbot.context_cache.get_context_cache_registry", return_value=ContextCacheRegistry()),
+        ):
+            analyze_with_gemini(mock_client, pr_details)
+            analyze_with_gemini(mock_client, {**pr_details, "diff": "other diff"})
+            self.assertEqual(analyze_with_gemini(mock_client, pr_details), "First analysis")
+
+        self.assertEqual(len(backend.created), 1)
+        self.assertTrue(backend.created[0][2].startswith("Focus primarily on security"))
+        call = mock_client.models.generate_content.call_args.kwargs
+        self.assertEqual(call["contents"], "Diff:\nother diff")
+        self.assertEqual(call["config"].cached_content, "cachedContents/fake-1")
+        self.assertIsNone(call["config"].system_instruction)
+
+    @patch("harperbot.harperbot.load_config")
+    def test_analyze_with_gemini_retries_inline_when_the_context_cache_is_gone(self, mock_load_config):
+        """A request naming a cache Gemini no longer has is resent at once with the instruction inline."""
+        from harperbot.context_cache import ContextCacheRegistry, FakeCacheBackend
+
+        mock_load_config.return_value = {
+            "model": "gemini-2.5-flash",
+            "max_diff_length": 4000,
+            "max_output_tokens": 4096,
+            "prompt": "Diff:\n{diff_content}",
+            "system_instruction": "Follow the team's review guidelines. " * 200,
+            "context_cache_ttl": 3600,
+        }
+        gone = RuntimeError("404 NOT_FOUND. CachedContent not found")
+        gone.code, gone.status = 404, "NOT_FOUND"
+        backend = FakeCacheBackend()
+        mock_client = Mock()
+        mock_client.models.generate_content.side_effect = [gone, Mock(text="First analysis"), Mock(text="Second analysis")]
+        pr_details = {"title": "Test PR", "body": "", "files_changed": ["test.py"], "diff": "test diff"}
+
+        with (
+            patch("harperbot.harperbot.GeminiCacheBackend", return_value=backend),
+            patch("harperbot.context_cache.get_context_cache_registry", return_value=ContextCacheRegistry()),
+            self.assertLogs(level="WARNING"),
+        ):
+            self.assertEqual(analyze_with_gemini(mock_client, pr_details), "First analysis")
+            analyze_with_gemini(mock_client, {**pr_details, "diff": "other diff"})
+
+        stale, inline, renewed = [c.kwargs["config"] for c in mock_client.models.generate_content.call_args_list]
+        self.assertEqual(stale.cached_content, "cachedContents/fake-1")
+        self.assertIsNone(inline.cached_content)
+        self.assertTrue(inline.system_instruction.startswith("Follow the team's"))
+        # The next review creates a new cache.
+        self.assertEqual(renewed.cached_content, "cachedContents/fake-2")
+
+    def test_analyze_incrementally_reanalyzes_only_changed_files(self):
+        """A push that changes one file sends only that file to Gemini and keeps the other findings."""
+        config = {
+            "model": "gemini-2.5-flash",
+            "focus": "all",
+            "max_diff_length": 200,
+            "temperature": 0.2,
+            "max_output_tokens": 4096,
+            "max_parallel_chunks": 2,
+            "prompt": "{files_list}",
+        }
+
+        def file_diff(name, line):
+            return f"diff --git a/{name} b/{name}\n--- a/{name}\n+++ b/{name}\n@@ -1,0 +1,8 @@\n" + f"+{line}\n" * 8
+
+        mock_client = Mock()
+        mock_client.models.generate_content.side_effect = lambda model, contents, config: Mock(
+            text=f"### Summary\nReviewed {contents}."
+        )
+        pr_details = {"title": "Test PR", "body": "", "number": 5, "head_sha": "aaa111"}
+        first = {
+            **pr_details,
+            "files_changed": ["a.py", "b.py"],
+            "diff": file_diff("a.py", "x = 1") + file_diff("b.py", "y = 1"),
+        }
+        second = {**first, "head_sha": "bbb222", "diff": file_diff("a.py", "x = 1") + file_diff("b.py", "y = 2")}
+
+        with patch("harperbot.harperbot.load_config", return_value=config):
+            analyze_incrementally(mock_client, first, config, "o/r", None)
+            self.assertEqual(mock_client.models.generate_content.call_count, 2)
+            # Findings are only trusted for the SHA of the posted analysis; with a mismatch the
+            # whole diff is re-planned (the unchanged a.py chunk still hits the analysis cache).
+            with self.assertLogs(level="INFO") as logs:
+                analyze_incrementally(mock_client, second, config, "o/r", "ccc333")
+            self.assertIn("reusing 0 finding groups, analyzing 2 chunks", "\n".join(logs.output))
+            self.assertEqual(mock_client.models.generate_content.call_count, 3)
+
+            third = {**second, "head_sha": "ddd444", "diff": file_diff("a.py", "x = 1") + file_diff("b.py", "y = 3")}
+            analysis = analyze_incrementally(mock_client, third, config, "o/r", "bbb222")
+
+        self.assertEqual(mock_client.models.generate_content.call_count, 4)
+        self.assertEqual(mock_client.models.generate_content.call_args.kwargs["contents"], "b.py")
+        self.assertIn("Reviewed a.py.\n\nReviewed b.py.", analysis)
+        self.assertIn("Re-reviewed 1 of 2 files", analysis)
+
+    def test_last_analyzed_sha_reads_the_analysis_comment_marker(self):
+        comments = [
+            Mock(body="thanks!"),
+            Mock(body="<details><summary>HarperBot</summary>\n...\n<!-- harperbot-sha: abc123 -->"),
+        ]
+
+        self.assertEqual(last_analyzed_sha(comments), "abc123")
+        self.assertIsNone(last_analyzed_sha(comments[:1]))
+
     @patch("harperbot.harperbot.load_config")
     def test_analyze_with_gemini_prompt_backcompat_files_diff(self, mock_load_config):
         """Supports legacy {files}/{diff} placeholders in prompt templates."""
@@ -229,6 +582,127 @@ class TestHarperBot(unittest.TestCase):
         self.assertEqual(result, "A" * 25000)
         self.assertNotIn("... (truncated for length)", result)
 
+    @patch("harperbot.harperbot.load_config")
+    def test_stream_analysis_with_gemini_reports_progress(self, mock_load_config):
+        """Streamed chunks are accumulated and posted as progress from a worker thread, outside the Gemini slot."""
+        mock_load_config.return_value = {
+            "model": "gemini-2.5-flash",
+            "max_output_tokens": 4096,
+            "prompt": "Test prompt {num_files} {files_list} {diff_content} {focus_instruction}",
+        }
+        mock_client = Mock()
+        mock_client.models.generate_content_stream.return_value = iter(
+            [
+                Mock(text="## Summary\n", candidates=[]),
+                Mock(
+                    text="Looks good.",
+                    candidates=[Mock(finish_reason="FinishReason.STOP")],
+                    usage_metadata=Mock(candidates_token_count=42),
+                ),
+            ]
+        )
+        threads = []
+        progress = Mock(
+            ready=Mock(return_value=True), post=Mock(side_effect=lambda text: threads.append(threading.get_ident()))
+        )
+        pr_details = {"title": "Test PR", "body": "", "files_changed": ["test.py"], "diff": "test diff"}
+        from harperbot.harperbot import get_gemini_scheduler
+
+        with patch.object(get_gemini_scheduler(), "charge") as charge:
+            result = stream_analysis_with_gemini(mock_client, pr_details, progress)
+
+        self.assertEqual(result, "## Summary\nLooks good.")
+        self.assertEqual(progress.post.call_args_list[0][0][0], "## Summary")
+        self.assertNotIn(threading.get_ident(), threads)
+        # The streamed output tokens count against the TPM budget.
+        charge.assert_called_once_with(42)
+
+    @patch("harperbot.harperbot.load_config")
+    def test_stream_analysis_with_gemini_stops_at_token_limit(self, mock_load_config):
+        """A MAX_TOKENS finish reason ends the stream and is noted in the analysis."""
+        mock_load_config.return_value = {
+            "model": "gemini-2.5-flash",
+            "max_output_tokens": 4096,
+            "prompt": "Test prompt {num_files} {files_list} {diff_content} {focus_instruction}",
+        }
+        chunks = iter(
+            [
+                Mock(text="## Summary\nPartial", candidates=[Mock(finish_reason="FinishReason.MAX_TOKENS")]),
+                Mock(text="never read", candidates=[]),
+            ]
+        )
+        mock_client = Mock()
+        mock_client.models.generate_content_stream.return_value = chunks
+        pr_details = {"title": "Test PR", "body": "", "files_changed": ["test.py"], "diff": "test diff"}
+
+        result = stream_analysis_with_gemini(mock_client, pr_details, Mock())
+
+        self.assertIn("## Summary\nPartial", result)
+        self.assertIn("stopped early", result)
+        self.assertEqual(next(chunks).text, "never read")
+
+    @patch("harperbot.harperbot.time.monotonic")
+    def test_progressive_comment_is_rate_limited(self, mock_monotonic):
+        """Partial analyses create the comment once, then edit it at most once per interval."""
+        event = Mock(issue_comments=[], pr_number=1)
+        comment = Mock()
+        event.pr.create_issue_comment.return_value = comment
+        stream = Mock(has_text=True)
+        stream.partial_text.return_value = "## Summary"
+        progress = ProgressiveComment(event, interval=5)
+
+        for now in (0.0, 1.0, 6.0):
+            mock_monotonic.return_value = now
+            if progress.ready():
+                progress.post(stream.partial_text())
+
+        event.pr.create_issue_comment.assert_called_once()
+        event.remember_issue_comment.assert_called_once_with(comment)
+        comment.edit.assert_called_once()
+        self.assertNotIn("harperbot-sha", comment.edit.call_args[0][0])
+        self.assertEqual(progress.updates, 2)
+
+    def test_progressive_comment_interrupt_replaces_the_streaming_note(self):
+        from harperbot.harperbot import INTERRUPTED_NOTE, STREAMING_NOTE
+
+        event = Mock(issue_comments=[], pr_number=1)
+        comment = event.pr.create_issue_comment.return_value
+        progress = ProgressiveComment(event, interval=5)
+        progress.interrupt()
+        comment.edit.assert_not_called()
+
+        progress.post("## Summary")
+        progress.interrupt()
+
+        body = comment.edit.call_args[0][0]
+        self.assertIn("## Summary", body)
+        self.assertIn(INTERRUPTED_NOTE, body)
+        self.assertNotIn(STREAMING_NOTE, body)
+
+    @patch("harperbot.harperbot.post_comment_webhook")
+    @patch("harperbot.harperbot.stream_analysis_with_gemini", return_value="## Summary\nDone")
+    @patch("harperbot.harperbot.ProgressiveComment")
+    @patch("harperbot.harperbot.load_config", return_value={"stream_analysis": True})
+    @patch("harperbot.harperbot.get_pr_details_webhook")
+    @patch("harperbot.harperbot.setup_environment_webhook")
+    def test_streamed_run_that_ends_without_a_final_comment_is_marked_interrupted(
+        self, mock_setup_env, mock_get_pr_details, _mock_config, mock_progress, _mock_stream, mock_post
+    ):
+        mock_setup_env.return_value = (Mock(), "token", Mock())
+        mock_get_pr_details.return_value = {"number": 1, "files_changed": ["x.py"], "diff": "diff", "head_sha": "sha"}
+        checks = iter([False, True])
+
+        run_analysis_for_pr(123, "o/r", 1, force=True, is_cancelled=lambda: next(checks))
+
+        mock_post.assert_not_called()
+        mock_progress.return_value.interrupt.assert_called_once_with()
+
+        mock_progress.reset_mock()
+        run_analysis_for_pr(123, "o/r", 1, force=True)
+
+        mock_post.assert_called_once()
+        mock_progress.return_value.interrupt.assert_not_called()
+
     def test_parse_diff_for_suggestions_valid(self):
         """Test parsing diff suggestions."""
         diff_text = """--- a/test.py
@@ -290,6 +764,40 @@ class TestHarperBot(unittest.TestCase):
             ],
         )
 
+    def test_parse_code_suggestions_finds_crlf_and_indented_diff_blocks(self):
+        """Blocks the old `find`-based scan missed still yield suggestions."""
+        block = "test.py\n@@ -1,1 +1,1 @@\n-old line\n+new line"
+        analysis = (
+            "### Code Suggestions\r\n"
+            + "```diff\r\n"
+            + block.replace("\n", "\r\n")
+            + "\r\n```\r\n"
+            + "1. Also:\n   ```diff\n"
+            + block.replace("\n", "\n   ")
+            + "\n   ```\n"
+        )
+
+        suggestions = parse_code_suggestions(analysis)
+
+        self.assertEqual([s["suggestion"] for s in suggestions], ["new line", "new line"])
+
+    def test_update_main_comment_replaces_code_suggestions(self):
+        analysis = "### Summary\nOk\n### Code Suggestions\n```diff\n### not a heading\n```\n#### Detail\nx\n### Issues\n- none"
+
+        self.assertEqual(
+            update_main_comment(analysis),
+            "### Summary\nOk\n### Code Suggestions\n- Suggestions posted as inline comments below.\n### Issues\n- none",
+        )
+
+    def test_update_main_comment_replaces_code_suggestions_in_a_fenced_reply(self):
+        """A reply wrapped in a ```markdown fence still has its suggestions replaced, and is posted unwrapped."""
+        analysis = "```markdown\n### Summary\nOk\n### Code Suggestions\n```diff\napp.py\n+x\n```\n### Issues\n- none\n```"
+
+        self.assertEqual(
+            update_main_comment(analysis),
+            "### Summary\nOk\n### Code Suggestions\n- Suggestions posted as inline comments below.\n### Issues\n- none",
+        )
+
     def test_parse_diff_for_suggestions_invalid(self):
         """Test parsing invalid diff."""
         diff_text = "not a diff"
@@ -483,9 +991,13 @@ class TestHarperBot(unittest.TestCase):
             mock_post_comment.assert_not_called()
 
         mock_post_notice.assert_called_once()
+        # `/analyze` is held back by the same cooldown, so the notice points to when it ends.
+        body = mock_post_notice.call_args[0][4]
+        self.assertIn("Comment `/analyze` after that time", body)
+        self.assertNotIn("immediately", body)
 
-    @patch("harperbot.harperbot.requests.get")
-    def test_get_pr_details_webhook_uses_auth_header_when_token_provided(self, mock_get):
+    @patch("harperbot.harperbot.get_http_session")
+    def test_get_pr_details_webhook_uses_auth_header_when_token_provided(self, mock_session):
         g = Mock()
         repo = Mock()
         pr = Mock()
@@ -494,6 +1006,7 @@ class TestHarperBot(unittest.TestCase):
         pr.get_files.return_value = []
         pr.diff_url = "https://example.invalid/diff"
 
+        mock_get = mock_session.return_value.get
         mock_get.return_value = Mock(text="diff")
 
         get_pr_details_webhook(g, "o/r", 1, installation_token="inst-token")
@@ -502,14 +1015,31 @@ class TestHarperBot(unittest.TestCase):
         self.assertIn("Authorization", kwargs["headers"])
         self.assertEqual(kwargs["headers"]["Authorization"], "token inst-token")
 
-    @patch("harperbot.harperbot.requests.get")
-    def test_fetch_pr_diff_returns_empty_on_non_200(self, mock_get):
+    @patch("harperbot.harperbot.get_http_session")
+    def test_fetch_pr_diff_returns_empty_on_non_200(self, mock_session):
         response = Mock()
         response.status_code = 403
         response.text = "forbidden"
-        mock_get.return_value = response
+        mock_session.return_value.get.return_value = response
         self.assertEqual(fetch_pr_diff("https://example.invalid/diff", token="t"), "")
 
+    @patch("harperbot.harperbot.get_http_session")
+    def test_stream_pr_diff_stops_reading_at_the_byte_cap(self, mock_session):
+        response = Mock(status_code=200)
+        chunks = [b"diff --git a/a.py b/a.py\n+one\n", b"+two\n", b"+three\n", b"+four\n"]
+        response.iter_content.return_value = iter(chunks)
+        mock_session.return_value.get.return_value = response
+
+        with self.assertLogs(level="WARNING"):
+            fetched = stream_pr_diff("https://example.invalid/diff", "t", max_bytes=40)
+
+        self.assertEqual(fetched.text, "diff --git a/a.py b/a.py\n+one\n+two\n")
+        self.assertTrue(fetched.truncated)
+        self.assertTrue(mock_session.return_value.get.call_args.kwargs["stream"])
+        # The last chunk is never read, and the connection is released.
+        self.assertEqual(next(response.iter_content.return_value), b"+four\n")
+        response.close.assert_called_once()
+
     def test_post_inline_suggestions_creates_review_without_inline(self):
         """When no inline suggestions are valid, still post a review entry."""
         pr = Mock()
@@ -553,6 +1083,54 @@ class TestHarperBot(unittest.TestCase):
         self.assertEqual(kwargs["comments"][0]["line"], 1)
         self.assertEqual(kwargs["comments"][0]["side"], "RIGHT")
 
+    def test_post_inline_suggestions_moves_lines_outside_the_diff_into_the_body(self):
+        """Suggestions GitHub would reject are moved into the body, so one review call succeeds."""
+        pr = Mock()
+        pr_details = {
+            "head_sha": "deadbeef",
+            "diff": "diff --git a/a.txt b/a.txt\n@@ -1,2 +1,2 @@\n-old\n+new\n same\n",
+        }
+        repo = Mock()
+        repo.get_commit.return_value = Mock()
+        pr.get_reviews.return_value = []
+        suggestions = [
+            {"path": "a.txt", "start_line": 2, "end_line": 2, "op": "replace", "suggestion": "better"},
+            {"path": "a.txt", "start_line": 40, "end_line": 41, "op": "delete", "suggestion": None},
+            {"path": "other.txt", "start_line": 1, "end_line": 1, "op": "replace", "suggestion": "x = 1"},
+        ]
+
+        post_inline_suggestions(pr, pr_details, suggestions, g=Mock(), repo=repo)
+
+        pr.create_review.assert_called_once()
+        _args, kwargs = pr.create_review.call_args
+        expected = {"path": "a.txt", "body": "```suggestion\nbetter\n```", "line": 2, "side": "RIGHT"}
+        self.assertEqual(kwargs["comments"], [expected])
+        self.assertIn("harperbot-sha: deadbeef", kwargs["body"])
+        self.assertIn("`a.txt` lines 40-41: suggested deletion.", kwargs["body"])
+        self.assertIn("`other.txt` line 1:\n```\nx = 1\n```", kwargs["body"])
+
+    def test_post_inline_suggestions_falls_back_to_diff_positions(self):
+        """If line-based comments are rejected, positions come from the diff, across hunks."""
+        pr = Mock()
+        pr_details = {
+            "head_sha": "deadbeef",
+            "diff": "diff --git a/a.txt b/a.txt\n@@ -1,1 +1,1 @@\n-old\n+new\n@@ -9,1 +9,1 @@\n-x\n+y\n",
+        }
+        repo = Mock()
+        repo.get_commit.return_value = Mock()
+        pr.get_reviews.return_value = []
+        pr.create_review.side_effect = [Exception("line is not part of the diff"), None]
+        suggestions = [
+            {"path": "a.txt", "start_line": 9, "end_line": 9, "op": "replace", "suggestion": "z"},
+            {"path": "a.txt", "start_line": 5, "end_line": 5, "op": "replace", "suggestion": "w"},
+        ]
+
+        with self.assertLogs(level="WARNING"):
+            post_inline_suggestions(pr, pr_details, suggestions, g=Mock(), repo=repo)
+
+        _args, kwargs = pr.create_review.call_args
+        self.assertEqual(kwargs["comments"], [{"path": "a.txt", "position": 5, "body": "```suggestion\nz\n```"}])
+
     @patch("harperbot.harperbot.post_inline_suggestions")
     @patch("harperbot.harperbot.Github")
     @patch("harperbot.harperbot.load_config")
@@ -603,13 +1181,42 @@ class TestHarperBot(unittest.TestCase):
         _args, kwargs = mock_post_inline.call_args
         self.assertTrue(kwargs["force_review"])
 
+    def test_posted_analysis_is_kept_per_head_for_apply(self):
+        from harperbot.harperbot import load_posted_analysis, upsert_analysis_comment
+
+        event = Mock(repo_name="o/r", issue_comments=[])
+
+        upsert_analysis_comment(event, {"number": 1, "head_sha": "abc123"}, "## Summary\nposted")
+
+        event.pr.create_issue_comment.assert_called_once()
+        self.assertEqual(load_posted_analysis("o/r", 1, "abc123"), "## Summary\nposted")
+        self.assertIsNone(load_posted_analysis("o/r", 1, "def456"))
+
+    def test_posted_suggestions_are_read_back_from_the_comment(self):
+        """Another process, without the analysis cache entry, reads the suggestions from the comment marker."""
+        from harperbot.analysis_cache import AnalysisCache
+        from harperbot.harperbot import load_posted_analysis, parse_code_suggestions, upsert_analysis_comment
+
+        analysis = "### Summary\nposted\n\n### Code Suggestions\n```diff\na.py\n@@ -1,1 +1,1 @@\n-old\n+new\n```\n\n### Scores\n- Code Quality: 8/10"
+        event = Mock(repo_name="o/r", issue_comments=[])
+        upsert_analysis_comment(event, {"number": 1, "head_sha": "abc123"}, analysis)
+        body = event.pr.create_issue_comment.call_args.args[0]
+        comment = Mock(body=body)
+
+        with patch("harperbot.harperbot.get_analysis_cache", return_value=AnalysisCache()):
+            posted = load_posted_analysis("o/r", 1, "abc123", [comment])
+            self.assertIsNone(load_posted_analysis("o/r", 1, "abc1234", [comment]))
+
+        self.assertEqual(parse_code_suggestions(posted), parse_code_suggestions(analysis))
+        self.assertTrue(parse_code_suggestions(posted))
+
     @patch("harperbot.harperbot.handle_merge_command")
     @patch("harperbot.harperbot.handle_apply_comment")
     @patch("harperbot.harperbot.run_analysis_for_pr")
     def test_handle_pr_comment_command_dispatches_analyze(self, mock_run_analysis, _mock_apply, _mock_merge):
         result = handle_pr_comment_command(123, "o/r", 1, "/analyze", "alice")
         self.assertEqual(result, ({"status": "ok"}, 200))
-        mock_run_analysis.assert_called_once_with(123, "o/r", 1, force=True, force_review=False)
+        mock_run_analysis.assert_called_once_with(123, "o/r", 1, force=True, force_review=False, fresh=False)
 
     @patch("harperbot.harperbot.handle_merge_command")
     @patch("harperbot.harperbot.handle_apply_comment")
@@ -617,7 +1224,15 @@ class TestHarperBot(unittest.TestCase):
     def test_handle_pr_comment_command_dispatches_analyze_force_review(self, mock_run_analysis, _mock_apply, _mock_merge):
         result = handle_pr_comment_command(123, "o/r", 1, "/analyze --force-review", "alice")
         self.assertEqual(result, ({"status": "ok"}, 200))
-        mock_run_analysis.assert_called_once_with(123, "o/r", 1, force=True, force_review=True)
+        mock_run_analysis.assert_called_once_with(123, "o/r", 1, force=True, force_review=True, fresh=False)
+
+    @patch("harperbot.harperbot.handle_merge_command")
+    @patch("harperbot.harperbot.handle_apply_comment")
+    @patch("harperbot.harperbot.run_analysis_for_pr")
+    def test_handle_pr_comment_command_dispatches_analyze_fresh(self, mock_run_analysis, _mock_apply, _mock_merge):
+        result = handle_pr_comment_command(123, "o/r", 1, "/analyze --fresh", "alice")
+        self.assertEqual(result, ({"status": "ok"}, 200))
+        mock_run_analysis.assert_called_once_with(123, "o/r", 1, force=True, force_review=False, fresh=True)
 
     @patch("harperbot.harperbot.handle_merge_command")
     @patch("harperbot.harperbot.handle_apply_comment")
@@ -992,6 +1607,259 @@ class TestHarperBot(unittest.TestCase):
         expected_content = "line 1\nline 3"
         mock_repo.create_git_blob.assert_called_with(expected_content, "utf-8")
 
+    @patch("harperbot.harperbot.run_analysis_for_pr")
+    @patch("harperbot.harperbot.get_job_queue")
+    @patch.dict("os.environ", {"WEBHOOK_SECRET": "test-secret"}, clear=False)
+    def test_webhook_handler_enqueues_and_returns_202(self, mock_get_queue, mock_run_analysis):
+        """With a job queue configured, verified PR events are enqueued instead of analyzed inline."""
+        import hashlib
+        import hmac
+        import json
+
+        from harperbot.harperbot import app, webhook_handler
+
+        queue = Mock()
+        queue.enqueue.return_value = "job-1"
+        mock_get_queue.return_value = queue
+
+        body = json.dumps(
+            {
+                "action": "synchronize",
+                "pull_request": {"number": 7, "head": {"sha": "cafef00d"}},
+                "installation": {"id": 123},
+                "repository": {"full_name": "o/r"},
+            }
+        ).encode()
+        signature = "sha256=" + hmac.new(b"test-secret", body, hashlib.sha256).hexdigest()
+
+        with app.test_request_context(
+            "/webhook",
+            method="POST",
+            data=body,
+            content_type="application/json",
+            headers={"X-Hub-Signature-256": signature},
+        ):
+            response, status = webhook_handler()
+
+        self.assertEqual(status, 202)
+        self.assertEqual(response.get_json(), {"status": "queued", "job_id": "job-1"})
+        args, kwargs = queue.enqueue.call_args
+        self.assertEqual(
+            args,
+            ("pull_request", {"installation_id": 123, "repo_name": "o/r", "pr_number": 7, "head_sha": "cafef00d"}),
+        )
+        self.assertEqual(kwargs["coalesce_key"], "o/r#7")
+        self.assertEqual(kwargs["head_sha"], "cafef00d")
+        self.assertGreaterEqual(kwargs["delay"], 0)
+        mock_run_analysis.assert_not_called()
+
+    @patch("harperbot.harperbot.run_analysis_for_pr")
+    @patch("harperbot.harperbot.get_job_queue", return_value=None)
+    @patch.dict("os.environ", {"WEBHOOK_SECRET": "test-secret"}, clear=False)
+    def test_webhook_handler_drops_redelivered_webhook(self, _mock_get_queue, mock_run_analysis):
+        """A repeated X-GitHub-Delivery id is acknowledged without running analysis again."""
+        import hashlib
+        import hmac
+        import json
+
+        from harperbot.deliveries import DeliveryCache
+        from harperbot.harperbot import app, webhook_handler
+
+        body = json.dumps(
+            {
+                "action": "opened",
+                "pull_request": {"number": 7},
+                "installation": {"id": 123},
+                "repository": {"full_name": "o/r"},
+            }
+        ).encode()
+        headers = {
+            "X-Hub-Signature-256": "sha256=" + hmac.new(b"test-secret", body, hashlib.sha256).hexdigest(),
+            "X-GitHub-Delivery": "delivery-1",
+        }
+
+        with patch("harperbot.harperbot.get_delivery_cache", return_value=DeliveryCache()):
+            for _ in range(2):
+                with app.test_request_context(
+                    "/webhook", method="POST", data=body, content_type="application/json", headers=headers
+                ):
+                    response = webhook_handler()
+
+        self.assertEqual(response.get_json(), {"status": "duplicate"})
+        mock_run_analysis.assert_called_once_with(123, "o/r", 7)
+
+    def test_check_config_reports_an_invalid_file(self):
+        import tempfile
+
+        from harperbot.harperbot import main
+
+        with tempfile.TemporaryDirectory() as tmp:
+            good, bad = os.path.join(tmp, "good.yaml"), os.path.join(tmp, "bad.yaml")
+            with open(good, "w") as f:
+                f.write("focus: security\n")
+            with open(bad, "w") as f:
+                f.write("focus: everything\n")
+
+            self.assertEqual(main(["check-config", good]), 0)
+            self.assertEqual(main(["check-config", bad]), 1)
+            self.assertEqual(main(["check-config", os.path.join(tmp, "missing.yaml")]), 1)
+
+    @patch("harperbot.harperbot.load_config")
+    def test_create_app_validates_the_config_at_startup(self, mock_load_config):
+        from harperbot import harperbot as core
+        from harperbot.settings import ConfigError
+
+        if not core.flask_available:
+            self.skipTest("Flask is not installed")
+        self.assertIs(core.create_app(), core.app)
+        mock_load_config.side_effect = ConfigError("focus must be one of all, security, performance, quality")
+        with self.assertRaises(ConfigError):
+            core.create_app()
+
+    @patch("harperbot.harperbot.run_analysis_for_pr")
+    def test_process_job_dispatches_pull_request(self, mock_run_analysis):
+        from harperbot.harperbot import process_job
+
+        process_job({"id": "j", "kind": "pull_request", "payload": {"installation_id": 1, "repo_name": "o/r", "pr_number": 2}})
+
+        mock_run_analysis.assert_called_once_with(installation_id=1, repo_name="o/r", pr_number=2)
+
+    @patch("harperbot.harperbot.run_analysis_for_pr")
+    def test_process_job_passes_supersede_check_for_coalesced_jobs(self, mock_run_analysis):
+        from harperbot.harperbot import process_job
+
+        queue = Mock()
+        queue.is_superseded.return_value = True
+        job = {"id": "j", "kind": "pull_request", "coalesce_key": "o/r#2", "payload": {"pr_number": 2}}
+
+        process_job(job, queue)
+
+        is_cancelled = mock_run_analysis.call_args.kwargs["is_cancelled"]
+        self.assertTrue(is_cancelled())
+        queue.is_superseded.assert_called_once_with(job)
+
+    @patch("harperbot.harperbot.post_comment_webhook")
+    @patch("harperbot.harperbot.analyze_with_gemini")
+    @patch("harperbot.harperbot.get_pr_details_webhook")
+    @patch("harperbot.harperbot.setup_environment_webhook")
+    def test_run_analysis_for_pr_skips_stale_head_sha(self, mock_setup_env, mock_get_pr_details, mock_analyze, mock_post):
+        g = Mock()
+        g.get_repo.return_value.compare.return_value.status = "ahead"
+        mock_setup_env.return_value = (g, "token", Mock())
+        mock_get_pr_details.return_value = {"number": 1, "files_changed": ["x.py"], "diff": "diff", "head_sha": "newer"}
+
+        run_analysis_for_pr(123, "o/r", 1, force=True, head_sha="older")
+
+        g.get_repo.return_value.compare.assert_called_once_with("older", "newer")
+        mock_analyze.assert_not_called()
+        mock_post.assert_not_called()
+
+    @patch("harperbot.harperbot.post_comment_webhook")
+    @patch("harperbot.harperbot.analyze_with_gemini")
+    @patch("harperbot.harperbot.get_pr_details_webhook")
+    @patch("harperbot.harperbot.setup_environment_webhook")
+    def test_run_analysis_for_pr_retries_when_github_lags_behind_the_push(
+        self, mock_setup_env, mock_get_pr_details, mock_analyze, mock_post
+    ):
+        from harperbot.harperbot import StaleHeadPending
+
+        g = Mock()
+        g.get_repo.return_value.compare.return_value.status = "behind"
+        mock_setup_env.return_value = (g, "token", Mock())
+        mock_get_pr_details.return_value = {"number": 1, "files_changed": ["x.py"], "diff": "diff", "head_sha": "previous"}
+
+        with self.assertRaises(StaleHeadPending):
+            run_analysis_for_pr(123, "o/r", 1, head_sha="pushed")
+        # A newer job for the PR takes over instead of retrying.
+        run_analysis_for_pr(123, "o/r", 1, head_sha="pushed", is_cancelled=lambda: True)
+
+        mock_analyze.assert_not_called()
+        mock_post.assert_not_called()
+
+    @patch("harperbot.harperbot.post_comment_webhook")
+    @patch("harperbot.harperbot.analyze_with_gemini")
+    @patch("harperbot.harperbot.get_pr_details_webhook")
+    @patch("harperbot.harperbot.setup_environment_webhook")
+    def test_run_analysis_for_pr_discards_result_when_cancelled(
+        self, mock_setup_env, mock_get_pr_details, mock_analyze, mock_post
+    ):
+        mock_setup_env.return_value = (Mock(), "token", Mock())
+        mock_get_pr_details.return_value = {"number": 1, "files_changed": ["x.py"], "diff": "diff", "head_sha": "sha"}
+        mock_analyze.return_value = "analysis text"
+        checks = iter([False, True])
+
+        run_analysis_for_pr(123, "o/r", 1, force=True, is_cancelled=lambda: next(checks))
+
+        mock_analyze.assert_called_once()
+        mock_post.assert_not_called()
+
+    @patch("harperbot.harperbot.post_inline_suggestions")
+    @patch("harperbot.harperbot.analyze_with_gemini", return_value="## Summary\nLooks good")
+    @patch("harperbot.harperbot.stream_pr_diff", return_value=FetchedDiff(text="diff"))
+    @patch("harperbot.harperbot.get_github_client")
+    @patch("harperbot.harperbot.setup_environment_webhook")
+    def test_run_analysis_for_pr_fetches_repo_pr_and_comments_once(
+        self, mock_setup_env, mock_get_client, _mock_diff, _mock_analyze, mock_post_inline
+    ):
+        g = Mock()
+        repo = g.get_repo.return_value
+        pr = repo.get_pull.return_value
+        pr.head.sha = "sha"
+        pr.number = 1
+        pr.get_files.return_value = [Mock(filename="x.py")]
+        pr.get_issue_comments.return_value = []
+        repo.get_issue.return_value.get_labels.return_value = []
+        mock_setup_env.return_value = (g, "token", Mock())
+
+        run_analysis_for_pr(123, "o/r", 1)
+
+        g.get_repo.assert_called_once()
+        repo.get_pull.assert_called_once_with(1)
+        pr.get_issue_comments.assert_called_once()
+        pr.create_issue_comment.assert_called_once()
+        self.assertIs(mock_post_inline.call_args.args[0], pr)
+        # The posting stage reuses the event's objects instead of a new client.
+        mock_get_client.return_value.get_repo.assert_not_called()
+
+    @patch("harperbot.harperbot.analyze_with_gemini")
+    @patch("harperbot.harperbot.stream_pr_diff", return_value=FetchedDiff(text="diff"))
+    @patch("harperbot.harperbot.setup_environment_webhook")
+    def test_run_analysis_for_pr_prechecks_use_one_graphql_snapshot(self, mock_setup_env, mock_diff, mock_analyze):
+        g = Mock()
+        page = {"nodes": [], "pageInfo": {"hasNextPage": False, "endCursor": None}}
+        pull_request = {
+            "number": 1,
+            "title": "t",
+            "body": "",
+            "url": "https://github.com/o/r/pull/1",
+            "headRefName": "feature",
+            "headRefOid": "deadbeef",
+            "baseRefName": "main",
+            "author": {"login": "alice"},
+            "labels": page,
+            "files": {**page, "nodes": [{"path": "x.py"}]},
+            "comments": {**page, "nodes": [{"databaseId": 5, "body": "harperbot-sha: deadbeef"}]},
+            "reviews": page,
+        }
+        g.requester.graphql_query.return_value = ({}, {"data": {"repository": {"pullRequest": pull_request}}})
+        mock_setup_env.return_value = (g, "token", Mock())
+
+        run_analysis_for_pr(123, "o/r", 1)
+
+        mock_diff.assert_called_once_with("https://github.com/o/r/pull/1.diff", "token")
+        mock_analyze.assert_not_called()
+        g.requester.graphql_query.assert_called_once()
+        g.get_repo.return_value.get_pull.assert_not_called()
+        g.get_repo.return_value.get_issue.assert_not_called()
+
+    @patch("harperbot.harperbot.handle_pr_comment_command")
+    def test_process_job_raises_on_server_error_so_queue_retries(self, mock_handle_command):
+        from harperbot.harperbot import process_job
+
+        mock_handle_command.return_value = ({"error": "Processing failed"}, 500)
+        with self.assertRaises(RuntimeError):
+            process_job({"id": "j", "kind": "comment_command", "payload": {"pr_number": 2}})
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -33,14 +33,17 @@ class TestHarperBotApply(unittest.TestCase):
         fake_harperbot_mod.load_config = Mock(return_value={"enable_authoring": True})
         fake_harperbot_mod.format_notice = Mock(side_effect=lambda title, details: f"{title}: {details}")
         fake_harperbot_mod.get_commenter_permission = Mock(return_value="write")
-        fake_harperbot_mod.build_pr_details_from_pr = Mock(return_value={"number": 1})
-        fake_harperbot_mod.analyze_with_gemini = Mock(return_value="analysis text")
+        fake_harperbot_mod.load_posted_analysis = Mock(return_value="analysis text")
         fake_harperbot_mod.parse_code_suggestions = Mock(return_value=[])
         fake_harperbot_mod.apply_suggestions_to_pr = Mock()
+        fake_harperbot_mod.last_analyzed_sha = Mock(return_value=None)
+        fake_harperbot_mod.build_pr_details_from_pr = Mock()
+        fake_harperbot_mod.analyze_with_gemini = Mock()
 
         with (
             patch.object(harperbot_apply, "flask_available", True),
             patch.object(harperbot_apply, "jsonify", lambda obj: obj),
+            patch.object(harperbot_apply, "current_event", return_value=Mock(repo=repo, pr=pr, issue_comments=[])),
             patch.dict(sys.modules, {"harperbot.harperbot": fake_harperbot_mod}),
         ):
             result = harperbot_apply.handle_apply_comment(123, "o/r", 1, commenter_login="alice")
@@ -64,23 +67,28 @@ class TestHarperBotApply(unittest.TestCase):
         fake_harperbot_mod.load_config = Mock(return_value={"enable_authoring": True})
         fake_harperbot_mod.format_notice = Mock(side_effect=lambda title, details: f"{title}: {details}")
         fake_harperbot_mod.get_commenter_permission = Mock(return_value="write")
-        fake_harperbot_mod.build_pr_details_from_pr = Mock(return_value={"number": 1})
-        fake_harperbot_mod.analyze_with_gemini = Mock(return_value="analysis text")
+        fake_harperbot_mod.load_posted_analysis = Mock(return_value="analysis text")
         fake_harperbot_mod.parse_code_suggestions = Mock(return_value=[("a.txt", "1", "change")])
         fake_harperbot_mod.apply_suggestions_to_pr = Mock()
+        fake_harperbot_mod.last_analyzed_sha = Mock(return_value=None)
+        fake_harperbot_mod.build_pr_details_from_pr = Mock()
+        fake_harperbot_mod.analyze_with_gemini = Mock()
 
         with (
             patch.object(harperbot_apply, "flask_available", True),
             patch.object(harperbot_apply, "jsonify", lambda obj: obj),
+            patch.object(harperbot_apply, "current_event", return_value=Mock(repo=repo, pr=pr, issue_comments=[])),
             patch.dict(sys.modules, {"harperbot.harperbot": fake_harperbot_mod}),
         ):
             result = harperbot_apply.handle_apply_comment(123, "o/r", 1, commenter_login="alice")
 
         fake_harperbot_mod.apply_suggestions_to_pr.assert_called_once_with(repo, pr, [("a.txt", "1", "change")])
+        self.assertEqual(fake_harperbot_mod.load_posted_analysis.call_args.args[:3], ("o/r", 1, pr.head.sha))
+        fake_harperbot_mod.analyze_with_gemini.assert_not_called()
         pr.create_issue_comment.assert_called_once_with("Applied code suggestions from HarperBot analysis.")
         self.assertEqual(result, {"status": "applied"})
 
-    def test_handle_apply_comment_rejects_when_authoring_disabled(self):
+    def test_handle_apply_comment_without_a_posted_review_asks_for_analyze(self):
         from harperbot import harperbot_apply
 
         fake_harperbot_mod = types.SimpleNamespace()
@@ -88,21 +96,97 @@ class TestHarperBotApply(unittest.TestCase):
         g = Mock()
         repo = Mock()
         pr = Mock()
+        pr.head.sha = "abcdef1234567"
         g.get_repo.return_value = repo
         repo.get_pull.return_value = pr
 
         fake_harperbot_mod.setup_environment_webhook = Mock(return_value=(g, "token", Mock()))
-        fake_harperbot_mod.load_config = Mock(return_value={"enable_authoring": False})
+        fake_harperbot_mod.load_config = Mock(return_value={"enable_authoring": True})
         fake_harperbot_mod.format_notice = Mock(side_effect=lambda title, details: f"{title}: {details}")
         fake_harperbot_mod.get_commenter_permission = Mock(return_value="write")
+        fake_harperbot_mod.load_posted_analysis = Mock(return_value=None)
+        fake_harperbot_mod.parse_code_suggestions = Mock()
+        fake_harperbot_mod.apply_suggestions_to_pr = Mock()
+        fake_harperbot_mod.last_analyzed_sha = Mock(return_value=None)
         fake_harperbot_mod.build_pr_details_from_pr = Mock()
         fake_harperbot_mod.analyze_with_gemini = Mock()
+
+        with (
+            patch.object(harperbot_apply, "flask_available", True),
+            patch.object(harperbot_apply, "jsonify", lambda obj: obj),
+            patch.object(harperbot_apply, "current_event", return_value=Mock(repo=repo, pr=pr, issue_comments=[])),
+            patch.dict(sys.modules, {"harperbot.harperbot": fake_harperbot_mod}),
+        ):
+            result = harperbot_apply.handle_apply_comment(123, "o/r", 1, commenter_login="alice")
+
+        self.assertEqual(fake_harperbot_mod.load_posted_analysis.call_args.args[:3], ("o/r", 1, "abcdef1234567"))
+        fake_harperbot_mod.analyze_with_gemini.assert_not_called()
+        fake_harperbot_mod.apply_suggestions_to_pr.assert_not_called()
+        self.assertIn("abcdef1", pr.create_issue_comment.call_args.args[0])
+        self.assertEqual(result, {"status": "no_analysis"})
+
+    def test_handle_apply_comment_reanalyzes_a_review_posted_without_suggestions_marker(self):
+        from harperbot import harperbot_apply
+
+        fake_harperbot_mod = types.SimpleNamespace()
+
+        g = Mock()
+        repo = Mock()
+        pr = Mock()
+        pr.head.sha = "abcdef1234567"
+        g.get_repo.return_value = repo
+        repo.get_pull.return_value = pr
+
+        fake_harperbot_mod.setup_environment_webhook = Mock(return_value=(g, "token", Mock()))
+        fake_harperbot_mod.load_config = Mock(return_value={"enable_authoring": True})
+        fake_harperbot_mod.format_notice = Mock(side_effect=lambda title, details: f"{title}: {details}")
+        fake_harperbot_mod.get_commenter_permission = Mock(return_value="write")
+        fake_harperbot_mod.load_posted_analysis = Mock(return_value=None)
+        fake_harperbot_mod.parse_code_suggestions = Mock(return_value=[("a.txt", "1", "change")])
+        fake_harperbot_mod.apply_suggestions_to_pr = Mock()
+        fake_harperbot_mod.last_analyzed_sha = Mock(return_value="abcdef1234567")
+        fake_harperbot_mod.build_pr_details_from_pr = Mock(return_value={"number": 1})
+        fake_harperbot_mod.analyze_with_gemini = Mock(return_value="fresh analysis")
+
+        with (
+            patch.object(harperbot_apply, "flask_available", True),
+            patch.object(harperbot_apply, "jsonify", lambda obj: obj),
+            patch.object(harperbot_apply, "current_event", return_value=Mock(repo=repo, pr=pr, issue_comments=[])),
+            patch.dict(sys.modules, {"harperbot.harperbot": fake_harperbot_mod}),
+        ):
+            result = harperbot_apply.handle_apply_comment(123, "o/r", 1, commenter_login="alice")
+
+        fake_harperbot_mod.analyze_with_gemini.assert_called_once()
+        fake_harperbot_mod.parse_code_suggestions.assert_called_once_with("fresh analysis")
+        fake_harperbot_mod.apply_suggestions_to_pr.assert_called_once_with(repo, pr, [("a.txt", "1", "change")])
+        self.assertEqual(result, {"status": "applied"})
+
+    def test_handle_apply_comment_rejects_when_authoring_disabled(self):
+        from harperbot import harperbot_apply
+
+        fake_harperbot_mod = types.SimpleNamespace()
+
+        g = Mock()
+        repo = Mock()
+        pr = Mock()
+        g.get_repo.return_value = repo
+        repo.get_pull.return_value = pr
+
+        fake_harperbot_mod.setup_environment_webhook = Mock(return_value=(g, "token", Mock()))
+        fake_harperbot_mod.load_config = Mock(return_value={"enable_authoring": False})
+        fake_harperbot_mod.format_notice = Mock(side_effect=lambda title, details: f"{title}: {details}")
+        fake_harperbot_mod.get_commenter_permission = Mock(return_value="write")
+        fake_harperbot_mod.load_posted_analysis = Mock()
         fake_harperbot_mod.parse_code_suggestions = Mock()
         fake_harperbot_mod.apply_suggestions_to_pr = Mock()
+        fake_harperbot_mod.last_analyzed_sha = Mock(return_value=None)
+        fake_harperbot_mod.build_pr_details_from_pr = Mock()
+        fake_harperbot_mod.analyze_with_gemini = Mock()
 
         with (
             patch.object(harperbot_apply, "flask_available", True),
             patch.object(harperbot_apply, "jsonify", lambda obj: obj),
+            patch.object(harperbot_apply, "current_event", return_value=Mock(repo=repo, pr=pr, issue_comments=[])),
             patch.dict(sys.modules, {"harperbot.harperbot": fake_harperbot_mod}),
         ):
             payload, status = harperbot_apply.handle_apply_comment(123, "o/r", 1, commenter_login="alice")
@@ -110,7 +194,7 @@ class TestHarperBotApply(unittest.TestCase):
         self.assertEqual(status, 403)
         self.assertEqual(payload, {"status": "forbidden"})
         pr.create_issue_comment.assert_called_once()
-        fake_harperbot_mod.analyze_with_gemini.assert_not_called()
+        fake_harperbot_mod.load_posted_analysis.assert_not_called()
         fake_harperbot_mod.apply_suggestions_to_pr.assert_not_called()
 
     def test_handle_apply_comment_rejects_without_write_permission(self):
@@ -128,14 +212,17 @@ class TestHarperBotApply(unittest.TestCase):
         fake_harperbot_mod.load_config = Mock(return_value={"enable_authoring": True})
         fake_harperbot_mod.format_notice = Mock(side_effect=lambda title, details: f"{title}: {details}")
         fake_harperbot_mod.get_commenter_permission = Mock(return_value="read")
-        fake_harperbot_mod.build_pr_details_from_pr = Mock()
-        fake_harperbot_mod.analyze_with_gemini = Mock()
+        fake_harperbot_mod.load_posted_analysis = Mock()
         fake_harperbot_mod.parse_code_suggestions = Mock()
         fake_harperbot_mod.apply_suggestions_to_pr = Mock()
+        fake_harperbot_mod.last_analyzed_sha = Mock(return_value=None)
+        fake_harperbot_mod.build_pr_details_from_pr = Mock()
+        fake_harperbot_mod.analyze_with_gemini = Mock()
 
         with (
             patch.object(harperbot_apply, "flask_available", True),
             patch.object(harperbot_apply, "jsonify", lambda obj: obj),
+            patch.object(harperbot_apply, "current_event", return_value=Mock(repo=repo, pr=pr, issue_comments=[])),
             patch.dict(sys.modules, {"harperbot.harperbot": fake_harperbot_mod}),
         ):
             payload, status = harperbot_apply.handle_apply_comment(123, "o/r", 1, commenter_login="alice")
@@ -143,7 +230,7 @@ class TestHarperBotApply(unittest.TestCase):
         self.assertEqual(status, 403)
         self.assertEqual(payload, {"status": "forbidden"})
         pr.create_issue_comment.assert_called_once()
-        fake_harperbot_mod.analyze_with_gemini.assert_not_called()
+        fake_harperbot_mod.load_posted_analysis.assert_not_called()
         fake_harperbot_mod.apply_suggestions_to_pr.assert_not_called()
 
     def test_handle_apply_comment_rejects_non_collaborator_lookup_failure(self):
@@ -161,14 +248,17 @@ class TestHarperBotApply(unittest.TestCase):
         fake_harperbot_mod.load_config = Mock(return_value={"enable_authoring": True})
         fake_harperbot_mod.format_notice = Mock(side_effect=lambda title, details: f"{title}: {details}")
         fake_harperbot_mod.get_commenter_permission = Mock(return_value=None)
-        fake_harperbot_mod.build_pr_details_from_pr = Mock()
-        fake_harperbot_mod.analyze_with_gemini = Mock()
+        fake_harperbot_mod.load_posted_analysis = Mock()
         fake_harperbot_mod.parse_code_suggestions = Mock()
         fake_harperbot_mod.apply_suggestions_to_pr = Mock()
+        fake_harperbot_mod.last_analyzed_sha = Mock(return_value=None)
+        fake_harperbot_mod.build_pr_details_from_pr = Mock()
+        fake_harperbot_mod.analyze_with_gemini = Mock()
 
         with (
             patch.object(harperbot_apply, "flask_available", True),
             patch.object(harperbot_apply, "jsonify", lambda obj: obj),
+            patch.object(harperbot_apply, "current_event", return_value=Mock(repo=repo, pr=pr, issue_comments=[])),
             patch.dict(sys.modules, {"harperbot.harperbot": fake_harperbot_mod}),
         ):
             payload, status = harperbot_apply.handle_apply_comment(123, "o/r", 1, commenter_login="external-user")
@@ -176,5 +266,5 @@ class TestHarperBotApply(unittest.TestCase):
         self.assertEqual(status, 403)
         self.assertEqual(payload, {"status": "forbidden"})
         pr.create_issue_comment.assert_called_once()
-        fake_harperbot_mod.analyze_with_gemini.assert_not_called()
+        fake_harperbot_mod.load_posted_analysis.assert_not_called()
         fake_harperbot_mod.apply_suggestions_to_pr.assert_not_called()
@@ -0,0 +1,61 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the shared HarperBot HTTP session.
+Run with: python -m pytest test/test_http_session.py
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import Mock, patch
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from github import Auth, Github  # noqa: E402
+from github.GithubRetry import GithubRetry  # noqa: E402
+
+from harperbot.http_session import (  # noqa: E402
+    HTTP_POOL_SIZE,
+    SharedSessionHTTPSConnection,
+    get_http_session,
+    install_github_session,
+)
+
+
+class TestHttpSession(unittest.TestCase):
+    def test_session_is_shared_and_pooled(self):
+        session = get_http_session()
+
+        self.assertIs(session, get_http_session())
+        adapter = session.get_adapter("https://example.com/diff")
+        self.assertEqual(adapter._pool_maxsize, HTTP_POOL_SIZE)
+        self.assertIsInstance(session.get_adapter("https://api.github.com/repos/o/r").max_retries, GithubRetry)
+        # The URL PyGithub actually sends carries the port.
+        self.assertIsInstance(session.get_adapter("https://api.github.com:443/repos/o/r").max_retries, GithubRetry)
+        self.assertNotIsInstance(session.get_adapter("https://api.github.com.evil/x").max_retries, GithubRetry)
+
+    def test_github_connections_reuse_shared_session(self):
+        first = SharedSessionHTTPSConnection("api.github.com")
+        second = SharedSessionHTTPSConnection("api.github.com")
+        first.close()
+
+        self.assertIs(first.session, get_http_session())
+        self.assertIs(second.session, first.session)
+
+    def test_github_requests_go_through_shared_session(self):
+        install_github_session()
+        response = Mock(status_code=200, headers={"content-type": "application/json"}, text='{"login": "harper"}')
+        with patch.object(get_http_session(), "get", return_value=response) as mock_get:
+            user = Github(auth=Auth.Token("t")).get_user()
+            self.assertEqual(user.login, "harper")
+
+        url = mock_get.call_args.args[0]
+        self.assertTrue(url.startswith("https://api.github.com"))
+        self.assertIsInstance(get_http_session().get_adapter(url).max_retries, GithubRetry)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for HarperBot incremental review findings.
+Run with: python -m pytest test/test_incremental.py
+"""
+
+import os
+import sys
+import unittest
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot.analysis_cache import AnalysisCache  # noqa: E402
+from harperbot.incremental import (  # noqa: E402
+    FindingGroup,
+    Findings,
+    load_findings,
+    patch_hashes,
+    pending_diff,
+    reusable_groups,
+    save_findings,
+)
+
+
+def _file_diff(path: str, line: str) -> str:
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1,0 +1,1 @@\n+{line}\n"
+
+
+class TestIncrementalFindings(unittest.TestCase):
+    def test_only_groups_with_unchanged_patches_are_reused(self):
+        before = patch_hashes(_file_diff("a.py", "a") + _file_diff("b.py", "b") + _file_diff("c.py", "c"))
+        findings = Findings(
+            sha="abc123",
+            groups=(
+                FindingGroup(files=(("a.py", before["a.py"]),), analysis="A", size=1),
+                FindingGroup(files=(("b.py", before["b.py"]), ("c.py", before["c.py"])), analysis="BC", size=2),
+            ),
+        )
+        diff = _file_diff("a.py", "a") + _file_diff("b.py", "b2") + _file_diff("c.py", "c") + _file_diff("d.py", "d")
+
+        reused = reusable_groups(findings, patch_hashes(diff))
+
+        self.assertEqual([group.analysis for group in reused], ["A"])
+        self.assertEqual(
+            pending_diff(diff, reused), _file_diff("b.py", "b2") + _file_diff("c.py", "c") + _file_diff("d.py", "d")
+        )
+
+    def test_findings_round_trip_through_the_store(self):
+        store = AnalysisCache()
+        findings = Findings(sha="abc123", groups=(FindingGroup(files=(("a.py", "h1"),), analysis="A", size=10),))
+
+        save_findings(store, "o/r", 1, findings)
+
+        self.assertEqual(load_findings(store, "o/r", 1), findings)
+        self.assertIsNone(load_findings(store, "o/r", 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot job queue.
+Run with: python -m pytest test/test_jobqueue.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot.jobqueue import JobQueue, run_worker  # noqa: E402
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "jobs.sqlite3")
+        self.queue = JobQueue(self.path, lease_seconds=60, max_attempts=3)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_enqueue_and_claim_round_trips_payload(self):
+        job_id = self.queue.enqueue("pull_request", {"repo_name": "o/r", "pr_number": 1})
+
+        job = self.queue.claim("w1")
+
+        self.assertEqual(job["id"], job_id)
+        self.assertEqual(job["kind"], "pull_request")
+        self.assertEqual(job["payload"], {"repo_name": "o/r", "pr_number": 1})
+        self.assertEqual(job["attempts"], 1)
+        self.assertIsNone(self.queue.claim("w2"))
+
+    def test_complete_removes_job(self):
+        self.queue.enqueue("pull_request", {})
+        job = self.queue.claim("w1")
+        self.queue.complete(job["id"])
+        self.assertEqual(self.queue.stats(), {})
+
+    def test_delayed_job_is_not_claimed_early(self):
+        self.queue.enqueue("pull_request", {}, delay=30)
+        self.assertIsNone(self.queue.claim("w1"))
+
+    def test_expired_lease_is_reclaimed_after_crash(self):
+        with patch("harperbot.jobqueue.time.time", return_value=1000.0):
+            self.queue.enqueue("pull_request", {})
+            first = self.queue.claim("crashed-worker")
+        with patch("harperbot.jobqueue.time.time", return_value=1000.0 + 61):
+            second = self.queue.claim("w2")
+
+        self.assertEqual(first["id"], second["id"])
+        self.assertEqual(second["attempts"], 2)
+
+    def test_fail_retries_then_marks_dead(self):
+        now = 1000.0
+        with patch("harperbot.jobqueue.time.time", return_value=now):
+            self.queue.enqueue("pull_request", {})
+        for _attempt in range(3):
+            with patch("harperbot.jobqueue.time.time", return_value=now):
+                job = self.queue.claim("w1")
+                self.assertIsNotNone(job)
+                self.queue.fail(job["id"], "boom")
+            now += 1000
+
+        self.assertEqual(self.queue.stats(), {"dead": 1})
+
+    def test_enqueue_supersedes_pending_jobs_with_same_key(self):
+        self.queue.enqueue("pull_request", {"sha": "a"}, coalesce_key="o/r#1", head_sha="a")
+        self.queue.enqueue("pull_request", {"sha": "b"}, coalesce_key="o/r#1", head_sha="b")
+        self.queue.enqueue("pull_request", {"sha": "x"}, coalesce_key="o/r#2", head_sha="x")
+
+        claimed = [self.queue.claim("w1"), self.queue.claim("w2")]
+
+        self.assertEqual(sorted(job["payload"]["sha"] for job in claimed), ["b", "x"])
+        self.assertIsNone(self.queue.claim("w3"))
+
+    def test_claim_respects_per_pr_lease(self):
+        self.queue.enqueue("pull_request", {"sha": "a"}, coalesce_key="o/r#1")
+        running = self.queue.claim("w1")
+        self.queue.enqueue("pull_request", {"sha": "b"}, coalesce_key="o/r#1")
+
+        # The newer job waits until the running analysis of the same PR finishes.
+        self.assertIsNone(self.queue.claim("w2"))
+        self.assertTrue(self.queue.is_superseded(running))
+
+        self.queue.complete(running["id"])
+        newer = self.queue.claim("w2")
+        self.assertEqual(newer["payload"], {"sha": "b"})
+        self.assertFalse(self.queue.is_superseded(newer))
+
+    def test_run_worker_drains_queue(self):
+        self.queue.enqueue("pull_request", {"n": 1})
+        self.queue.enqueue("pull_request", {"n": 2})
+        seen = []
+        stop = threading.Event()
+
+        def handler(job):
+            seen.append(job["payload"]["n"])
+            if len(seen) == 2:
+                stop.set()
+
+        run_worker(self.queue, handler, concurrency=2, poll_interval=0.01, stop_event=stop)
+
+        self.assertEqual(sorted(seen), [1, 2])
+        self.assertEqual(self.queue.stats(), {})
+
+    def test_run_worker_renews_the_lease_of_a_long_job(self):
+        queue = JobQueue(self.path, lease_seconds=0.3, max_attempts=3)
+        queue.enqueue("pull_request", {})
+        stop = threading.Event()
+        reclaimed = []
+
+        def handler(job):
+            time.sleep(1.0)
+            # Well past the original lease, the running job is still not handed out again.
+            reclaimed.append(queue.claim("other-worker"))
+            stop.set()
+
+        run_worker(queue, handler, concurrency=1, poll_interval=0.01, stop_event=stop)
+
+        self.assertEqual(reclaimed, [None])
+        self.assertEqual(queue.stats(), {})
+
+    def test_run_worker_requeues_failed_job(self):
+        self.queue.enqueue("pull_request", {})
+        stop = threading.Event()
+
+        def handler(job):
+            stop.set()
+            raise RuntimeError("transient")
+
+        run_worker(self.queue, handler, concurrency=1, poll_interval=0.01, stop_event=stop)
+
+        self.assertEqual(self.queue.stats(), {"pending": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for HarperBot lazy imports.
+Run with: python -m pytest test/test_lazy.py
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+from unittest.mock import Mock, patch
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+REPO_ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, REPO_ROOT)
+
+from harperbot.lazy import LazyObject, lazy_attribute, lazy_module  # noqa: E402
+
+HEAVY_MODULES = ("google.genai", "github", "requests", "yaml", "dotenv")
+
+
+class TestLazyObject(unittest.TestCase):
+    def test_factory_runs_once_on_first_use(self):
+        factory = Mock(return_value=Mock(value=7))
+        proxy = LazyObject(factory, "thing")
+
+        self.assertEqual(factory.call_count, 0)
+        self.assertEqual(proxy.value, 7)
+        self.assertEqual(proxy.value, 7)
+        self.assertEqual(factory.call_count, 1)
+
+    def test_calls_are_forwarded(self):
+        proxy = lazy_attribute("json", "dumps")
+        self.assertEqual(proxy({"a": 1}), '{"a": 1}')
+
+    def test_module_attributes_can_be_patched(self):
+        proxy = lazy_module("json")
+        with patch.object(proxy, "loads", return_value="patched"):
+            self.assertEqual(proxy.loads("{}"), "patched")
+        self.assertEqual(proxy.loads("{}"), {})
+
+
+class TestColdStartImports(unittest.TestCase):
+    def test_webhook_import_does_not_load_heavy_dependencies(self):
+        code = "import sys, harperbot.harperbot; " f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        result = subprocess.run(
+            [sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True, timeout=60
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
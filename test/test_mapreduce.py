@@ -0,0 +1,88 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for HarperBot map-reduce analysis of large diffs.
+Run with: python -m pytest test/test_mapreduce.py
+"""
+
+import os
+import sys
+import unittest
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot.mapreduce import merge_analyses, split_diff  # noqa: E402
+
+
+def _file_diff(path: str, lines: int, start: int = 1) -> str:
+    body = "".join(f"+line {n}\n" for n in range(lines))
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -{start},0 +{start},{lines} @@\n{body}"
+
+
+class TestSplitDiff(unittest.TestCase):
+    def test_small_files_are_packed_together(self):
+        diff = _file_diff("a.py", 2) + _file_diff("b.py", 2)
+
+        chunks = split_diff(diff, 1000)
+
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0].text, diff)
+        self.assertEqual(chunks[0].files, ("a.py", "b.py"))
+
+    def test_chunks_break_on_file_boundaries(self):
+        first, second = _file_diff("a.py", 5), _file_diff("b.py", 5)
+
+        chunks = split_diff(first + second, len(first) + 10)
+
+        self.assertEqual([chunk.text for chunk in chunks], [first, second])
+        self.assertEqual([chunk.files for chunk in chunks], [("a.py",), ("b.py",)])
+
+    def test_large_file_is_split_by_hunk_with_its_header(self):
+        header = "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n"
+        hunks = ["@@ -1,1 +1,2 @@\n context\n+added\n", "@@ -50,1 +51,2 @@\n context\n+added\n"]
+
+        chunks = split_diff(header + "".join(hunks), len(header) + len(hunks[0]) + 5)
+
+        self.assertEqual([chunk.text for chunk in chunks], [header + hunks[0], header + hunks[1]])
+        self.assertEqual({chunk.files for chunk in chunks}, {("a.py",)})
+
+    def test_oversized_hunk_is_split_by_line_with_renumbered_headers(self):
+        diff = "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n@@ -10,4 +10,4 @@ def f():\n a\n-b\n+c\n d\n e\n"
+
+        chunks = split_diff(diff, 85)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.text.startswith("diff --git a/a.py b/a.py\n"))
+            self.assertLessEqual(len(chunk.text), 85)
+        hunk_headers = [line for chunk in chunks for line in chunk.text.splitlines() if line.startswith("@@")]
+        self.assertEqual(hunk_headers, ["@@ -10,2 +10,2 @@ def f():", "@@ -12,2 +12,2 @@ def f():"])
+
+
+class TestMergeAnalyses(unittest.TestCase):
+    def test_sections_are_merged_in_the_comment_format(self):
+        first = (
+            "### Summary\nAdds the parser.\n\n### Scores\n- Code Quality: 8/10\n- Security: 6/10\n\n"
+            "### Issues\n- Missing tests\n\n### Code Suggestions\n```python\nx = 1\n```"
+        )
+        second = "### Summary\nUpdates the CLI.\n\n### Scores\n- Code Quality: 6/10\n- Security: 9/10\n\n### Issues\n- Missing tests\n- Unused import"
+
+        merged = merge_analyses([(first, 300), (second, 100)], notes=["Reviewed in 2 parts."])
+
+        self.assertIn("### Summary\nAdds the parser.\n\nUpdates the CLI.", merged)
+        self.assertIn("- Code Quality: 7.5/10\n- Security: 6.8/10", merged)
+        self.assertIn("### Issues\n- Missing tests\n- Unused import", merged)
+        self.assertEqual(merged.count("### Summary"), 1)
+        self.assertIn("```python\nx = 1\n```", merged)
+        self.assertTrue(merged.endswith("_Reviewed in 2 parts._"))
+
+    def test_headings_inside_code_blocks_are_not_sections(self):
+        analysis = "### Code Suggestions\n```markdown\n### Not a heading\n```"
+
+        self.assertEqual(merge_analyses([(analysis, 1)]), analysis)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot quota cooldown.
+Run with: python -m pytest test/test_quota.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot import metrics, quota  # noqa: E402
+from harperbot.quota import (  # noqa: E402
+    QuotaCooldown,
+    QuotaState,
+    ensure_quota_available,
+    is_quota_error,
+    record_quota_error,
+    retry_delay,
+)
+
+
+class _APIError(Exception):
+    def __init__(self, message, *, code=None, details=None, response=None):
+        super().__init__(message)
+        self.code = code
+        self.details = details
+        self.response = response
+
+
+class TestRetryDelay(unittest.TestCase):
+    def test_retry_info_in_the_error_details(self):
+        details = {
+            "error": {
+                "code": 429,
+                "details": [
+                    {"@type": "type.googleapis.com/google.rpc.QuotaFailure"},
+                    {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "37s"},
+                ],
+            }
+        }
+
+        self.assertEqual(retry_delay(_APIError("429 RESOURCE_EXHAUSTED", code=429, details=details)), 37.0)
+
+    def test_retry_after_header(self):
+        response = Mock(headers={"Retry-After": "12"})
+
+        self.assertEqual(retry_delay(_APIError("429 Too Many Requests", code=429, response=response)), 12.0)
+
+    def test_delay_in_the_message(self):
+        self.assertEqual(retry_delay(Exception("Quota exceeded. Please retry in 5.5s.")), 5.5)
+        self.assertIsNone(retry_delay(Exception("Quota exceeded")))
+
+    def test_is_quota_error(self):
+        self.assertTrue(is_quota_error(_APIError("Too Many Requests", code=429)))
+        self.assertTrue(is_quota_error(Exception("RESOURCE_EXHAUSTED: quota")))
+        self.assertFalse(is_quota_error(Exception("500 internal error")))
+        self.assertFalse(is_quota_error(QuotaCooldown(time.time() + 10)))
+
+
+class TestQuotaState(unittest.TestCase):
+    def test_cooldown_expires(self):
+        state = QuotaState()
+
+        state.trip("key", 0.05)
+        self.assertIsNotNone(state.cooldown_until("key"))
+        self.assertIsNone(state.cooldown_until("other"))
+        time.sleep(0.06)
+        self.assertIsNone(state.cooldown_until("key"))
+
+    def test_trip_never_shortens_a_cooldown(self):
+        state = QuotaState()
+
+        until = state.trip("key", 60)
+
+        self.assertEqual(state.trip("key", 1), until)
+
+    def test_file_is_shared_between_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "quota.sqlite3")
+            worker_a, worker_b = QuotaState(path=path), QuotaState(path=path)
+
+            until = worker_a.trip("key", 60)
+
+            self.assertEqual(worker_b.cooldown_until("key"), until)
+
+
+class TestQuotaCooldown(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        patcher = patch.object(quota, "get_quota_state", return_value=QuotaState())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_quota_error_pauses_later_calls(self):
+        ensure_quota_available()
+
+        with self.assertLogs(level="WARNING"):
+            until = record_quota_error(_APIError("429", code=429, response=Mock(headers={"Retry-After": "30"})), 300)
+
+        self.assertAlmostEqual(until, time.time() + 30, delta=2)
+        with self.assertRaises(QuotaCooldown) as raised:
+            ensure_quota_available()
+        self.assertEqual(raised.exception.until, until)
+        self.assertIn("quota", str(raised.exception))
+        self.assertEqual(metrics.get("gemini_quota_errors"), 1)
+        self.assertEqual(metrics.get("gemini_calls_skipped_quota"), 1)
+
+    def test_default_cooldown_without_a_retry_delay(self):
+        with self.assertLogs(level="WARNING"):
+            until = record_quota_error(Exception("Quota exceeded for this project"), 300)
+
+        self.assertAlmostEqual(until, time.time() + 300, delta=2)
+
+    def test_other_errors_do_not_trip(self):
+        self.assertIsNone(record_quota_error(Exception("500 internal error"), 300))
+        ensure_quota_available()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,233 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot Gemini retry, hedging and circuit breaker policies.
+Run with: python -m pytest test/test_resilience.py
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot import metrics  # noqa: E402
+from harperbot.resilience import (  # noqa: E402
+    CircuitBreaker,
+    CircuitOpen,
+    Deadline,
+    GeminiDeadlineExceeded,
+    backoff_delay,
+    hedged,
+    hedged_async,
+    next_retry_delay,
+)
+from harperbot.routing import LatencyTracker  # noqa: E402
+
+TIMEOUT = TimeoutError("The read operation timed out")
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_backoff_is_jittered_and_capped(self):
+        delays = [backoff_delay(2) for _ in range(200)]
+
+        self.assertTrue(all(0 <= delay <= 4 for delay in delays))
+        self.assertGreater(len(set(delays)), 100)
+        self.assertLessEqual(backoff_delay(20), 30)
+
+    def test_only_transient_errors_are_retried(self):
+        deadline = Deadline(0)
+
+        self.assertIsNotNone(next_retry_delay(0, TIMEOUT, deadline))
+        self.assertIsNone(next_retry_delay(2, TIMEOUT, deadline))
+        self.assertEqual(metrics.get("gemini_retries"), 1)
+
+    def test_retry_that_would_miss_the_deadline_gives_up(self):
+        clock = _Clock()
+        deadline = Deadline(10, clock=clock)
+        clock.now = 9.5
+
+        with patch("harperbot.resilience.backoff_delay", return_value=0.2):
+            with self.assertRaises(GeminiDeadlineExceeded) as raised:
+                next_retry_delay(0, TIMEOUT, deadline)
+
+        self.assertIs(raised.exception.__cause__, TIMEOUT)
+
+    def test_spent_deadline_refuses_new_attempts(self):
+        clock = _Clock()
+        deadline = Deadline(10, clock=clock)
+        config = object()
+
+        self.assertIs(Deadline(0).apply(config), config)
+        clock.now = 9.5
+        with self.assertRaises(GeminiDeadlineExceeded):
+            deadline.apply(config)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.clock = _Clock()
+        self.breaker = CircuitBreaker(threshold=3, cooldown=30, clock=self.clock)
+
+    def _fail(self):
+        with self.assertRaises(TimeoutError):
+            with self.breaker.guard():
+                raise TIMEOUT
+
+    def test_opens_after_consecutive_failures_and_probes_after_cooldown(self):
+        with self.assertLogs(level="WARNING"):
+            for _ in range(3):
+                self._fail()
+        with self.assertRaises(CircuitOpen):
+            with self.breaker.guard():
+                self.fail("the circuit is open")
+
+        self.clock.now = 31
+        self._fail()
+        with self.assertRaises(CircuitOpen):
+            with self.breaker.guard():
+                pass
+
+        self.clock.now = 62
+        with self.breaker.guard():
+            pass
+        with self.breaker.guard():
+            pass
+        self.assertEqual(metrics.get("gemini_circuit_opened"), 1)
+        self.assertEqual(metrics.get("gemini_circuit_rejections"), 2)
+
+    def test_success_resets_the_failure_count(self):
+        for _ in range(2):
+            self._fail()
+        with self.breaker.guard():
+            pass
+        for _ in range(2):
+            self._fail()
+
+        with self.breaker.guard():
+            pass
+
+
+class TestHedging(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_slow_call_is_hedged_and_the_faster_result_wins(self):
+        calls = []
+        lock = threading.Lock()
+
+        def call():
+            with lock:
+                calls.append(None)
+                first = len(calls) == 1
+            if first:
+                time.sleep(0.3)
+                return "slow"
+            return "fast"
+
+        self.assertEqual(hedged(call, 0.01), "fast")
+        self.assertEqual(metrics.get("gemini_hedged_requests"), 1)
+        self.assertEqual(metrics.get("gemini_hedge_wins"), 1)
+
+    def test_hedge_holds_its_reservation_until_it_ends(self):
+        released = threading.Event()
+        calls = []
+
+        def call():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.3)
+                return "slow"
+            return "fast"
+
+        self.assertEqual(hedged(call, 0.01, lambda: released.set), "fast")
+        self.assertTrue(released.wait(1))
+
+    def test_abandoned_request_that_finishes_is_reported(self):
+        abandoned = []
+        reported = threading.Event()
+        calls = []
+
+        def call():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.2)
+                return "slow"
+            return "fast"
+
+        def on_abandoned(result):
+            abandoned.append(result)
+            reported.set()
+
+        self.assertEqual(hedged(call, 0.01, on_abandoned=on_abandoned), "fast")
+        self.assertTrue(reported.wait(1))
+        self.assertEqual(abandoned, ["slow"])
+
+    def test_hedge_is_skipped_without_a_free_slot(self):
+        calls = []
+
+        def call():
+            calls.append(None)
+            time.sleep(0.05)
+            return "only"
+
+        self.assertEqual(hedged(call, 0.01, lambda: None), "only")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(metrics.get("gemini_hedges_skipped"), 1)
+        self.assertEqual(metrics.get("gemini_hedged_requests"), 0)
+
+    def test_fast_call_is_not_hedged(self):
+        self.assertEqual(hedged(lambda: "done", 1.0), "done")
+        self.assertEqual(metrics.get("gemini_hedged_requests"), 0)
+
+    def test_async_hedge_cancels_the_slower_request(self):
+        started = []
+
+        async def call():
+            started.append(len(started))
+            if len(started) == 1:
+                await asyncio.sleep(5)
+                return "slow"
+            return "fast"
+
+        released = []
+        abandoned = []
+
+        async def main():
+            return await asyncio.wait_for(hedged_async(call, 0.01, lambda: lambda: released.append(True), abandoned.append), 2)
+
+        self.assertEqual(asyncio.run(main()), "fast")
+        self.assertEqual(metrics.get("gemini_hedge_wins"), 1)
+        self.assertEqual(released, [True])
+        # The cancelled request never finished, so it has no usage to charge.
+        self.assertEqual(abandoned, [])
+
+    def test_hedge_delay_is_the_recent_p95(self):
+        tracker = LatencyTracker()
+        for seconds in range(1, 21):
+            tracker.record("m", float(seconds))
+
+        self.assertEqual(tracker.percentile("m", 0.95, min_samples=20), 19.0)
+        self.assertIsNone(tracker.percentile("m", 0.95, min_samples=21))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for HarperBot model routing.
+Run with: python -m pytest test/test_routing.py
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot import metrics  # noqa: E402
+from harperbot.routing import LatencyTracker, changed_lines, route_model  # noqa: E402
+from harperbot.settings import parse_config  # noqa: E402
+
+TIERS = [
+    {"name": "small", "model": "gemini-2.5-flash-lite", "max_changed_lines": 10, "max_files": 2, "latency_target_seconds": 5},
+    {"name": "medium", "max_changed_lines": 100, "latency_target_seconds": 20},
+    {"name": "large", "model": "gemini-2.5-pro", "thinking_budget": 2048, "latency_target_seconds": 60},
+]
+
+
+def _pr(lines: int, files: int = 1) -> dict:
+    body = "".join(f"+line {n}\n" for n in range(lines))
+    return {
+        "diff": f"--- a/a.py\n+++ b/a.py\n@@ -0,0 +1,{lines} @@\n{body}",
+        "files_changed": [f"f{n}.py" for n in range(files)],
+    }
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRouteModel(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.clock = _Clock()
+        self.tracker = LatencyTracker(window=600, smoothing=0.5, clock=self.clock)
+        patcher = patch("harperbot.routing.get_latency_tracker", return_value=self.tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.config = parse_config({"model": "gemini-2.5-flash", "model_tiers": TIERS})
+
+    def test_no_tiers_keeps_the_configured_model(self):
+        self.assertIsNone(route_model(parse_config({}), _pr(5)))
+
+    def test_tier_is_chosen_by_changed_lines_and_files(self):
+        self.assertEqual(route_model(self.config, _pr(5)).name, "small")
+        self.assertEqual(route_model(self.config, _pr(5, files=3)).name, "medium")
+        self.assertEqual(route_model(self.config, _pr(50)).name, "medium")
+        large = route_model(self.config, _pr(500))
+        self.assertEqual((large.name, large.model, large.thinking_budget), ("large", "gemini-2.5-pro", 2048))
+        self.assertEqual(metrics.get("model_tier_medium"), 2)
+
+    def test_chunks_are_routed_by_the_whole_diff(self):
+        self.assertEqual(route_model(self.config, {**_pr(5), "routing_size": (500, 1)}).name, "large")
+
+    def test_slow_tier_falls_back_to_a_faster_one_until_samples_expire(self):
+        self.tracker.record("gemini-2.5-pro", 90)
+        self.tracker.record("gemini-2.5-flash", 30)
+
+        self.assertEqual(route_model(self.config, _pr(500)).name, "small")
+        self.assertEqual(metrics.get("model_tier_fallbacks"), 2)
+
+        self.clock.now = 601
+        self.assertEqual(route_model(self.config, _pr(500)).name, "large")
+
+    def test_moving_average_recovers_after_fast_calls(self):
+        self.tracker.record("gemini-2.5-pro", 90)
+        for _ in range(3):
+            self.tracker.record("gemini-2.5-pro", 30)
+
+        self.assertLess(self.tracker.average("gemini-2.5-pro"), 60)
+        self.assertEqual(route_model(self.config, _pr(500)).name, "large")
+
+    def test_changed_lines_ignores_file_headers(self):
+        self.assertEqual(changed_lines("--- a/x\n+++ b/x\n@@ -1,2 +1,2 @@\n-old\n+new\n context\n"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
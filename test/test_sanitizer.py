@@ -0,0 +1,62 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot output sanitizer.
+Run with: python -m pytest test/test_sanitizer.py
+"""
+
+import os
+import sys
+import unittest
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot.sanitizer import sanitize_markup  # noqa: E402
+
+# (model output, sanitized output)
+CORPUS = [
+    ("plain review text", "plain review text"),
+    ("a <b>bold</b> word", "a bold word"),
+    ("<script>alert(1)</script>done", "alert(1)done"),
+    ("<SCRIPT src=x.js></SCRIPT>", ""),
+    ("a <div\nclass=x> b", "a  b"),
+    ("empty <> brackets", "empty <> brackets"),
+    ("[link](JavaScript:alert(1))", "[link](alert(1))"),
+    ("img ONERROR = steal()", "img  steal()"),
+    # A removal that joins two fragments into a new match is caught on the next pass.
+    ("java<b>script:alert(1)", "alert(1)"),
+    ("<x>```\n```\n<script>\n```", "```\n```\n\n```"),
+    # Fenced code is kept literally.
+    ("x\n```java\nList<int> a; onClick={f}\n```\n<i>y</i>", "x\n```java\nList<int> a; onClick={f}\n```\ny"),
+    ("~~~\n<T> javascript:\n~~~\n<i>", "~~~\n<T> javascript:\n~~~\n"),
+    ("  ```ts\nconst m: Map<string, number>;\n   ```\n<r>", "  ```ts\nconst m: Map<string, number>;\n   ```\n"),
+    # A closing fence uses the opener's character, at least as many times, with no info string.
+    ("````\n```\n<k>\n````\n<r>", "````\n```\n<k>\n````\n"),
+    ("```\n<k>\n~~~\n<still code>\n```\n<r>", "```\n<k>\n~~~\n<still code>\n```\n"),
+    ("```\n<k>\n```python\n<still code>\n```\n<r>", "```\n<k>\n```python\n<still code>\n```\n"),
+    # A reply cut off inside a code block keeps the rest as code, as GitHub renders it.
+    ("```diff\n+ Vec<u8>", "```diff\n+ Vec<u8>"),
+    # Not fences: a backtick in the info string, or four spaces of indentation.
+    ("```py `x`\n<t>", "```py `x`\n"),
+    ("    ```\n<i>", "    ```\n"),
+    ("a < b > c", "a  c"),
+]
+
+
+class TestSanitizeMarkup(unittest.TestCase):
+    def test_corpus(self):
+        for text, expected in CORPUS:
+            with self.subTest(text=text):
+                self.assertEqual(sanitize_markup(text), expected)
+
+    def test_output_is_stable(self):
+        for text, _ in CORPUS:
+            with self.subTest(text=text):
+                once = sanitize_markup(text)
+                self.assertEqual(sanitize_markup(once), once)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot Gemini scheduler.
+Run with: python -m pytest test/test_scheduler.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot import metrics  # noqa: E402
+from harperbot.scheduler import GeminiQueueTimeout, GeminiScheduler, gemini_caller, parse_weights  # noqa: E402
+
+
+class TestGeminiScheduler(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def _run_queued(self, scheduler, callers):
+        """Hold the only slot, queue one call per `(installation, manual)`, then release and return the run order."""
+        order = []
+
+        def call(installation, manual, label):
+            with gemini_caller(installation, manual=manual), scheduler.slot(100):
+                order.append(label)
+
+        threads = []
+        with scheduler.slot(100):
+            for label, (installation, manual) in enumerate(callers):
+                thread = threading.Thread(target=call, args=(installation, manual, label))
+                thread.start()
+                threads.append(thread)
+                while len(scheduler._queue) < label + 1:
+                    time.sleep(0.001)
+        for thread in threads:
+            thread.join(timeout=5)
+        return order
+
+    def test_disabled_scheduler_does_not_queue(self):
+        scheduler = GeminiScheduler(rpm=0, tpm=0, max_concurrent=0)
+
+        with scheduler.slot(100), scheduler.slot(100):
+            self.assertEqual(scheduler._queue, [])
+
+    def test_installations_take_turns(self):
+        scheduler = GeminiScheduler(max_concurrent=1, weights={})
+
+        order = self._run_queued(scheduler, [(1, False), (1, False), (1, False), (2, False)])
+
+        # Installation 2's only call runs before installation 1's backlog is drained.
+        self.assertEqual(order, [0, 3, 1, 2])
+
+    def test_weights_give_installations_a_larger_share(self):
+        scheduler = GeminiScheduler(max_concurrent=1, weights={"1": 2.0})
+
+        order = self._run_queued(scheduler, [(1, False), (1, False), (1, False), (2, False), (2, False)])
+
+        self.assertEqual(order, [0, 1, 3, 2, 4])
+
+    def test_manual_runs_go_first(self):
+        scheduler = GeminiScheduler(max_concurrent=1, weights={})
+
+        order = self._run_queued(scheduler, [(1, False), (2, False), (3, True)])
+
+        self.assertEqual(order[0], 2)
+
+    def test_calls_over_the_rate_limit_wait_then_time_out(self):
+        scheduler = GeminiScheduler(rpm=1, timeout=0.05)
+
+        with scheduler.slot(100):
+            pass
+        with self.assertRaises(GeminiQueueTimeout):
+            with scheduler.slot(100):
+                pass
+        self.assertEqual(metrics.get("gemini_queue_timeouts"), 1)
+        self.assertEqual(scheduler._in_flight, 0)
+
+    def test_rate_limit_is_shared_through_the_state_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "budget.db")
+            worker_a = GeminiScheduler(rpm=1, timeout=0.05, state_path=path)
+            worker_b = GeminiScheduler(rpm=1, timeout=0.05, state_path=path)
+
+            with worker_a.slot(100):
+                pass
+            # The other process sees the request already spent.
+            with self.assertRaises(GeminiQueueTimeout):
+                with worker_b.slot(100):
+                    pass
+
+    def test_reserve_takes_a_free_slot_without_waiting(self):
+        scheduler = GeminiScheduler(max_concurrent=2)
+
+        with scheduler.slot(100):
+            release = scheduler.try_reserve(100)
+            self.assertIsNotNone(release)
+            # Both slots are taken now, so a second hedge is refused instead of queued.
+            self.assertIsNone(scheduler.try_reserve(100))
+            release()
+        self.assertEqual(scheduler._in_flight, 0)
+        self.assertEqual(scheduler._queue, [])
+
+    def test_async_slots_respect_the_concurrency_limit(self):
+        scheduler = GeminiScheduler(max_concurrent=1)
+        in_flight = 0
+        peak = 0
+
+        async def call():
+            nonlocal in_flight, peak
+            async with scheduler.slot_async(100):
+                in_flight += 1
+                peak = max(peak, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+
+        async def main():
+            await asyncio.gather(*(call() for _ in range(5)))
+
+        asyncio.run(main())
+        self.assertEqual(peak, 1)
+        self.assertEqual(scheduler._in_flight, 0)
+
+    def test_parse_weights(self):
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(parse_weights("123:2, 456:0.5,bad,789:x"), {"123": 2.0, "456": 0.5})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for HarperBot settings (config.yaml loading and validation).
+Run with: python -m pytest test/test_settings.py
+"""
+
+import dataclasses
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import yaml
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot import metrics  # noqa: E402
+from harperbot.settings import CONFIG_PATH, Config, ConfigError, ConfigLoader, parse_config  # noqa: E402
+
+
+class TestParseConfig(unittest.TestCase):
+    def test_repo_config_is_valid(self):
+        config = ConfigLoader(CONFIG_PATH).get()
+        self.assertEqual(config.model, "gemini-2.5-flash")
+        self.assertIn("{diff}", config["prompt"])
+        self.assertIn("{focus_instruction}", config.system_instruction)
+        # Model routing is opt-in.
+        self.assertEqual(config.model_tiers, ())
+
+    def test_example_model_tiers_are_valid(self):
+        """The commented-out `model_tiers` example in config.yaml parses once uncommented."""
+        with open(CONFIG_PATH) as f:
+            example = f.read().split("\n# model_tiers:\n", 1)[1].split("\n\n", 1)[0]
+        tiers = yaml.safe_load("\n".join(line[2:] for line in example.splitlines()))
+        config = parse_config({"model_tiers": tiers})
+        self.assertEqual([tier["name"] for tier in config.model_tiers], ["small", "medium", "large"])
+        self.assertTrue(all(tier["latency_target_seconds"] < 50 for tier in config.model_tiers))
+
+    def test_values_merge_over_defaults(self):
+        config = parse_config({"focus": "security", "temperature": 1})
+        self.assertEqual(config.focus, "security")
+        self.assertEqual(config.temperature, 1.0)
+        self.assertEqual(config["max_diff_length"], 4000)
+        self.assertEqual(config.get("max_output_tokens"), 8192)
+
+    def test_invalid_values_are_rejected(self):
+        for raw in (
+            {"max_diff_length": "4000"},
+            {"max_diff_length": True},
+            {"max_output_tokens": 0},
+            {"temperature": 3},
+            {"focus": "style"},
+            {"enable_authoring": "yes"},
+            {"stream_analysis": 1},
+            {"max_parallel_chunks": 0},
+            {"incremental_analysis": "yes"},
+            {"max_diff_tokens": -1},
+            {"token_counter": "remote"},
+            {"generated_files": "*.lock"},
+            {"stream_update_interval": 0},
+            {"safety_settings": [{"category": "HARM_CATEGORY_HARASSMENT"}]},
+            {"context_cache_ttl": -1},
+            {"system_instruction": ["not", "text"]},
+            {"model_tiers": {"name": "small"}},
+            {"model_tiers": [{"model": "gemini-2.5-flash-lite"}]},
+            {"model_tiers": [{"name": "small"}, {"name": "small"}]},
+            {"model_tiers": [{"name": "small", "max_lines": 10}]},
+            {"model_tiers": [{"name": "small", "max_changed_lines": 0}]},
+            {"model_tiers": [{"name": "small", "thinking_budget": -2}]},
+            {"model_tiers": [{"name": "small", "latency_target_seconds": "fast"}]},
+            ["not", "a", "mapping"],
+        ):
+            with self.subTest(raw=raw):
+                with self.assertRaises(ConfigError):
+                    parse_config(raw)
+
+    def test_config_is_immutable(self):
+        config = parse_config({"safety_settings": [{"category": "c", "threshold": "t"}], "custom": {"a": [1]}})
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            config.model = "other"
+        with self.assertRaises(TypeError):
+            config.safety_settings[0]["threshold"] = "BLOCK_NONE"
+        with self.assertRaises(TypeError):
+            config["custom"]["a"] = 2
+        self.assertEqual(config["custom"]["a"], (1,))
+        self.assertEqual(dict(config)["custom"], config.extra["custom"])
+
+
+class TestConfigLoader(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "config.yaml")
+        self.loader = ConfigLoader(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, text, mtime=None):
+        with open(self.path, "w") as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_missing_file_uses_defaults(self):
+        self.assertEqual(self.loader.get(), Config())
+
+    def test_parses_only_when_file_changes(self):
+        self._write("focus: security\n", mtime=1000)
+        first = self.loader.get()
+        self.assertIs(self.loader.get(), first)
+
+        # Touched but identical content: re-hashed, not re-parsed.
+        self._write("focus: security\n", mtime=2000)
+        self.assertIs(self.loader.get(), first)
+        self.assertEqual(metrics.get("config_loads"), 1)
+
+        self._write("focus: quality\n", mtime=3000)
+        self.assertEqual(self.loader.get().focus, "quality")
+        self.assertEqual(metrics.get("config_loads"), 2)
+
+    def test_invalid_file_fails_first_load(self):
+        self._write("max_diff_length: lots\n")
+        with self.assertRaises(ConfigError):
+            self.loader.get()
+
+    def test_invalid_edit_keeps_previous_config(self):
+        self._write("max_diff_length: 1000\n", mtime=1000)
+        good = self.loader.get()
+
+        self._write("max_diff_length: [\n", mtime=2000)
+        with self.assertLogs(level="ERROR"):
+            self.assertIs(self.loader.get(), good)
+        self.assertIs(self.loader.get(), good)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2026 friday_gemini_ai
+
+"""
+Unit tests for the HarperBot GraphQL PR snapshot loader.
+Run with: python -m pytest test/test_snapshot.py
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import Mock
+
+# Add the repo root to path so we can import `harperbot.*` as a package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from harperbot.event_context import EventContext  # noqa: E402
+from harperbot.snapshot import PAGE_QUERIES, SNAPSHOT_QUERY, SnapshotComment, load_pr_snapshot  # noqa: E402
+
+
+def _connection(nodes, end_cursor=None):
+    return {"nodes": nodes, "pageInfo": {"hasNextPage": end_cursor is not None, "endCursor": end_cursor}}
+
+
+def _pull_request(**connections):
+    pr = {
+        "number": 7,
+        "title": "Add feature",
+        "body": None,
+        "url": "https://github.com/o/r/pull/7",
+        "headRefName": "feature",
+        "headRefOid": "abc123",
+        "baseRefName": "main",
+        "author": {"login": "alice"},
+        "labels": _connection([{"name": "harperbot:paused"}]),
+        "files": _connection([{"path": "a.py"}, {"path": "b.py"}]),
+        "comments": _connection([{"databaseId": 1, "body": "hi", "author": None}]),
+        "reviews": _connection([{"databaseId": 9, "body": "harperbot-sha: abc123", "commit": {"oid": "abc123"}}]),
+    }
+    pr.update(connections)
+    return {"data": {"repository": {"pullRequest": pr}}}
+
+
+def _github(*responses):
+    g = Mock()
+    g.requester.graphql_query.side_effect = [({}, response) for response in responses]
+    return g
+
+
+class TestLoadPrSnapshot(unittest.TestCase):
+    def test_single_round_trip(self):
+        g = _github(_pull_request())
+
+        snapshot = load_pr_snapshot(g, "o/r", 7)
+
+        g.requester.graphql_query.assert_called_once_with(SNAPSHOT_QUERY, {"owner": "o", "name": "r", "number": 7})
+        self.assertEqual(snapshot.head_sha, "abc123")
+        self.assertEqual(snapshot.body, "")
+        self.assertEqual(snapshot.files, ("a.py", "b.py"))
+        self.assertEqual(snapshot.labels, ("harperbot:paused",))
+        self.assertEqual(snapshot.comments, (SnapshotComment(id=1, body="hi", author=None),))
+        self.assertEqual(snapshot.reviews[0].commit_sha, "abc123")
+        self.assertEqual(snapshot.diff_url, "https://github.com/o/r/pull/7.diff")
+        self.assertEqual(snapshot.gitattributes, "")
+
+    def test_gitattributes_come_from_the_head_commit(self):
+        head_ref = {"target": {"file": {"object": {"text": "dist/** linguist-generated\n"}}}}
+        g = _github(_pull_request(headRef=head_ref))
+
+        snapshot = load_pr_snapshot(g, "o/r", 7)
+
+        self.assertEqual(snapshot.gitattributes, "dist/** linguist-generated\n")
+
+    def test_paginates_only_connections_with_more_pages(self):
+        first = _pull_request(comments=_connection([{"databaseId": 1, "body": "one"}], end_cursor="c1"))
+        second = {"data": {"repository": {"pullRequest": {"comments": _connection([{"databaseId": 2, "body": "two"}], "c2")}}}}
+        third = {"data": {"repository": {"pullRequest": {"comments": _connection([{"databaseId": 3, "body": "three"}])}}}}
+        g = _github(first, second, third)
+
+        snapshot = load_pr_snapshot(g, "o/r", 7)
+
+        self.assertEqual([comment.id for comment in snapshot.comments], [1, 2, 3])
+        self.assertEqual(g.requester.graphql_query.call_count, 3)
+        query, variables = g.requester.graphql_query.call_args.args
+        self.assertEqual(query, PAGE_QUERIES["comments"])
+        self.assertEqual(variables["cursor"], "c2")
+
+
+class TestEventContextSnapshot(unittest.TestCase):
+    def test_labels_and_comments_come_from_the_snapshot(self):
+        g = _github(_pull_request())
+        event = EventContext("o/r", 7, g)
+
+        self.assertEqual(event.label_names, {"harperbot:paused"})
+        self.assertEqual([comment.body for comment in event.issue_comments], ["hi"])
+        self.assertEqual(len(event.reviews), 1)
+
+        g.requester.graphql_query.assert_called_once()
+        g.get_repo.return_value.get_pull.assert_not_called()
+        g.get_repo.return_value.get_issue.assert_not_called()
+
+    def test_editable_comment_fetches_only_the_matching_comment(self):
+        g = _github(_pull_request())
+        event = EventContext("o/r", 7, g)
+
+        event.editable_comment(event.issue_comments[0]).edit("updated")
+
+        pr = g.get_repo.return_value.get_pull.return_value
+        pr.get_issue_comment.assert_called_once_with(1)
+        pr.get_issue_comment.return_value.edit.assert_called_once_with("updated")
+
+    def test_falls_back_to_rest_when_graphql_fails(self):
+        g = Mock()
+        g.requester.graphql_query.side_effect = RuntimeError("GraphQL disabled")
+        label = Mock()
+        label.name = "bug"
+        g.get_repo.return_value.get_issue.return_value.get_labels.return_value = [label]
+
+        event = EventContext("o/r", 7, g)
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(event.label_names, {"bug"})
+        self.assertIsNone(event.snapshot)
+        self.assertIsNone(event.reviews)
+        g.requester.graphql_query.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()